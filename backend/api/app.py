@@ -7,13 +7,17 @@ Endpoints para:
 - Dashboard y reportes
 """
 
+import hmac
 import os
 import sys
 import sqlite3
 import logging
+import time
 from datetime import datetime, timedelta
+from functools import wraps
+from itertools import chain
 from pathlib import Path
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response, g
 from flask_jwt_extended import (
     JWTManager, create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity, get_jwt
@@ -34,6 +38,15 @@ try:
     from auth import AuthManager
 except ImportError:
     from api.auth import AuthManager
+from core.agregados_manager import AgregadosManager
+from core.archivo_manager import ArchivoManager
+from core.cache_respuestas import CacheRespuestas
+from core.jobs_manager import JobsManager
+from core.metricas import METRICAS
+from core.notas_credito_manager import NotasCreditoManager
+from core.paginacion import PaginadorKeyset, CursorInvalido
+from core.sqlite_pool import conectar, obtener_pool
+from core.jobs_runner import JobsRunner
 
 # Configuración
 load_dotenv()
@@ -72,6 +85,9 @@ except Exception:
             def decorator(f):
                 return f
             return decorator
+
+        def exempt(self, f):
+            return f
     limiter = DummyLimiter()
 
 # Managers
@@ -82,12 +98,122 @@ DB_PATH = Path(os.getenv('DB_PATH', str(PROJECT_ROOT / 'data' / 'notas_credito.d
 
 
 def get_db_connection():
-    """Obtiene conexión a la base de datos"""
-    conn = sqlite3.connect(str(DB_PATH))
+    """Obtiene una conexión del pool compartido (close() la devuelve al pool)"""
+    conn = conectar(str(DB_PATH))
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# Contadores y sumas del dashboard mantenidos por triggers (lectura O(1))
+agregados_manager = AgregadosManager(str(DB_PATH))
+
+# Caché de respuestas de lectura: la clave incluye la versión de datos de la BD
+cache_respuestas = CacheRespuestas.desde_entorno()
+
+
+def respuesta_cacheada(vista):
+    """
+    Sirve la vista desde la caché mientras la versión de datos no cambie y
+    responde 304 si el cliente ya tiene esa versión (If-None-Match).
+    Va debajo de @jwt_required() para que la autenticación se valide siempre;
+    la clave incluye el usuario, así que dos usuarios nunca comparten entrada.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not cache_respuestas.activa:
+            return vista(*args, **kwargs)
+        try:
+            version = agregados_manager.obtener_version()
+        except sqlite3.Error as e:
+            logger.warning(f"Caché de respuestas omitida: {e}")
+            return vista(*args, **kwargs)
+
+        clave = (get_jwt_identity(), request.path, tuple(sorted(request.args.items(multi=True))), version)
+        guardada = cache_respuestas.obtener(clave)
+        if guardada is None:
+            respuesta = make_response(vista(*args, **kwargs))
+            if respuesta.status_code != 200:
+                return respuesta
+            etag = cache_respuestas.guardar(clave, respuesta.get_data())
+            respuesta.headers['X-Cache'] = 'MISS'
+        else:
+            cuerpo, etag = guardada
+            respuesta = app.response_class(cuerpo, status=200, mimetype='application/json')
+            respuesta.headers['X-Cache'] = 'HIT'
+
+        respuesta.set_etag(etag)
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+        respuesta = respuesta.make_conditional(request)
+        if respuesta.status_code == 304:
+            cache_respuestas.registrar_no_modificado()
+        return respuesta
+
+    return envoltura
+
+
+@app.before_request
+def _iniciar_cronometro():
+    g.inicio_solicitud = time.perf_counter()
+
+
+@app.after_request
+def _medir_solicitud(respuesta):
+    """Duración por regla de ruta (no por URL, para acotar las series) y código de estado"""
+    inicio = g.pop('inicio_solicitud', None)
+    if inicio is not None:
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        METRICAS.observar('cipa_http_solicitud_duracion_segundos', time.perf_counter() - inicio,
+                          metodo=request.method, ruta=ruta, estado=respuesta.status_code)
+    return respuesta
+
+
+# Meses cerrados de facturas y rechazadas movidos a archivos columnares
+archivo_manager = ArchivoManager(str(DB_PATH), os.getenv('ARCHIVO_DIR') or None)
+
+# Listados paginados por cursor sobre (fecha, id) descendente (incluyen los meses archivados)
+paginador_facturas = PaginadorKeyset('facturas', 'fecha_factura', archivo=archivo_manager)
+paginador_rechazadas = PaginadorKeyset('facturas_rechazadas', 'fecha_factura', admite_nulos=True,
+                                       archivo=archivo_manager)
+paginador_notas = PaginadorKeyset('notas_credito', 'fecha_nota')
+
+
+def _listar_pagina(paginador, condiciones, limite_defecto, total_agregado=None):
+    """
+    Respuesta común de los listados: página desde `cursor` y, si se pide
+    `incluir_total`, el total (de los agregados si no hay filtros que lo impidan)
+
+    Args:
+        total_agregado: Función que recibe los agregados y devuelve el total,
+            o None si los filtros obligan a contar
+    """
+    limite = int(request.args.get('limite', limite_defecto))
+    cursor = request.args.get('cursor')
+    incluir_total = request.args.get('incluir_total', '').lower() in ('true', '1')
+
+    conn = get_db_connection()
+    try:
+        resultado = paginador.pagina(conn, condiciones, limite, cursor)
+        if incluir_total:
+            if total_agregado is not None:
+                resultado['total'] = total_agregado(agregados_manager.obtener(conn))
+            else:
+                resultado['total'] = paginador.contar(conn, condiciones)
+    finally:
+        conn.close()
+    return resultado
+
+
+# Jobs en segundo plano (procesar-rango): la petición solo registra el job y
+# un pool local de hilos lo ejecuta con checkpoint por día
+jobs_manager = JobsManager(str(DB_PATH))
+jobs_runner = JobsRunner(
+    jobs_manager,
+    max_workers=int(os.getenv('JOBS_WORKERS', '1') or 1),
+    intervalo_latido=float(os.getenv('JOBS_INTERVALO_LATIDO', '15')),
+    limite_latido=float(os.getenv('JOBS_LIMITE_LATIDO', '900'))
+)
+
+
 # JWT ERROR HANDLERS
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
@@ -250,7 +376,7 @@ def list_users():
     if claims.get('rol') != 'admin':
         return jsonify({"error": "No tiene permisos para ver usuarios"}), 403
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = conectar(str(DB_PATH))
     cursor = conn.cursor()
 
     cursor.execute('''
@@ -277,60 +403,48 @@ def list_users():
 # ENDPOINTS DE FACTURAS
 @app.route('/api/facturas', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def listar_facturas():
-    """Listar facturas válidas con filtros"""
+    """
+    Listar facturas válidas con filtros, paginadas por cursor
+
+    Query params: nit_cliente, fecha_desde, fecha_hasta, con_nota, limite,
+    cursor (siguiente_cursor de la página anterior), incluir_total
+    """
     try:
         nit_cliente = request.args.get('nit_cliente')
         fecha_desde = request.args.get('fecha_desde')
         fecha_hasta = request.args.get('fecha_hasta')
         con_nota = request.args.get('con_nota')
-        limite = int(request.args.get('limite', 100))
-        offset = int(request.args.get('offset', 0))
 
-        query = "SELECT * FROM facturas WHERE 1=1"
-        params = []
+        condiciones = []
 
         if nit_cliente:
-            query += " AND nit_cliente = ?"
-            params.append(nit_cliente)
+            condiciones.append(("nit_cliente = ?", [nit_cliente]))
 
         if fecha_desde:
-            query += " AND fecha_factura >= ?"
-            params.append(fecha_desde)
+            condiciones.append(("fecha_factura >= ?", [fecha_desde]))
 
         if fecha_hasta:
-            query += " AND fecha_factura <= ?"
-            params.append(fecha_hasta)
+            condiciones.append(("fecha_factura <= ?", [fecha_hasta]))
 
+        columna_total = 'facturas_cantidad'
         if con_nota is not None:
             if con_nota.lower() == 'true' or con_nota == '1':
-                query += " AND nota_aplicada = 1"
+                condiciones.append(("nota_aplicada = ?", [1]))
+                columna_total = 'facturas_con_nota'
             elif con_nota.lower() == 'false' or con_nota == '0':
-                query += " AND nota_aplicada = 0"
-
-        query += " ORDER BY fecha_factura DESC LIMIT ? OFFSET ?"
-        params.extend([limite, offset])
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(query, params)
-        facturas = [dict(row) for row in cursor.fetchall()]
+                condiciones.append(("nota_aplicada = ?", [0]))
+                columna_total = None
 
-        query_count = query.split('ORDER BY')[0].replace('SELECT *', 'SELECT COUNT(*)')
-        cursor.execute(query_count, params[:-2])
-        total = cursor.fetchone()[0]
+        total_agregado = None
+        if not (nit_cliente or fecha_desde or fecha_hasta) and columna_total:
+            total_agregado = lambda agregados: agregados['totales'][columna_total]
 
-        conn.close()
-
-        return jsonify({
-            "items": facturas,
-            "total": total,
-            "limite": limite,
-            "offset": offset,
-            "total_paginas": (total + limite - 1) // limite
-        }), 200
+        return jsonify(_listar_pagina(paginador_facturas, condiciones, 100, total_agregado)), 200
 
+    except CursorInvalido as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error en listar_facturas: {e}")
         return jsonify({"error": "Error al obtener facturas"}), 500
@@ -346,6 +460,8 @@ def obtener_factura(factura_id):
 
         cursor.execute('SELECT * FROM facturas WHERE id = ?', (factura_id,))
         factura = cursor.fetchone()
+        if not factura:
+            factura = archivo_manager.obtener_por_id('facturas', factura_id, conn)
 
         if not factura:
             conn.close()
@@ -372,32 +488,21 @@ def obtener_factura(factura_id):
 
 @app.route('/api/facturas/estadisticas', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def estadisticas_facturas():
     """Estadísticas de facturas"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        stats = {}
-
-        cursor.execute('SELECT COUNT(*), SUM(valor_total) FROM facturas')
-        row = cursor.fetchone()
-        stats['facturas_validas'] = row[0] or 0
-        stats['valor_total_facturado'] = row[1] or 0
-
-        cursor.execute('SELECT COUNT(*) FROM facturas WHERE nota_aplicada = 1')
-        stats['facturas_con_notas'] = cursor.fetchone()[0]
-
-        cursor.execute('SELECT SUM(descuento_valor) FROM facturas WHERE nota_aplicada = 1')
-        stats['total_descontado'] = cursor.fetchone()[0] or 0
-
-        cursor.execute('SELECT COUNT(*) FROM facturas_rechazadas')
-        stats['facturas_rechazadas'] = cursor.fetchone()[0]
-
-        cursor.execute('SELECT SUM(valor_total) FROM facturas_rechazadas')
-        stats['valor_rechazado'] = cursor.fetchone()[0] or 0
+        totales = agregados_manager.obtener()['totales']
+
+        stats = {
+            'facturas_validas': totales['facturas_cantidad'],
+            'valor_total_facturado': totales['facturas_valor_total'],
+            'facturas_con_notas': totales['facturas_con_nota'],
+            'total_descontado': totales['facturas_descuento_con_nota'],
+            'facturas_rechazadas': totales['rechazadas_cantidad'],
+            'valor_rechazado': totales['rechazadas_valor_total']
+        }
 
-        conn.close()
         return jsonify(stats), 200
 
     except Exception as e:
@@ -407,47 +512,33 @@ def estadisticas_facturas():
 
 @app.route('/api/facturas/rechazadas', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def listar_facturas_rechazadas():
-    """Listar facturas rechazadas"""
+    """
+    Listar facturas rechazadas, paginadas por cursor
+
+    Query params: fecha_desde, fecha_hasta, limite, cursor, incluir_total
+    """
     try:
-        limite = int(request.args.get('limite', 50))
-        offset = int(request.args.get('offset', 0))
         fecha_desde = request.args.get('fecha_desde')
         fecha_hasta = request.args.get('fecha_hasta')
 
-        query = "SELECT * FROM facturas_rechazadas WHERE 1=1"
-        params = []
+        condiciones = []
 
         if fecha_desde:
-            query += " AND fecha_factura >= ?"
-            params.append(fecha_desde)
+            condiciones.append(("fecha_factura >= ?", [fecha_desde]))
 
         if fecha_hasta:
-            query += " AND fecha_factura <= ?"
-            params.append(fecha_hasta)
-
-        query += " ORDER BY fecha_registro DESC LIMIT ? OFFSET ?"
-        params.extend([limite, offset])
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(query, params)
-        rechazadas = [dict(row) for row in cursor.fetchall()]
-
-        query_count = query.split('ORDER BY')[0].replace('SELECT *', 'SELECT COUNT(*)')
-        cursor.execute(query_count, params[:-2])
-        total = cursor.fetchone()[0]
+            condiciones.append(("fecha_factura <= ?", [fecha_hasta]))
 
-        conn.close()
+        total_agregado = None
+        if not condiciones:
+            total_agregado = lambda agregados: agregados['totales']['rechazadas_cantidad']
 
-        return jsonify({
-            "items": rechazadas,
-            "total": total,
-            "limite": limite,
-            "offset": offset
-        }), 200
+        return jsonify(_listar_pagina(paginador_rechazadas, condiciones, 50, total_agregado)), 200
 
+    except CursorInvalido as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error en listar_facturas_rechazadas: {e}")
         return jsonify({"error": "Error al obtener facturas rechazadas"}), 500
@@ -456,58 +547,46 @@ def listar_facturas_rechazadas():
 # ENDPOINTS DE NOTAS CRÉDITO
 @app.route('/api/notas', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def listar_notas():
-    """Listar notas de crédito"""
+    """
+    Listar notas de crédito, paginadas por cursor
+
+    Query params: estado, nit_cliente, fecha_desde, fecha_hasta, limite,
+    cursor, incluir_total
+    """
     try:
         estado = request.args.get('estado')
         nit_cliente = request.args.get('nit_cliente')
         fecha_desde = request.args.get('fecha_desde')
         fecha_hasta = request.args.get('fecha_hasta')
-        limite = int(request.args.get('limite', 100))
-        offset = int(request.args.get('offset', 0))
 
-        query = "SELECT * FROM notas_credito WHERE 1=1"
-        params = []
+        condiciones = []
 
         if estado:
-            query += " AND estado = ?"
-            params.append(estado)
+            condiciones.append(("estado = ?", [estado]))
 
         if nit_cliente:
-            query += " AND nit_cliente = ?"
-            params.append(nit_cliente)
+            condiciones.append(("nit_cliente = ?", [nit_cliente]))
 
         if fecha_desde:
-            query += " AND fecha_nota >= ?"
-            params.append(fecha_desde)
+            condiciones.append(("fecha_nota >= ?", [fecha_desde]))
 
         if fecha_hasta:
-            query += " AND fecha_nota <= ?"
-            params.append(fecha_hasta)
+            condiciones.append(("fecha_nota <= ?", [fecha_hasta]))
 
-        query += " ORDER BY fecha_nota DESC LIMIT ? OFFSET ?"
-        params.extend([limite, offset])
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        total_agregado = None
+        if not (nit_cliente or fecha_desde or fecha_hasta):
+            if estado:
+                total_agregado = lambda agregados: agregados['notas_por_estado'].get(
+                    estado, {'cantidad': 0})['cantidad']
+            else:
+                total_agregado = lambda agregados: agregados['totales']['notas_cantidad']
 
-        cursor.execute(query, params)
-        notas = [dict(row) for row in cursor.fetchall()]
-
-        query_count = query.split('ORDER BY')[0].replace('SELECT *', 'SELECT COUNT(*)')
-        cursor.execute(query_count, params[:-2])
-        total = cursor.fetchone()[0]
-
-        conn.close()
-
-        return jsonify({
-            "items": notas,
-            "total": total,
-            "limite": limite,
-            "offset": offset,
-            "total_paginas": (total + limite - 1) // limite
-        }), 200
+        return jsonify(_listar_pagina(paginador_notas, condiciones, 100, total_agregado)), 200
 
+    except CursorInvalido as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error en listar_notas: {e}")
         return jsonify({"error": "Error al obtener notas"}), 500
@@ -549,37 +628,32 @@ def obtener_nota(nota_id):
 
 @app.route('/api/notas/estadisticas', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def estadisticas_notas():
     """Estadísticas de notas de crédito"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        stats = {}
+        agregados = agregados_manager.obtener()
+        totales = agregados['totales']
 
-        cursor.execute('SELECT COUNT(*), SUM(valor_total) FROM notas_credito')
-        row = cursor.fetchone()
-        stats['total_notas'] = row[0] or 0
-        stats['valor_total'] = row[1] or 0
-
-        cursor.execute('''
-            SELECT estado, COUNT(*), SUM(saldo_pendiente)
-            FROM notas_credito GROUP BY estado
-        ''')
-        for row in cursor.fetchall():
-            estado_lower = row[0].lower()
-            stats[f'notas_{estado_lower}'] = row[1]
-            stats[f'saldo_{estado_lower}'] = row[2] or 0
+        stats = {
+            'total_notas': totales['notas_cantidad'],
+            'valor_total': totales['notas_valor_total']
+        }
 
-        cursor.execute('SELECT SUM(saldo_pendiente) FROM notas_credito WHERE estado != "APLICADA"')
-        stats['saldo_pendiente_total'] = cursor.fetchone()[0] or 0
+        saldo_pendiente_total = 0
+        for estado, valores in agregados['notas_por_estado'].items():
+            if not estado:
+                continue
+            estado_lower = estado.lower()
+            stats[f'notas_{estado_lower}'] = valores['cantidad']
+            stats[f'saldo_{estado_lower}'] = valores['saldo_pendiente']
+            if estado != 'APLICADA':
+                saldo_pendiente_total += valores['saldo_pendiente']
+        stats['saldo_pendiente_total'] = saldo_pendiente_total
 
-        cursor.execute('SELECT COUNT(*), SUM(valor_aplicado) FROM aplicaciones_notas')
-        row = cursor.fetchone()
-        stats['total_aplicaciones'] = row[0] or 0
-        stats['monto_total_aplicado'] = row[1] or 0
+        stats['total_aplicaciones'] = totales['aplicaciones_cantidad']
+        stats['monto_total_aplicado'] = totales['aplicaciones_valor']
 
-        conn.close()
         return jsonify(stats), 200
 
     except Exception as e:
@@ -614,6 +688,7 @@ def obtener_aplicaciones(numero_nota):
 # REPORTE OPERATIVO
 @app.route('/api/reporte/operativo', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def reporte_operativo():
     """Reporte operativo diario"""
     try:
@@ -623,53 +698,33 @@ def reporte_operativo():
             fecha = fecha_obj.strftime('%Y-%m-%d')
 
         conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Notas de la fecha
-        cursor.execute('''
-            SELECT * FROM notas_credito
-            WHERE DATE(fecha_nota) = ? OR DATE(fecha_registro) = ?
-            ORDER BY fecha_nota DESC
-        ''', (fecha, fecha))
-        notas = [dict(row) for row in cursor.fetchall()]
-
-        # Aplicaciones de la fecha
-        cursor.execute('''
-            SELECT * FROM aplicaciones_notas
-            WHERE DATE(fecha_aplicacion) = ?
-            ORDER BY fecha_aplicacion DESC
-        ''', (fecha,))
-        aplicaciones = [dict(row) for row in cursor.fetchall()]
-
-        # Facturas rechazadas de la fecha
-        cursor.execute('''
-            SELECT * FROM facturas_rechazadas
-            WHERE DATE(fecha_factura) = ?
-            ORDER BY fecha_factura DESC
-        ''', (fecha,))
-        rechazadas = [dict(row) for row in cursor.fetchall()]
+        try:
+            # Notas, aplicaciones y rechazos de la fecha (rangos sobre índices)
+            movimientos = NotasCreditoManager.obtener_movimientos_dia(conn, fecha)
+            inicio, fin = NotasCreditoManager.rango_dias(fecha)
+            movimientos['facturas_rechazadas'] += archivo_manager.filas(
+                'facturas_rechazadas', [("fecha_factura >= ?", [inicio]), ("fecha_factura < ?", [fin])],
+                conn=conn)
+
+            # Resumen general
+            por_estado = agregados_manager.obtener(conn)['notas_por_estado']
+        except ValueError:
+            return jsonify({"error": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
+        finally:
+            conn.close()
 
-        # Resumen general
-        cursor.execute('''
-            SELECT COUNT(*), SUM(saldo_pendiente)
-            FROM notas_credito WHERE estado = 'PENDIENTE'
-        ''')
-        row = cursor.fetchone()
+        sin_notas = {'cantidad': 0, 'saldo_pendiente': 0}
         resumen = {
-            'notas_pendientes': row[0] or 0,
-            'saldo_pendiente': row[1] or 0
+            'notas_pendientes': por_estado.get('PENDIENTE', sin_notas)['cantidad'],
+            'saldo_pendiente': por_estado.get('PENDIENTE', sin_notas)['saldo_pendiente'],
+            'notas_aplicadas': por_estado.get('APLICADA', sin_notas)['cantidad']
         }
 
-        cursor.execute('SELECT COUNT(*) FROM notas_credito WHERE estado = "APLICADA"')
-        resumen['notas_aplicadas'] = cursor.fetchone()[0]
-
-        conn.close()
-
         return jsonify({
             "fecha": fecha,
-            "notas_credito": notas,
-            "aplicaciones": aplicaciones,
-            "facturas_rechazadas": rechazadas,
+            "notas_credito": movimientos['notas_credito'],
+            "aplicaciones": movimientos['aplicaciones'],
+            "facturas_rechazadas": movimientos['facturas_rechazadas'],
             "resumen": resumen
         }), 200
 
@@ -681,42 +736,34 @@ def reporte_operativo():
 # DASHBOARD
 @app.route('/api/dashboard', methods=['GET'])
 @jwt_required()
+@respuesta_cacheada
 def dashboard():
     """Datos del dashboard principal"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        data = {}
-
-        # Facturas
-        cursor.execute('SELECT COUNT(*), SUM(valor_total) FROM facturas')
-        row = cursor.fetchone()
-        data['facturas_validas'] = row[0] or 0
-        data['valor_total_facturado'] = row[1] or 0
-
-        cursor.execute('SELECT COUNT(*) FROM facturas WHERE nota_aplicada = 1')
-        data['facturas_con_notas'] = cursor.fetchone()[0]
-
-        cursor.execute('SELECT SUM(descuento_cantidad), SUM(descuento_valor) FROM facturas')
-        row = cursor.fetchone()
-        data['total_descuento_cantidad'] = row[0] or 0
-        data['total_descuento_valor'] = row[1] or 0
-
-        # Rechazadas
-        cursor.execute('SELECT COUNT(*), SUM(valor_total) FROM facturas_rechazadas')
-        row = cursor.fetchone()
-        data['facturas_rechazadas'] = row[0] or 0
-        data['valor_rechazado'] = row[1] or 0
-
-        # Notas
-        cursor.execute('SELECT COUNT(*), SUM(saldo_pendiente) FROM notas_credito WHERE estado = "PENDIENTE"')
-        row = cursor.fetchone()
-        data['notas_pendientes'] = row[0] or 0
-        data['saldo_pendiente'] = row[1] or 0
-
-        cursor.execute('SELECT COUNT(*) FROM notas_credito WHERE estado = "APLICADA"')
-        data['notas_aplicadas'] = cursor.fetchone()[0]
+        # Contadores y sumas materializados (misma lectura para todos los bloques)
+        agregados = agregados_manager.obtener(conn)
+        totales = agregados['totales']
+        por_estado = agregados['notas_por_estado']
+        sin_notas = {'cantidad': 0, 'saldo_pendiente': 0}
+
+        data = {
+            # Facturas
+            'facturas_validas': totales['facturas_cantidad'],
+            'valor_total_facturado': totales['facturas_valor_total'],
+            'facturas_con_notas': totales['facturas_con_nota'],
+            'total_descuento_cantidad': totales['facturas_descuento_cantidad'],
+            'total_descuento_valor': totales['facturas_descuento_valor'],
+            # Rechazadas
+            'facturas_rechazadas': totales['rechazadas_cantidad'],
+            'valor_rechazado': totales['rechazadas_valor_total'],
+            # Notas
+            'notas_pendientes': por_estado.get('PENDIENTE', sin_notas)['cantidad'],
+            'saldo_pendiente': por_estado.get('PENDIENTE', sin_notas)['saldo_pendiente'],
+            'notas_aplicadas': por_estado.get('APLICADA', sin_notas)['cantidad']
+        }
 
         # Últimas aplicaciones
         cursor.execute('''
@@ -737,12 +784,163 @@ def dashboard():
 # ENDPOINTS DE ADMIN - EXPORTACIÓN Y PROCESAMIENTO
 # =========================================================================
 
+# Consultas de exportación por tipo: (SQL con rango semiabierto [desde, día siguiente a hasta), encabezados)
+EXPORTACIONES = {
+    'facturas': ('''
+        SELECT numero_linea, numero_factura, producto, codigo_producto,
+               nombre_cliente, nit_cliente, cantidad_original, precio_unitario,
+               valor_total, nota_aplicada, numero_nota_aplicada,
+               descuento_cantidad, descuento_valor, cantidad_restante,
+               valor_restante, fecha_factura
+        FROM facturas
+        WHERE fecha_factura >= ? AND fecha_factura < ?
+        ORDER BY fecha_factura DESC, numero_factura
+    ''', ['Linea', 'Factura', 'Producto', 'Codigo', 'Cliente', 'NIT',
+          'Cantidad', 'Precio Unit', 'Valor Total', 'Nota Aplicada',
+          'Num Nota', 'Desc Cantidad', 'Desc Valor', 'Cant Rest',
+          'Valor Rest', 'Fecha']),
+    'notas': ('''
+        SELECT numero_nota, fecha_nota, nombre_cliente, nit_cliente,
+               nombre_producto, codigo_producto, cantidad, valor_total,
+               cantidad_pendiente, saldo_pendiente, estado, causal_devolucion
+        FROM notas_credito
+        WHERE fecha_nota >= ? AND fecha_nota < ?
+        ORDER BY fecha_nota DESC
+    ''', ['Nota', 'Fecha', 'Cliente', 'NIT', 'Producto', 'Codigo',
+          'Cantidad', 'Valor Total', 'Cant Pend', 'Saldo Pend',
+          'Estado', 'Causal']),
+    'rechazadas': ('''
+        SELECT numero_factura, numero_linea, producto, codigo_producto,
+               nombre_cliente, nit_cliente, cantidad, valor_total,
+               tipo_inventario, razon_rechazo, fecha_factura
+        FROM facturas_rechazadas
+        WHERE fecha_factura >= ? AND fecha_factura < ?
+        ORDER BY fecha_factura DESC
+    ''', ['Factura', 'Linea', 'Producto', 'Codigo', 'Cliente', 'NIT',
+          'Cantidad', 'Valor', 'Tipo Inv', 'Razon Rechazo', 'Fecha']),
+    'aplicaciones': ('''
+        SELECT numero_nota, numero_factura, numero_linea, nit_cliente,
+               codigo_producto, cantidad_aplicada, valor_aplicado, fecha_aplicacion
+        FROM aplicaciones_notas
+        WHERE fecha_aplicacion >= ? AND fecha_aplicacion < ?
+        ORDER BY fecha_aplicacion DESC
+    ''', ['Nota', 'Factura', 'Linea', 'NIT', 'Codigo',
+          'Cantidad Aplicada', 'Valor Aplicado', 'Fecha']),
+}
+
+# Tipos de exportación que incluyen los meses archivados: (tabla, columna de fecha)
+EXPORTACIONES_ARCHIVADAS = {
+    'facturas': ('facturas', 'fecha_factura'),
+    'rechazadas': ('facturas_rechazadas', 'fecha_factura'),
+}
+
+# Formatos de exportación: extensión del archivo generado
+FORMATOS_EXPORTACION = {'xlsx': 'xlsx', 'csv': 'csv', 'csv.gz': 'csv.gz'}
+
+# Filas leídas del cursor por lote y filas de muestra para calcular anchos
+LOTE_EXPORTACION = 5000
+MUESTRA_ANCHOS = 1000
+
+
+def _lotes_cursor(cursor, primer_lote):
+    """Entrega el lote ya leído y luego el resto del cursor en lotes de LOTE_EXPORTACION"""
+    lote = primer_lote
+    while lote:
+        yield lote
+        lote = cursor.fetchmany(LOTE_EXPORTACION)
+
+
+def _exportar_xlsx(lotes, muestra, columns, output_path, titulo):
+    """
+    Escribe la exportación en un workbook write-only
+
+    Los anchos se calculan sobre el encabezado y las filas de muestra (se
+    fijan antes de escribir). Las celdas con borde se crean una vez por
+    columna y se reutilizan en cada fila, así todas comparten el mismo estilo.
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(titulo)
+
+    # Estilos
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    # Ajustar anchos con la muestra
+    for col, header in enumerate(columns):
+        max_length = max([len(str(header))] + [len(str(row[col])) for row in muestra])
+        ws.column_dimensions[get_column_letter(col + 1)].width = min(max_length + 2, 50)
+
+    # Headers
+    encabezados = []
+    for header in columns:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = Alignment(horizontal='center')
+        cell.border = thin_border
+        encabezados.append(cell)
+    ws.append(encabezados)
+
+    # Datos
+    celdas = []
+    for _ in columns:
+        cell = WriteOnlyCell(ws)
+        cell.border = thin_border
+        celdas.append(cell)
+
+    total = 0
+    for lote in lotes:
+        for row in lote:
+            for cell, value in zip(celdas, row):
+                cell.value = value
+            ws.append(celdas)
+        total += len(lote)
+
+    wb.save(str(output_path))
+    return total
+
+
+def _exportar_csv(lotes, columns, output_path, comprimir):
+    """Escribe la exportación en CSV (UTF-8 con BOM para Excel) o CSV gzip"""
+    import csv
+    import gzip
+
+    if comprimir:
+        archivo = gzip.open(output_path, 'wt', encoding='utf-8-sig', newline='', compresslevel=6)
+    else:
+        archivo = open(output_path, 'w', encoding='utf-8-sig', newline='')
+
+    total = 0
+    with archivo:
+        writer = csv.writer(archivo)
+        writer.writerow(columns)
+        for lote in lotes:
+            writer.writerows(lote)
+            total += len(lote)
+    return total
+
+
 @app.route('/api/admin/exportar-excel', methods=['POST'])
 @jwt_required()
 def exportar_excel_bd():
     """
-    Exporta datos de la BD a Excel por rango de fechas
+    Exporta datos de la BD a Excel (o CSV / CSV comprimido) por rango de fechas
     Solo para admins
+
+    Las filas se leen del cursor por lotes y se escriben directamente al
+    archivo, de modo que la memoria no depende del tamaño del rango.
+    Body opcional: formato = 'xlsx' (por defecto), 'csv' o 'csv.gz'
     """
     try:
         claims = get_jwt()
@@ -752,137 +950,69 @@ def exportar_excel_bd():
         data = request.get_json()
         fecha_desde = data.get('fecha_desde')
         fecha_hasta = data.get('fecha_hasta')
-        tipo = data.get('tipo', 'facturas')  # facturas, notas, rechazadas
+        tipo = data.get('tipo', 'facturas')  # facturas, notas, rechazadas, aplicaciones
+        formato = data.get('formato', 'xlsx')
 
         if not fecha_desde or not fecha_hasta:
             return jsonify({"error": "Fechas requeridas"}), 400
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        try:
+            rango = NotasCreditoManager.rango_dias(fecha_desde, fecha_hasta)
+        except ValueError:
+            return jsonify({"error": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
 
         # Determinar query según tipo
-        if tipo == 'facturas':
-            cursor.execute('''
-                SELECT numero_linea, numero_factura, producto, codigo_producto,
-                       nombre_cliente, nit_cliente, cantidad_original, precio_unitario,
-                       valor_total, nota_aplicada, numero_nota_aplicada,
-                       descuento_cantidad, descuento_valor, cantidad_restante,
-                       valor_restante, fecha_factura
-                FROM facturas
-                WHERE fecha_factura >= ? AND fecha_factura <= ?
-                ORDER BY fecha_factura DESC, numero_factura
-            ''', (fecha_desde, fecha_hasta))
-            columns = ['Linea', 'Factura', 'Producto', 'Codigo', 'Cliente', 'NIT',
-                      'Cantidad', 'Precio Unit', 'Valor Total', 'Nota Aplicada',
-                      'Num Nota', 'Desc Cantidad', 'Desc Valor', 'Cant Rest',
-                      'Valor Rest', 'Fecha']
-
-        elif tipo == 'notas':
-            cursor.execute('''
-                SELECT numero_nota, fecha_nota, nombre_cliente, nit_cliente,
-                       nombre_producto, codigo_producto, cantidad, valor_total,
-                       cantidad_pendiente, saldo_pendiente, estado, causal_devolucion
-                FROM notas_credito
-                WHERE fecha_nota >= ? AND fecha_nota <= ?
-                ORDER BY fecha_nota DESC
-            ''', (fecha_desde, fecha_hasta))
-            columns = ['Nota', 'Fecha', 'Cliente', 'NIT', 'Producto', 'Codigo',
-                      'Cantidad', 'Valor Total', 'Cant Pend', 'Saldo Pend',
-                      'Estado', 'Causal']
-
-        elif tipo == 'rechazadas':
-            cursor.execute('''
-                SELECT numero_factura, numero_linea, producto, codigo_producto,
-                       nombre_cliente, nit_cliente, cantidad, valor_total,
-                       tipo_inventario, razon_rechazo, fecha_factura
-                FROM facturas_rechazadas
-                WHERE fecha_factura >= ? AND fecha_factura <= ?
-                ORDER BY fecha_factura DESC
-            ''', (fecha_desde, fecha_hasta))
-            columns = ['Factura', 'Linea', 'Producto', 'Codigo', 'Cliente', 'NIT',
-                      'Cantidad', 'Valor', 'Tipo Inv', 'Razon Rechazo', 'Fecha']
-
-        elif tipo == 'aplicaciones':
-            cursor.execute('''
-                SELECT numero_nota, numero_factura, numero_linea, nit_cliente,
-                       codigo_producto, cantidad_aplicada, valor_aplicado, fecha_aplicacion
-                FROM aplicaciones_notas
-                WHERE DATE(fecha_aplicacion) >= ? AND DATE(fecha_aplicacion) <= ?
-                ORDER BY fecha_aplicacion DESC
-            ''', (fecha_desde, fecha_hasta))
-            columns = ['Nota', 'Factura', 'Linea', 'NIT', 'Codigo',
-                      'Cantidad Aplicada', 'Valor Aplicado', 'Fecha']
-        else:
+        if tipo not in EXPORTACIONES:
             return jsonify({"error": "Tipo inválido"}), 400
+        if formato not in FORMATOS_EXPORTACION:
+            return jsonify({"error": "Formato inválido (xlsx, csv, csv.gz)"}), 400
+        query, columns = EXPORTACIONES[tipo]
 
-        rows = cursor.fetchall()
-        conn.close()
-
-        if not rows:
-            return jsonify({"error": "No hay datos para el rango seleccionado"}), 404
+        if formato == 'xlsx':
+            try:
+                import openpyxl
+            except ImportError:
+                return jsonify({"error": "openpyxl no instalado"}), 500
 
-        # Generar Excel
+        conn = get_db_connection()
         try:
-            import openpyxl
-            from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-        except ImportError:
-            return jsonify({"error": "openpyxl no instalado"}), 500
-
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = tipo.capitalize()
-
-        # Estilos
-        header_font = Font(bold=True, color="FFFFFF")
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
-
-        # Headers
-        for col, header in enumerate(columns, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = Alignment(horizontal='center')
-            cell.border = thin_border
-
-        # Datos
-        for row_idx, row in enumerate(rows, 2):
-            for col_idx, value in enumerate(row, 1):
-                cell = ws.cell(row=row_idx, column=col_idx, value=value)
-                cell.border = thin_border
-
-        # Ajustar anchos
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column].width = adjusted_width
-
-        # Guardar
-        output_dir = PROJECT_ROOT / 'output'
-        output_dir.mkdir(exist_ok=True)
-
-        filename = f"export_{tipo}_{fecha_desde}_{fecha_hasta}.xlsx"
-        output_path = output_dir / filename
-
-        wb.save(str(output_path))
+            cursor = conn.cursor()
+            # Tuplas simples: más livianas que sqlite3.Row para escribir
+            cursor.row_factory = None
+            cursor.execute(query, rango)
+
+            lotes = _lotes_cursor(cursor, cursor.fetchmany(max(LOTE_EXPORTACION, MUESTRA_ANCHOS)))
+            if tipo in EXPORTACIONES_ARCHIVADAS:
+                # Después de las filas de la BD, las de los meses archivados del rango
+                tabla, columna_fecha = EXPORTACIONES_ARCHIVADAS[tipo]
+                lotes = chain(lotes, archivo_manager.lotes(
+                    tabla, [d[0] for d in cursor.description],
+                    [(f"{columna_fecha} >= ?", [rango[0]]), (f"{columna_fecha} < ?", [rango[1]])],
+                    LOTE_EXPORTACION, conn))
+
+            # El primer lote sirve también de muestra para los anchos
+            primer_lote = next(lotes, None)
+            if not primer_lote:
+                return jsonify({"error": "No hay datos para el rango seleccionado"}), 404
+
+            output_dir = PROJECT_ROOT / 'output'
+            output_dir.mkdir(exist_ok=True)
+
+            filename = f"export_{tipo}_{fecha_desde}_{fecha_hasta}.{FORMATOS_EXPORTACION[formato]}"
+            output_path = output_dir / filename
+
+            lotes = chain([primer_lote], lotes)
+            if formato == 'xlsx':
+                total = _exportar_xlsx(lotes, primer_lote[:MUESTRA_ANCHOS], columns, output_path, tipo.capitalize())
+            else:
+                total = _exportar_csv(lotes, columns, output_path, comprimir=(formato == 'csv.gz'))
+        finally:
+            conn.close()
 
         return jsonify({
             "exito": True,
-            "mensaje": f"Excel generado con {len(rows)} registros",
+            "mensaje": f"{'Excel' if formato == 'xlsx' else 'CSV'} generado con {total} registros",
             "archivo": filename,
-            "total_registros": len(rows)
+            "total_registros": total
         }), 200
 
     except Exception as e:
@@ -920,12 +1050,41 @@ def descargar_archivo(filename):
         return jsonify({"error": "Error al descargar archivo"}), 500
 
 
+def _config_procesamiento():
+    """Configuración de main.procesar_rango_fechas desde las variables de entorno"""
+    return {
+        'CONNI_KEY': os.getenv('CONNI_KEY'),
+        'CONNI_TOKEN': os.getenv('CONNI_TOKEN'),
+        'DB_PATH': str(DB_PATH),
+        'TEMPLATE_PATH': os.getenv('TEMPLATE_PATH', './templates/plantilla.xlsx'),
+        'RANGO_PREFETCH_DIAS': os.getenv('RANGO_PREFETCH_DIAS'),
+        'RANGO_VENTANA_DIAS': os.getenv('RANGO_VENTANA_DIAS'),
+        'SIESA_CACHE_DIR': os.getenv('SIESA_CACHE_DIR', str(PROJECT_ROOT / 'data' / 'siesa_cache')),
+        'SIESA_CACHE_TTL_MINUTOS': os.getenv('SIESA_CACHE_TTL_MINUTOS'),
+        'SIESA_CACHE_MODO': os.getenv('SIESA_CACHE_MODO')
+    }
+
+
+def _ejecutar_procesar_rango(parametros, seguimiento):
+    """Job 'procesar_rango': se ejecuta en un hilo del pool de jobs"""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from main import procesar_rango_fechas
+
+    fecha_desde = datetime.strptime(parametros['fecha_desde'], '%Y-%m-%d')
+    fecha_hasta = datetime.strptime(parametros['fecha_hasta'], '%Y-%m-%d')
+    return procesar_rango_fechas(fecha_desde, fecha_hasta, _config_procesamiento(), seguimiento)
+
+
+jobs_runner.registrar('procesar_rango', _ejecutar_procesar_rango)
+
+
 @app.route('/api/admin/procesar-rango', methods=['POST'])
 @jwt_required()
 def procesar_rango():
     """
-    Procesa un rango de fechas desde la API externa y guarda en BD
-    Solo para admins - Proceso largo
+    Encola el procesamiento de un rango de fechas desde la API externa
+    Solo para admins - Responde de inmediato con el ID del job; el avance se
+    consulta en /api/admin/jobs/<job_id>
     """
     try:
         claims = get_jwt()
@@ -950,26 +1109,26 @@ def procesar_rango():
         if fecha_desde > fecha_hasta:
             return jsonify({"error": "Fecha desde debe ser anterior a fecha hasta"}), 400
 
-        # Importar función de procesamiento
-        sys.path.insert(0, str(BACKEND_DIR))
-        from main import procesar_rango_fechas
-
-        # Configuración
-        config = {
-            'CONNI_KEY': os.getenv('CONNI_KEY'),
-            'CONNI_TOKEN': os.getenv('CONNI_TOKEN'),
-            'DB_PATH': str(DB_PATH),
-            'TEMPLATE_PATH': os.getenv('TEMPLATE_PATH', './templates/plantilla.xlsx')
-        }
-
-        if not config['CONNI_KEY'] or not config['CONNI_TOKEN']:
+        config = _config_procesamiento()
+        if config['SIESA_CACHE_MODO'] != 'offline' and (not config['CONNI_KEY'] or not config['CONNI_TOKEN']):
             return jsonify({"error": "Credenciales API no configuradas"}), 500
 
-        # Ejecutar procesamiento
-        resultado = procesar_rango_fechas(fecha_desde, fecha_hasta, config)
-
-        return jsonify(resultado), 200
+        job_id = jobs_runner.encolar(
+            'procesar_rango',
+            {'fecha_desde': fecha_desde_str, 'fecha_hasta': fecha_hasta_str},
+            usuario=claims.get('username') or str(get_jwt_identity()),
+            dias_total=diff_days + 1
+        )
 
+        return jsonify({
+            "job_id": job_id,
+            "estado": JobsManager.PENDIENTE,
+            "mensaje": "Procesamiento encolado",
+            "url_estado": f"/api/admin/jobs/{job_id}"
+        }), 202
+
+    except ValueError:
+        return jsonify({"error": "Formato de fecha inválido (YYYY-MM-DD)"}), 400
     except Exception as e:
         logger.error(f"Error en procesar_rango: {e}")
         import traceback
@@ -977,6 +1136,80 @@ def procesar_rango():
         return jsonify({"error": f"Error al procesar: {str(e)}"}), 500
 
 
+@app.route('/api/admin/jobs', methods=['GET'])
+@jwt_required()
+def listar_jobs():
+    """Lista los jobs más recientes"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+
+    limite = min(request.args.get('limite', 20, type=int), 100)
+    return jsonify({"jobs": jobs_manager.listar_jobs(limite)}), 200
+
+
+@app.route('/api/admin/jobs/<int:job_id>', methods=['GET'])
+@limiter.exempt
+@jwt_required()
+def obtener_job(job_id):
+    """Estado y avance por día de un job (pensado para consultarse periódicamente)"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+
+    job = jobs_manager.obtener_job(job_id, incluir_dias=True)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/api/admin/jobs/<int:job_id>/resultado', methods=['GET'])
+@jwt_required()
+def obtener_resultado_job(job_id):
+    """Resultado de un job terminado (202 mientras sigue en curso)"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+
+    job = jobs_manager.obtener_job(job_id)
+    if not job:
+        return jsonify({"error": "Job no encontrado"}), 404
+
+    if job['estado'] == JobsManager.ERROR:
+        return jsonify({"estado": job['estado'], "error": job['error']}), 409
+    if job['estado'] not in JobsManager.ESTADOS_FINALES or job['resultado'] is None:
+        return jsonify({"estado": job['estado'], "progreso": job['progreso']}), 202
+    return jsonify(job['resultado']), 200
+
+
+@app.route('/api/admin/jobs/<int:job_id>/cancelar', methods=['POST'])
+@jwt_required()
+def cancelar_job(job_id):
+    """Cancela un job; si está en proceso se detiene al terminar el día en curso"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+
+    estado = jobs_manager.solicitar_cancelacion(job_id)
+    if estado is None:
+        return jsonify({"error": "Job no encontrado"}), 404
+    return jsonify({"job_id": job_id, "estado": estado, "cancelacion_solicitada": True}), 200
+
+
+@app.route('/api/admin/jobs/<int:job_id>/reanudar', methods=['POST'])
+@jwt_required()
+def reanudar_job(job_id):
+    """Vuelve a encolar un job con error o cancelado desde su último día confirmado"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+
+    if not jobs_manager.reanudar_job(job_id):
+        return jsonify({"error": "Solo se pueden reanudar jobs con error o cancelados"}), 409
+    jobs_runner.despertar()
+    return jsonify({"job_id": job_id, "estado": JobsManager.PENDIENTE}), 202
+
+
 @app.route('/api/admin/archivos', methods=['GET'])
 @jwt_required()
 def listar_archivos():
@@ -989,7 +1222,7 @@ def listar_archivos():
 
         archivos = []
         for f in output_dir.iterdir():
-            if f.is_file() and f.suffix in ['.xlsx', '.txt']:
+            if f.is_file() and f.suffix in ['.xlsx', '.txt', '.csv', '.gz']:
                 archivos.append({
                     'nombre': f.name,
                     'tamaño': f.stat().st_size,
@@ -1005,6 +1238,16 @@ def listar_archivos():
         return jsonify({"error": "Error al listar archivos"}), 500
 
 
+@app.route('/api/admin/cache', methods=['GET'])
+@jwt_required()
+def estadisticas_cache():
+    """Aciertos, fallos y respuestas 304 de la caché de respuestas (solo admins)"""
+    claims = get_jwt()
+    if claims.get('rol') != 'admin':
+        return jsonify({"error": "No tiene permisos"}), 403
+    return jsonify(cache_respuestas.obtener_estadisticas()), 200
+
+
 # HEALTH CHECK
 @app.route('/api/health', methods=['GET'])
 def health():
@@ -1016,6 +1259,29 @@ def health():
     }), 200
 
 
+@app.route('/api/metrics', methods=['GET'])
+@limiter.limit("12 per minute")
+def metricas():
+    """
+    Métricas en formato de texto de Prometheus - sin JWT para el scraper,
+    con `Authorization: Bearer <METRICS_TOKEN>`; sin METRICS_TOKEN el
+    endpoint no existe (404)
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        return jsonify({"error": "Endpoint no encontrado"}), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({"error": "No autorizado"}), 401
+
+    for clave, valor in cache_respuestas.obtener_estadisticas().items():
+        METRICAS.fijar(f'cipa_cache_respuestas_{clave}', valor, 'Caché de respuestas: ' + clave)
+    for clave, valor in obtener_pool(str(DB_PATH)).obtener_estadisticas().items():
+        METRICAS.fijar(f'cipa_sqlite_pool_{clave}', valor, 'Pool de conexiones SQLite: ' + clave)
+
+    return app.response_class(METRICAS.exportar_prometheus(), status=200,
+                              mimetype='text/plain; version=0.0.4')
+
+
 # ERROR HANDLERS
 @app.errorhandler(404)
 def not_found(error):
@@ -1027,8 +1293,21 @@ def internal_error(error):
     return jsonify({"error": "Error interno del servidor"}), 500
 
 
+def _iniciar_jobs():
+    """Arranca el pool de jobs salvo que JOBS_WORKERS=0 (proceso solo API)"""
+    if int(os.getenv('JOBS_WORKERS', '1') or 0) > 0:
+        jobs_runner.iniciar()
+
+
 if __name__ == '__main__':
     port = int(os.getenv('API_PORT', 2500))
     logger.info(f"Iniciando API en puerto {port}")
     logger.info(f"Base de datos: {DB_PATH}")
+    # Con el recargador de debug solo el proceso hijo (el que atiende) ejecuta jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        _iniciar_jobs()
     app.run(host='0.0.0.0', port=port, debug=True)
+elif os.getenv('JOBS_EN_API') == '1':
+    # Importada por un servidor WSGI cada worker carga este módulo: los jobs los
+    # ejecuta scripts/ejecutar_jobs.py, salvo que haya un solo worker (JOBS_EN_API=1)
+    _iniciar_jobs()
@@ -10,13 +10,15 @@ Características:
 """
 
 import os
-import sqlite3
 import bcrypt
 import logging
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, Tuple
 
+from core.migraciones import asegurar_esquema
+from core.sqlite_pool import conectar
+
 logger = logging.getLogger(__name__)
 
 
@@ -39,74 +41,11 @@ class AuthManager:
         self._inicializar_tablas()
 
     def _inicializar_tablas(self):
-        """Inicializa tablas de autenticación"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # Tabla de usuarios
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                rol TEXT DEFAULT 'viewer',
-                activo INTEGER DEFAULT 1,
-                intentos_fallidos INTEGER DEFAULT 0,
-                bloqueado_hasta TIMESTAMP NULL,
-                ultimo_acceso TIMESTAMP NULL,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_modificacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Tabla de sesiones/tokens
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sesiones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                token_jti TEXT NOT NULL UNIQUE,
-                refresh_jti TEXT UNIQUE,
-                ip_address TEXT,
-                user_agent TEXT,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_expiracion TIMESTAMP NOT NULL,
-                activa INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES usuarios(id)
-            )
-        ''')
-
-        # Tabla de intentos de login
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS intentos_login (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                ip_address TEXT,
-                exitoso INTEGER NOT NULL,
-                razon_fallo TEXT,
-                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Índices
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_user ON sesiones(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_jti ON sesiones(token_jti)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_intentos_ip ON intentos_login(ip_address, fecha)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_intentos_user ON intentos_login(username, fecha)')
-
-        # Crear usuario admin por defecto si no existe
-        cursor.execute('SELECT COUNT(*) FROM usuarios WHERE username = ?', ('admin',))
-        if cursor.fetchone()[0] == 0:
-            password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
-            cursor.execute('''
-                INSERT INTO usuarios (username, password_hash, email, rol)
-                VALUES (?, ?, ?, ?)
-            ''', ('admin', password_hash.decode('utf-8'), 'admin@cipa.com', 'admin'))
-
-            logger.warning("⚠️  Usuario admin creado con contraseña por defecto. CAMBIAR INMEDIATAMENTE!")
-
-        conn.commit()
-        conn.close()
+        """
+        Deja la BD en la versión actual del esquema: las tablas de autenticación
+        y el usuario admin inicial son la migración 2 (core/migraciones.py)
+        """
+        asegurar_esquema(self.db_path)
 
     def crear_usuario(self, username: str, password: str, email: str = None, rol: str = 'viewer') -> bool:
         """
@@ -121,7 +60,7 @@ class AuthManager:
         Returns:
             True si se creó exitosamente
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         try:
@@ -156,7 +95,7 @@ class AuthManager:
         Returns:
             (bloqueado: bool, bloqueado_hasta: datetime)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -185,7 +124,7 @@ class AuthManager:
 
     def _desbloquear_usuario(self, username: str):
         """Desbloquea un usuario y resetea intentos fallidos"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -210,60 +149,62 @@ class AuthManager:
         Returns:
             (autenticado: bool, datos_usuario: dict, mensaje: str)
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
-        # Verificar bloqueo
-        bloqueado, bloqueado_hasta = self.verificar_usuario_bloqueado(username)
-        if bloqueado:
-            msg = f"Usuario bloqueado hasta {bloqueado_hasta.strftime('%Y-%m-%d %H:%M:%S')}"
-            self._registrar_intento(username, ip_address, False, msg)
-            return False, None, msg
+        try:
+            # Verificar bloqueo
+            bloqueado, bloqueado_hasta = self.verificar_usuario_bloqueado(username)
+            if bloqueado:
+                msg = f"Usuario bloqueado hasta {bloqueado_hasta.strftime('%Y-%m-%d %H:%M:%S')}"
+                self._registrar_intento(username, ip_address, False, msg)
+                return False, None, msg
+
+            # Buscar usuario
+            cursor.execute('''
+                SELECT id, username, password_hash, email, rol, activo
+                FROM usuarios
+                WHERE username = ?
+            ''', (username,))
 
-        # Buscar usuario
-        cursor.execute('''
-            SELECT id, username, password_hash, email, rol, activo
-            FROM usuarios
-            WHERE username = ?
-        ''', (username,))
+            row = cursor.fetchone()
 
-        row = cursor.fetchone()
+            if not row:
+                self._registrar_intento(username, ip_address, False, "Usuario no existe")
+                return False, None, "Credenciales inválidas"
 
-        if not row:
-            self._registrar_intento(username, ip_address, False, "Usuario no existe")
-            return False, None, "Credenciales inválidas"
-
-        user_id, username_db, password_hash, email, rol, activo = row
-
-        if not activo:
-            self._registrar_intento(username, ip_address, False, "Usuario inactivo")
-            return False, None, "Usuario inactivo"
-
-        # Verificar contraseña
-        if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
-            # Incrementar intentos fallidos
-            self._incrementar_intentos_fallidos(username)
-            self._registrar_intento(username, ip_address, False, "Contraseña incorrecta")
-            return False, None, "Credenciales inválidas"
-
-        # Autenticación exitosa
-        self._resetear_intentos_fallidos(username)
-        self._registrar_intento(username, ip_address, True, None)
-        self._actualizar_ultimo_acceso(username)
-
-        usuario = {
-            'id': user_id,
-            'username': username_db,
-            'email': email,
-            'rol': rol
-        }
+            user_id, username_db, password_hash, email, rol, activo = row
 
-        conn.close()
-        return True, usuario, "Autenticación exitosa"
+            if not activo:
+                self._registrar_intento(username, ip_address, False, "Usuario inactivo")
+                return False, None, "Usuario inactivo"
+
+            # Verificar contraseña
+            if not bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
+                # Incrementar intentos fallidos
+                self._incrementar_intentos_fallidos(username)
+                self._registrar_intento(username, ip_address, False, "Contraseña incorrecta")
+                return False, None, "Credenciales inválidas"
+
+            # Autenticación exitosa
+            self._resetear_intentos_fallidos(username)
+            self._registrar_intento(username, ip_address, True, None)
+            self._actualizar_ultimo_acceso(username)
+
+            usuario = {
+                'id': user_id,
+                'username': username_db,
+                'email': email,
+                'rol': rol
+            }
+
+            return True, usuario, "Autenticación exitosa"
+        finally:
+            conn.close()
 
     def _registrar_intento(self, username: str, ip_address: str, exitoso: bool, razon_fallo: str = None):
         """Registra un intento de login"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -276,7 +217,7 @@ class AuthManager:
 
     def _incrementar_intentos_fallidos(self, username: str, max_intentos: int = 5):
         """Incrementa contador de intentos fallidos y bloquea si es necesario"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -304,7 +245,7 @@ class AuthManager:
 
     def _resetear_intentos_fallidos(self, username: str):
         """Resetea el contador de intentos fallidos"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -319,7 +260,7 @@ class AuthManager:
 
     def _actualizar_ultimo_acceso(self, username: str):
         """Actualiza fecha de último acceso"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -334,7 +275,7 @@ class AuthManager:
     def registrar_sesion(self, user_id: int, token_jti: str, refresh_jti: str,
                         ip_address: str, user_agent: str, expires_in: int = 3600) -> bool:
         """Registra una sesión JWT"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         try:
@@ -358,7 +299,7 @@ class AuthManager:
 
     def invalidar_sesion(self, token_jti: str) -> bool:
         """Invalida una sesión (logout)"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -373,7 +314,7 @@ class AuthManager:
 
     def verificar_sesion_activa(self, token_jti: str) -> bool:
         """Verifica si una sesión está activa"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         cursor.execute('''
@@ -401,7 +342,7 @@ class AuthManager:
 
     def cambiar_contraseña(self, username: str, nueva_contraseña: str) -> bool:
         """Cambia la contraseña de un usuario"""
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         try:
@@ -434,7 +375,7 @@ class AuthManager:
         Returns:
             Diccionario con datos del usuario o None si no existe
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = conectar(self.db_path)
         cursor = conn.cursor()
 
         try:
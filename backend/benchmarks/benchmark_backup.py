@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Respaldos en Caliente
+==================================
+
+Genera una BD sintética de varios GB con el esquema real (migraciones) y
+mide con core/backup_manager.py:
+
+1. La latencia de commit de un escritor concurrente mientras se copia la BD,
+   en modo WAL y DELETE, con la copia por pasos y en un solo paso (lo que
+   bloquea al escritor y cuántas veces se reinicia la copia)
+2. El ciclo completo crear -> verificar -> restaurar por cada compresión
+   disponible: MB/s, relación de compresión y tiempos
+
+Uso:
+    python benchmarks/benchmark_backup.py [--gb 2] [--paginas-por-paso 4096]
+        [--escrituras-por-s 200] [--directorio /tmp] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.backup_manager import BackupManager, compresiones_disponibles
+from core.migraciones import aplicar_migraciones
+from core.sqlite_pool import obtener_pool
+
+FILAS_POR_LOTE = 200_000
+
+# Filas parecidas a las reales: textos repetitivos con partes variables,
+# para que la relación de compresión sea representativa
+INSERTAR_FACTURAS = '''
+    WITH RECURSIVE serie(n) AS (SELECT ? UNION ALL SELECT n + 1 FROM serie WHERE n < ?)
+    INSERT INTO facturas (numero_linea, numero_factura, indice_linea, producto, codigo_producto, nit_cliente,
+                          nombre_cliente, cantidad_original, precio_unitario, valor_total, cantidad_restante,
+                          valor_restante, tipo_inventario, fecha_factura, fecha_proceso)
+    SELECT 'FE' || n || '_P' || (n % 97), 'FE' || n, 0, 'PRODUCTO ' || (n % 500) || ' PRESENTACION ' || (n % 7),
+           'P' || printf('%05d', n % 500), '900' || printf('%06d', n % 3000),
+           'CLIENTE ' || (n % 3000) || ' S.A.S.', (n % 50) + 1, 1000 + (abs(random()) % 90000),
+           ((n % 50) + 1) * 1000.0, (n % 50) + 1, ((n % 50) + 1) * 1000.0, 'INV' || (n % 12),
+           date('2024-01-01', '+' || (n % 600) || ' days'), date('2024-01-01', '+' || (n % 600) || ' days')
+    FROM serie
+'''
+
+
+def generar_bd(db_path, gb):
+    """Crea la BD con el esquema actual y la llena de facturas hasta `gb`"""
+    aplicar_migraciones(db_path)
+    # Sin conexiones del pool abiertas se puede cambiar el modo de journal
+    obtener_pool(db_path).cerrar(incluir_en_uso=True)
+    objetivo = int(gb * 1024 ** 3)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    n = 1
+    while os.path.getsize(db_path) < objetivo:
+        conn.execute('BEGIN')
+        conn.execute(INSERTAR_FACTURAS, (n, n + FILAS_POR_LOTE - 1))
+        conn.execute('COMMIT')
+        n += FILAS_POR_LOTE
+    conn.execute('CREATE TABLE IF NOT EXISTS bench_escrituras (id INTEGER PRIMARY KEY, momento REAL)')
+    conn.close()
+    return n - 1
+
+
+def cambiar_modo(db_path, modo):
+    conn = sqlite3.connect(db_path)
+    conn.execute(f'PRAGMA journal_mode = {modo}')
+    conn.close()
+
+
+def escritor(db_path, detener, intervalo, latencias, errores):
+    """Commits pequeños a ritmo fijo, como la ingesta mientras corre el respaldo"""
+    conn = sqlite3.connect(db_path, timeout=600, isolation_level=None)
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO bench_escrituras (momento) VALUES (?)', (time.time(),))
+            conn.execute('COMMIT')
+            latencias.append(time.perf_counter() - inicio)
+        except sqlite3.OperationalError as e:
+            errores.append(str(e))
+        time.sleep(intervalo)
+    conn.close()
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def medir_copia_concurrente(db_path, directorio, modo, paginas_por_paso, args):
+    """Copia la BD (sin comprimir) con un escritor activo y devuelve tiempos y latencias"""
+    cambiar_modo(db_path, modo)
+    manager = BackupManager(directorio, paginas_por_paso=paginas_por_paso, max_reinicios=args.max_reinicios)
+    destino = manager.directorio / f'copia_{modo}_{paginas_por_paso}.db'
+
+    latencias, errores = [], []
+    detener = threading.Event()
+    hilo = threading.Thread(target=escritor, args=(db_path, detener, 1 / args.escrituras_por_s, latencias, errores))
+    hilo.start()
+    time.sleep(0.5)
+    inicio = time.perf_counter()
+    try:
+        avance = manager._copiar(db_path, destino)
+        error = None
+    except sqlite3.OperationalError as e:
+        avance, error = {'pasos': None, 'reinicios': args.max_reinicios + 1}, str(e)
+    duracion = time.perf_counter() - inicio
+    time.sleep(0.5)
+    detener.set()
+    hilo.join()
+    if destino.exists():
+        destino.unlink()
+
+    return {
+        'modo': modo,
+        'paginas_por_paso': paginas_por_paso,
+        'copia_s': round(duracion, 2),
+        'copia_mb_s': round(os.path.getsize(db_path) / 1024 ** 2 / duracion, 1) if not error else None,
+        'pasos': avance['pasos'],
+        'reinicios': avance['reinicios'],
+        'completada': error is None,
+        'commits': len(latencias),
+        'commit_p50_ms': round(statistics.median(latencias) * 1000, 2) if latencias else None,
+        'commit_p95_ms': round(percentil(latencias, 0.95) * 1000, 2) if latencias else None,
+        'commit_max_ms': round(max(latencias) * 1000, 2) if latencias else None,
+        'errores_escritor': len(errores),
+    }
+
+
+def medir_ciclo(db_path, directorio, compresion, args):
+    """crear -> verificar -> restaurar con una compresión"""
+    manager = BackupManager(os.path.join(directorio, compresion), compresion=compresion,
+                            paginas_por_paso=args.paginas_por_paso)
+    inicio = time.perf_counter()
+    m = manager.crear(db_path)
+    crear_s = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    consistente = manager.verificar(m['nombre'])['consistente']
+    verificar_s = time.perf_counter() - inicio
+
+    restaurada = os.path.join(directorio, f'restaurada_{compresion}.db')
+    inicio = time.perf_counter()
+    manager.restaurar(m['nombre'], restaurada, respaldar_actual=False)
+    restaurar_s = time.perf_counter() - inicio
+    os.unlink(restaurada)
+
+    megas = m['bytes_bd'] / 1024 ** 2
+    return {
+        'compresion': compresion,
+        'bd_mb': round(megas, 1),
+        'archivo_mb': round(m['bytes_archivo'] / 1024 ** 2, 1),
+        'relacion': round(m['bytes_bd'] / m['bytes_archivo'], 2),
+        'copia_s': m['duracion_copia_s'],
+        'compresion_s': m['duracion_compresion_s'],
+        'crear_s': round(crear_s, 2),
+        'crear_mb_s': round(megas / crear_s, 1),
+        'verificar_s': round(verificar_s, 2),
+        'restaurar_s': round(restaurar_s, 2),
+        'consistente': consistente,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de respaldos en caliente')
+    parser.add_argument('--gb', type=float, default=2, help='Tamaño de la BD sintética en GB')
+    parser.add_argument('--paginas-por-paso', type=int, default=4096, help='Páginas por paso de la copia')
+    parser.add_argument('--escrituras-por-s', type=float, default=200, help='Ritmo del escritor concurrente')
+    parser.add_argument('--max-reinicios', type=int, default=3, help='Reinicios tolerados por copia')
+    parser.add_argument('--directorio', default=None, help='Dónde crear la BD temporal (necesita ~3x --gb)')
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados en JSON')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(dir=args.directorio) as directorio:
+        db_path = os.path.join(directorio, 'bench.db')
+        inicio = time.perf_counter()
+        filas = generar_bd(db_path, args.gb)
+        generacion_s = time.perf_counter() - inicio
+        bd_mb = round(os.path.getsize(db_path) / 1024 ** 2, 1)
+
+        concurrencia = [medir_copia_concurrente(db_path, directorio, modo, paginas, args)
+                        for modo in ('wal', 'delete') for paginas in (args.paginas_por_paso, -1)]
+        cambiar_modo(db_path, 'wal')
+        ciclos = [medir_ciclo(db_path, directorio, compresion, args) for compresion in compresiones_disponibles()]
+
+    resultado = {
+        'bd_mb': bd_mb,
+        'filas_facturas': filas,
+        'generacion_s': round(generacion_s, 1),
+        'concurrencia': concurrencia,
+        'ciclos': ciclos,
+    }
+
+    if args.json:
+        print(json.dumps(resultado, indent=2))
+        return
+
+    print(f"BD sintética: {resultado['bd_mb']} MB, {filas:,} facturas (generada en {resultado['generacion_s']} s)\n")
+    print(f"{'modo':<7} {'pág/paso':>9} {'copia s':>8} {'MB/s':>7} {'pasos':>6} {'reinic.':>8} "
+          f"{'commits':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>9}")
+    for r in concurrencia:
+        print(f"{r['modo']:<7} {r['paginas_por_paso']:>9} {r['copia_s']:>8} {r['copia_mb_s']!s:>7} "
+              f"{r['pasos']!s:>6} {r['reinicios']:>8} {r['commits']:>8} {r['commit_p50_ms']!s:>8} "
+              f"{r['commit_p95_ms']!s:>8} {r['commit_max_ms']!s:>9}"
+              f"{'' if r['completada'] else '  (abortada)'}")
+    print(f"\n{'compresión':<11} {'archivo MB':>11} {'relación':>9} {'copia s':>8} {'compr. s':>9} "
+          f"{'MB/s':>7} {'verificar s':>12} {'restaurar s':>12}")
+    for r in ciclos:
+        print(f"{r['compresion']:<11} {r['archivo_mb']:>11} {r['relacion']:>9} {r['copia_s']:>8} "
+              f"{r['compresion_s']:>9} {r['crear_mb_s']:>7} {r['verificar_s']:>12} {r['restaurar_s']:>12}"
+              f"{'' if r['consistente'] else '  (INCONSISTENTE)'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Generación de Excel
+================================
+
+Mide tiempo y memoria pico (tracemalloc) de ExcelProcessor.generar_excel
+(escritura write-only en streaming) para distintos tamaños. Las facturas
+transformadas se generan sobre la marcha, de modo que la memoria pico
+refleja solo la escritura del archivo y debe mantenerse plana.
+
+El tiempo se mide en una pasada sin tracemalloc y la memoria en otra.
+
+Uso:
+    python benchmarks/benchmark_excel.py [--filas 1000 10000 100000] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'core'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from excel_processor import ExcelProcessor
+from generador_siesa import generar_filas
+
+# Filas SIESA distintas que se repiten para formar tamaños grandes
+FILAS_BASE = 5000
+
+
+def facturas_transformadas(processor, base, cantidad):
+    """Genera `cantidad` facturas transformadas recorriendo `base` en ciclo"""
+    for i in range(cantidad):
+        yield processor.transformar_factura(base[i % len(base)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de generar_excel')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados en JSON')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    processor = ExcelProcessor()
+    base = generar_filas(datetime(2025, 11, 10), FILAS_BASE, 42)
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as directorio:
+        for cantidad in args.filas:
+            ruta = os.path.join(directorio, f"facturas_{cantidad}.xlsx")
+            inicio = time.perf_counter()
+            processor.generar_excel(facturas_transformadas(processor, base, cantidad), ruta)
+            duracion = time.perf_counter() - inicio
+
+            tracemalloc.start()
+            processor.generar_excel(facturas_transformadas(processor, base, cantidad), ruta)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultados.append({
+                'filas': cantidad,
+                'tiempo_s': round(duracion, 3),
+                'filas_s': round(cantidad / duracion),
+                'memoria_pico_mb': round(pico / 1024 / 1024, 2),
+                'tamano_archivo_kb': round(os.path.getsize(ruta) / 1024, 1)
+            })
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        print(f"{'Filas':>8} | {'Tiempo (s)':>10} | {'Filas/s':>9} | {'Memoria pico (MB)':>17} | {'Archivo (KB)':>12}")
+        print('-' * 70)
+        for r in resultados:
+            print(f"{r['filas']:>8} | {r['tiempo_s']:>10} | {r['filas_s']:>9,} | "
+                  f"{r['memoria_pico_mb']:>17} | {r['tamano_archivo_kb']:>12}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Benchmark del Procesamiento Diario por Etapas
+=============================================
+
+Mide por separado cada etapa de procesar_fecha sobre un día sintético
+(generador_siesa) de distintos tamaños:
+
+- descarga: SiesaAPIClient.iterar_facturas contra un servidor SIESA local
+  (http.server) que responde {'codigo': 0, 'detalle': {'Table': [...]}}
+- filtrado: BusinessRulesValidator.filtrar_facturas
+- registro_bd: registrar_notas_credito + sincronizar_dia dentro del lote del día
+- aplicacion_notas: procesar_notas_para_facturas y confirmación del lote
+- transformacion: ExcelProcessor.transformar_factura de las facturas válidas
+- excel: ExcelProcessor.generar_excel
+
+Además informa la memoria retenida por línea como fila de la API (dict) y
+como LineaFactura (tracemalloc).
+
+Cada repetición usa una BD y un Excel nuevos en un directorio temporal; por
+etapa se informa el mejor tiempo. Los resultados en JSON (--salida) llevan el
+commit y la versión de Python para compararlos entre commits con --comparar.
+
+Uso:
+    python benchmarks/benchmark_pipeline.py [--filas 1000 10000 100000] [--repeticiones 1]
+        [--semilla 42] [--salida resultados.json] [--comparar anterior.json] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'core'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from api_client import SiesaAPIClient
+from business_rules import BusinessRulesValidator
+from excel_processor import ExcelProcessor
+from linea_factura import LineaFactura
+from notas_credito_manager import NotasCreditoManager
+from generador_siesa import generar_filas
+
+ETAPAS = ['descarga', 'filtrado', 'registro_bd', 'aplicacion_notas', 'transformacion', 'excel']
+
+FECHA = datetime(2025, 11, 10)
+
+
+class ServidorSiesaLocal:
+    """Servidor HTTP local que responde la consulta de SIESA con cuerpos ya serializados"""
+
+    def __init__(self):
+        self.cuerpos = {}  # 'FECHA_INI=...' -> bytes
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parametros = parse_qs(urlparse(self.path).query)['parametros'][0]
+                datos = servidor.cuerpos.get(parametros.split('|')[0], b'{"codigo": 0, "detalle": {"Table": []}}')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/ejecutarconsulta"
+        self.hilo = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.hilo.start()
+
+    def publicar(self, fecha: datetime, filas):
+        """Respuesta de la consulta de `fecha`; devuelve su tamaño en bytes"""
+        cuerpo = {'codigo': 0, 'mensaje': 'OK', 'detalle': {'Table': filas}}
+        self.cuerpos[f"FECHA_INI='{fecha:%Y-%m-%d}'"] = json.dumps(cuerpo).encode('utf-8')
+        return len(self.cuerpos[f"FECHA_INI='{fecha:%Y-%m-%d}'"])
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def ejecutar_dia(cliente, directorio):
+    """Procesa FECHA etapa por etapa como procesar_fecha y devuelve tiempos y conteos"""
+    tiempos = {}
+
+    inicio = time.perf_counter()
+    filas = list(cliente.iterar_facturas(FECHA))
+    tiempos['descarga'] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    validas, notas, rechazadas = BusinessRulesValidator().filtrar_facturas(filas)
+    tiempos['filtrado'] = time.perf_counter() - inicio
+
+    manager = NotasCreditoManager(os.path.join(directorio, 'benchmark.db'))
+    with manager.lote():
+        inicio = time.perf_counter()
+        manager.registrar_notas_credito(notas)
+        sincronizacion = manager.sincronizar_dia(validas, rechazadas, FECHA)
+        tiempos['registro_bd'] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        aplicaciones = manager.procesar_notas_para_facturas(sincronizacion['facturas_para_notas'])
+    tiempos['aplicacion_notas'] = time.perf_counter() - inicio
+
+    processor = ExcelProcessor()
+    inicio = time.perf_counter()
+    transformadas = [processor.transformar_factura(factura) for factura in validas]
+    tiempos['transformacion'] = time.perf_counter() - inicio
+
+    ruta = os.path.join(directorio, 'facturas.xlsx')
+    inicio = time.perf_counter()
+    processor.generar_excel(transformadas, ruta)
+    tiempos['excel'] = time.perf_counter() - inicio
+
+    conteos = {'filas_api': len(filas), 'validas': len(validas), 'notas': len(notas),
+               'rechazadas': len(rechazadas), 'aplicaciones': len(aplicaciones),
+               'excel_kb': round(os.path.getsize(ruta) / 1024, 1)}
+    return tiempos, conteos
+
+
+def memoria_por_linea(filas):
+    """Bytes retenidos por línea: filas de la API decodificadas (dict) y luego como LineaFactura"""
+    cuerpo = json.dumps(filas)
+    tracemalloc.start()
+    try:
+        inicio = tracemalloc.get_traced_memory()[0]
+        crudas = json.loads(cuerpo)
+        con_dict = tracemalloc.get_traced_memory()[0] - inicio
+        lineas = list(LineaFactura.desde_filas(crudas))
+        del crudas
+        con_registro = tracemalloc.get_traced_memory()[0] - inicio
+    finally:
+        tracemalloc.stop()
+    return {'dict': round(con_dict / len(filas)), 'linea_factura': round(con_registro / len(lineas))}
+
+
+def medir(servidor, cantidad, semilla, repeticiones):
+    filas = generar_filas(FECHA, cantidad, semilla)
+    bytes_respuesta = servidor.publicar(FECHA, filas)
+    memoria = memoria_por_linea(filas)
+    del filas
+    mejores = {}
+    with SiesaAPIClient('benchmark', 'benchmark', base_url=servidor.url, max_reintentos=0) as cliente:
+        for _ in range(repeticiones):
+            with tempfile.TemporaryDirectory() as directorio:
+                tiempos, conteos = ejecutar_dia(cliente, directorio)
+            for etapa, duracion in tiempos.items():
+                mejores[etapa] = min(duracion, mejores.get(etapa, duracion))
+
+    total = sum(mejores.values())
+    return {
+        'filas': cantidad,
+        **conteos,
+        'bytes_respuesta': bytes_respuesta,
+        'memoria_bytes_linea': memoria,
+        'etapas_s': {etapa: round(mejores[etapa], 4) for etapa in ETAPAS},
+        'total_s': round(total, 4),
+        'filas_s': round(cantidad / total) if total else 0,
+    }
+
+
+def metadatos(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'commit': commit or None,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'semilla': args.semilla,
+        'repeticiones': args.repeticiones,
+    }
+
+
+def imprimir_tabla(resultados):
+    print(f"{'Filas':>8} | " + ' | '.join(f"{etapa:>16}" for etapa in ETAPAS) + f" | {'Total (s)':>9} | {'Filas/s':>8}")
+    print('-' * (32 + 19 * len(ETAPAS)))
+    for r in resultados:
+        print(f"{r['filas']:>8} | " + ' | '.join(f"{r['etapas_s'][etapa]:>16}" for etapa in ETAPAS) +
+              f" | {r['total_s']:>9} | {r['filas_s']:>8,}")
+    print("\nMemoria por línea (bytes): " + ', '.join(
+        f"{r['filas']} filas: dict {r['memoria_bytes_linea']['dict']} / "
+        f"LineaFactura {r['memoria_bytes_linea']['linea_factura']}" for r in resultados))
+
+
+def imprimir_comparacion(anterior, actual):
+    """Relación actual/anterior por etapa (< 1 es más rápido)"""
+    previos = {r['filas']: r for r in anterior['resultados']}
+    print(f"\nComparación contra {anterior['metadatos'].get('commit')} (actual / anterior):")
+    for r in actual['resultados']:
+        previo = previos.get(r['filas'])
+        if previo is None:
+            continue
+        relaciones = [f"{etapa} {r['etapas_s'][etapa] / previo['etapas_s'][etapa]:.2f}x"
+                      for etapa in ETAPAS if previo['etapas_s'].get(etapa)]
+        print(f"{r['filas']:>8}: total {r['total_s'] / previo['total_s']:.2f}x | " + ', '.join(relaciones))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de procesar_fecha por etapas')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=1)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--salida', help='Guardar los resultados en este archivo JSON')
+    parser.add_argument('--comparar', help='Resultados JSON de otro commit para comparar')
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados en JSON')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    servidor = ServidorSiesaLocal()
+    try:
+        informe = {
+            'metadatos': metadatos(args),
+            'resultados': [medir(servidor, cantidad, args.semilla, args.repeticiones)
+                           for cantidad in args.filas],
+        }
+    finally:
+        servidor.detener()
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(informe, archivo, indent=2)
+
+    if args.json:
+        print(json.dumps(informe, indent=2))
+    else:
+        imprimir_tabla(informe['resultados'])
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            imprimir_comparacion(json.load(archivo), informe)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
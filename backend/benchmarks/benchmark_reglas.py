@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Reglas de Negocio
+==============================
+
+Compara el rendimiento (líneas por segundo) de BusinessRulesValidator.filtrar_facturas
+(plan compilado) contra filtrar_facturas_referencia (línea por línea, en
+referencia_reglas.py) y verifica
+que ambos produzcan exactamente las mismas listas y razones de rechazo.
+
+Uso:
+    python benchmarks/benchmark_reglas.py [--filas 1000 10000 100000] [--repeticiones 3] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'core'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from business_rules import BusinessRulesValidator
+from linea_factura import LineaFactura
+from generador_siesa import generar_filas
+from referencia_reglas import filtrar_facturas_referencia, posiciones
+
+
+def medir(funcion, filas, repeticiones):
+    """Mejor tiempo de `repeticiones` ejecuciones (s) y el último resultado"""
+    mejor = None
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(filas)
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, resultado
+
+
+def firma(resultado, filas):
+    """Representación comparable de (válidas, notas, rechazadas)"""
+    posicion = posiciones(filas)
+
+    def indice(linea):
+        # filtrar_facturas entrega LineaFactura; la referencia, las filas de la API sin modificar
+        return linea.indice_linea if isinstance(linea, LineaFactura) else posicion[id(linea)]
+
+    validas, notas, rechazadas = resultado
+    return ([indice(f) for f in validas],
+            [indice(f) for f in notas],
+            [(indice(r['factura']), r['razon_rechazo']) for r in rechazadas])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de filtrar_facturas')
+    parser.add_argument('--filas', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=42)
+    parser.add_argument('--sin-logs', action='store_true',
+                        help='Desactivar logging (por defecto nivel INFO hacia /dev/null, como en producción)')
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados en JSON')
+    args = parser.parse_args()
+
+    if args.sin_logs:
+        logging.disable(logging.CRITICAL)
+    else:
+        logging.basicConfig(level=logging.INFO, stream=open(os.devnull, 'w'), force=True)
+    validator = BusinessRulesValidator()
+
+    resultados = []
+    for cantidad in args.filas:
+        filas = generar_filas(datetime(2025, 11, 10), cantidad, args.semilla)
+        t_ref, r_ref = medir(lambda f: filtrar_facturas_referencia(validator, f), filas, args.repeticiones)
+        t_plan, r_plan = medir(validator.filtrar_facturas, filas, args.repeticiones)
+        resultados.append({
+            'filas': cantidad,
+            'referencia_s': round(t_ref, 4),
+            'compilado_s': round(t_plan, 4),
+            'referencia_lineas_s': round(cantidad / t_ref),
+            'compilado_lineas_s': round(cantidad / t_plan),
+            'aceleracion': round(t_ref / t_plan, 2),
+            'equivalente': firma(r_ref, filas) == firma(r_plan, filas)
+        })
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        print(f"{'Filas':>8} | {'Referencia (líneas/s)':>22} | {'Compilado (líneas/s)':>21} | {'x':>6} | Equivalente")
+        print('-' * 80)
+        for r in resultados:
+            print(f"{r['filas']:>8} | {r['referencia_lineas_s']:>22,} | {r['compilado_lineas_s']:>21,} | "
+                  f"{r['aceleracion']:>6} | {'SI' if r['equivalente'] else 'NO'}")
+
+    return 0 if all(r['equivalente'] for r in resultados) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
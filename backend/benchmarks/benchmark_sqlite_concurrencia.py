@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Benchmark de Lecturas Concurrentes Durante la Ingesta
+=====================================================
+
+Mide la latencia de las consultas del dashboard mientras un hilo escritor
+registra días completos (filtrar + lote de NotasCreditoManager), con dos
+configuraciones del pool de conexiones (core/sqlite_pool.py):
+
+- sin_pool: journal DELETE, synchronous FULL, caché por defecto y una
+  conexión nueva por consulta (comportamiento anterior)
+- pool: WAL, synchronous NORMAL, caché/mmap ampliados y conexiones reutilizadas
+
+Cada configuración corre en un subproceso con su propia BD temporal.
+
+Uso:
+    python benchmarks/benchmark_sqlite_concurrencia.py [--filas 5000]
+        [--dias-base 5] [--dias-ingesta 3] [--lectores 4] [--json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'core'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from business_rules import BusinessRulesValidator
+from notas_credito_manager import NotasCreditoManager
+from sqlite_pool import conectar, obtener_pool
+from generador_siesa import generar_filas
+
+MODOS = {
+    'sin_pool': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE_KB': '2000',
+        'SQLITE_MMAP_SIZE_MB': '0',
+        'SQLITE_BUSY_TIMEOUT_MS': '5000',
+        'SQLITE_POOL_MAX': '0',
+    },
+    'pool': {},
+}
+
+# Consultas representativas del dashboard y los listados
+CONSULTAS_LECTURA = [
+    'SELECT COUNT(*), SUM(valor_total) FROM facturas',
+    'SELECT COUNT(*) FROM facturas WHERE nota_aplicada = 1',
+    'SELECT COUNT(*), SUM(valor_total) FROM facturas_rechazadas',
+    "SELECT COUNT(*), SUM(saldo_pendiente) FROM notas_credito WHERE estado = 'PENDIENTE'",
+    'SELECT * FROM facturas ORDER BY fecha_factura DESC LIMIT 50',
+]
+
+FECHA_INICIAL = datetime(2025, 6, 2)
+
+
+def registrar_dia(manager, validator, fecha, filas, semilla):
+    facturas_raw = generar_filas(fecha, filas, semilla)
+    validas, notas, rechazadas = validator.filtrar_facturas(facturas_raw)
+    with manager.lote():
+        manager.registrar_notas_credito(notas)
+        manager.registrar_facturas_rechazadas(rechazadas)
+        if validas:
+            manager.registrar_facturas(validas)
+            manager.procesar_notas_para_facturas(validas)
+
+
+def lector(db_path, detener, latencias, errores):
+    while not detener.is_set():
+        inicio = time.perf_counter()
+        try:
+            conn = conectar(db_path)
+            conn.row_factory = sqlite3.Row
+            for sql in CONSULTAS_LECTURA:
+                conn.execute(sql).fetchall()
+            conn.close()
+        except sqlite3.OperationalError as e:
+            errores.append(str(e))
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(int(len(ordenados) * p), len(ordenados) - 1)]
+
+
+def ejecutar_modo(modo, args):
+    """Corre una configuración completa en este proceso"""
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as directorio:
+        db_path = os.path.join(directorio, 'bench.db')
+        manager = NotasCreditoManager(db_path)
+        validator = BusinessRulesValidator()
+
+        for d in range(args.dias_base):
+            registrar_dia(manager, validator, FECHA_INICIAL + timedelta(days=d), args.filas, d)
+
+        # Lectores sin escritor (referencia)
+        latencias_reposo, errores_reposo = [], []
+        detener = threading.Event()
+        hilos = [threading.Thread(target=lector, args=(db_path, detener, latencias_reposo, errores_reposo))
+                 for _ in range(args.lectores)]
+        for h in hilos:
+            h.start()
+        time.sleep(1.0)
+        detener.set()
+        for h in hilos:
+            h.join()
+
+        # Lectores mientras se ingieren días
+        latencias, errores = [], []
+        detener = threading.Event()
+        hilos = [threading.Thread(target=lector, args=(db_path, detener, latencias, errores))
+                 for _ in range(args.lectores)]
+        for h in hilos:
+            h.start()
+
+        inicio = time.perf_counter()
+        for d in range(args.dias_base, args.dias_base + args.dias_ingesta):
+            registrar_dia(manager, validator, FECHA_INICIAL + timedelta(days=d), args.filas, d)
+        duracion_ingesta = time.perf_counter() - inicio
+
+        detener.set()
+        for h in hilos:
+            h.join()
+
+        return {
+            'modo': modo,
+            'filas_por_dia': args.filas,
+            'lectores': args.lectores,
+            'ingesta_s': round(duracion_ingesta, 3),
+            'lecturas_reposo_por_s': round(len(latencias_reposo) / 1.0, 1),
+            'lecturas': len(latencias),
+            'lecturas_por_s': round(len(latencias) / duracion_ingesta, 1),
+            'latencia_p50_ms': round(statistics.median(latencias) * 1000, 2) if latencias else None,
+            'latencia_p95_ms': round(percentil(latencias, 0.95) * 1000, 2) if latencias else None,
+            'latencia_max_ms': round(max(latencias) * 1000, 2) if latencias else None,
+            'errores_bloqueo': len(errores),
+            'pool': obtener_pool(db_path).obtener_estadisticas(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de lecturas concurrentes durante la ingesta')
+    parser.add_argument('--filas', type=int, default=5000, help='Filas SIESA por día')
+    parser.add_argument('--dias-base', type=int, default=5, help='Días cargados antes de medir')
+    parser.add_argument('--dias-ingesta', type=int, default=3, help='Días ingeridos durante la medición')
+    parser.add_argument('--lectores', type=int, default=4, help='Hilos lectores concurrentes')
+    parser.add_argument('--modo', choices=list(MODOS), help=argparse.SUPPRESS)
+    parser.add_argument('--json', action='store_true', help='Imprimir resultados en JSON')
+    args = parser.parse_args()
+
+    if args.modo:
+        print(json.dumps(ejecutar_modo(args.modo, args)))
+        return
+
+    resultados = []
+    for modo, entorno in MODOS.items():
+        comando = [sys.executable, __file__, '--modo', modo,
+                   '--filas', str(args.filas), '--dias-base', str(args.dias_base),
+                   '--dias-ingesta', str(args.dias_ingesta), '--lectores', str(args.lectores)]
+        salida = subprocess.run(comando, env={**os.environ, **entorno}, capture_output=True,
+                                text=True, check=True)
+        resultados.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+        return
+
+    print(f"{'modo':<10} {'ingesta s':>10} {'lect/s':>8} {'reposo/s':>9} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'max ms':>8} {'bloqueos':>9}")
+    for r in resultados:
+        print(f"{r['modo']:<10} {r['ingesta_s']:>10} {r['lecturas_por_s']:>8} {r['lecturas_reposo_por_s']:>9} "
+              f"{r['latencia_p50_ms']!s:>8} {r['latencia_p95_ms']!s:>8} {r['latencia_max_ms']!s:>8} "
+              f"{r['errores_bloqueo']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Generador de Datos SIESA Sintéticos
+===================================
+
+Genera filas con la misma forma que Api_Consulta_Fac_Correagro
+(detalle.Table) para benchmarks reproducibles: la misma semilla produce
+siempre las mismas filas.
+
+Mezcla facturas de varias líneas, notas crédito (prefijo N), tipos de
+inventario excluidos, valores con espacios, líneas sin tipo, agentes de
+retención excluidos y condiciones de pago / IVA / unidades variadas.
+"""
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+PREFIJOS_FACTURA = ['FEM', 'FEC', 'FE']
+PREFIJOS_NOTA = ['NCE', 'NC']
+TIPOS_INVENTARIO = ['INVPT', 'INVAGRO', 'INVMEDICAD', 'VS420510', 'DESCUENTO', ' INVPT ', None]
+CONDICIONES_PAGO = ['CREDITO 30 DIAS', 'CONTADO', '8 DIAS', '60 DIAS']
+GRUPOS_IMPOSITIVOS = ['IVA 5% RTF', 'IVA 19%', 'EXCLUIDO']
+CIUDADES = ['001-Pereira', 'Cali', 'Manizales', None]
+UNIDADES = [('BULTO', 'BT40'), ('KILO', 'KLS'), ('UNIDAD', 'UND'), ('LITRO', '800G')]
+AGENTES_RETENCION = ['', '0001 - AGENTE DE RETENCION', '0002 - NO AGENTE DE RETENCION', '']
+
+
+def generar_filas(fecha: datetime, cantidad: int, semilla: int = 0,
+                  proporcion_notas: float = 0.1) -> List[Dict]:
+    """
+    Genera `cantidad` filas para una fecha
+
+    Args:
+        fecha: Fecha de las facturas (f_fecha)
+        cantidad: Número de filas (líneas) a generar
+        semilla: Semilla del generador aleatorio
+        proporcion_notas: Fracción aproximada de documentos que son notas crédito
+
+    Returns:
+        Lista de filas en el formato de la API
+    """
+    rnd = random.Random(f"{fecha:%Y%m%d}-{semilla}")
+    clientes = [f"9001{i:05d}" for i in range(max(cantidad // 60, 30))]
+    productos = [f"P{i:04d}" for i in range(max(cantidad // 50, 40))]
+    filas = []
+    documento = 0
+    while len(filas) < cantidad:
+        documento += 1
+        es_nota = rnd.random() < proporcion_notas
+        prefijo = rnd.choice(PREFIJOS_NOTA if es_nota else PREFIJOS_FACTURA)
+        cliente = rnd.choice(clientes)
+        agente = rnd.choice(AGENTES_RETENCION)
+        for _ in range(min(rnd.randint(1, 6), cantidad - len(filas))):
+            cantidad_base = rnd.choice([1, 2, 5, 10, 25, 40])
+            valor = cantidad_base * rnd.choice([20000, 50000, 150000, 300000])
+            if es_nota and rnd.random() < 0.05:
+                valor = 0
+            um_inv, um_base = rnd.choice(UNIDADES)
+            filas.append({
+                'f_prefijo': prefijo,
+                'f_nrodocto': int(fecha.strftime('%y%j')) * 100000 + documento,
+                'f_fecha': fecha.strftime('%Y-%m-%dT00:00:00'),
+                'f_cod_item': rnd.choice(productos),
+                'f_desc_item': 'DESCUENTO COMERCIAL' if rnd.random() < 0.02 else 'PRODUCTO AGRICOLA',
+                'f_cliente_desp': cliente,
+                'f_cliente_fact_razon_soc': f"CLIENTE {cliente}",
+                'f_cant_base': cantidad_base,
+                'f_valor_subtotal_local': valor,
+                'f_cod_tipo_inv': rnd.choice(TIPOS_INVENTARIO),
+                'f_desc_tipo_inv': 'TIPO INVENTARIO',
+                'f_desc_cond_pago': rnd.choice(CONDICIONES_PAGO),
+                'f_desc_grupo_impositivo': rnd.choice(GRUPOS_IMPOSITIVOS),
+                'f_ciudad_punto_envio': rnd.choice(CIUDADES),
+                'f_um_inv_desc': um_inv,
+                'f_um_base': um_base,
+                'f_02_014': agente,
+                'f_notas_causal_dev': 'DEVOLUCION' if es_nota else None,
+            })
+    return filas
+
+
+def generar_rango(fecha_desde: datetime, dias: int, filas_por_dia: int, semilla: int = 0) -> Dict[str, List[Dict]]:
+    """Genera {YYYY-MM-DD: filas} para `dias` días consecutivos"""
+    return {
+        (fecha_desde + timedelta(days=i)).strftime('%Y-%m-%d'):
+            generar_filas(fecha_desde + timedelta(days=i), filas_por_dia, semilla)
+        for i in range(dias)
+    }
@@ -0,0 +1,48 @@
+"""
+Implementación de Referencia de la Aplicación de Notas
+======================================================
+
+procesar_notas_para_facturas línea por línea, como era antes del motor en
+memoria de NotasCreditoManager: cada línea consulta las notas pendientes de
+su cliente y producto (obtener_notas_pendientes, FIFO por fecha_nota) y
+aplica cada una con aplicar_nota_a_factura, que escribe en la BD. No forma
+parte del procesamiento: test_motor_notas.py la usa para verificar que ambos
+motores dejen las mismas tablas.
+"""
+
+import logging
+from typing import Dict, List
+
+try:
+    from core.notas_credito_manager import NotasCreditoManager
+except ImportError:
+    from notas_credito_manager import NotasCreditoManager
+
+logger = logging.getLogger(__name__)
+
+
+def procesar_notas_referencia(manager: NotasCreditoManager, facturas: List) -> List[Dict]:
+    """
+    Aplica las notas pendientes a las facturas una línea y una nota a la vez
+
+    Args:
+        manager: Gestor sobre la BD (puede tener un lote activo)
+        facturas: Las mismas facturas que recibe procesar_notas_para_facturas
+
+    Returns:
+        Lista de aplicaciones realizadas
+    """
+    aplicaciones = []
+
+    for factura in facturas:
+        datos = manager._datos_factura_para_nota(factura)
+        if not datos['nit_cliente'] or not datos['codigo_producto']:
+            continue
+
+        for nota in manager.obtener_notas_pendientes(datos['nit_cliente'], datos['codigo_producto']):
+            aplicacion = manager.aplicar_nota_a_factura(nota, factura)
+            if aplicacion:
+                aplicaciones.append(aplicacion)
+
+    logger.info(f"Se realizaron {len(aplicaciones)} aplicaciones de notas crédito (referencia)")
+    return aplicaciones
@@ -0,0 +1,155 @@
+"""
+Implementación de Referencia de las Reglas de Negocio
+=====================================================
+
+filtrar_facturas línea por línea, como era antes del plan compilado de
+BusinessRulesValidator. No forma parte del procesamiento: benchmark_reglas.py
+la usa para medir la aceleración y ambos (el benchmark y
+test_razones_rechazo.py) para verificar que el resultado sea el mismo.
+"""
+
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    from core.business_rules import BusinessRulesValidator
+    from core.razones_rechazo import (razon, MONTO_MINIMO, NO_AGENTE_RETENCION,
+                                      NOTA_TIPO_INVENTARIO, TIPO_INVENTARIO)
+except ImportError:
+    from business_rules import BusinessRulesValidator
+    from razones_rechazo import (razon, MONTO_MINIMO, NO_AGENTE_RETENCION,
+                                 NOTA_TIPO_INVENTARIO, TIPO_INVENTARIO)
+
+logger = logging.getLogger(__name__)
+
+
+def posiciones(filas: List[Dict]) -> Dict[int, int]:
+    """Posición de cada fila de entrada por id(), el indice_linea que le asigna filtrar_facturas"""
+    return {id(fila): i for i, fila in enumerate(filas)}
+
+
+def filtrar_facturas_referencia(validator: BusinessRulesValidator, facturas: Iterable[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Implementación línea por línea de BusinessRulesValidator.filtrar_facturas
+    (sin plan compilado), con las reglas del validador
+
+    El monto mínimo se valida por FACTURA ACOPLADA (líneas sumadas por
+    prefijo+número) sobre el total de las líneas procesables (tipo de
+    inventario permitido). No modifica las filas: las entrega tal como
+    llegaron, sin indice_linea (ver posiciones()).
+
+    Returns:
+        (facturas_validas, notas_credito, facturas_rechazadas) con las filas de la API
+    """
+    facturas_validas = []
+    notas_credito = []
+    facturas_rechazadas = []
+
+    # Separar notas crédito y validar tipo de inventario
+    # IMPORTANTE: Las notas de crédito con prefijo 'N' se aceptan
+    # SOLO si su tipo de inventario NO está en TIPOS_INVENTARIO_EXCLUIDOS
+    facturas_regulares = []
+    total_documentos = 0
+    for factura in facturas:
+        total_documentos += 1
+
+        if validator.es_nota_credito(factura):
+            tipo_inv = validator._obtener_tipo_inventario_normalizado(factura)
+            # Validar tipo de inventario en notas de crédito
+            if not validator.tipo_inventario_permitido(factura):
+                facturas_rechazadas.append({
+                    'factura': factura,
+                    **razon(NOTA_TIPO_INVENTARIO, tipo_inventario=tipo_inv)
+                })
+                logger.warning(f"❌ Nota crédito rechazada: {factura.get('f_prefijo', '')}{factura.get('f_nrodocto', '')} - Tipo inventario excluido: '{tipo_inv}'")
+            else:
+                notas_credito.append(factura)
+                logger.debug(f"✅ Nota crédito aceptada: {factura.get('f_prefijo', '')}{factura.get('f_nrodocto', '')} - Tipo inventario: '{tipo_inv}'")
+        else:
+            # VALIDACIÓN CRÍTICA: Verificar f_02_014 (agente de retención)
+            if validator.es_agente_retencion_no_permitido(factura):
+                facturas_rechazadas.append({
+                    'factura': factura,
+                    **razon(NO_AGENTE_RETENCION, agente_retencion=factura.get('f_02_014', ''))
+                })
+            else:
+                facturas_regulares.append(factura)
+
+    logger.info(f"Total documentos: {total_documentos} ({len(facturas_regulares)} facturas, {len(notas_credito)} notas crédito válidas, {len(facturas_rechazadas)} documentos rechazados)")
+
+    # Agrupar facturas regulares por número completo
+    facturas_agrupadas = validator.agrupar_por_factura(facturas_regulares)
+
+    logger.info(f"Facturas únicas a validar: {len(facturas_agrupadas)}")
+
+    # Procesar cada factura completa
+    for numero_factura, lineas in facturas_agrupadas.items():
+        total_factura_bruta = validator.calcular_total_factura(lineas)
+
+        # Validar tipo de inventario por línea
+        lineas_validas_factura = []
+        lineas_rechazadas_factura = []
+
+        for linea in lineas:
+            if not validator.tipo_inventario_permitido(linea):
+                tipo_inv = validator._obtener_tipo_inventario_normalizado(linea)
+                lineas_rechazadas_factura.append({
+                    'factura': linea,
+                    **razon(TIPO_INVENTARIO, tipo_inventario=tipo_inv)
+                })
+            else:
+                lineas_validas_factura.append(linea)
+
+        # Si todas las líneas de la factura fueron rechazadas por tipo de inventario
+        if len(lineas_validas_factura) == 0 and len(lineas_rechazadas_factura) > 0:
+            facturas_rechazadas.extend(lineas_rechazadas_factura)
+            logger.info(f"Factura rechazada por tipo inventario: {numero_factura} - {len(lineas)} líneas")
+            continue
+
+        total_factura_procesable = validator.calcular_total_factura(lineas_validas_factura)
+
+        # Validar monto mínimo sobre líneas procesables de la factura acoplada
+        if total_factura_procesable < validator.MONTO_MINIMO:
+            rechazo = razon(MONTO_MINIMO, total_procesable=total_factura_procesable,
+                            monto_minimo=validator.MONTO_MINIMO)
+
+            for linea in lineas_validas_factura:
+                facturas_rechazadas.append({
+                    'factura': linea,
+                    **rechazo
+                })
+
+            if lineas_rechazadas_factura:
+                facturas_rechazadas.extend(lineas_rechazadas_factura)
+
+            logger.info(
+                f"Factura rechazada por monto procesable: {numero_factura} - "
+                f"Total bruto: ${total_factura_bruta:,.2f}, "
+                f"Total procesable: ${total_factura_procesable:,.2f} "
+                f"({len(lineas_validas_factura)} líneas válidas, {len(lineas_rechazadas_factura)} rechazadas)"
+            )
+            continue
+
+        # Si al menos una línea es válida y el total procesable cumple el mínimo
+        facturas_validas.extend(lineas_validas_factura)
+
+        if len(lineas_rechazadas_factura) > 0:
+            facturas_rechazadas.extend(lineas_rechazadas_factura)
+            logger.info(
+                f"Factura {numero_factura}: total bruto ${total_factura_bruta:,.2f}, "
+                f"total procesable ${total_factura_procesable:,.2f}, "
+                f"{len(lineas_validas_factura)} líneas válidas, "
+                f"{len(lineas_rechazadas_factura)} líneas rechazadas por tipo inventario"
+            )
+        else:
+            logger.info(
+                f"Factura válida: {numero_factura} - "
+                f"Total acoplado procesable: ${total_factura_procesable:,.2f} ({len(lineas)} líneas)"
+            )
+
+    logger.info(f"\nRESUMEN FILTRADO:")
+    logger.info(f"  - Líneas válidas: {len(facturas_validas)}")
+    logger.info(f"  - Notas crédito: {len(notas_credito)}")
+    logger.info(f"  - Líneas rechazadas: {len(facturas_rechazadas)}")
+
+    return facturas_validas, notas_credito, facturas_rechazadas
@@ -0,0 +1,390 @@
+"""
+Módulo de Agregados Materializados del Dashboard
+Mantiene contadores y sumas de facturas, rechazadas, notas crédito y
+aplicaciones para que /api/dashboard y los endpoints de estadísticas no
+recorran las tablas completas en cada carga.
+
+ESTRUCTURA DE BD:
+- resumen_totales: Una sola fila con los contadores y sumas globales, más
+  version_datos (se incrementa con cada fila insertada, modificada o
+  eliminada; la usa la caché de respuestas de la API)
+- resumen_notas_estado: Cantidad y saldo pendiente de notas por estado
+
+Los valores se actualizan con triggers AFTER INSERT / UPDATE / DELETE sobre
+las tablas base, dentro de la misma transacción que el cambio (ingesta,
+aplicación de notas, rechazos o correcciones manuales). `verificar()`
+recalcula todo desde cero y reporta la diferencia.
+
+Las filas movidas al archivo histórico (archivo_manager) siguen contando: sus
+totales quedan en archivo_meses y se suman al recalcular.
+"""
+import json
+import logging
+import sqlite3
+from typing import Dict, List, Tuple
+
+try:
+    from core.sqlite_pool import conectar
+except ImportError:
+    from sqlite_pool import conectar
+
+logger = logging.getLogger(__name__)
+
+
+# Columnas de resumen_totales: (columna, tabla base, tipo, expresión por fila con X = NEW/OLD)
+COLUMNAS_TOTALES: List[Tuple[str, str, str, str]] = [
+    ('facturas_cantidad', 'facturas', 'INTEGER', '1'),
+    ('facturas_valor_total', 'facturas', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('facturas_con_nota', 'facturas', 'INTEGER', 'CASE WHEN X.nota_aplicada = 1 THEN 1 ELSE 0 END'),
+    ('facturas_descuento_cantidad', 'facturas', 'REAL', 'COALESCE(X.descuento_cantidad, 0)'),
+    ('facturas_descuento_valor', 'facturas', 'REAL', 'COALESCE(X.descuento_valor, 0)'),
+    ('facturas_descuento_con_nota', 'facturas', 'REAL',
+     'CASE WHEN X.nota_aplicada = 1 THEN COALESCE(X.descuento_valor, 0) ELSE 0 END'),
+    ('rechazadas_cantidad', 'facturas_rechazadas', 'INTEGER', '1'),
+    ('rechazadas_valor_total', 'facturas_rechazadas', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('notas_cantidad', 'notas_credito', 'INTEGER', '1'),
+    ('notas_valor_total', 'notas_credito', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('aplicaciones_cantidad', 'aplicaciones_notas', 'INTEGER', '1'),
+    ('aplicaciones_valor', 'aplicaciones_notas', 'REAL', 'COALESCE(X.valor_aplicado, 0)'),
+]
+
+# Columnas de cada tabla base que afectan los totales (disparan el trigger UPDATE)
+COLUMNAS_VIGILADAS = {
+    'facturas': ['valor_total', 'nota_aplicada', 'descuento_cantidad', 'descuento_valor'],
+    'facturas_rechazadas': ['valor_total'],
+    'notas_credito': ['valor_total'],
+    'aplicaciones_notas': ['valor_aplicado'],
+}
+
+# Diferencia tolerada entre el valor materializado y el recalculado (sumas REAL)
+TOLERANCIA = 0.01
+
+
+class AgregadosManager:
+    """Instala, consulta y verifica los agregados materializados"""
+
+    def __init__(self, db_path: str = './data/notas_credito.db'):
+        self.db_path = db_path
+        self._instalado = False
+
+    # =========================================================================
+    # INSTALACIÓN
+    # =========================================================================
+
+    @staticmethod
+    def _sql_triggers() -> List[str]:
+        sentencias = []
+        for tabla, vigiladas in COLUMNAS_VIGILADAS.items():
+            columnas = [(col, expr) for col, t, _, expr in COLUMNAS_TOTALES if t == tabla]
+
+            def delta(signo: str, fila: str) -> str:
+                return ', '.join([f"{col} = {col} {signo} {expr.replace('X.', fila + '.')}"
+                                  for col, expr in columnas] + ['version_datos = version_datos + 1'])
+
+            sentencias.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_ins AFTER INSERT ON {tabla}
+                BEGIN
+                    UPDATE resumen_totales SET {delta('+', 'NEW')} WHERE id = 1;
+                END
+            ''')
+            sentencias.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_del AFTER DELETE ON {tabla}
+                BEGIN
+                    UPDATE resumen_totales SET {delta('-', 'OLD')} WHERE id = 1;
+                END
+            ''')
+            sentencias.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_upd
+                AFTER UPDATE OF {', '.join(vigiladas)} ON {tabla}
+                BEGIN
+                    UPDATE resumen_totales SET {delta('-', 'OLD')} WHERE id = 1;
+                    UPDATE resumen_totales SET {delta('+', 'NEW')} WHERE id = 1;
+                END
+            ''')
+            # Cualquier otra columna modificada también cambia las respuestas de la API
+            sentencias.append(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_resumen_{tabla}_version
+                AFTER UPDATE ON {tabla}
+                BEGIN
+                    UPDATE resumen_totales SET version_datos = version_datos + 1 WHERE id = 1;
+                END
+            ''')
+
+        # Notas por estado: la fila del estado se crea la primera vez que aparece
+        sentencias.append('''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_notas_estado_ins AFTER INSERT ON notas_credito
+            BEGIN
+                INSERT OR IGNORE INTO resumen_notas_estado (estado) VALUES (IFNULL(NEW.estado, ''));
+                UPDATE resumen_notas_estado
+                SET cantidad = cantidad + 1, saldo_pendiente = saldo_pendiente + COALESCE(NEW.saldo_pendiente, 0)
+                WHERE estado = IFNULL(NEW.estado, '');
+            END
+        ''')
+        sentencias.append('''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_notas_estado_del AFTER DELETE ON notas_credito
+            BEGIN
+                UPDATE resumen_notas_estado
+                SET cantidad = cantidad - 1, saldo_pendiente = saldo_pendiente - COALESCE(OLD.saldo_pendiente, 0)
+                WHERE estado = IFNULL(OLD.estado, '');
+            END
+        ''')
+        sentencias.append('''
+            CREATE TRIGGER IF NOT EXISTS trg_resumen_notas_estado_upd
+            AFTER UPDATE OF estado, saldo_pendiente ON notas_credito
+            BEGIN
+                UPDATE resumen_notas_estado
+                SET cantidad = cantidad - 1, saldo_pendiente = saldo_pendiente - COALESCE(OLD.saldo_pendiente, 0)
+                WHERE estado = IFNULL(OLD.estado, '');
+                INSERT OR IGNORE INTO resumen_notas_estado (estado) VALUES (IFNULL(NEW.estado, ''));
+                UPDATE resumen_notas_estado
+                SET cantidad = cantidad + 1, saldo_pendiente = saldo_pendiente + COALESCE(NEW.saldo_pendiente, 0)
+                WHERE estado = IFNULL(NEW.estado, '');
+            END
+        ''')
+        return sentencias
+
+    @classmethod
+    def _nombres_triggers(cls) -> List[str]:
+        nombres = []
+        for tabla in COLUMNAS_VIGILADAS:
+            nombres += [f'trg_resumen_{tabla}_ins', f'trg_resumen_{tabla}_del', f'trg_resumen_{tabla}_upd',
+                        f'trg_resumen_{tabla}_version']
+        nombres += ['trg_resumen_notas_estado_ins', 'trg_resumen_notas_estado_del',
+                    'trg_resumen_notas_estado_upd']
+        return nombres
+
+    @classmethod
+    def instalar(cls, conn: sqlite3.Connection) -> bool:
+        """
+        Crea las tablas de resumen y los triggers si falta alguno, y en ese
+        caso recalcula los valores desde cero en la misma transacción (BD
+        existentes, tablas base recreadas por una migración o instalaciones
+        de una versión anterior, cuyos triggers se reemplazan).
+
+        Requiere que las tablas base ya existan. Confirma la transacción.
+
+        Returns:
+            True si hubo que instalar / recalcular
+        """
+        existentes = {fila[0] for fila in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_resumen_%'")}
+        columnas_tabla = {fila[1] for fila in conn.execute('PRAGMA table_info(resumen_totales)')}
+        if 'version_datos' in columnas_tabla and set(cls._nombres_triggers()) <= existentes:
+            return False
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            columnas = ',\n'.join(f'{col} {tipo} NOT NULL DEFAULT 0' for col, _, tipo, _ in COLUMNAS_TOTALES)
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS resumen_totales (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    {columnas},
+                    version_datos INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            if columnas_tabla and 'version_datos' not in columnas_tabla:
+                conn.execute('ALTER TABLE resumen_totales ADD COLUMN version_datos INTEGER NOT NULL DEFAULT 0')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS resumen_notas_estado (
+                    estado TEXT PRIMARY KEY,
+                    cantidad INTEGER NOT NULL DEFAULT 0,
+                    saldo_pendiente REAL NOT NULL DEFAULT 0
+                )
+            ''')
+            for nombre in cls._nombres_triggers():
+                conn.execute(f'DROP TRIGGER IF EXISTS {nombre}')
+            for sentencia in cls._sql_triggers():
+                conn.execute(sentencia)
+            cls._escribir(conn, cls._calcular(conn))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        logger.info("Agregados del dashboard instalados y recalculados")
+        return True
+
+    def asegurar_instalado(self):
+        if self._instalado:
+            return
+        conn = conectar(self.db_path)
+        try:
+            self.instalar(conn)
+        finally:
+            conn.close()
+        self._instalado = True
+
+    # =========================================================================
+    # CÁLCULO DESDE CERO
+    # =========================================================================
+
+    @staticmethod
+    def totales_tabla(conn: sqlite3.Connection, tabla: str, where: str = '', params: tuple = ()) -> Dict:
+        """Columnas de resumen_totales de una tabla base, calculadas sobre sus filas (con filtro opcional)"""
+        columnas = [(col, expr) for col, t, _, expr in COLUMNAS_TOTALES if t == tabla]
+        sumas = ', '.join(f"COALESCE(SUM({expr.replace('X.', '')}), 0)" for _, expr in columnas)
+        fila = conn.execute(f'SELECT {sumas} FROM {tabla}{where}', params).fetchone()
+        return {col: valor for (col, _), valor in zip(columnas, fila)}
+
+    @staticmethod
+    def ajustar(conn: sqlite3.Connection, totales: Dict, signo: int = 1):
+        """
+        Suma (o resta, signo=-1) valores a resumen_totales sin pasar por los
+        triggers. La usa el archivo histórico: las filas que salen de la BD
+        siguen contando en los totales.
+        """
+        if not totales:
+            return
+        conn.execute(
+            f"UPDATE resumen_totales SET {', '.join(f'{col} = {col} + ?' for col in totales)} WHERE id = 1",
+            [signo * valor for valor in totales.values()]
+        )
+
+    @classmethod
+    def _calcular(cls, conn: sqlite3.Connection) -> Dict:
+        """Recorre las tablas base (y los totales de los meses archivados) y calcula todos los agregados"""
+        totales = {}
+        for tabla in COLUMNAS_VIGILADAS:
+            totales.update(cls.totales_tabla(conn, tabla))
+
+        archivo = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archivo_meses'").fetchone()
+        if archivo:
+            for (texto,) in conn.execute('SELECT totales FROM archivo_meses'):
+                for col, valor in json.loads(texto).items():
+                    totales[col] += valor
+
+        por_estado = {
+            estado: {'cantidad': cantidad, 'saldo_pendiente': saldo}
+            for estado, cantidad, saldo in conn.execute('''
+                SELECT IFNULL(estado, ''), COUNT(*), COALESCE(SUM(saldo_pendiente), 0)
+                FROM notas_credito GROUP BY IFNULL(estado, '')
+            ''')
+        }
+        return {'totales': totales, 'notas_por_estado': por_estado}
+
+    @staticmethod
+    def _escribir(conn: sqlite3.Connection, valores: Dict):
+        # UPSERT (no REPLACE): version_datos nunca retrocede
+        columnas = [col for col, _, _, _ in COLUMNAS_TOTALES]
+        conn.execute(f'''
+            INSERT INTO resumen_totales (id, {', '.join(columnas)})
+            VALUES (1, {', '.join('?' for _ in columnas)})
+            ON CONFLICT(id) DO UPDATE SET
+                {', '.join(f'{col} = excluded.{col}' for col in columnas)},
+                version_datos = version_datos + 1
+        ''', [valores['totales'][col] for col in columnas])
+        conn.execute('DELETE FROM resumen_notas_estado')
+        conn.executemany('INSERT INTO resumen_notas_estado (estado, cantidad, saldo_pendiente) VALUES (?, ?, ?)',
+                         [(estado, v['cantidad'], v['saldo_pendiente'])
+                          for estado, v in valores['notas_por_estado'].items()])
+
+    @staticmethod
+    def _leer(conn: sqlite3.Connection) -> Dict:
+        cursor = conn.execute('SELECT * FROM resumen_totales WHERE id = 1')
+        nombres = [d[0] for d in cursor.description]
+        fila = cursor.fetchone()
+        totales = {col: fila[nombres.index(col)] for col, _, _, _ in COLUMNAS_TOTALES} if fila else {}
+        por_estado = {
+            estado: {'cantidad': cantidad, 'saldo_pendiente': saldo}
+            for estado, cantidad, saldo in conn.execute(
+                'SELECT estado, cantidad, saldo_pendiente FROM resumen_notas_estado WHERE cantidad != 0')
+        }
+        return {'totales': totales, 'notas_por_estado': por_estado}
+
+    # =========================================================================
+    # CONSULTA
+    # =========================================================================
+
+    def obtener(self, conn: sqlite3.Connection = None) -> Dict:
+        """
+        Agregados actuales (lectura O(1))
+
+        Returns:
+            {'totales': {columna: valor}, 'notas_por_estado': {estado: {cantidad, saldo_pendiente}}}
+        """
+        self.asegurar_instalado()
+        propia = conn is None
+        if propia:
+            conn = conectar(self.db_path)
+        try:
+            return self._leer(conn)
+        finally:
+            if propia:
+                conn.close()
+
+    def obtener_version(self, conn: sqlite3.Connection = None) -> int:
+        """Versión de datos actual: cambia con cada escritura en las tablas base"""
+        self.asegurar_instalado()
+        propia = conn is None
+        if propia:
+            conn = conectar(self.db_path)
+        try:
+            fila = conn.execute('SELECT version_datos FROM resumen_totales WHERE id = 1').fetchone()
+            return fila[0] if fila else 0
+        finally:
+            if propia:
+                conn.close()
+
+    # =========================================================================
+    # VERIFICACIÓN
+    # =========================================================================
+
+    def verificar(self, reparar: bool = False) -> Dict:
+        """
+        Recalcula los agregados desde cero y los compara con los materializados
+
+        Args:
+            reparar: Si hay diferencias, reemplazar los valores materializados
+
+        Returns:
+            {'consistente': bool, 'diferencias': [{clave, materializado, recalculado, diferencia}],
+             'reparado': bool}
+        """
+        self.asegurar_instalado()
+        conn = conectar(self.db_path)
+        try:
+            # Lectura consistente de ambos lados (sin escrituras intermedias)
+            conn.execute('BEGIN IMMEDIATE' if reparar else 'BEGIN')
+            materializado = self._leer(conn)
+            recalculado = self._calcular(conn)
+
+            diferencias = []
+            for col, _, _, _ in COLUMNAS_TOTALES:
+                diferencias += self._comparar(col, materializado['totales'].get(col),
+                                              recalculado['totales'][col])
+            estados = set(materializado['notas_por_estado']) | set(recalculado['notas_por_estado'])
+            vacio = {'cantidad': 0, 'saldo_pendiente': 0}
+            for estado in sorted(estados):
+                m = materializado['notas_por_estado'].get(estado, vacio)
+                r = recalculado['notas_por_estado'].get(estado, vacio)
+                for campo in ('cantidad', 'saldo_pendiente'):
+                    diferencias += self._comparar(f'notas_estado[{estado}].{campo}', m[campo], r[campo])
+
+            reparado = False
+            if diferencias and reparar:
+                self._escribir(conn, recalculado)
+                reparado = True
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        if diferencias:
+            logger.warning(f"Agregados inconsistentes: {len(diferencias)} diferencia(s)"
+                           f"{' (reparados)' if reparado else ''}")
+        return {'consistente': not diferencias, 'diferencias': diferencias, 'reparado': reparado}
+
+    @staticmethod
+    def _comparar(clave: str, materializado, recalculado) -> List[Dict]:
+        if materializado is None or abs(materializado - recalculado) > TOLERANCIA:
+            return [{
+                'clave': clave,
+                'materializado': materializado,
+                'recalculado': recalculado,
+                'diferencia': None if materializado is None else materializado - recalculado
+            }]
+        return []
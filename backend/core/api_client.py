@@ -1,23 +1,330 @@
 import requests
-from datetime import datetime, timedelta
-from typing import List, Dict
+from requests.adapters import HTTPAdapter
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+import codecs
 import logging
 import json
+import random
+import threading
+import time
+
+try:
+    from core.metricas import METRICAS
+except ImportError:
+    from metricas import METRICAS
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class _LectorJSONIncremental:
+    """
+    Lee un documento JSON desde un flujo de bloques de bytes sin cargarlo
+    completo en memoria.
+
+    Solo decodifica valores completos (filas, escalares) con json.JSONDecoder;
+    los arreglos se recorren elemento por elemento, de modo que el texto en
+    memoria se limita a lo que aún no se ha consumido.
+    """
+
+    ESPACIOS = ' \t\n\r'
+
+    def __init__(self, bloques: Iterable[bytes]):
+        self._bloques = iter(bloques)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._fin = False
+
+    def _leer(self, minimo: int = 1) -> bool:
+        """Agrega al menos `minimo` caracteres al buffer; False si el flujo terminó"""
+        if self._fin:
+            return False
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        agregado = 0
+        partes = [self._buffer]
+        while agregado < minimo:
+            bloque = next(self._bloques, None)
+            if bloque is None:
+                partes.append(self._utf8.decode(b'', final=True))
+                self._fin = True
+                break
+            texto = self._utf8.decode(bloque)
+            partes.append(texto)
+            agregado += len(texto)
+        self._buffer = ''.join(partes)
+        return agregado > 0 or len(partes[-1]) > 0
+
+    def _siguiente_caracter(self) -> str:
+        """Salta espacios y retorna el siguiente carácter sin consumirlo ('' al final)"""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self.ESPACIOS:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._leer():
+                return ''
+
+    def _consumir(self, esperados: str) -> str:
+        caracter = self._siguiente_caracter()
+        if not caracter or caracter not in esperados:
+            raise json.JSONDecodeError(f"Se esperaba uno de {esperados!r}", self._buffer, self._pos)
+        self._pos += 1
+        return caracter
+
+    def valor(self):
+        """Decodifica el siguiente valor JSON completo"""
+        self._siguiente_caracter()
+        while True:
+            try:
+                valor, fin = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # Valor incompleto: leer al menos lo pendiente otra vez (crecimiento geométrico)
+                if not self._leer(max(len(self._buffer) - self._pos, 1)):
+                    raise
+                continue
+            # Un número al final del buffer puede continuar en el siguiente bloque
+            if fin == len(self._buffer) and not self._fin:
+                self._leer()
+                continue
+            self._pos = fin
+            return valor
+
+    def tipo_siguiente(self) -> str:
+        """'objeto', 'arreglo' u 'otro' según el siguiente valor"""
+        caracter = self._siguiente_caracter()
+        return {'{': 'objeto', '[': 'arreglo'}.get(caracter, 'otro')
+
+    def claves(self) -> Iterator[str]:
+        """
+        Recorre un objeto entregando sus claves; el llamador debe consumir
+        el valor de cada clave (valor() o elementos()) antes de continuar.
+        """
+        self._consumir('{')
+        if self._siguiente_caracter() == '}':
+            self._pos += 1
+            return
+        while True:
+            clave = self.valor()
+            self._consumir(':')
+            yield clave
+            if self._consumir(',}') == '}':
+                return
+
+    def elementos(self) -> Iterator:
+        """Recorre un arreglo entregando cada elemento decodificado"""
+        self._consumir('[')
+        if self._siguiente_caracter() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.valor()
+            if self._consumir(',]') == ']':
+                return
+
+    def terminar(self):
+        """Verifica que después del documento solo queden espacios"""
+        if self._siguiente_caracter():
+            raise json.JSONDecodeError("Datos adicionales después del documento", self._buffer, self._pos)
+
+    def fragmento(self, largo: int = 500) -> str:
+        """Texto alrededor de la posición actual (para logs de error)"""
+        return self._buffer[max(self._pos - largo // 2, 0):self._pos + largo // 2]
+
+
 class SiesaAPIClient:
     """Cliente para interactuar con la API de SIESA"""
     
     BASE_URL = "https://siesaprod.cipa.com.co/produccion/v3/ejecutarconsulta"
+
+    # Códigos HTTP transitorios que justifican reintentar la consulta
+    STATUS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+    # Bytes por bloque al leer la respuesta en modo streaming
+    TAMANO_BLOQUE = 64 * 1024
+
+    # Claves alternativas donde buscar las filas (en detalle y en la raíz)
+    CLAVES_TABLA_DETALLE = ('Table', 'table')
+    CLAVES_FILAS_RAIZ = ('data', 'facturas', 'result', 'rows', 'Table', 'table')
     
-    def __init__(self, conni_key: str, conni_token: str):
+    def __init__(self, conni_key: str, conni_token: str, base_url: Optional[str] = None,
+                 timeout: float = 30, pool_size: int = 10, max_reintentos: int = 3,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 max_filas_ventana: int = 20000, cache=None):
+        """
+        Args:
+            conni_key: Llave de conexión SIESA
+            conni_token: Token de conexión SIESA
+            base_url: URL del servicio (por defecto BASE_URL)
+            timeout: Timeout por solicitud en segundos
+            pool_size: Conexiones keep-alive a mantener abiertas (>= hilos concurrentes)
+            max_reintentos: Reintentos ante timeouts, errores de conexión o 5xx/429
+            backoff_base: Espera base en segundos (se duplica en cada reintento)
+            backoff_max: Espera máxima entre reintentos
+            max_filas_ventana: Filas a partir de las cuales una ventana de varios
+                días se considera demasiado grande y se parte (obtener_facturas_rango)
+            cache: SiesaCache opcional; las respuestas se leen/guardan en disco
+                y en modo offline no se consulta la red
+        """
         self.headers = {
             "Connikey": conni_key,
             "conniToken": conni_token,
             "Content-Type": "application/json"
         }
+        self.base_url = base_url or self.BASE_URL
+        self.timeout = timeout
+        self.max_reintentos = max_reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_filas_ventana = max_filas_ventana
+        self.cache = cache
+
+        # Sesión con pool de conexiones: reutiliza TCP/TLS entre días.
+        # Los reintentos se manejan en _consultar para aplicar jitter y medir cada intento.
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._metricas = []
+        self._lock_metricas = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Cierra las conexiones del pool"""
+        self.session.close()
+
+    def _espera_reintento(self, intento: int) -> float:
+        """Backoff exponencial con jitter completo: U(0, min(max, base * 2^intento))"""
+        tope = min(self.backoff_max, self.backoff_base * (2 ** intento))
+        return random.uniform(0, tope)
+
+    def _consultar(self, params: Dict, reintentar_timeout: bool = True,
+                   stream: bool = False) -> Tuple[requests.Response, Dict]:
+        """
+        Ejecuta la consulta GET (idempotente) con reintentos y registra métricas.
+
+        Reintenta ante Timeout, ConnectionError y respuestas STATUS_REINTENTABLES.
+        Agotados los reintentos, relanza la excepción o retorna la última respuesta
+        para que el llamador ejecute raise_for_status.
+
+        Con reintentar_timeout=False un timeout se relanza de inmediato (lo usan
+        las ventanas de varios días, que prefieren partirse a reintentar).
+
+        Con stream=True el cuerpo no se descarga aquí: la métrica se registra
+        con bytes=0 y el llamador la completa al terminar de leer.
+
+        Returns:
+            Tupla (response, metrica)
+        """
+        inicio = time.perf_counter()
+        intento = 0
+        while True:
+            inicio_intento = time.perf_counter()
+            try:
+                response = self.session.get(self.base_url, params=params, timeout=self.timeout,
+                                            stream=stream)
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                duracion = time.perf_counter() - inicio_intento
+                no_reintentar = not reintentar_timeout and isinstance(e, requests.exceptions.Timeout)
+                if intento >= self.max_reintentos or no_reintentar:
+                    self._registrar_metrica(params, None, intento + 1, time.perf_counter() - inicio, 0, str(e))
+                    raise
+                espera = self._espera_reintento(intento)
+                logger.warning(f"Error transitorio consultando SIESA ({type(e).__name__}) tras {duracion:.2f}s - "
+                               f"reintento {intento + 1}/{self.max_reintentos} en {espera:.2f}s")
+                time.sleep(espera)
+                intento += 1
+                continue
+
+            if response.status_code in self.STATUS_REINTENTABLES and intento < self.max_reintentos:
+                espera = self._espera_reintento(intento)
+                logger.warning(f"SIESA respondió {response.status_code} - "
+                               f"reintento {intento + 1}/{self.max_reintentos} en {espera:.2f}s")
+                # Leer el cuerpo (corto) para devolver la conexión keep-alive al pool
+                response.content
+                response.close()
+                time.sleep(espera)
+                intento += 1
+                continue
+
+            metrica = self._registrar_metrica(params, response.status_code, intento + 1,
+                                              time.perf_counter() - inicio,
+                                              None if stream else len(response.content), None)
+            return response, metrica
+
+    def _registrar_metrica(self, params: Dict, status: Optional[int], intentos: int,
+                           duracion: float, bytes_respuesta: Optional[int], error: Optional[str]) -> Dict:
+        """
+        Guarda la métrica de una solicitud (thread-safe).
+
+        bytes_respuesta=None indica un cuerpo aún por leer (streaming); se
+        registra en 0 y se completa con _completar_metrica.
+        """
+        metrica = {
+            'parametros': params.get('parametros'),
+            'status': status,
+            'intentos': intentos,
+            'duracion_s': duracion,
+            'bytes': bytes_respuesta or 0,
+            'error': error
+        }
+        with self._lock_metricas:
+            self._metricas.append(metrica)
+        METRICAS.incrementar('cipa_siesa_reintentos_total', intentos - 1)
+        if bytes_respuesta is not None:
+            self._publicar_metrica(metrica)
+            logger.info(f"SIESA {params.get('parametros')} -> status={status} intentos={intentos} "
+                        f"tiempo={duracion:.2f}s bytes={bytes_respuesta}")
+        return metrica
+
+    def _completar_metrica(self, metrica: Dict, bytes_respuesta: int, duracion_lectura: float):
+        """Suma a la métrica el cuerpo leído en streaming"""
+        with self._lock_metricas:
+            metrica['bytes'] += bytes_respuesta
+            metrica['duracion_s'] += duracion_lectura
+        self._publicar_metrica(metrica)
+        logger.info(f"SIESA {metrica['parametros']} -> status={metrica['status']} intentos={metrica['intentos']} "
+                    f"tiempo={metrica['duracion_s']:.2f}s bytes={metrica['bytes']}")
+
+    @staticmethod
+    def _publicar_metrica(metrica: Dict):
+        """Suma la solicitud terminada al registro del proceso (/api/metrics)"""
+        estado = 'error' if metrica['error'] else str(metrica['status'])
+        METRICAS.observar('cipa_siesa_solicitud_duracion_segundos', metrica['duracion_s'], status=estado)
+        METRICAS.incrementar('cipa_siesa_bytes_total', metrica['bytes'])
+
+    def obtener_metricas(self) -> Dict:
+        """
+        Resumen de tiempos de las solicitudes realizadas por este cliente
+
+        Returns:
+            Diccionario con totales, tiempos y el detalle por solicitud
+        """
+        with self._lock_metricas:
+            detalle = list(self._metricas)
+
+        duraciones = [m['duracion_s'] for m in detalle]
+        return {
+            'solicitudes': len(detalle),
+            'intentos': sum(m['intentos'] for m in detalle),
+            'reintentos': sum(m['intentos'] - 1 for m in detalle),
+            'errores': sum(1 for m in detalle if m['error'] or (m['status'] or 0) >= 400),
+            'tiempo_total_s': sum(duraciones),
+            'tiempo_promedio_s': (sum(duraciones) / len(duraciones)) if duraciones else 0.0,
+            'tiempo_max_s': max(duraciones) if duraciones else 0.0,
+            'bytes_total': sum(m['bytes'] for m in detalle),
+            'detalle': detalle
+        }
     
     def obtener_facturas(self, fecha: datetime) -> List[Dict]:
         """
@@ -29,99 +336,207 @@ class SiesaAPIClient:
         Returns:
             Lista de facturas en formato JSON
         """
+        return self._consultar_facturas(fecha, fecha)
+
+    def iterar_facturas(self, fecha: datetime) -> Iterator[Dict]:
+        """
+        Obtiene las facturas de una fecha en modo streaming
+
+        El cuerpo se lee por bloques y cada fila de detalle.Table se entrega
+        apenas se decodifica, sin mantener la respuesta completa en memoria
+        (texto crudo + estructura parseada). Si la conexión falla a mitad de
+        la lectura la excepción se propaga al consumidor sin reintentar,
+        porque parte de las filas ya fue entregada.
+
+        Args:
+            fecha: Fecha para consultar las facturas
+
+        Yields:
+            Filas (dict) en el orden de la respuesta
+        """
+        return self._iterar_facturas(fecha, fecha)
+
+    def obtener_facturas_rango(self, desde: datetime, hasta: datetime) -> Dict[date, List[Dict]]:
+        """
+        Obtiene las facturas de un rango de fechas con ventanas de ancho variable
+        y las agrupa por día según f_fecha.
+
+        Se consulta la ventana completa en una sola solicitud; si SIESA tarda
+        demasiado (timeout) o la respuesta alcanza max_filas_ventana (posible
+        truncamiento), la ventana se parte a la mitad y se consulta cada mitad.
+        Una semana tranquila se resuelve así con una sola solicitud.
+
+        Args:
+            desde: Fecha inicial (incluida)
+            hasta: Fecha final (incluida)
+
+        Returns:
+            Diccionario ordenado {fecha (date): [filas]} con todos los días del
+            rango, incluidos los días sin facturas (lista vacía)
+        """
+        dia_desde = desde.date() if isinstance(desde, datetime) else desde
+        dia_hasta = hasta.date() if isinstance(hasta, datetime) else hasta
+
+        por_dia = {dia_desde + timedelta(days=i): [] for i in range((dia_hasta - dia_desde).days + 1)}
+
+        for ventana_desde, filas in self._consultar_ventana(dia_desde, dia_hasta):
+            for fila in filas:
+                dia = self._dia_de_fila(fila)
+                if dia not in por_dia:
+                    logger.warning(f"Fila con f_fecha fuera de la ventana consultada ({fila.get('f_fecha')}), "
+                                   f"se asigna a {ventana_desde}")
+                    dia = ventana_desde
+                por_dia[dia].append(fila)
+
+        logger.info(f"Rango {dia_desde} a {dia_hasta}: {sum(len(f) for f in por_dia.values())} filas "
+                    f"en {len(por_dia)} días")
+        return por_dia
+
+    def _consultar_ventana(self, desde: date, hasta: date):
+        """
+        Consulta una ventana [desde, hasta] partiéndola a la mitad mientras
+        haga timeout o llegue con max_filas_ventana filas o más.
+
+        Yields:
+            Tuplas (inicio_subventana, filas) en orden de fecha
+        """
+        dias = (hasta - desde).days + 1
+        if dias == 1:
+            # Un solo día no se puede partir: reintentos normales
+            yield desde, self._consultar_facturas(desde, hasta)
+            return
+
+        try:
+            filas = self._consultar_facturas(desde, hasta, reintentar_timeout=False)
+        except requests.exceptions.Timeout:
+            logger.warning(f"Timeout en ventana {desde} a {hasta} ({dias} días), se parte a la mitad")
+            filas = None
+
+        if filas is not None and len(filas) < self.max_filas_ventana:
+            yield desde, filas
+            return
+
+        if filas is not None:
+            logger.warning(f"Ventana {desde} a {hasta} retornó {len(filas)} filas "
+                           f"(límite {self.max_filas_ventana}), se parte a la mitad")
+
+        mitad = desde + timedelta(days=dias // 2 - 1)
+        yield from self._consultar_ventana(desde, mitad)
+        yield from self._consultar_ventana(mitad + timedelta(days=1), hasta)
+
+    @staticmethod
+    def _dia_de_fila(fila: Dict) -> Optional[date]:
+        """Fecha (date) de una fila según f_fecha ('2025-11-10T00:00:00')"""
+        try:
+            return date.fromisoformat(str(fila.get('f_fecha', ''))[:10])
+        except ValueError:
+            return None
+
+    def _consultar_facturas(self, fecha_ini, fecha_fin, reintentar_timeout: bool = True) -> List[Dict]:
+        """
+        Ejecuta Api_Consulta_Fac_Correagro entre dos fechas (incluidas)
+
+        Args:
+            fecha_ini: Fecha inicial (date o datetime)
+            fecha_fin: Fecha final (date o datetime)
+            reintentar_timeout: Si False, un timeout se propaga sin reintentar
+
+        Returns:
+            Lista de facturas en formato JSON
+        """
+        return list(self._iterar_facturas(fecha_ini, fecha_fin, reintentar_timeout))
+
+    def _iterar_facturas(self, fecha_ini, fecha_fin, reintentar_timeout: bool = True) -> Iterator[Dict]:
+        """
+        Ejecuta Api_Consulta_Fac_Correagro entre dos fechas (incluidas) y
+        entrega las filas a medida que se leen de la respuesta
+
+        Args:
+            fecha_ini: Fecha inicial (date o datetime)
+            fecha_fin: Fecha final (date o datetime)
+            reintentar_timeout: Si False, un timeout se propaga sin reintentar
+
+        Yields:
+            Facturas en formato JSON
+        """
         # Formato YYYY-MM-DD con comillas simples (como espera SIESA)
-        fecha_str = fecha.strftime('%Y-%m-%d')
+        fecha_str = fecha_ini.strftime('%Y-%m-%d')
+        fecha_fin_str = fecha_fin.strftime('%Y-%m-%d')
 
         # SIESA espera: FECHA_INI='2025-11-10'|FECHA_FIN='2025-11-10'
         params = {
             "idCompania": "37",
             "descripcion": "Api_Consulta_Fac_Correagro",
-            "parametros": f"FECHA_INI='{fecha_str}'|FECHA_FIN='{fecha_str}'"
+            "parametros": f"FECHA_INI='{fecha_str}'|FECHA_FIN='{fecha_fin_str}'"
         }
 
+        lector = None
         try:
-            logger.info(f"Consultando facturas para la fecha: {fecha_str}")
-            logger.info(f"URL: {self.BASE_URL}")
+            if fecha_fin_str == fecha_str:
+                logger.info(f"Consultando facturas para la fecha: {fecha_str}")
+            else:
+                logger.info(f"Consultando facturas del {fecha_str} al {fecha_fin_str}")
+
+            # Respuesta guardada en la caché local
+            bloques_cache = self.cache.leer(params, fecha_fin, self.TAMANO_BLOQUE) if self.cache else None
+            if bloques_cache is not None:
+                lector = _LectorJSONIncremental(bloques_cache)
+                yield from self._filas_de_respuesta(lector)
+                return
+            if self.cache and self.cache.offline:
+                raise LookupError(f"Modo offline: no hay respuesta en caché para {params['parametros']}")
+
+            logger.info(f"URL: {self.base_url}")
             logger.info(f"Parámetros: {params}")
 
-            response = requests.get(
-                self.BASE_URL,
-                params=params,
-                headers=self.headers,
-                timeout=30
-            )
+            response, metrica = self._consultar(params, reintentar_timeout=reintentar_timeout, stream=True)
+
+            with response:
+                # Log de la URL completa generada
+                logger.info(f"URL completa: {response.url}")
 
-            # Log de la URL completa generada
-            logger.info(f"URL completa: {response.url}")
+                # Intentar obtener el cuerpo de la respuesta antes de raise_for_status
+                if response.status_code == 400:
+                    logger.error(f"Error 400 - Respuesta del servidor:")
+                    try:
+                        error_data = response.json()
+                        logger.error(f"JSON Error: {json.dumps(error_data, indent=2)}")
+                    except:
+                        logger.error(f"Texto Error: {response.text[:500]}")
 
-            # Intentar obtener el cuerpo de la respuesta antes de raise_for_status
-            if response.status_code == 400:
-                logger.error(f"Error 400 - Respuesta del servidor:")
+                response.raise_for_status()
+
+                # Parsear respuesta JSON por bloques (copiándolos a la caché si está activa)
+                escritura = self.cache.escritor(params) if self.cache else None
+                leido = {'bytes': 0}
+
+                def bloques():
+                    for bloque in response.iter_content(chunk_size=self.TAMANO_BLOQUE):
+                        leido['bytes'] += len(bloque)
+                        if escritura:
+                            escritura.escribir(bloque)
+                        yield bloque
+
+                inicio_lectura = time.perf_counter()
+                lector = _LectorJSONIncremental(bloques())
+                total = 0
+                completa = False
                 try:
-                    error_data = response.json()
-                    logger.error(f"JSON Error: {json.dumps(error_data, indent=2)}")
-                except:
-                    logger.error(f"Texto Error: {response.text[:500]}")
-
-            response.raise_for_status()
-            
-            # Parsear respuesta JSON
-            data = response.json()
-            
-            # Verificar estructura de respuesta SIESA
-            if isinstance(data, dict):
-                # Verificar si hay error en la respuesta
-                if 'codigo' in data and data['codigo'] != 0:
-                    logger.error(f"Error en API: {data.get('mensaje', 'Error desconocido')}")
-                    raise ValueError(f"Error en API: {data.get('mensaje', 'Error desconocido')}")
-                
-                # Extraer facturas de la estructura SIESA
-                if 'detalle' in data and isinstance(data['detalle'], dict):
-                    detalle = data['detalle']
-                    
-                    # Buscar en Table (estructura SIESA común)
-                    if 'Table' in detalle and isinstance(detalle['Table'], list):
-                        facturas = detalle['Table']
-                        logger.info(f"Se obtuvieron {len(facturas)} facturas")
-                        return facturas
-                    
-                    # Buscar en table (lowercase)
-                    if 'table' in detalle and isinstance(detalle['table'], list):
-                        facturas = detalle['table']
-                        logger.info(f"Se obtuvieron {len(facturas)} facturas")
-                        return facturas
-                    
-                    # Si detalle tiene una lista directa
-                    for key in detalle.keys():
-                        if isinstance(detalle[key], list):
-                            facturas = detalle[key]
-                            logger.info(f"Se obtuvieron {len(facturas)} facturas desde clave '{key}'")
-                            return facturas
-                
-                # Buscar directamente en las claves principales
-                for key in ['data', 'facturas', 'result', 'rows', 'Table', 'table']:
-                    if key in data and isinstance(data[key], list):
-                        facturas = data[key]
-                        logger.info(f"Se obtuvieron {len(facturas)} facturas desde clave '{key}'")
-                        return facturas
-                
-                # Log de estructura no reconocida
-                logger.error(f"Estructura de respuesta no reconocida")
-                logger.error(f"Claves principales: {list(data.keys())}")
-                if 'detalle' in data:
-                    logger.error(f"Claves en 'detalle': {list(data['detalle'].keys()) if isinstance(data['detalle'], dict) else type(data['detalle'])}")
-                logger.error(f"Respuesta completa: {json.dumps(data, indent=2)[:1000]}")
-                raise ValueError("No se encontraron facturas en la estructura de respuesta")
-            
-            # Si la respuesta es una lista directamente
-            elif isinstance(data, list):
-                logger.info(f"Se obtuvieron {len(data)} facturas")
-                return data
-            
-            else:
-                logger.error(f"Tipo de respuesta no esperado: {type(data)}")
-                raise ValueError(f"Tipo de respuesta no esperado: {type(data)}")
-            
+                    for fila in self._filas_de_respuesta(lector):
+                        total += 1
+                        yield fila
+                    lector.terminar()
+                    completa = True
+                finally:
+                    self._completar_metrica(metrica, leido['bytes'], time.perf_counter() - inicio_lectura)
+                    # Solo se guardan respuestas leídas completas y válidas
+                    if escritura and completa:
+                        escritura.confirmar()
+                    elif escritura:
+                        escritura.descartar()
+
+                logger.info(f"Se obtuvieron {total} facturas")
+
         except requests.exceptions.RequestException as e:
             logger.error(f"Error al consultar la API: {e}")
             if 'response' in locals():
@@ -130,9 +545,99 @@ class SiesaAPIClient:
             raise
         except json.JSONDecodeError as e:
             logger.error(f"Error al parsear JSON: {e}")
-            if 'response' in locals():
-                logger.error(f"Respuesta (primeros 500 chars): {response.text[:500]}")
+            if lector is not None:
+                logger.error(f"Respuesta (alrededor del error): {lector.fragmento()}")
             raise
         except ValueError as e:
             logger.error(f"Error al procesar respuesta: {e}")
             raise
+
+    def _filas_de_respuesta(self, lector: _LectorJSONIncremental) -> Iterator[Dict]:
+        """
+        Recorre la estructura de respuesta SIESA y entrega sus filas.
+
+        detalle.Table (o detalle.table) se recorre fila por fila sin
+        materializarse. Las demás ubicaciones conocidas (otra lista en
+        detalle, claves de la raíz como 'data' o 'rows', o una lista como
+        raíz) son formatos alternativos poco frecuentes: se decodifican
+        completas y se entregan solo si no apareció detalle.Table.
+
+        SIESA envía 'codigo' antes de 'detalle'; si un código de error llegara
+        después de las filas, el ValueError se lanza al terminar de recorrerlas.
+        """
+        tipo = lector.tipo_siguiente()
+
+        # Si la respuesta es una lista directamente
+        if tipo == 'arreglo':
+            yield from lector.elementos()
+            return
+
+        if tipo != 'objeto':
+            data = lector.valor()
+            logger.error(f"Tipo de respuesta no esperado: {type(data)}")
+            raise ValueError(f"Tipo de respuesta no esperado: {type(data)}")
+
+        encabezado = {}
+        claves_raiz = []
+        claves_detalle = None
+        lista_detalle = None
+        listas_raiz = {}
+        entregadas = False
+
+        for clave in lector.claves():
+            claves_raiz.append(clave)
+            # Con error de API ya informado no se entregan filas
+            error_api = 'codigo' in encabezado and encabezado['codigo'] != 0
+
+            if clave == 'detalle' and lector.tipo_siguiente() == 'objeto':
+                claves_detalle = []
+                for clave_detalle in lector.claves():
+                    claves_detalle.append(clave_detalle)
+                    es_tabla = clave_detalle in self.CLAVES_TABLA_DETALLE
+                    if (es_tabla and not entregadas and not error_api
+                            and lector.tipo_siguiente() == 'arreglo'):
+                        # Buscar en Table (estructura SIESA común)
+                        yield from lector.elementos()
+                        entregadas = True
+                        continue
+                    valor = lector.valor()
+                    if isinstance(valor, list) and lista_detalle is None:
+                        lista_detalle = (clave_detalle, valor)
+                continue
+
+            valor = lector.valor()
+            if clave == 'detalle':
+                claves_detalle = type(valor)
+            elif clave in self.CLAVES_FILAS_RAIZ and isinstance(valor, list):
+                listas_raiz[clave] = valor
+            elif not isinstance(valor, (list, dict)):
+                encabezado[clave] = valor
+
+        # Verificar si hay error en la respuesta
+        if 'codigo' in encabezado and encabezado['codigo'] != 0:
+            logger.error(f"Error en API: {encabezado.get('mensaje', 'Error desconocido')}")
+            raise ValueError(f"Error en API: {encabezado.get('mensaje', 'Error desconocido')}")
+
+        if entregadas:
+            return
+
+        # Si detalle tiene una lista directa
+        if lista_detalle is not None:
+            clave, facturas = lista_detalle
+            logger.info(f"Se obtuvieron {len(facturas)} facturas desde clave '{clave}'")
+            yield from facturas
+            return
+
+        # Buscar directamente en las claves principales
+        for clave in self.CLAVES_FILAS_RAIZ:
+            if clave in listas_raiz:
+                logger.info(f"Se obtuvieron {len(listas_raiz[clave])} facturas desde clave '{clave}'")
+                yield from listas_raiz[clave]
+                return
+
+        # Log de estructura no reconocida
+        logger.error(f"Estructura de respuesta no reconocida")
+        logger.error(f"Claves principales: {claves_raiz}")
+        if claves_detalle is not None:
+            logger.error(f"Claves en 'detalle': {claves_detalle}")
+        raise ValueError("No se encontraron facturas en la estructura de respuesta")
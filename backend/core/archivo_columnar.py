@@ -0,0 +1,198 @@
+"""
+Formato Columnar Comprimido del Archivo Histórico
+Un archivo por tabla y mes cerrado (ver archivo_manager). Solo usa la
+biblioteca estándar: cada columna se guarda en un bloque zlib independiente,
+de modo que una consulta descomprime únicamente las columnas que necesita.
+
+ESTRUCTURA DEL ARCHIVO:
+- MAGIA (8 bytes) + longitud de la cabecera (uint32 little-endian)
+- Cabecera JSON: filas, columnas con su codificación y posición, metadatos
+- Bloques de columnas, uno tras otro
+
+CODIFICACIONES:
+- entero: array('q') de int64 (columna sin NULL, solo enteros)
+- real: array('d') de float64 (columna sin NULL, solo reales)
+- diccionario: valores distintos en JSON + índices (B/H/I); fechas, NIT,
+  razones de rechazo, estados y demás textos repetidos
+- json: lista JSON (columnas mixtas o con NULL y alta cardinalidad)
+
+El lector abre el archivo con mmap y descomprime cada columna la primera vez
+que se pide.
+"""
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Sequence
+
+MAGIA = b'NCCOL\x00\x01\x00'
+VERSION_FORMATO = 1
+NIVEL_COMPRESION = 6
+
+_LONGITUD = struct.Struct('<I')
+
+
+def _a_bytes(valores: array) -> bytes:
+    if sys.byteorder != 'little':
+        valores = array(valores.typecode, valores)
+        valores.byteswap()
+    return valores.tobytes()
+
+
+def _desde_bytes(tipo: str, datos: bytes) -> array:
+    valores = array(tipo)
+    valores.frombytes(datos)
+    if sys.byteorder != 'little':
+        valores.byteswap()
+    return valores
+
+
+def _tipo_indices(distintos: int) -> str:
+    if distintos <= 0x100:
+        return 'B'
+    if distintos <= 0x10000:
+        return 'H'
+    return 'I'
+
+
+def _codificar(valores: Sequence) -> Dict:
+    """Elige la codificación de una columna y devuelve {'codificacion', 'datos', ...}"""
+    tipos = {type(v) for v in valores}
+    if tipos == {int} and all(-2 ** 63 <= v < 2 ** 63 for v in valores):
+        return {'codificacion': 'entero', 'datos': _a_bytes(array('q', valores))}
+    if tipos == {float}:
+        return {'codificacion': 'real', 'datos': _a_bytes(array('d', valores))}
+
+    # El tipo forma parte de la clave: 1 y 1.0 son valores distintos para SQLite
+    posiciones, distintos, indices = {}, [], []
+    for v in valores:
+        clave = (type(v), v)
+        posicion = posiciones.get(clave)
+        if posicion is None:
+            posicion = posiciones[clave] = len(distintos)
+            distintos.append(v)
+        indices.append(posicion)
+
+    if len(distintos) * 2 <= len(valores):
+        tipo = _tipo_indices(len(distintos))
+        diccionario = json.dumps(distintos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        datos = _LONGITUD.pack(len(diccionario)) + diccionario + _a_bytes(array(tipo, indices))
+        return {'codificacion': 'diccionario', 'indices': tipo, 'datos': datos}
+
+    lista = json.dumps(list(valores), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return {'codificacion': 'json', 'datos': lista}
+
+
+def escribir_columnar(ruta: str, columnas: List[str], filas: Sequence[Sequence],
+                      metadatos: Dict = None) -> int:
+    """
+    Escribe filas (tuplas en el orden de `columnas`) en formato columnar
+
+    Args:
+        ruta: Archivo de destino (se sobrescribe)
+        columnas: Nombres de las columnas
+        filas: Filas en el orden en que se deben leer
+        metadatos: Datos libres (JSON) que se guardan en la cabecera
+
+    Returns:
+        Tamaño del archivo en bytes
+    """
+    especificaciones, bloques, inicio = [], [], 0
+    for posicion, nombre in enumerate(columnas):
+        codificada = _codificar([fila[posicion] for fila in filas])
+        bloque = zlib.compress(codificada.pop('datos'), NIVEL_COMPRESION)
+        codificada.update({'nombre': nombre, 'inicio': inicio, 'longitud': len(bloque)})
+        especificaciones.append(codificada)
+        bloques.append(bloque)
+        inicio += len(bloque)
+
+    cabecera = json.dumps({
+        'version': VERSION_FORMATO,
+        'filas': len(filas),
+        'columnas': especificaciones,
+        'metadatos': metadatos or {},
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    with open(ruta, 'wb') as archivo:
+        archivo.write(MAGIA)
+        archivo.write(_LONGITUD.pack(len(cabecera)))
+        archivo.write(cabecera)
+        for bloque in bloques:
+            archivo.write(bloque)
+        return archivo.tell()
+
+
+class LectorColumnar:
+    """Lectura perezosa (mmap) de un archivo columnar"""
+
+    def __init__(self, ruta: str):
+        """
+        Raises:
+            ValueError: Si el archivo no tiene el formato esperado
+        """
+        self.ruta = ruta
+        self._archivo = open(ruta, 'rb')
+        try:
+            self._mapa = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._mapa[:len(MAGIA)] != MAGIA:
+                raise ValueError(f"{ruta} no es un archivo columnar del archivo histórico")
+            longitud, = _LONGITUD.unpack_from(self._mapa, len(MAGIA))
+            inicio_cabecera = len(MAGIA) + _LONGITUD.size
+            cabecera = json.loads(self._mapa[inicio_cabecera:inicio_cabecera + longitud].decode('utf-8'))
+        except Exception:
+            self.cerrar()
+            raise
+        if cabecera.get('version') != VERSION_FORMATO:
+            self.cerrar()
+            raise ValueError(f"{ruta}: versión de formato {cabecera.get('version')} no soportada")
+
+        self._inicio_bloques = inicio_cabecera + longitud
+        self.filas: int = cabecera['filas']
+        self.metadatos: Dict = cabecera['metadatos']
+        self._especificaciones = {c['nombre']: c for c in cabecera['columnas']}
+        self.columnas: List[str] = [c['nombre'] for c in cabecera['columnas']]
+        self._decodificadas: Dict[str, list] = {}
+
+    def columna(self, nombre: str) -> list:
+        """Valores de una columna (se descomprime una sola vez)"""
+        valores = self._decodificadas.get(nombre)
+        if valores is not None:
+            return valores
+
+        especificacion = self._especificaciones[nombre]
+        inicio = self._inicio_bloques + especificacion['inicio']
+        datos = zlib.decompress(self._mapa[inicio:inicio + especificacion['longitud']])
+        codificacion = especificacion['codificacion']
+        if codificacion == 'entero':
+            valores = _desde_bytes('q', datos).tolist()
+        elif codificacion == 'real':
+            valores = _desde_bytes('d', datos).tolist()
+        elif codificacion == 'diccionario':
+            longitud, = _LONGITUD.unpack_from(datos, 0)
+            fin = _LONGITUD.size + longitud
+            distintos = json.loads(datos[_LONGITUD.size:fin].decode('utf-8'))
+            valores = [distintos[i] for i in _desde_bytes(especificacion['indices'], datos[fin:])]
+        else:
+            valores = json.loads(datos.decode('utf-8'))
+
+        self._decodificadas[nombre] = valores
+        return valores
+
+    def fila(self, posicion: int, columnas: List[str] = None) -> tuple:
+        return tuple(self.columna(nombre)[posicion] for nombre in (columnas or self.columnas))
+
+    def cerrar(self):
+        mapa = getattr(self, '_mapa', None)
+        if mapa is not None:
+            mapa.close()
+            self._mapa = None
+        self._archivo.close()
+        self._decodificadas = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
@@ -0,0 +1,576 @@
+"""
+Archivo Histórico de Facturas por Mes
+Mueve los meses cerrados de facturas y facturas_rechazadas a archivos
+columnares comprimidos (archivo_columnar), uno por tabla y mes, para que
+notas_credito.db, que los workflows copian y versionan, no crezca sin límite.
+
+ESTRUCTURA:
+- Archivos: <directorio>/<tabla>/<YYYY-MM>-<huella>.ncol, ordenados por
+  (fecha DESC, id DESC), el mismo orden de los listados de la API
+- archivo_meses (en la BD): archivo, filas, rango de ids y fechas, sha256 y
+  los totales de resumen_totales de las filas archivadas
+
+Archivar un mes es una sola transacción: se escribe y verifica el archivo,
+se registra el mes, se borran sus filas y se devuelven sus totales a
+resumen_totales (los triggers de borrado los habían descontado), así el
+dashboard no cambia. Las consultas de la API (listados por cursor, conteos,
+exportaciones, reporte operativo, detalle de factura) unen las filas vivas
+con las archivadas; los meses se descartan por su rango de fechas antes de
+abrir el archivo.
+
+Un mes archivado no admite nueva ingesta (main.py lo omite): las notas se
+aplicarían contra facturas que ya no están en la BD. restaurar_mes devuelve
+el mes completo a la BD.
+"""
+import hashlib
+import json
+import logging
+import operator
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from core.agregados_manager import AgregadosManager
+    from core.archivo_columnar import LectorColumnar, escribir_columnar
+    from core.razones_rechazo import clasificar_pendientes
+    from core.sqlite_pool import conectar
+except ImportError:
+    from agregados_manager import AgregadosManager
+    from archivo_columnar import LectorColumnar, escribir_columnar
+    from razones_rechazo import clasificar_pendientes
+    from sqlite_pool import conectar
+
+logger = logging.getLogger(__name__)
+
+# Tablas que se pueden archivar: columna de fecha que define el mes
+TABLAS_ARCHIVABLES = {
+    'facturas': 'fecha_factura',
+    'facturas_rechazadas': 'fecha_factura',
+}
+
+EXTENSION = '.ncol'
+
+# Condiciones de los listados que el archivo sabe evaluar: "columna op ?" y "columna IS [NOT] NULL"
+_PATRON_COMPARACION = re.compile(r'^\s*(\w+)\s*(=|==|!=|<>|<=|>=|<|>)\s*\?\s*$')
+_PATRON_NULO = re.compile(r'^\s*(\w+)\s+IS\s+(NOT\s+)?NULL\s*$', re.IGNORECASE)
+_OPERADORES = {
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne, '<>': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+}
+
+
+def _clave_sql(valor):
+    """Orden de SQLite entre tipos: números antes que textos"""
+    return (0, valor) if isinstance(valor, (int, float)) else (1, valor)
+
+
+class ArchivoManager:
+    """Archiva, restaura y consulta los meses cerrados de las tablas de facturas"""
+
+    def __init__(self, db_path: str = './data/notas_credito.db', directorio: str = None,
+                 meses_en_memoria: int = 6):
+        """
+        Args:
+            db_path: Ruta de la base de datos SQLite
+            directorio: Carpeta de los archivos (por defecto <carpeta de la BD>/archivo)
+            meses_en_memoria: Archivos abiertos (con sus columnas ya descomprimidas)
+                que se conservan entre consultas
+        """
+        self.db_path = db_path
+        self.directorio = Path(directorio) if directorio else Path(db_path).parent / 'archivo'
+        self.meses_en_memoria = meses_en_memoria
+        self._abiertos = OrderedDict()
+        self._lock = threading.Lock()
+        self._instalado = False
+
+    # =========================================================================
+    # INSTALACIÓN
+    # =========================================================================
+
+    @staticmethod
+    def instalar(conn: sqlite3.Connection):
+        """Crea la tabla archivo_meses si no existe (no confirma la transacción)"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS archivo_meses (
+                tabla TEXT NOT NULL,
+                mes TEXT NOT NULL,
+                archivo TEXT NOT NULL,
+                filas INTEGER NOT NULL,
+                id_min INTEGER NOT NULL,
+                id_max INTEGER NOT NULL,
+                fecha_min TEXT NOT NULL,
+                fecha_max TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                totales TEXT NOT NULL,
+                fecha_archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (tabla, mes)
+            )
+        ''')
+
+    def asegurar_instalado(self):
+        if self._instalado:
+            return
+        conn = conectar(self.db_path)
+        try:
+            self.instalar(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self._instalado = True
+
+    @contextmanager
+    def _conexion(self, conn: sqlite3.Connection = None):
+        """Usa la conexión del llamador o abre una propia"""
+        self.asegurar_instalado()
+        if conn is not None:
+            yield conn
+            return
+        propia = conectar(self.db_path)
+        try:
+            yield propia
+        finally:
+            propia.close()
+
+    # =========================================================================
+    # MESES
+    # =========================================================================
+
+    @staticmethod
+    def rango_mes(mes: str) -> Tuple[str, str]:
+        """
+        Límites [inicio, fin) de un mes YYYY-MM
+
+        Raises:
+            ValueError: Si el mes no tiene formato YYYY-MM
+        """
+        inicio = datetime.strptime(mes, '%Y-%m')
+        anio, numero = (inicio.year + 1, 1) if inicio.month == 12 else (inicio.year, inicio.month + 1)
+        return inicio.strftime('%Y-%m-%d'), f'{anio:04d}-{numero:02d}-01'
+
+    @staticmethod
+    def _tabla_archivable(tabla: str) -> str:
+        if tabla not in TABLAS_ARCHIVABLES:
+            raise ValueError(f"La tabla {tabla} no se puede archivar")
+        return TABLAS_ARCHIVABLES[tabla]
+
+    def meses(self, tabla: str = None, conn: sqlite3.Connection = None) -> List[Dict]:
+        """Meses archivados (del más reciente al más antiguo)"""
+        with self._conexion(conn) as conn:
+            cursor = conn.execute(
+                'SELECT * FROM archivo_meses WHERE ?1 IS NULL OR tabla = ?1 ORDER BY mes DESC, tabla',
+                (tabla,))
+            nombres = [d[0] for d in cursor.description]
+            return [dict(zip(nombres, fila)) for fila in cursor.fetchall()]
+
+    def mes_archivado(self, fecha: str, conn: sqlite3.Connection = None) -> bool:
+        """True si el mes de la fecha (YYYY-MM-DD o YYYY-MM) está archivado en alguna tabla"""
+        with self._conexion(conn) as conn:
+            return conn.execute('SELECT 1 FROM archivo_meses WHERE mes = ? LIMIT 1',
+                                (fecha[:7],)).fetchone() is not None
+
+    def meses_archivables(self, meses_retencion: int = 3, hoy: date = None) -> List[Tuple[str, str]]:
+        """
+        Meses con filas en la BD anteriores a la ventana de retención
+
+        Args:
+            meses_retencion: Meses cerrados que se mantienen en la BD además del actual
+            hoy: Fecha de referencia (por defecto hoy)
+
+        Returns:
+            [(tabla, 'YYYY-MM')] del más antiguo al más reciente
+        """
+        if meses_retencion < 0:
+            raise ValueError("meses_retencion no puede ser negativo")
+        hoy = hoy or date.today()
+        indice = hoy.year * 12 + hoy.month - 1 - meses_retencion
+        corte = f'{indice // 12:04d}-{indice % 12 + 1:02d}-01'
+
+        archivables = []
+        with self._conexion() as conn:
+            for tabla, columna in TABLAS_ARCHIVABLES.items():
+                archivables += [(tabla, mes) for (mes,) in conn.execute(
+                    f'SELECT DISTINCT substr({columna}, 1, 7) FROM {tabla} WHERE {columna} < ? ORDER BY 1',
+                    (corte,))]
+        return sorted(archivables, key=lambda item: (item[1], item[0]))
+
+    # =========================================================================
+    # ARCHIVAR / RESTAURAR
+    # =========================================================================
+
+    @staticmethod
+    def _sha256(ruta: Path) -> str:
+        huella = hashlib.sha256()
+        with open(ruta, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(1 << 20), b''):
+                huella.update(bloque)
+        return huella.hexdigest()
+
+    def _registro(self, conn: sqlite3.Connection, tabla: str, mes: str) -> Optional[Dict]:
+        cursor = conn.execute('SELECT * FROM archivo_meses WHERE tabla = ? AND mes = ?', (tabla, mes))
+        fila = cursor.fetchone()
+        return dict(zip([d[0] for d in cursor.description], fila)) if fila else None
+
+    def archivar_mes(self, tabla: str, mes: str) -> Dict:
+        """
+        Mueve las filas de un mes de la BD a su archivo columnar
+
+        Si el mes ya estaba archivado y aparecieron filas nuevas, se escribe un
+        archivo con ambas y se reemplaza el anterior.
+
+        Returns:
+            {'tabla', 'mes', 'archivado', 'filas', 'filas_movidas', 'archivo', 'bytes'}
+        """
+        columna_fecha = self._tabla_archivable(tabla)
+        inicio, fin = self.rango_mes(mes)
+        where = f' WHERE {columna_fecha} >= ? AND {columna_fecha} < ?'
+
+        self.asegurar_instalado()
+        conn = conectar(self.db_path)
+        temporal = ruta_nueva = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            anterior = self._registro(conn, tabla, mes)
+            cursor = conn.execute(
+                f'SELECT * FROM {tabla}{where} ORDER BY {columna_fecha} DESC, id DESC', (inicio, fin))
+            columnas = [d[0] for d in cursor.description]
+            vivas = [tuple(fila) for fila in cursor.fetchall()]
+            if not vivas:
+                conn.rollback()
+                return {'tabla': tabla, 'mes': mes, 'archivado': False, 'filas': 0, 'filas_movidas': 0}
+
+            totales_vivas = AgregadosManager.totales_tabla(conn, tabla, where, (inicio, fin))
+            totales = dict(totales_vivas)
+            filas = vivas
+            if anterior:
+                with LectorColumnar(str(self.directorio / anterior['archivo'])) as lector:
+                    valores = [lector.columna(c) if c in lector.columnas else [None] * lector.filas
+                               for c in columnas]
+                    filas = vivas + list(zip(*valores))
+                for col, valor in json.loads(anterior['totales']).items():
+                    totales[col] = totales.get(col, 0) + valor
+                pos_fecha, pos_id = columnas.index(columna_fecha), columnas.index('id')
+                filas.sort(key=lambda fila: (fila[pos_fecha], fila[pos_id]), reverse=True)
+
+            fechas = [fila[columnas.index(columna_fecha)] for fila in filas]
+            ids = [fila[columnas.index('id')] for fila in filas]
+            metadatos = {'tabla': tabla, 'mes': mes, 'fecha_min': min(fechas), 'fecha_max': max(fechas),
+                         'id_min': min(ids), 'id_max': max(ids)}
+
+            # Escritura en un temporal; el nombre final lleva la huella del contenido
+            carpeta = self.directorio / tabla
+            carpeta.mkdir(parents=True, exist_ok=True)
+            temporal = carpeta / f'.{mes}{EXTENSION}.tmp'
+            tamano = escribir_columnar(str(temporal), columnas, filas, metadatos)
+            sha256 = self._sha256(temporal)
+            ruta_nueva = carpeta / f'{mes}-{sha256[:12]}{EXTENSION}'
+            os.replace(temporal, ruta_nueva)
+
+            with LectorColumnar(str(ruta_nueva)) as lector:
+                if lector.filas != len(filas) or lector.columna('id') != ids:
+                    raise ValueError(f"Verificación fallida del archivo {ruta_nueva}")
+
+            conn.execute('''
+                INSERT OR REPLACE INTO archivo_meses
+                    (tabla, mes, archivo, filas, id_min, id_max, fecha_min, fecha_max,
+                     bytes, sha256, totales, fecha_archivado)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (tabla, mes, ruta_nueva.relative_to(self.directorio).as_posix(), len(filas),
+                  metadatos['id_min'], metadatos['id_max'], metadatos['fecha_min'], metadatos['fecha_max'],
+                  tamano, sha256, json.dumps(totales)))
+            # Los triggers de borrado descuentan los totales: se devuelven los de las filas movidas
+            conn.execute(f'DELETE FROM {tabla}{where}', (inicio, fin))
+            AgregadosManager.ajustar(conn, totales_vivas)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            if temporal is not None:
+                temporal.unlink(missing_ok=True)
+            if ruta_nueva is not None and not (anterior and ruta_nueva == self.directorio / anterior['archivo']):
+                ruta_nueva.unlink(missing_ok=True)
+            raise
+        finally:
+            conn.close()
+
+        if anterior and anterior['archivo'] != ruta_nueva.relative_to(self.directorio).as_posix():
+            (self.directorio / anterior['archivo']).unlink(missing_ok=True)
+
+        logger.info(f"Archivado {tabla} {mes}: {len(vivas)} fila(s) movidas, "
+                    f"{len(filas)} en {ruta_nueva.name} ({tamano:,} bytes)")
+        return {'tabla': tabla, 'mes': mes, 'archivado': True, 'filas': len(filas),
+                'filas_movidas': len(vivas), 'archivo': ruta_nueva.relative_to(self.directorio).as_posix(),
+                'bytes': tamano}
+
+    def archivar(self, meses_retencion: int = 3, hoy: date = None) -> List[Dict]:
+        """Archiva todos los meses anteriores a la ventana de retención"""
+        return [self.archivar_mes(tabla, mes) for tabla, mes in self.meses_archivables(meses_retencion, hoy)]
+
+    def compactar(self) -> Dict:
+        """
+        VACUUM de la BD: las páginas liberadas al archivar se devuelven al
+        sistema de archivos (sin esto el archivo .db no se achica)
+
+        Returns:
+            {'bytes_antes', 'bytes_despues'}
+        """
+        antes = os.path.getsize(self.db_path)
+        conn = conectar(self.db_path)
+        try:
+            conn.execute('VACUUM')
+            # En modo WAL el archivo principal se reescribe al hacer checkpoint
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        finally:
+            conn.close()
+        despues = os.path.getsize(self.db_path)
+        logger.info(f"BD compactada: {antes:,} -> {despues:,} bytes")
+        return {'bytes_antes': antes, 'bytes_despues': despues}
+
+    def restaurar_mes(self, tabla: str, mes: str) -> Dict:
+        """
+        Devuelve a la BD las filas de un mes archivado y elimina su archivo
+
+        Raises:
+            ValueError: Si el mes no está archivado o el archivo no coincide con su huella
+        """
+        self._tabla_archivable(tabla)
+        self.asegurar_instalado()
+        conn = conectar(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            registro = self._registro(conn, tabla, mes)
+            if not registro:
+                raise ValueError(f"{tabla} {mes} no está archivado")
+            ruta = self.directorio / registro['archivo']
+            if self._sha256(ruta) != registro['sha256']:
+                raise ValueError(f"{ruta} no coincide con la huella registrada")
+
+            columnas_tabla = {fila[1] for fila in conn.execute(f'PRAGMA table_info({tabla})')}
+            with LectorColumnar(str(ruta)) as lector:
+                columnas = [c for c in lector.columnas if c in columnas_tabla]
+                filas = list(zip(*(lector.columna(c) for c in columnas)))
+
+            # Los triggers de inserción vuelven a sumar los totales que quedaron del archivo
+            AgregadosManager.ajustar(conn, json.loads(registro['totales']), -1)
+            conn.executemany(
+                f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' for _ in columnas)})",
+                filas)
+            if tabla == 'facturas_rechazadas' and 'codigo_rechazo' not in columnas:
+                # Archivo anterior al catálogo de razones: el código sale del texto
+                clasificar_pendientes(conn)
+            conn.execute('DELETE FROM archivo_meses WHERE tabla = ? AND mes = ?', (tabla, mes))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        with self._lock:
+            self._abiertos.pop(str(ruta), None)
+        ruta.unlink(missing_ok=True)
+        logger.info(f"Restaurado {tabla} {mes}: {len(filas)} fila(s)")
+        return {'tabla': tabla, 'mes': mes, 'filas': len(filas)}
+
+    def verificar(self) -> Dict:
+        """
+        Comprueba cada mes archivado: archivo presente, huella, cantidad de
+        filas y que no haya filas del mes en la BD (ingesta posterior al archivo)
+
+        Returns:
+            {'consistente': bool, 'meses': [{tabla, mes, archivo, filas, problemas}]}
+        """
+        resultado = []
+        with self._conexion() as conn:
+            for registro in self.meses(conn=conn):
+                problemas = []
+                ruta = self.directorio / registro['archivo']
+                if not ruta.exists():
+                    problemas.append('archivo inexistente')
+                elif self._sha256(ruta) != registro['sha256']:
+                    problemas.append('la huella sha256 no coincide')
+                else:
+                    with LectorColumnar(str(ruta)) as lector:
+                        if lector.filas != registro['filas']:
+                            problemas.append(f"{lector.filas} filas en el archivo, {registro['filas']} registradas")
+
+                columna = TABLAS_ARCHIVABLES[registro['tabla']]
+                vivas = conn.execute(
+                    f"SELECT COUNT(*) FROM {registro['tabla']} WHERE {columna} >= ? AND {columna} < ?",
+                    self.rango_mes(registro['mes'])).fetchone()[0]
+                if vivas:
+                    problemas.append(f'{vivas} fila(s) del mes siguen en la BD (volver a archivar el mes)')
+
+                resultado.append({'tabla': registro['tabla'], 'mes': registro['mes'],
+                                  'archivo': registro['archivo'], 'filas': registro['filas'],
+                                  'problemas': problemas})
+
+        consistente = not any(mes['problemas'] for mes in resultado)
+        if not consistente:
+            logger.warning("Archivo histórico con problemas: "
+                           f"{sum(1 for mes in resultado if mes['problemas'])} mes(es)")
+        return {'consistente': consistente, 'meses': resultado}
+
+    # =========================================================================
+    # CONSULTA
+    # =========================================================================
+
+    def _lector(self, registro: Dict) -> LectorColumnar:
+        """Archivo abierto (LRU); el nombre lleva la huella, así que nunca queda desactualizado"""
+        ruta = str(self.directorio / registro['archivo'])
+        with self._lock:
+            lector = self._abiertos.get(ruta)
+            if lector is not None:
+                self._abiertos.move_to_end(ruta)
+                return lector
+        lector = LectorColumnar(ruta)
+        with self._lock:
+            self._abiertos[ruta] = lector
+            while len(self._abiertos) > max(self.meses_en_memoria, 1):
+                # Sin cerrar: otro hilo puede estar leyéndolo; se libera al perder la referencia
+                self._abiertos.popitem(last=False)
+        return lector
+
+    @staticmethod
+    def _compilar(condiciones: List[Tuple[str, list]]) -> List[Tuple[str, object, object]]:
+        """
+        Condiciones SQL de los listados a predicados [(columna, operador, valor)]
+
+        Raises:
+            ValueError: Si alguna condición no es "columna op ?" ni "columna IS [NOT] NULL"
+        """
+        predicados = []
+        for sql, params in condiciones:
+            comparacion = _PATRON_COMPARACION.match(sql)
+            if comparacion and len(params) == 1:
+                predicados.append((comparacion.group(1), _OPERADORES[comparacion.group(2)], params[0]))
+                continue
+            nulo = _PATRON_NULO.match(sql)
+            if nulo and not params:
+                predicados.append((nulo.group(1), 'no_nulo' if nulo.group(2) else 'nulo', None))
+                continue
+            raise ValueError(f"Condición no soportada por el archivo histórico: {sql}")
+        return predicados
+
+    @staticmethod
+    def _cumple(valor, operador, referencia) -> bool:
+        if operador == 'nulo':
+            return valor is None
+        if operador == 'no_nulo':
+            return valor is not None
+        if valor is None or referencia is None:
+            return False
+        return operador(_clave_sql(valor), _clave_sql(referencia))
+
+    def _candidatos(self, tabla: str, predicados: List, conn: sqlite3.Connection) -> List[Dict]:
+        """Meses archivados cuyo rango de fechas puede cumplir los filtros de fecha"""
+        columna = TABLAS_ARCHIVABLES.get(tabla)
+        if columna is None:
+            return []
+        meses = self.meses(tabla, conn)
+        for col, operador, valor in predicados:
+            if col != columna:
+                continue
+            if operador == 'nulo' or (operador not in ('no_nulo',) and valor is None):
+                return []  # Las filas archivadas siempre tienen fecha
+            if operador in (operator.gt, operator.ge, operator.eq):
+                meses = [m for m in meses if m['fecha_max'] >= str(valor)]
+            if operador in (operator.lt, operator.le, operator.eq):
+                meses = [m for m in meses if m['fecha_min'] <= str(valor)]
+        return meses
+
+    @staticmethod
+    def _primera_despues(fechas: list, ids: list, clave: Tuple) -> int:
+        """Posición de la primera fila con (fecha, id) < clave (las filas están en orden descendente)"""
+        inferior, superior = 0, len(ids)
+        while inferior < superior:
+            medio = (inferior + superior) // 2
+            if (fechas[medio], ids[medio]) < clave:
+                superior = medio
+            else:
+                inferior = medio + 1
+        return inferior
+
+    def _posiciones(self, tabla: str, condiciones: List[Tuple[str, list]], despues_de: Tuple = None,
+                    conn: sqlite3.Connection = None) -> Iterator[Tuple[LectorColumnar, int]]:
+        """(archivo, posición) de las filas que cumplen los filtros, en orden (fecha DESC, id DESC)"""
+        if despues_de is not None and despues_de[0] is None:
+            return  # Continuación por las filas sin fecha: ninguna está archivada
+        predicados = self._compilar(condiciones)
+        columna_fecha = TABLAS_ARCHIVABLES.get(tabla)
+        for registro in self._candidatos(tabla, predicados, conn):
+            if despues_de is not None and registro['fecha_min'] > despues_de[0]:
+                continue
+            lector = self._lector(registro)
+            inicio = 0
+            if despues_de is not None:
+                inicio = self._primera_despues(lector.columna(columna_fecha), lector.columna('id'),
+                                               tuple(despues_de))
+            filtros = [(lector.columna(col) if col in lector.columnas else [None] * lector.filas, op, valor)
+                       for col, op, valor in predicados]
+            for posicion in range(inicio, lector.filas):
+                if all(self._cumple(valores[posicion], op, valor) for valores, op, valor in filtros):
+                    yield lector, posicion
+
+    def filas(self, tabla: str, condiciones: List[Tuple[str, list]], limite: int = None,
+              despues_de: Tuple = None, conn: sqlite3.Connection = None) -> List[Dict]:
+        """
+        Filas archivadas que cumplen los filtros, en orden (fecha DESC, id DESC)
+
+        Args:
+            tabla: Tabla original
+            condiciones: Filtros [(sql, [parámetros])] como los de PaginadorKeyset
+            limite: Máximo de filas
+            despues_de: Clave (fecha, id) de continuación; solo filas estrictamente menores
+            conn: Conexión para leer archivo_meses (opcional)
+        """
+        filas = []
+        if limite is not None and limite <= 0:
+            return filas
+        with self._conexion(conn) as conn:
+            for lector, posicion in self._posiciones(tabla, condiciones, despues_de, conn):
+                filas.append(dict(zip(lector.columnas, lector.fila(posicion))))
+                if limite is not None and len(filas) >= limite:
+                    break
+        return filas
+
+    def contar(self, tabla: str, condiciones: List[Tuple[str, list]], conn: sqlite3.Connection = None) -> int:
+        """Total de filas archivadas que cumplen los filtros"""
+        with self._conexion(conn) as conn:
+            if not condiciones:
+                return sum(registro['filas'] for registro in self.meses(tabla, conn))
+            return sum(1 for _ in self._posiciones(tabla, condiciones, conn=conn))
+
+    def lotes(self, tabla: str, columnas: List[str], condiciones: List[Tuple[str, list]],
+              tamano: int, conn: sqlite3.Connection = None) -> Iterator[List[tuple]]:
+        """Filas archivadas como tuplas de `columnas`, en lotes (exportaciones)"""
+        with self._conexion(conn) as conn:
+            lote = []
+            for lector, posicion in self._posiciones(tabla, condiciones, conn=conn):
+                lote.append(tuple(lector.columna(c)[posicion] if c in lector.columnas else None
+                                  for c in columnas))
+                if len(lote) >= tamano:
+                    yield lote
+                    lote = []
+            if lote:
+                yield lote
+
+    def obtener_por_id(self, tabla: str, fila_id: int, conn: sqlite3.Connection = None) -> Optional[Dict]:
+        """Fila archivada por id, o None"""
+        with self._conexion(conn) as conn:
+            for registro in self.meses(tabla, conn):
+                if not registro['id_min'] <= fila_id <= registro['id_max']:
+                    continue
+                lector = self._lector(registro)
+                try:
+                    posicion = lector.columna('id').index(fila_id)
+                except ValueError:
+                    continue
+                return dict(zip(lector.columnas, lector.fila(posicion)))
+        return None
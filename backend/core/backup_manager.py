@@ -0,0 +1,435 @@
+"""
+Respaldos de la Base de Datos
+Copias en caliente de notas_credito.db con la API de respaldo en línea de
+SQLite, comprimidas (zstd o gzip) y con huellas sha256, más retención,
+verificación y restauración. Solo usa la biblioteca estándar; zstd requiere
+el paquete opcional `zstandard` (sin él se usa gzip).
+
+- La copia avanza por pasos de `paginas_por_paso` páginas. En modo WAL (el
+  del pool) se hace sobre una instantánea de lectura abierta: el escritor
+  nunca espera y la copia no se reinicia aunque haya escrituras. En modo
+  rollback (DELETE) cada paso toma el bloqueo compartido solo durante el
+  paso (con `pausa_ms` entre pasos) y SQLite reinicia la copia si otra
+  conexión escribe; tras `max_reinicios` se aborta
+- La copia se escribe en un temporal del directorio de respaldos, se revisa
+  con PRAGMA quick_check y se comprime en streaming calculando el sha256 de
+  la BD y del archivo comprimido
+- Cada respaldo tiene un manifiesto JSON al lado (<nombre>.json) con huellas,
+  tamaños, versión del esquema y duración
+- restaurar() descomprime a un temporal, comprueba las huellas y la
+  integridad, respalda la BD actual y la reemplaza con la API de respaldo
+  (las conexiones abiertas ven el cambio; no se reemplaza el archivo)
+
+ESTRUCTURA:
+<directorio>/<bd>_<YYYYMMDD_HHMMSS>.db.zst | .db.gz
+<directorio>/<bd>_<YYYYMMDD_HHMMSS>.json
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = {'zstd': '.db.zst', 'gzip': '.db.gz'}
+# Errores de un archivo comprimido truncado o dañado
+ERRORES_DESCOMPRESION = (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+NIVELES = {'zstd': 3, 'gzip': 6}
+BLOQUE = 1024 * 1024
+
+
+def compresiones_disponibles() -> List[str]:
+    return ['zstd', 'gzip'] if zstandard is not None else ['gzip']
+
+
+class _LectorConHuella:
+    """Archivo de lectura que acumula sha256 y bytes de lo leído"""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.huella = hashlib.sha256()
+        self.bytes = 0
+
+    def read(self, tamano: int = -1) -> bytes:
+        datos = self.archivo.read(tamano)
+        self.huella.update(datos)
+        self.bytes += len(datos)
+        return datos
+
+
+class _EscritorConHuella:
+    """Archivo de escritura (o ninguno) que acumula sha256 y bytes de lo escrito"""
+
+    def __init__(self, archivo=None):
+        self.archivo = archivo
+        self.huella = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, datos) -> int:
+        self.huella.update(datos)
+        self.bytes += len(datos)
+        if self.archivo is not None:
+            self.archivo.write(datos)
+        return len(datos)
+
+    def flush(self):
+        if self.archivo is not None:
+            self.archivo.flush()
+
+
+def _comprimir(lector, escritor, compresion: str, tamano: int):
+    if compresion == 'zstd':
+        compresor = zstandard.ZstdCompressor(level=NIVELES['zstd'], threads=-1)
+        compresor.copy_stream(lector, escritor, size=tamano, read_size=BLOQUE, write_size=BLOQUE)
+    else:
+        with gzip.GzipFile(fileobj=escritor, mode='wb', compresslevel=NIVELES['gzip'], mtime=0) as comprimido:
+            shutil.copyfileobj(lector, comprimido, BLOQUE)
+
+
+def _descomprimir(lector, escritor, compresion: str):
+    if compresion == 'zstd':
+        if zstandard is None:
+            raise ValueError("El respaldo usa zstd y el paquete `zstandard` no está instalado")
+        zstandard.ZstdDecompressor().copy_stream(lector, escritor, read_size=BLOQUE, write_size=BLOQUE)
+    else:
+        with gzip.GzipFile(fileobj=lector, mode='rb') as comprimido:
+            shutil.copyfileobj(comprimido, escritor, BLOQUE)
+
+
+def _abrir_inmutable(ruta: Path) -> sqlite3.Connection:
+    """Conexión de solo lectura a una copia que nadie más usa (sin -wal ni -shm)"""
+    return sqlite3.connect(f'file:{ruta}?immutable=1', uri=True)
+
+
+def _quick_check(ruta: Path, completo: bool = False) -> str:
+    conn = _abrir_inmutable(ruta)
+    try:
+        filas = conn.execute('PRAGMA integrity_check' if completo else 'PRAGMA quick_check').fetchall()
+    finally:
+        conn.close()
+    return '; '.join(str(fila[0]) for fila in filas[:5])
+
+
+def _eliminar(ruta: Path):
+    for sufijo in ('', '-wal', '-shm', '-journal'):
+        try:
+            os.remove(f'{ruta}{sufijo}')
+        except FileNotFoundError:
+            pass
+
+
+class BackupManager:
+    """Crea, lista, depura, verifica y restaura respaldos comprimidos de la BD"""
+
+    def __init__(self, directorio: str = './backups', compresion: str = 'auto',
+                 paginas_por_paso: int = 4096, pausa_ms: float = 0, max_reinicios: int = 3):
+        """
+        Args:
+            directorio: Carpeta de los respaldos
+            compresion: 'zstd', 'gzip' o 'auto' (zstd si está instalado)
+            paginas_por_paso: Páginas copiadas por paso de la API de respaldo
+            pausa_ms: Espera entre pasos (cede el bloqueo al escritor en modo rollback)
+            max_reinicios: Reinicios de la copia por escrituras concurrentes antes de abortar
+        """
+        if compresion == 'auto':
+            compresion = compresiones_disponibles()[0]
+        if compresion not in compresiones_disponibles():
+            raise ValueError(f"Compresión no disponible: {compresion} (disponibles: "
+                             f"{', '.join(compresiones_disponibles())})")
+        self.directorio = Path(directorio)
+        self.compresion = compresion
+        self.paginas_por_paso = paginas_por_paso
+        self.pausa_ms = pausa_ms
+        self.max_reinicios = max_reinicios
+
+    # =========================================================================
+    # CREACIÓN
+    # =========================================================================
+
+    def _copiar(self, db_path: str, destino: Path) -> Dict:
+        """Copia en caliente por pasos; devuelve modo de journal, pasos y reinicios"""
+        origen = sqlite3.connect(db_path, isolation_level=None)
+        copia = sqlite3.connect(str(destino))
+        avance = {'pasos': 0, 'reinicios': 0, 'restantes': None}
+
+        def progreso(estado, restantes, total):
+            if avance['restantes'] is not None and restantes > avance['restantes']:
+                avance['reinicios'] += 1
+                if avance['reinicios'] > self.max_reinicios:
+                    raise sqlite3.OperationalError(
+                        f"La BD cambió {avance['reinicios']} veces durante el respaldo; usar modo WAL "
+                        f"o respaldar fuera de la ingesta")
+            avance['restantes'] = restantes
+            avance['pasos'] += 1
+            if self.pausa_ms:
+                time.sleep(self.pausa_ms / 1000)
+
+        try:
+            modo = origen.execute('PRAGMA journal_mode').fetchone()[0].lower()
+            if modo == 'wal':
+                # Instantánea de lectura: los pasos leen siempre la misma versión
+                origen.execute('BEGIN')
+                origen.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            origen.backup(copia, pages=self.paginas_por_paso, progress=progreso)
+            if origen.in_transaction:
+                origen.execute('COMMIT')
+        finally:
+            origen.close()
+            copia.close()
+        return {'journal_mode': modo, 'pasos': avance['pasos'], 'reinicios': avance['reinicios']}
+
+    def _nombre_libre(self, db_path: str) -> str:
+        base = f"{Path(db_path).stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        nombre, n = base, 1
+        while (self.directorio / f'{nombre}.json').exists():
+            n += 1
+            nombre = f'{base}_{n}'
+        return nombre
+
+    def crear(self, db_path: str, verificar_integridad: bool = True) -> Dict:
+        """
+        Respalda la BD sin detener a los escritores
+
+        Args:
+            db_path: Ruta de la base de datos
+            verificar_integridad: Ejecutar PRAGMA quick_check sobre la copia
+
+        Returns:
+            Manifiesto del respaldo
+
+        Raises:
+            FileNotFoundError: Si la BD no existe
+            sqlite3.DatabaseError: Si la copia no pasa quick_check o no se pudo copiar
+        """
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"No existe la base de datos: {db_path}")
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        nombre = self._nombre_libre(db_path)
+        temporal = self.directorio / f'.{nombre}.tmp'
+        archivo = self.directorio / f'{nombre}{EXTENSIONES[self.compresion]}'
+
+        inicio = time.perf_counter()
+        try:
+            copia = self._copiar(db_path, temporal)
+            duracion_copia = time.perf_counter() - inicio
+
+            conn = _abrir_inmutable(temporal)
+            try:
+                paginas = conn.execute('PRAGMA page_count').fetchone()[0]
+                tamano_pagina = conn.execute('PRAGMA page_size').fetchone()[0]
+                version_esquema = conn.execute('PRAGMA user_version').fetchone()[0]
+            finally:
+                conn.close()
+            if verificar_integridad:
+                resultado = _quick_check(temporal)
+                if resultado != 'ok':
+                    raise sqlite3.DatabaseError(f"La copia no pasó quick_check: {resultado}")
+
+            inicio_compresion = time.perf_counter()
+            with open(temporal, 'rb') as entrada, open(archivo, 'wb') as salida:
+                lector = _LectorConHuella(entrada)
+                escritor = _EscritorConHuella(salida)
+                _comprimir(lector, escritor, self.compresion, os.path.getsize(temporal))
+                salida.flush()
+                os.fsync(salida.fileno())
+            duracion_compresion = time.perf_counter() - inicio_compresion
+        except BaseException:
+            _eliminar(archivo)
+            raise
+        finally:
+            _eliminar(temporal)
+
+        manifiesto = {
+            'nombre': nombre,
+            'archivo': archivo.name,
+            'bd_origen': os.path.abspath(db_path),
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'compresion': self.compresion,
+            'bytes_bd': lector.bytes,
+            'bytes_archivo': escritor.bytes,
+            'sha256_bd': lector.huella.hexdigest(),
+            'sha256_archivo': escritor.huella.hexdigest(),
+            'paginas': paginas,
+            'tamano_pagina': tamano_pagina,
+            'version_esquema': version_esquema,
+            'journal_mode': copia['journal_mode'],
+            'pasos': copia['pasos'],
+            'reinicios': copia['reinicios'],
+            'integridad_verificada': verificar_integridad,
+            'duracion_copia_s': round(duracion_copia, 3),
+            'duracion_compresion_s': round(duracion_compresion, 3),
+        }
+        ruta_manifiesto = self.directorio / f'{nombre}.json'
+        temporal_manifiesto = self.directorio / f'.{nombre}.json.tmp'
+        temporal_manifiesto.write_text(json.dumps(manifiesto, indent=2, ensure_ascii=False), encoding='utf-8')
+        os.replace(temporal_manifiesto, ruta_manifiesto)
+
+        logger.info(f"Respaldo {archivo.name}: {lector.bytes:,} -> {escritor.bytes:,} bytes "
+                    f"({copia['pasos']} pasos, {duracion_copia:.2f} s copia, {duracion_compresion:.2f} s compresión)")
+        return manifiesto
+
+    # =========================================================================
+    # CONSULTA Y RETENCIÓN
+    # =========================================================================
+
+    def listar(self) -> List[Dict]:
+        """Manifiestos de los respaldos, del más antiguo al más reciente"""
+        if not self.directorio.is_dir():
+            return []
+        respaldos = []
+        for ruta in self.directorio.glob('*.json'):
+            try:
+                respaldos.append(json.loads(ruta.read_text(encoding='utf-8')))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Manifiesto ilegible {ruta.name}: {e}")
+        return sorted(respaldos, key=lambda m: (m['fecha'], m['nombre']))
+
+    def obtener(self, nombre: str) -> Dict:
+        """
+        Manifiesto de un respaldo por nombre (con o sin extensión)
+
+        Raises:
+            ValueError: Si no existe
+        """
+        for extension in list(EXTENSIONES.values()) + ['.json']:
+            if nombre.endswith(extension):
+                nombre = nombre[:-len(extension)]
+        ruta = self.directorio / f'{nombre}.json'
+        if not ruta.exists():
+            raise ValueError(f"No existe el respaldo: {nombre}")
+        return json.loads(ruta.read_text(encoding='utf-8'))
+
+    def limpiar(self, dias: int, minimo: int = 1) -> List[str]:
+        """
+        Elimina los respaldos con más de `dias` días, conservando siempre
+        los `minimo` más recientes
+
+        Returns:
+            Nombres eliminados
+        """
+        limite = (datetime.now() - timedelta(days=dias)).isoformat(timespec='seconds')
+        respaldos = self.listar()
+        conservados = respaldos[-minimo:] if minimo > 0 else []
+        eliminados = []
+        for manifiesto in respaldos:
+            if manifiesto['fecha'] >= limite or manifiesto in conservados:
+                continue
+            _eliminar(self.directorio / manifiesto['archivo'])
+            _eliminar(self.directorio / f"{manifiesto['nombre']}.json")
+            eliminados.append(manifiesto['nombre'])
+            logger.info(f"Respaldo eliminado por retención: {manifiesto['archivo']}")
+        return eliminados
+
+    # =========================================================================
+    # VERIFICACIÓN Y RESTAURACIÓN
+    # =========================================================================
+
+    def _extraer(self, manifiesto: Dict, destino: Optional[Path]) -> List[str]:
+        """Descomprime (a `destino` o solo para calcular huellas); devuelve los problemas"""
+        archivo = self.directorio / manifiesto['archivo']
+        if not archivo.exists():
+            return [f"No existe el archivo {manifiesto['archivo']}"]
+        problemas = []
+        salida = open(destino, 'wb') if destino is not None else None
+        try:
+            with open(archivo, 'rb') as entrada:
+                lector = _LectorConHuella(entrada)
+                escritor = _EscritorConHuella(salida)
+                try:
+                    _descomprimir(lector, escritor, manifiesto['compresion'])
+                except ERRORES_DESCOMPRESION as e:
+                    return [f"Archivo comprimido dañado: {e}"]
+                lector.huella.update(entrada.read())
+        finally:
+            if salida is not None:
+                salida.close()
+        if lector.huella.hexdigest() != manifiesto['sha256_archivo']:
+            problemas.append("sha256 del archivo comprimido no coincide")
+        if escritor.huella.hexdigest() != manifiesto['sha256_bd'] or escritor.bytes != manifiesto['bytes_bd']:
+            problemas.append("sha256 de la BD descomprimida no coincide")
+        return problemas
+
+    def verificar(self, nombre: str = None, completo: bool = False) -> Dict:
+        """
+        Comprueba las huellas de los respaldos (o de uno) y, con `completo`,
+        la integridad de la BD descomprimida (PRAGMA integrity_check)
+
+        Returns:
+            {'consistente', 'respaldos': [{'nombre', 'archivo', 'problemas'}]}
+        """
+        manifiestos = [self.obtener(nombre)] if nombre else self.listar()
+        resultados = []
+        for manifiesto in manifiestos:
+            temporal = self.directorio / f".{manifiesto['nombre']}.verificar.tmp" if completo else None
+            try:
+                problemas = self._extraer(manifiesto, temporal)
+                if completo and not problemas:
+                    resultado = _quick_check(temporal, completo=True)
+                    if resultado != 'ok':
+                        problemas.append(f"integrity_check: {resultado}")
+            finally:
+                if temporal is not None:
+                    _eliminar(temporal)
+            resultados.append({'nombre': manifiesto['nombre'], 'archivo': manifiesto['archivo'],
+                               'problemas': problemas})
+        return {'consistente': all(not r['problemas'] for r in resultados), 'respaldos': resultados}
+
+    def restaurar(self, nombre: str, db_path: str, respaldar_actual: bool = True) -> Dict:
+        """
+        Reemplaza el contenido de la BD por el de un respaldo
+
+        El respaldo se descomprime y verifica antes de tocar la BD; si la BD
+        existe, primero se respalda (salvo `respaldar_actual=False`).
+
+        Returns:
+            {'nombre', 'db_path', 'bytes', 'respaldo_previo'}
+
+        Raises:
+            ValueError: Si el respaldo no existe o no pasa la verificación
+        """
+        manifiesto = self.obtener(nombre)
+        destino = Path(db_path)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporal = destino.parent / f'.{destino.name}.restaurando-{os.getpid()}'
+        try:
+            problemas = self._extraer(manifiesto, temporal)
+            if not problemas:
+                resultado = _quick_check(temporal)
+                if resultado != 'ok':
+                    problemas.append(f"quick_check: {resultado}")
+            if problemas:
+                raise ValueError(f"El respaldo {manifiesto['nombre']} no pasó la verificación: "
+                                 f"{'; '.join(problemas)}")
+
+            respaldo_previo = None
+            if respaldar_actual and destino.exists() and destino.stat().st_size > 0:
+                respaldo_previo = self.crear(str(destino))['nombre']
+
+            origen = _abrir_inmutable(temporal)
+            conn = sqlite3.connect(str(destino))
+            try:
+                origen.backup(conn, pages=self.paginas_por_paso)
+            finally:
+                origen.close()
+                conn.close()
+        finally:
+            _eliminar(temporal)
+
+        logger.info(f"BD {db_path} restaurada desde {manifiesto['archivo']}"
+                    f"{f' (respaldo previo: {respaldo_previo})' if respaldo_previo else ''}")
+        return {'nombre': manifiesto['nombre'], 'db_path': str(destino), 'bytes': manifiesto['bytes_bd'],
+                'respaldo_previo': respaldo_previo}
+
@@ -5,9 +5,19 @@ Módulo de Reglas de Negocio para Filtrado de Facturas
 Contiene la lógica de validación y filtrado según criterios de negocio
 """
 import logging
-from typing import List, Dict, Tuple
+import re
+from typing import Any, List, Dict, Iterable, Tuple
 from collections import defaultdict
 
+try:
+    from core.linea_factura import LineaFactura
+    from core.razones_rechazo import (razon, MONTO_MINIMO, NO_AGENTE_RETENCION,
+                                      NOTA_TIPO_INVENTARIO, TIPO_INVENTARIO)
+except ImportError:
+    from linea_factura import LineaFactura
+    from razones_rechazo import (razon, MONTO_MINIMO, NO_AGENTE_RETENCION,
+                                 NOTA_TIPO_INVENTARIO, TIPO_INVENTARIO)
+
 logger = logging.getLogger(__name__)
 
 
@@ -55,6 +65,12 @@ class BusinessRulesValidator:
     
     def __init__(self):
         """Inicializa el validador de reglas de negocio"""
+        # Plan compilado: conjuntos/patrones normalizados una sola vez
+        self._tipos_excluidos = frozenset(t.strip().upper() for t in self.TIPOS_INVENTARIO_EXCLUIDOS)
+        self._patron_agente_excluido = re.compile('|'.join(
+            re.escape(valor.upper()) for valor in sorted(self.AGENTES_RETENCION_EXCLUIDOS, key=len, reverse=True)
+        ))
+
         logger.info(f"BusinessRulesValidator inicializado con {len(self.TIPOS_INVENTARIO_EXCLUIDOS)} tipos excluidos")
         logger.info(f"Monto mínimo por factura completa: ${self.MONTO_MINIMO:,.2f}")
         logger.info(f"Agentes de retención excluidos: {len(self.AGENTES_RETENCION_EXCLUIDOS)}")
@@ -233,144 +249,186 @@ class BusinessRulesValidator:
         
         return total
     
-    def filtrar_facturas(self, facturas: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    def _compilar_columnas(self, facturas: Iterable[Dict]) -> Dict[str, List[Any]]:
+        """
+        Recorre las líneas una sola vez, las convierte en LineaFactura y
+        extrae sus campos clave en columnas
+
+        También asigna indice_linea a cada línea. Tipo de inventario y agente
+        de retención se repiten mucho, así que se evalúan por valor distinto
+        en _evaluar_columnas.
+        """
+        filas, numeros, notas, tipos, agentes = [], [], [], [], []
+        for idx, linea in enumerate(LineaFactura.desde_filas(facturas)):
+            # Índice único por línea (distingue líneas repetidas del mismo producto)
+            linea.indice_linea = idx
+            filas.append(linea)
+            numeros.append(linea.numero_factura)
+            notas.append(linea.es_nota)
+            tipos.append(linea.tipo_inventario)
+            agentes.append(linea.agente_retencion)
+
+        return {'filas': filas, 'numero': numeros, 'es_nota': notas,
+                'tipo_inventario': tipos, 'agente': agentes}
+
+    def _evaluar_columnas(self, columnas: Dict[str, List[Any]]):
+        """
+        Evalúa en lote las reglas de tipo de inventario y agente de retención
+
+        Cada valor distinto se normaliza y se compara una sola vez; luego se
+        proyecta a columnas 'tipo' (normalizado), 'permitido' y 'agente_excluido'.
+        Equivale a _obtener_tipo_inventario_normalizado, tipo_inventario_permitido
+        y es_agente_retencion_no_permitido aplicados línea por línea.
+        """
+        tipos_normalizados = {tipo: tipo.upper() for tipo in set(columnas['tipo_inventario'])}
+        tipos = [tipos_normalizados[tipo] for tipo in columnas['tipo_inventario']]
+        excluidos = {tipo for tipo in set(tipos) if tipo in self._tipos_excluidos}
+
+        permitidos = [tipo not in excluidos for tipo in tipos]
+        sin_tipo = 0
+        for i, tipo in enumerate(tipos):
+            if tipo:
+                continue
+            sin_tipo += 1
+            # Notas sin tipo cuyo producto es un descuento se rechazan
+            if columnas['es_nota'][i]:
+                nombre_producto = columnas['filas'][i].producto.upper()
+                if 'DESCUENTO' in nombre_producto or 'DESCESPEC' in nombre_producto:
+                    permitidos[i] = False
+        if sin_tipo:
+            logger.warning(f"{sin_tipo} líneas sin tipo de inventario")
+
+        agentes_excluidos = {}
+        for agente in set(columnas['agente']):
+            agentes_excluidos[agente] = bool(agente) and self._patron_agente_excluido.search(agente.upper()) is not None
+
+        columnas['tipo'] = tipos
+        columnas['permitido'] = permitidos
+        columnas['agente_excluido'] = [agentes_excluidos[agente] for agente in columnas['agente']]
+
+    def filtrar_facturas(self, facturas: Iterable[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
         """
         Filtra facturas según reglas de negocio y separa notas crédito
 
-        IMPORTANTE: La validación de monto mínimo se aplica por FACTURA ACOPLADA
-        (sumando líneas por prefijo+número), no a cada línea individual.
-        El monto mínimo también se valida sobre el total de líneas procesables
-        (tipo de inventario permitido) para evitar que salgan facturas por
-        debajo del umbral en el archivo final.
+        Usa un plan compilado: los campos clave de cada línea se extraen una
+        sola vez en columnas (_compilar_columnas), las reglas de tipo de
+        inventario y agente de retención se evalúan por valor distinto
+        (_evaluar_columnas) y los totales por factura acoplada se acumulan en
+        la misma pasada que agrupa. El resultado (listas, orden y razones) es
+        idéntico al de la implementación línea por línea de
+        benchmarks/referencia_reglas.py.
 
-        IMPORTANTE: Cada línea recibe un índice único (_indice_linea) para distinguir
-        múltiples líneas del mismo producto en la misma factura.
+        Las líneas se recorren una sola vez, por lo que `facturas` puede ser
+        un generador (p. ej. SiesaAPIClient.iterar_facturas). Se entregan como
+        LineaFactura: el resto del procesamiento no vuelve a leer los f_*.
 
         Args:
-            facturas: Lista de facturas desde la API
+            facturas: Lista (o iterable) de facturas desde la API (dict o LineaFactura)
 
         Returns:
-            Tupla con tres listas:
+            Tupla con tres listas de LineaFactura (las rechazadas en {'factura', 'razon_rechazo',
+            'codigo_rechazo', 'parametros_rechazo'}, ver core/razones_rechazo.py):
             - facturas_validas: Facturas que cumplen todas las reglas
             - notas_credito: Notas crédito identificadas
             - facturas_rechazadas: Facturas rechazadas con razón
         """
-        # Asignar índice único a cada línea ANTES de procesar
-        # Esto permite distinguir líneas duplicadas del mismo producto en la misma factura
-        for idx, factura in enumerate(facturas):
-            factura['_indice_linea'] = idx
+        columnas = self._compilar_columnas(facturas)
+        self._evaluar_columnas(columnas)
+
+        filas = columnas['filas']
+        tipos = columnas['tipo']
+        permitidos = columnas['permitido']
+        es_nota = columnas['es_nota']
+        agente_excluido = columnas['agente_excluido']
 
         facturas_validas = []
         notas_credito = []
         facturas_rechazadas = []
 
-        # Separar notas crédito y validar tipo de inventario
-        # IMPORTANTE: Las notas de crédito con prefijo 'N' se aceptan
-        # SOLO si su tipo de inventario NO está en TIPOS_INVENTARIO_EXCLUIDOS
-        facturas_regulares = []
-        for factura in facturas:
-            if self.es_nota_credito(factura):
-                tipo_inv = self._obtener_tipo_inventario_normalizado(factura)
-                # Validar tipo de inventario en notas de crédito
-                if not self.tipo_inventario_permitido(factura):
-                    razon = f"Nota crédito con tipo de inventario excluido: {tipo_inv}"
-                    facturas_rechazadas.append({
-                        'factura': factura,
-                        'razon_rechazo': razon
-                    })
-                    logger.warning(f"❌ Nota crédito rechazada: {factura.get('f_prefijo', '')}{factura.get('f_nrodocto', '')} - Tipo inventario excluido: '{tipo_inv}'")
+        # Razón de cada (código, valor): tipos de inventario y agentes se repiten
+        # en muchas líneas, así que texto y parámetros se arman una vez por valor
+        # (los rechazos de esas líneas comparten el dict de parámetros)
+        razones = {}
+
+        def rechazo(codigo, parametro, valor):
+            resultado = razones.get((codigo, valor))
+            if resultado is None:
+                resultado = razones[(codigo, valor)] = razon(codigo, **{parametro: valor})
+            return resultado
+
+        # Grupo por factura acoplada: [índices válidos, índices rechazados por tipo, total procesable]
+        grupos = {}
+        rechazos_agente = 0
+        for i, numero in enumerate(columnas['numero']):
+            if es_nota[i]:
+                if permitidos[i]:
+                    notas_credito.append(filas[i])
                 else:
-                    notas_credito.append(factura)
-                    logger.debug(f"✅ Nota crédito aceptada: {factura.get('f_prefijo', '')}{factura.get('f_nrodocto', '')} - Tipo inventario: '{tipo_inv}'")
-            else:
-                # VALIDACIÓN CRÍTICA: Verificar f_02_014 (agente de retención)
-                if self.es_agente_retencion_no_permitido(factura):
-                    razon = f"NO AGENTE DE RETENCION (f_02_014='{factura.get('f_02_014', '')}') - No debe registrarse"
                     facturas_rechazadas.append({
-                        'factura': factura,
-                        'razon_rechazo': razon
+                        'factura': filas[i], **rechazo(NOTA_TIPO_INVENTARIO, 'tipo_inventario', tipos[i])
                     })
-                else:
-                    facturas_regulares.append(factura)
-
-        logger.info(f"Total documentos: {len(facturas)} ({len(facturas_regulares)} facturas, {len(notas_credito)} notas crédito válidas, {len(facturas_rechazadas)} documentos rechazados)")
-        
-        # Agrupar facturas regulares por número completo
-        facturas_agrupadas = self.agrupar_por_factura(facturas_regulares)
-        
-        logger.info(f"Facturas únicas a validar: {len(facturas_agrupadas)}")
-        
-        # Procesar cada factura completa
-        for numero_factura, lineas in facturas_agrupadas.items():
-            total_factura_bruta = self.calcular_total_factura(lineas)
-
-            # Validar tipo de inventario por línea
-            lineas_validas_factura = []
-            lineas_rechazadas_factura = []
-
-            for linea in lineas:
-                if not self.tipo_inventario_permitido(linea):
-                    tipo_inv = self._obtener_tipo_inventario_normalizado(linea)
-                    razon = f"Tipo de inventario excluido: {tipo_inv}"
-                    lineas_rechazadas_factura.append({
-                        'factura': linea,
-                        'razon_rechazo': razon
-                    })
-                else:
-                    lineas_validas_factura.append(linea)
+                continue
 
-            # Si todas las líneas de la factura fueron rechazadas por tipo de inventario
-            if len(lineas_validas_factura) == 0 and len(lineas_rechazadas_factura) > 0:
-                facturas_rechazadas.extend(lineas_rechazadas_factura)
-                logger.info(f"Factura rechazada por tipo inventario: {numero_factura} - {len(lineas)} líneas")
+            # VALIDACIÓN CRÍTICA: f_02_014 (agente de retención)
+            if agente_excluido[i]:
+                rechazos_agente += 1
+                facturas_rechazadas.append({
+                    'factura': filas[i], **rechazo(NO_AGENTE_RETENCION, 'agente_retencion',
+                                                   filas[i].agente_retencion_api or filas[i].agente_retencion)
+                })
                 continue
 
-            total_factura_procesable = self.calcular_total_factura(lineas_validas_factura)
+            grupo = grupos.get(numero)
+            if grupo is None:
+                grupo = grupos[numero] = [[], [], 0.0]
+            if permitidos[i]:
+                grupo[0].append(i)
+                grupo[2] += filas[i].valor_total
+            else:
+                grupo[1].append(i)
 
-            # Validar monto mínimo sobre líneas procesables de la factura acoplada
-            if total_factura_procesable < self.MONTO_MINIMO:
-                razon = (
-                    f"Valor total acoplado de líneas válidas ${total_factura_procesable:,.2f} "
-                    f"no cumple monto mínimo ${self.MONTO_MINIMO:,.2f}"
-                )
+        total_documentos = len(filas)
+        logger.info(f"Total documentos: {total_documentos} ({total_documentos - len(notas_credito) - len(facturas_rechazadas)} facturas, "
+                    f"{len(notas_credito)} notas crédito válidas, {len(facturas_rechazadas)} documentos rechazados)")
+        if rechazos_agente:
+            logger.warning(f"⚠️ {rechazos_agente} líneas rechazadas: NO AGENTE DE RETENCION")
+        logger.info(f"Facturas únicas a validar: {len(grupos)}")
 
-                for linea in lineas_validas_factura:
-                    facturas_rechazadas.append({
-                        'factura': linea,
-                        'razon_rechazo': razon
-                    })
+        detalle = logger.isEnabledFor(logging.DEBUG)
+        facturas_bajo_minimo = 0
+        for numero_factura, (validas, rechazadas_tipo, total_procesable) in grupos.items():
+            lineas_rechazadas_factura = [
+                {'factura': filas[i], **rechazo(TIPO_INVENTARIO, 'tipo_inventario', tipos[i])}
+                for i in rechazadas_tipo
+            ]
 
-                if lineas_rechazadas_factura:
-                    facturas_rechazadas.extend(lineas_rechazadas_factura)
+            # Todas las líneas rechazadas por tipo de inventario
+            if not validas:
+                facturas_rechazadas.extend(lineas_rechazadas_factura)
+                continue
 
-                logger.info(
-                    f"Factura rechazada por monto procesable: {numero_factura} - "
-                    f"Total bruto: ${total_factura_bruta:,.2f}, "
-                    f"Total procesable: ${total_factura_procesable:,.2f} "
-                    f"({len(lineas_validas_factura)} líneas válidas, {len(lineas_rechazadas_factura)} rechazadas)"
-                )
+            # Monto mínimo sobre las líneas procesables de la factura acoplada
+            if total_procesable < self.MONTO_MINIMO:
+                facturas_bajo_minimo += 1
+                bajo_minimo = razon(MONTO_MINIMO, total_procesable=total_procesable, monto_minimo=self.MONTO_MINIMO)
+                facturas_rechazadas.extend({'factura': filas[i], **bajo_minimo} for i in validas)
+                facturas_rechazadas.extend(lineas_rechazadas_factura)
+                if detalle:
+                    logger.debug(f"Factura rechazada por monto procesable: {numero_factura} - "
+                                 f"Total procesable: ${total_procesable:,.2f}")
                 continue
 
-            # Si al menos una línea es válida y el total procesable cumple el mínimo
-            facturas_validas.extend(lineas_validas_factura)
+            facturas_validas.extend(filas[i] for i in validas)
+            facturas_rechazadas.extend(lineas_rechazadas_factura)
+            if detalle:
+                logger.debug(f"Factura válida: {numero_factura} - Total acoplado procesable: "
+                             f"${total_procesable:,.2f} ({len(validas)} líneas válidas, "
+                             f"{len(rechazadas_tipo)} rechazadas por tipo inventario)")
 
-            if len(lineas_rechazadas_factura) > 0:
-                facturas_rechazadas.extend(lineas_rechazadas_factura)
-                logger.info(
-                    f"Factura {numero_factura}: total bruto ${total_factura_bruta:,.2f}, "
-                    f"total procesable ${total_factura_procesable:,.2f}, "
-                    f"{len(lineas_validas_factura)} líneas válidas, "
-                    f"{len(lineas_rechazadas_factura)} líneas rechazadas por tipo inventario"
-                )
-            else:
-                logger.info(
-                    f"Factura válida: {numero_factura} - "
-                    f"Total acoplado procesable: ${total_factura_procesable:,.2f} ({len(lineas)} líneas)"
-                )
-        
         logger.info(f"\nRESUMEN FILTRADO:")
         logger.info(f"  - Líneas válidas: {len(facturas_validas)}")
         logger.info(f"  - Notas crédito: {len(notas_credito)}")
-        logger.info(f"  - Líneas rechazadas: {len(facturas_rechazadas)}")
-        
+        logger.info(f"  - Líneas rechazadas: {len(facturas_rechazadas)} "
+                    f"({facturas_bajo_minimo} facturas bajo el monto mínimo)")
+
         return facturas_validas, notas_credito, facturas_rechazadas
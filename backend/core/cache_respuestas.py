@@ -0,0 +1,100 @@
+"""
+Caché de Respuestas de Lectura de la API
+LRU en memoria del proceso para /api/dashboard, /api/reporte/operativo, las
+estadísticas y los listados, cuyos datos solo cambian cuando la ingesta
+(diaria o por rango) escribe en la BD.
+
+- La clave incluye la versión de datos de la BD (resumen_totales.version_datos,
+  incrementada por los triggers de agregados_manager en cada cambio), de modo
+  que una escritura de cualquier proceso invalida las entradas anteriores
+- Cada entrada guarda el cuerpo JSON ya serializado y su ETag (hash del
+  cuerpo); el llamador responde 304 si coincide con If-None-Match
+- ttl_segundos acota la vida de una entrada para respuestas que dependen de
+  la hora (p. ej. el reporte operativo sin fecha usa el día anterior)
+
+Configuración por variables de entorno: CACHE_RESPUESTAS_MAX (256 entradas;
+0 = desactivada), CACHE_RESPUESTAS_TTL (300 segundos)
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class CacheRespuestas:
+    """LRU de respuestas serializadas con ETag y contadores de uso"""
+
+    def __init__(self, max_entradas: int = 256, ttl_segundos: float = 300):
+        """
+        Args:
+            max_entradas: Entradas máximas antes de descartar la menos usada (0 = sin caché)
+            ttl_segundos: Vida máxima de una entrada
+        """
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self._estadisticas = {'aciertos': 0, 'fallos': 0, 'no_modificado': 0, 'descartadas': 0}
+
+    @property
+    def activa(self) -> bool:
+        return self.max_entradas > 0
+
+    @staticmethod
+    def calcular_etag(cuerpo: bytes) -> str:
+        """ETag fuerte (sin comillas) del cuerpo serializado"""
+        return hashlib.sha1(cuerpo).hexdigest()
+
+    def obtener(self, clave: Hashable) -> Optional[Tuple[bytes, str]]:
+        """(cuerpo, etag) si la clave está vigente; cuenta acierto o fallo"""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and ahora - entrada[2] > self.ttl_segundos:
+                del self._entradas[clave]
+                entrada = None
+            if entrada is None:
+                self._estadisticas['fallos'] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._estadisticas['aciertos'] += 1
+            return entrada[0], entrada[1]
+
+    def guardar(self, clave: Hashable, cuerpo: bytes) -> str:
+        """Guarda el cuerpo y devuelve su ETag"""
+        etag = self.calcular_etag(cuerpo)
+        if not self.activa:
+            return etag
+        with self._lock:
+            self._entradas[clave] = (cuerpo, etag, time.monotonic())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._estadisticas['descartadas'] += 1
+        return etag
+
+    def registrar_no_modificado(self):
+        with self._lock:
+            self._estadisticas['no_modificado'] += 1
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def obtener_estadisticas(self) -> Dict:
+        """Aciertos, fallos, respuestas 304, descartes y ocupación"""
+        with self._lock:
+            estadisticas = dict(self._estadisticas)
+            estadisticas['entradas'] = len(self._entradas)
+        consultas = estadisticas['aciertos'] + estadisticas['fallos']
+        estadisticas['tasa_aciertos'] = round(estadisticas['aciertos'] / consultas, 4) if consultas else 0.0
+        estadisticas['max_entradas'] = self.max_entradas
+        estadisticas['ttl_segundos'] = self.ttl_segundos
+        return estadisticas
+
+    @classmethod
+    def desde_entorno(cls) -> 'CacheRespuestas':
+        return cls(max_entradas=int(os.getenv('CACHE_RESPUESTAS_MAX', '256')),
+                   ttl_segundos=float(os.getenv('CACHE_RESPUESTAS_TTL', '300')))
@@ -1,12 +1,20 @@
 # src/excel_processor.py
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import numbers, Font, PatternFill, Alignment
+from openpyxl.utils import get_column_letter
 from datetime import datetime, timedelta
-from typing import List, Dict
+from typing import List, Dict, Iterable, Optional
 import logging
+import os
 import re
 
+try:
+    from core.linea_factura import LineaFactura
+except ImportError:
+    from linea_factura import LineaFactura
+
 logger = logging.getLogger(__name__)
 
 class ExcelProcessor:
@@ -17,9 +25,86 @@ class ExcelProcessor:
     NOMBRE_VENDEDOR = "COMPAÑIA INDUSTRIAL DE PRODUCTOS AGROPECUARIOS S.A"
     CODIGO_SUBYACENTE = "SPN-1"
     
-    def __init__(self, template_path: str = None):
+    # Campo de LineaFactura -> método que normaliza su valor crudo para el Excel.
+    # Cada campo tiene pocas decenas de valores distintos por día: el resultado
+    # se memoriza por valor y las repeticiones cuestan una consulta a un dict
+    CAMPOS_NORMALIZADOS = {
+        'condicion_pago': '_extraer_dias_condicion_pago',
+        'grupo_impositivo': '_extraer_iva',
+        'ciudad': '_extraer_ciudad',
+        'unidad_medida': '_normalizar_unidad_medida',
+        'um_base': '_extraer_multiplicador_um_base',
+    }
+
+    def __init__(self, template_path: str = None, max_normalizaciones: Optional[int] = None):
+        """
+        Args:
+            template_path: Ruta de la plantilla
+            max_normalizaciones: Valores memorizados por campo (0 = sin memoria);
+                por defecto NORMALIZACION_MEMO_MAX o 1024
+        """
         self.template_path = template_path
-    
+        if max_normalizaciones is None:
+            max_normalizaciones = int(os.getenv('NORMALIZACION_MEMO_MAX', '1024'))
+        self.max_normalizaciones = max_normalizaciones
+        self._normalizados = {campo: {} for campo in self.CAMPOS_NORMALIZADOS}
+        self._fallos = dict.fromkeys(self.CAMPOS_NORMALIZADOS, 0)
+        self._sin_espacio = dict.fromkeys(self.CAMPOS_NORMALIZADOS, 0)
+        self._lineas_transformadas = 0
+
+    def _memorizar(self, campo: str, valor):
+        """
+        Normaliza un valor que no está en la tabla del campo y lo guarda si cabe
+
+        Solo se guardan textos y None: 1, 1.0 y True son la misma clave de un
+        dict pero str() los convierte distinto.
+        """
+        resultado = getattr(self, self.CAMPOS_NORMALIZADOS[campo])(valor)
+        if valor is None or type(valor) is str:
+            tabla = self._normalizados[campo]
+            if len(tabla) < self.max_normalizaciones:
+                tabla[valor] = resultado
+            else:
+                self._sin_espacio[campo] += 1
+        return resultado
+
+    def precargar_normalizaciones(self, valores: Dict[str, Iterable]) -> int:
+        """
+        Llena las tablas con valores crudos ya conocidos (p. ej. los del día
+        anterior) para que su primera aparición también sea un acierto
+
+        Args:
+            valores: {campo de CAMPOS_NORMALIZADOS: valores crudos}
+
+        Returns:
+            Entradas agregadas
+        """
+        agregadas = 0
+        for campo, crudos in valores.items():
+            if campo not in self.CAMPOS_NORMALIZADOS:
+                raise ValueError(f"Campo sin normalización: {campo}")
+            tabla = self._normalizados[campo]
+            for valor in crudos:
+                if valor not in tabla and len(tabla) < self.max_normalizaciones:
+                    self._memorizar(campo, valor)
+                    agregadas += valor in tabla
+        return agregadas
+
+    def obtener_estadisticas_normalizacion(self) -> Dict:
+        """Aciertos, fallos y entradas de la tabla de cada campo"""
+        lineas = self._lineas_transformadas
+        campos = {}
+        for campo, tabla in self._normalizados.items():
+            fallos = self._fallos[campo]
+            campos[campo] = {
+                'aciertos': lineas - fallos,
+                'fallos': fallos,
+                'tasa_aciertos': round((lineas - fallos) / lineas, 4) if lineas else 0.0,
+                'entradas': len(tabla),
+                'sin_espacio': self._sin_espacio[campo],
+            }
+        return {'lineas': lineas, 'max_por_campo': self.max_normalizaciones, 'campos': campos}
+
     def _extraer_dias_condicion_pago(self, condicion_pago: str) -> int:
         """
         Extrae el número de días de la condición de pago
@@ -65,13 +150,14 @@ class ExcelProcessor:
         logger.debug(f"No se encontraron días en condición: '{condicion_pago}', usando 0")
         return 0
     
-    def _calcular_fecha_pago(self, fecha_factura, condicion_pago: str):
+    def _calcular_fecha_pago(self, fecha_factura, condicion_pago: str, dias: Optional[int] = None):
         """
         Calcula la fecha de pago sumando los días de la condición de pago a la fecha de factura
         
         Args:
             fecha_factura: Fecha de la factura (datetime.date o datetime)
             condicion_pago: Descripción de la condición de pago
+            dias: Días de la condición ya extraídos (si no, se extraen)
             
         Returns:
             Fecha de pago (datetime.date) o None si no hay fecha de factura
@@ -84,7 +170,8 @@ class ExcelProcessor:
             fecha_factura = fecha_factura.date()
         
         # Extraer días de la condición de pago
-        dias = self._extraer_dias_condicion_pago(condicion_pago)
+        if dias is None:
+            dias = self._extraer_dias_condicion_pago(condicion_pago)
         
         # Calcular fecha de pago
         fecha_pago = fecha_factura + timedelta(days=dias)
@@ -93,65 +180,66 @@ class ExcelProcessor:
         
         return fecha_pago
     
-    def transformar_factura(self, factura: Dict) -> Dict:
+    def transformar_factura(self, factura) -> Dict:
         """
         Transforma una factura del formato API al formato Excel
 
         Args:
-            factura: Datos de factura en formato JSON de la API
+            factura: LineaFactura (o fila cruda de la API, que se convierte)
 
         Returns:
             Diccionario con datos transformados
         """
-        # N° Factura: Prefijo + Número (sin espacios)
-        prefijo = str(factura.get('f_prefijo', '')).strip()
-        nrodocto = factura.get('f_nrodocto', '')
-        numero_factura = f"{prefijo}{nrodocto}"
-
-        # Procesar fecha factura
-        fecha_str = factura.get('f_fecha', '')
-        fecha_factura = None
-        if fecha_str:
-            try:
-                fecha_factura = datetime.fromisoformat(str(fecha_str).replace('T00:00:00', ''))
-            except (ValueError, AttributeError):
-                logger.warning(f"Error parseando fecha: {fecha_str}")
+        linea = LineaFactura.desde(factura)
+        numero_factura = linea.numero_factura
+        fecha_factura = linea.fecha
+        # Normalizaciones memorizadas: ningún resultado es None, así que None es "no visto"
+        normalizados = self._normalizados
+        self._lineas_transformadas += 1
 
         # Calcular fecha de pago
-        condicion_pago = factura.get('f_desc_cond_pago', '')
-        fecha_pago = self._calcular_fecha_pago(fecha_factura, condicion_pago)
+        condicion_pago = linea.condicion_pago
+        dias = normalizados['condicion_pago'].get(condicion_pago)
+        if dias is None:
+            self._fallos['condicion_pago'] += 1
+            dias = self._memorizar('condicion_pago', condicion_pago)
+        fecha_pago = self._calcular_fecha_pago(fecha_factura, condicion_pago, dias)
 
         # Extraer IVA del grupo impositivo (solo el número)
-        iva = self._extraer_iva(factura.get('f_desc_grupo_impositivo', ''))
+        iva = normalizados['grupo_impositivo'].get(linea.grupo_impositivo)
+        if iva is None:
+            self._fallos['grupo_impositivo'] += 1
+            iva = self._memorizar('grupo_impositivo', linea.grupo_impositivo)
 
         # Extraer ciudad (sin el código)
-        ciudad = self._extraer_ciudad(factura.get('f_ciudad_punto_envio'))
+        ciudad = normalizados['ciudad'].get(linea.ciudad)
+        if ciudad is None:
+            self._fallos['ciudad'] += 1
+            ciudad = self._memorizar('ciudad', linea.ciudad)
 
         # Normalizar unidad de medida a KG, UN o LT
-        unidad_medida = self._normalizar_unidad_medida(factura.get('f_um_inv_desc', ''))
-
-        # Cantidad base original de la API
-        cantidad_base_api = factura.get('f_cant_base', 0.0)
-        if cantidad_base_api is None:
-            cantidad_base_api = 0.0
+        unidad_medida = normalizados['unidad_medida'].get(linea.unidad_medida)
+        if unidad_medida is None:
+            self._fallos['unidad_medida'] += 1
+            unidad_medida = self._memorizar('unidad_medida', linea.unidad_medida)
 
         # f_um_base original (para la última columna)
-        um_base = str(factura.get('f_um_base', '')).strip()
+        um_base = linea.um_base
 
         # Multiplicador de unidad base
-        multiplicador = self._extraer_multiplicador_um_base(um_base)
+        multiplicador = normalizados['um_base'].get(um_base)
+        if multiplicador is None:
+            self._fallos['um_base'] += 1
+            multiplicador = self._memorizar('um_base', um_base)
 
         # INTERCAMBIO: 
         # - cantidad (columna E) = cantidad_base_api * multiplicador (lo que antes era cantidad_original)
         # - cantidad_original (columna T) = cantidad_base_api (lo que antes era cantidad)
-        cantidad_convertida = float(cantidad_base_api) * multiplicador
-        cantidad_original = float(cantidad_base_api)
+        cantidad_original = linea.cantidad
+        cantidad_convertida = cantidad_original * multiplicador
 
         # Valor total del API
-        valor_total = factura.get('f_valor_subtotal_local', 0.0)
-        if valor_total is None:
-            valor_total = 0.0
-        valor_total = float(valor_total)
+        valor_total = linea.valor_total
 
         # Calcular precio unitario = valor_total / cantidad_convertida
         if cantidad_convertida != 0:
@@ -162,21 +250,21 @@ class ExcelProcessor:
 
         return {
             'numero_factura': numero_factura,
-            'nombre_producto': str(factura.get('f_desc_item', '')).strip(),
+            'nombre_producto': linea.producto,
             'codigo_subyacente': self.CODIGO_SUBYACENTE,
             'unidad_medida': unidad_medida,
             'cantidad': cantidad_convertida,
             'precio_unitario': precio_unitario,
             'fecha_factura': fecha_factura,
             'fecha_pago': fecha_pago,  # AHORA CALCULADA
-            'nit_comprador': str(factura.get('f_cliente_desp', '')).strip(),
-            'nombre_comprador': str(factura.get('f_cliente_fact_razon_soc', '')).strip(),
+            'nit_comprador': linea.nit_cliente,
+            'nombre_comprador': linea.nombre_cliente,
             'nit_vendedor': self.NIT_VENDEDOR,
             'nombre_vendedor': self.NOMBRE_VENDEDOR,
             'principal': 'V',
             'municipio': ciudad,
             'iva': iva,
-            'descripcion': str(factura.get('f_desc_tipo_inv', '')).strip(),
+            'descripcion': linea.descripcion_tipo_inventario,
             'activa_factura': '1',
             'activa_bodega': '1',
             'incentivo': '',
@@ -184,9 +272,9 @@ class ExcelProcessor:
             'moneda': '1',
             'um_base': um_base,
             'valor_total': valor_total,
-            'codigo_producto_api': str(factura.get('f_cod_item', '')).strip(),
+            'codigo_producto_api': linea.codigo_producto,
             'condicion_pago': condicion_pago,  # Para debug/auditoría
-            'indice_linea': factura.get('_indice_linea', 0)  # Índice único de línea
+            'indice_linea': linea.indice_linea or 0  # Índice único de línea
         }
     
     def _extraer_iva(self, grupo_impositivo: str) -> str:
@@ -276,128 +364,146 @@ class ExcelProcessor:
         # Si no tiene número, multiplicar por 1
         return 1.0
     
+    # Columnas del Excel en orden: (encabezado, clave de la factura transformada, ancho, formato)
+    COLUMNAS_EXCEL = [
+        ('N° Factura', 'numero_factura', 15, None),
+        ('Nombre Producto', 'nombre_producto', 40, None),
+        ('Codigo Subyacente', 'codigo_subyacente', 18, None),
+        ('Unidad Medida en Kg,Un,Lt', 'unidad_medida', 25, None),
+        ('Cantidad (5 decimales - separdor coma)', 'cantidad', 25, '#,##0.00000'),
+        ('Precio Unitario (5 decimales - separdor coma)', 'precio_unitario', 25, '#,##0.00000'),
+        ('Fecha Factura Año-Mes-Dia', 'fecha_factura', 22, 'YYYY-MM-DD'),
+        ('Fecha Pago Año-Mes-Dia', 'fecha_pago', 22, 'YYYY-MM-DD'),
+        ('Nit Comprador (Existente)', 'nit_comprador', 22, None),
+        ('Nombre Comprador', 'nombre_comprador', 40, None),
+        ('Nit Vendedor (Existente)', 'nit_vendedor', 22, None),
+        ('Nombre Vendedor', 'nombre_vendedor', 50, None),
+        ('Principal V,C', 'principal', 15, None),
+        ('Municipio (Nombre Exacto de la Ciudad)', 'municipio', 35, None),
+        ('Iva (N°%)', 'iva', 12, None),
+        ('Descripción', 'descripcion', 35, None),
+        ('Activa Factura', 'activa_factura', 15, None),
+        ('Activa Bodega', 'activa_bodega', 15, None),
+        ('Incentivo', 'incentivo', 15, None),
+        ('Cantidad Original (5 decimales - separdor coma)', 'cantidad_original', 30, '#,##0.00000'),
+        ('Moneda (1,2,3)', 'moneda', 15, None),
+        ('UM Base', 'um_base', 15, None),
+        ('Valor Total', 'valor_total', 20, '#,##0.00000'),
+    ]
+
     def _crear_encabezados(self, ws):
-        """Crea los encabezados del Excel con formato"""
-        encabezados = [
-            'N° Factura',
-            'Nombre Producto',
-            'Codigo Subyacente',
-            'Unidad Medida en Kg,Un,Lt',
-            'Cantidad (5 decimales - separdor coma)',
-            'Precio Unitario (5 decimales - separdor coma)',
-            'Fecha Factura Año-Mes-Dia',
-            'Fecha Pago Año-Mes-Dia',
-            'Nit Comprador (Existente)',
-            'Nombre Comprador',
-            'Nit Vendedor (Existente)',
-            'Nombre Vendedor',
-            'Principal V,C',
-            'Municipio (Nombre Exacto de la Ciudad)',
-            'Iva (N°%)',
-            'Descripción',
-            'Activa Factura',
-            'Activa Bodega',
-            'Incentivo',
-            'Cantidad Original (5 decimales - separdor coma)',
-            'Moneda (1,2,3)',
-            'UM Base',
-            'Valor Total'
-        ]
+        """
+        Crea los encabezados del Excel con formato
 
+        Agrega la fila 1 con ws.append, por lo que sirve tanto para hojas
+        normales como para hojas write-only (el ancho de columnas debe fijarse
+        antes de escribir filas).
+        """
         # Estilo de encabezado
         header_font = Font(bold=True, color="FFFFFF")
         header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
         header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
 
-        for col_num, header in enumerate(encabezados, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
+        # Ajustar ancho de columnas
+        for col_num, (_, _, width, _) in enumerate(self.COLUMNAS_EXCEL, 1):
+            ws.column_dimensions[get_column_letter(col_num)].width = width
+
+        fila = []
+        for header, _, _, _ in self.COLUMNAS_EXCEL:
+            cell = WriteOnlyCell(ws, value=header)
             cell.font = header_font
             cell.fill = header_fill
             cell.alignment = header_alignment
+            fila.append(cell)
+        ws.append(fila)
 
-        # Ajustar ancho de columnas
-        column_widths = [15, 40, 18, 25, 25, 25, 22, 22, 22, 40, 22, 50, 15, 35, 12, 35, 15, 15, 15, 30, 15, 15, 20]
-        for col_num, width in enumerate(column_widths, 1):
-            ws.column_dimensions[ws.cell(row=1, column=col_num).column_letter].width = width
-    
-    def generar_excel(self, facturas: List[Dict], output_path: str) -> str:
+    def abrir_excel(self, output_path: str) -> 'EscritorExcelFacturas':
+        """
+        Abre un Excel write-only para agregar facturas transformadas por lotes
+
+        Returns:
+            EscritorExcelFacturas (usar agregar() y luego guardar())
+        """
+        return EscritorExcelFacturas(self, output_path)
+
+    def generar_excel(self, facturas: Iterable[Dict], output_path: str) -> str:
         """
         Genera archivo Excel con las facturas
-        
+
+        Las filas se escriben en streaming (workbook write-only) a medida que
+        se recorre `facturas`, que puede ser una lista o un generador; la
+        memoria usada no crece con el número de filas.
+
         Args:
-            facturas: Lista de facturas transformadas
+            facturas: Lista (o iterable) de facturas transformadas
             output_path: Ruta donde guardar el archivo
-            
+
         Returns:
             Ruta del archivo generado
         """
         try:
-            # Crear nuevo workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Facturas"
-            
-            # Crear encabezados
-            self._crear_encabezados(ws)
-            
-            logger.info(f"Procesando {len(facturas)} facturas")
-            
-            # Agregar datos
-            for idx, factura in enumerate(facturas, start=2):
-                ws[f'A{idx}'] = factura['numero_factura']
-                ws[f'B{idx}'] = factura['nombre_producto']
-                ws[f'C{idx}'] = factura['codigo_subyacente']
-                ws[f'D{idx}'] = factura['unidad_medida']
-                
-                # Cantidad con 5 decimales y separador coma
-                ws[f'E{idx}'] = factura['cantidad']
-                ws[f'E{idx}'].number_format = '#,##0.00000'
-                
-                # Precio unitario con 5 decimales
-                ws[f'F{idx}'] = factura['precio_unitario']
-                ws[f'F{idx}'].number_format = '#,##0.00000'
-                
-                # Fecha factura
-                if factura['fecha_factura']:
-                    ws[f'G{idx}'] = factura['fecha_factura']
-                    ws[f'G{idx}'].number_format = 'YYYY-MM-DD'
-                
-                # Fecha pago (AHORA CALCULADA)
-                if factura['fecha_pago']:
-                    ws[f'H{idx}'] = factura['fecha_pago']
-                    ws[f'H{idx}'].number_format = 'YYYY-MM-DD'
-                else:
-                    ws[f'H{idx}'] = ''
-                
-                ws[f'I{idx}'] = factura['nit_comprador']
-                ws[f'J{idx}'] = factura['nombre_comprador']
-                ws[f'K{idx}'] = factura['nit_vendedor']
-                ws[f'L{idx}'] = factura['nombre_vendedor']
-                ws[f'M{idx}'] = factura['principal']
-                ws[f'N{idx}'] = factura['municipio']
-                ws[f'O{idx}'] = factura['iva']
-                ws[f'P{idx}'] = factura['descripcion']
-                ws[f'Q{idx}'] = factura['activa_factura']
-                ws[f'R{idx}'] = factura['activa_bodega']
-                ws[f'S{idx}'] = factura['incentivo']
-                
-                # Cantidad original con 5 decimales
-                ws[f'T{idx}'] = factura['cantidad_original']
-                ws[f'T{idx}'].number_format = '#,##0.00000'
-                
-                ws[f'U{idx}'] = factura['moneda']
-                ws[f'V{idx}'] = factura['um_base']
-                
-                # Valor Total con 5 decimales
-                ws[f'W{idx}'] = factura['valor_total']
-                ws[f'W{idx}'].number_format = '#,##0.00000'
-            
-            # Guardar archivo
-            wb.save(output_path)
+            escritor = self.abrir_excel(output_path)
+            total = escritor.agregar(facturas)
+            logger.info(f"Procesando {total} facturas")
+            escritor.guardar()
             logger.info(f"Excel generado exitosamente: {output_path}")
             return output_path
-            
+
         except Exception as e:
             logger.error(f"Error al generar Excel: {e}")
-            raise
\ No newline at end of file
+            raise
+
+
+class EscritorExcelFacturas:
+    """
+    Escribe el Excel de facturas fila por fila (openpyxl write-only)
+
+    Las celdas con formato numérico/fecha se crean una sola vez por columna y
+    se reutilizan en cada fila: write-only serializa la fila al agregarla,
+    así que todas comparten el mismo estilo ya registrado.
+    """
+
+    def __init__(self, processor: ExcelProcessor, output_path: str):
+        self.output_path = output_path
+        self.filas_escritas = 0
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet("Facturas")
+        processor._crear_encabezados(self._ws)
+
+        self._columnas = []
+        for _, clave, _, formato in processor.COLUMNAS_EXCEL:
+            celda = None
+            if formato:
+                celda = WriteOnlyCell(self._ws)
+                celda.number_format = formato
+            self._columnas.append((clave, celda))
+
+    def agregar(self, facturas: Iterable[Dict]) -> int:
+        """
+        Agrega facturas transformadas al final de la hoja
+
+        Returns:
+            Número de filas agregadas en esta llamada
+        """
+        agregadas = 0
+        for factura in facturas:
+            fila = []
+            for clave, celda in self._columnas:
+                valor = factura[clave]
+                if celda is None:
+                    fila.append(valor)
+                elif not valor and clave in ('fecha_factura', 'fecha_pago'):
+                    # Fecha factura vacía: sin celda; fecha pago vacía: texto vacío sin formato
+                    fila.append(None if clave == 'fecha_factura' else '')
+                else:
+                    celda.value = valor
+                    fila.append(celda)
+            self._ws.append(fila)
+            agregadas += 1
+        self.filas_escritas += agregadas
+        return agregadas
+
+    def guardar(self) -> str:
+        """Cierra la hoja y guarda el archivo"""
+        self._wb.save(self.output_path)
+        return self.output_path
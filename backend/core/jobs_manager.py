@@ -0,0 +1,384 @@
+"""
+Módulo de Gestión de Jobs en Segundo Plano
+Persiste en SQLite los procesos largos (p. ej. procesar un rango de fechas)
+para que la API responda de inmediato y el avance se pueda consultar.
+
+ESTRUCTURA DE BD:
+- jobs: Un registro por job (estado, parámetros, avance, resultado)
+- jobs_dias: Checkpoint por día confirmado de cada job
+
+ESTADOS:
+PENDIENTE -> EN_PROCESO -> COMPLETADO | ERROR | CANCELADO
+
+El checkpoint de un día se escribe en la misma transacción que los datos del
+día, de modo que un job interrumpido se reanuda desde el último día
+confirmado sin repetir ni perder registros.
+"""
+import json
+import sqlite3
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+try:
+    from core.sqlite_pool import conectar
+    from core.migraciones import asegurar_esquema
+except ImportError:
+    from sqlite_pool import conectar
+    from migraciones import asegurar_esquema
+
+logger = logging.getLogger(__name__)
+
+
+class JobsManager:
+    """Gestiona la persistencia y el avance de los jobs en segundo plano"""
+
+    PENDIENTE = 'PENDIENTE'
+    EN_PROCESO = 'EN_PROCESO'
+    COMPLETADO = 'COMPLETADO'
+    ERROR = 'ERROR'
+    CANCELADO = 'CANCELADO'
+
+    ESTADOS_FINALES = (COMPLETADO, ERROR, CANCELADO)
+
+    def __init__(self, db_path: str = './data/notas_credito.db'):
+        """
+        Inicializa el gestor de jobs
+
+        Args:
+            db_path: Ruta de la base de datos SQLite (la misma de las facturas,
+                para confirmar el checkpoint junto con los datos del día)
+        """
+        self.db_path = db_path
+        self._crear_tablas()
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = conectar(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _ahora() -> str:
+        return datetime.now().isoformat(timespec='seconds')
+
+    def _crear_tablas(self):
+        """Deja la BD en la versión actual del esquema (jobs y jobs_dias: migración 3)"""
+        asegurar_esquema(self.db_path)
+
+    # =========================================================================
+    # CREACIÓN Y CONSULTA
+    # =========================================================================
+
+    def crear_job(self, tipo: str, parametros: Dict, usuario: Optional[str] = None,
+                  dias_total: int = 0) -> int:
+        """
+        Registra un job nuevo en estado PENDIENTE
+
+        Returns:
+            ID del job
+        """
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO jobs (tipo, estado, parametros, usuario, dias_total, fecha_creacion)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (tipo, self.PENDIENTE, json.dumps(parametros), usuario, dias_total, self._ahora()))
+        job_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+
+        logger.info(f"Job {job_id} ({tipo}) registrado: {parametros}")
+        return job_id
+
+    def _job_desde_fila(self, fila: sqlite3.Row) -> Dict:
+        job = dict(fila)
+        job['parametros'] = json.loads(job['parametros']) if job['parametros'] else {}
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+        job['cancelar'] = bool(job['cancelar'])
+        job['progreso'] = round(100.0 * job['dias_procesados'] / job['dias_total'], 1) if job['dias_total'] else 0.0
+        return job
+
+    def obtener_job(self, job_id: int, incluir_dias: bool = False) -> Optional[Dict]:
+        """
+        Obtiene un job con su avance
+
+        Args:
+            job_id: ID del job
+            incluir_dias: Agregar el detalle de los días confirmados
+
+        Returns:
+            Diccionario del job o None si no existe
+        """
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        fila = cursor.fetchone()
+        if fila is None:
+            conn.close()
+            return None
+
+        job = self._job_desde_fila(fila)
+        if incluir_dias:
+            cursor.execute('''
+                SELECT fecha, notas_credito, facturas_validas, facturas_rechazadas,
+                       aplicaciones, fecha_confirmacion
+                FROM jobs_dias WHERE job_id = ? ORDER BY fecha
+            ''', (job_id,))
+            job['dias'] = [dict(d) for d in cursor.fetchall()]
+        conn.close()
+        return job
+
+    def listar_jobs(self, limite: int = 20, tipo: Optional[str] = None) -> List[Dict]:
+        """Lista los jobs más recientes"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        if tipo:
+            cursor.execute('SELECT * FROM jobs WHERE tipo = ? ORDER BY id DESC LIMIT ?', (tipo, limite))
+        else:
+            cursor.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limite,))
+        jobs = [self._job_desde_fila(fila) for fila in cursor.fetchall()]
+        conn.close()
+        return jobs
+
+    def jobs_pendientes(self) -> List[int]:
+        """IDs de los jobs en espera, en orden de llegada"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM jobs WHERE estado = ? ORDER BY id', (self.PENDIENTE,))
+        ids = [fila[0] for fila in cursor.fetchall()]
+        conn.close()
+        return ids
+
+    # =========================================================================
+    # CICLO DE VIDA
+    # =========================================================================
+
+    def tomar_job(self, job_id: int, trabajador: str) -> bool:
+        """
+        Reclama un job PENDIENTE para ejecutarlo (operación atómica: si varios
+        procesos comparten la BD, solo uno lo obtiene)
+
+        Returns:
+            True si el job quedó EN_PROCESO a nombre de `trabajador`
+        """
+        ahora = self._ahora()
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs
+            SET estado = ?, trabajador = ?, intentos = intentos + 1,
+                fecha_inicio = COALESCE(fecha_inicio, ?), fecha_latido = ?
+            WHERE id = ? AND estado = ?
+        ''', (self.EN_PROCESO, trabajador, ahora, ahora, job_id, self.PENDIENTE))
+        tomado = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        return tomado
+
+    def registrar_latido(self, job_ids: List[int], timeout: float = 2.0):
+        """
+        Marca como vivos los jobs que está ejecutando este proceso
+
+        Usa una conexión propia, fuera del pool, que espera a lo sumo `timeout`
+        segundos por el bloqueo de escritura en lugar del busy_timeout del
+        pool: mientras un día se registra en su transacción el latido falla
+        rápido y se reintenta en la siguiente vuelta del supervisor.
+
+        Raises:
+            sqlite3.Error: Si la BD sigue bloqueada tras `timeout` segundos
+        """
+        if not job_ids:
+            return
+        conn = sqlite3.connect(self.db_path, timeout=timeout)
+        try:
+            conn.executemany('UPDATE jobs SET fecha_latido = ? WHERE id = ? AND estado = ?',
+                             [(self._ahora(), job_id, self.EN_PROCESO) for job_id in job_ids])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def recuperar_interrumpidos(self, limite_segundos: float, excluir: List[int] = ()) -> int:
+        """
+        Devuelve a PENDIENTE los jobs EN_PROCESO cuyo trabajador dejó de dar
+        señales de vida (proceso caído o reiniciado). Al volver a ejecutarse
+        continúan desde el último día confirmado.
+
+        Args:
+            limite_segundos: Antigüedad del último latido a partir de la cual
+                el job se considera interrumpido
+            excluir: Jobs que el proceso que llama está ejecutando (siguen vivos
+                aunque su latido se haya retrasado)
+
+        Returns:
+            Número de jobs recuperados
+        """
+        limite = (datetime.now() - timedelta(seconds=limite_segundos)).isoformat(timespec='seconds')
+        excluir = list(excluir)
+        sin_excluidos = f" AND id NOT IN ({', '.join('?' * len(excluir))})" if excluir else ''
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            UPDATE jobs SET estado = ?, trabajador = NULL
+            WHERE estado = ? AND (fecha_latido IS NULL OR fecha_latido < ?){sin_excluidos}
+        ''', (self.PENDIENTE, self.EN_PROCESO, limite, *excluir))
+        recuperados = cursor.rowcount
+        conn.commit()
+        conn.close()
+
+        if recuperados:
+            logger.warning(f"{recuperados} job(s) interrumpidos vuelven a la cola")
+        return recuperados
+
+    def solicitar_cancelacion(self, job_id: int) -> Optional[str]:
+        """
+        Pide cancelar un job. Si aún no empezó se cancela de inmediato; si está
+        en proceso se detiene al terminar el día en curso.
+
+        Returns:
+            Estado del job tras la solicitud, o None si no existe
+        """
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs SET estado = ?, cancelar = 1, fecha_fin = ?
+            WHERE id = ? AND estado = ?
+        ''', (self.CANCELADO, self._ahora(), job_id, self.PENDIENTE))
+        cursor.execute('UPDATE jobs SET cancelar = 1 WHERE id = ? AND estado = ?',
+                       (job_id, self.EN_PROCESO))
+        cursor.execute('SELECT estado FROM jobs WHERE id = ?', (job_id,))
+        fila = cursor.fetchone()
+        conn.commit()
+        conn.close()
+        return fila[0] if fila else None
+
+    def reanudar_job(self, job_id: int) -> bool:
+        """
+        Vuelve a encolar un job terminado en ERROR o CANCELADO; continúa desde
+        el último día confirmado
+
+        Returns:
+            True si el job volvió a PENDIENTE
+        """
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE jobs
+            SET estado = ?, cancelar = 0, error = NULL, resultado = NULL, fecha_fin = NULL
+            WHERE id = ? AND estado IN (?, ?)
+        ''', (self.PENDIENTE, job_id, self.ERROR, self.CANCELADO))
+        reanudado = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+        return reanudado
+
+    def finalizar_job(self, job_id: int, estado: str, resultado: Optional[Dict] = None,
+                      error: Optional[str] = None):
+        """Registra el estado final de un job con su resultado o error"""
+        conn = self._conectar()
+        conn.execute('''
+            UPDATE jobs
+            SET estado = ?, resultado = ?, error = ?, dia_actual = NULL,
+                trabajador = NULL, fecha_fin = ?
+            WHERE id = ?
+        ''', (estado, json.dumps(resultado) if resultado is not None else None,
+              error, self._ahora(), job_id))
+        conn.commit()
+        conn.close()
+        logger.info(f"Job {job_id} finalizado: {estado}")
+
+    # =========================================================================
+    # AVANCE Y CHECKPOINT
+    # =========================================================================
+
+    def cancelacion_solicitada(self, job_id: int) -> bool:
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('SELECT cancelar FROM jobs WHERE id = ?', (job_id,))
+        fila = cursor.fetchone()
+        conn.close()
+        return bool(fila and fila[0])
+
+    def iniciar_dia(self, job_id: int, fecha: str):
+        """Registra el día que se está procesando"""
+        conn = self._conectar()
+        conn.execute('UPDATE jobs SET dia_actual = ?, fecha_latido = ? WHERE id = ?',
+                     (fecha, self._ahora(), job_id))
+        conn.commit()
+        conn.close()
+
+    def confirmar_dia(self, job_id: int, fecha: str, estadisticas: Dict,
+                      conn: Optional[sqlite3.Connection] = None):
+        """
+        Guarda el checkpoint de un día
+
+        Args:
+            job_id: ID del job
+            fecha: Día confirmado (YYYY-MM-DD)
+            estadisticas: notas_credito, facturas_validas, facturas_rechazadas, aplicaciones
+            conn: Conexión de la transacción del día; si se indica, el checkpoint
+                se confirma junto con los datos (sin commit aquí)
+        """
+        propia = conn is None
+        if propia:
+            conn = self._conectar()
+
+        ahora = self._ahora()
+        conn.execute('''
+            INSERT OR REPLACE INTO jobs_dias
+            (job_id, fecha, notas_credito, facturas_validas, facturas_rechazadas,
+             aplicaciones, fecha_confirmacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id, fecha,
+              estadisticas.get('notas_credito', 0),
+              estadisticas.get('facturas_validas', 0),
+              estadisticas.get('facturas_rechazadas', 0),
+              estadisticas.get('aplicaciones', 0),
+              ahora))
+        conn.execute('''
+            UPDATE jobs
+            SET dias_procesados = (SELECT COUNT(*) FROM jobs_dias WHERE job_id = ?),
+                ultimo_dia_confirmado = ?, fecha_latido = ?
+            WHERE id = ?
+        ''', (job_id, fecha, ahora, job_id))
+
+        if propia:
+            conn.commit()
+            conn.close()
+
+    def dias_confirmados(self, job_id: int) -> Dict[str, Dict]:
+        """Estadísticas de los días ya confirmados, por fecha (YYYY-MM-DD)"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT fecha, notas_credito, facturas_validas, facturas_rechazadas, aplicaciones
+            FROM jobs_dias WHERE job_id = ?
+        ''', (job_id,))
+        dias = {fila['fecha']: dict(fila) for fila in cursor.fetchall()}
+        conn.close()
+        return dias
+
+    def seguimiento(self, job_id: int) -> 'SeguimientoJob':
+        return SeguimientoJob(self, job_id)
+
+
+class SeguimientoJob:
+    """
+    Enlace entre un proceso largo y su job: informa el avance, guarda el
+    checkpoint de cada día y consulta si se pidió cancelar
+    """
+
+    def __init__(self, manager: JobsManager, job_id: int):
+        self.manager = manager
+        self.job_id = job_id
+
+    def dias_confirmados(self) -> Dict[str, Dict]:
+        return self.manager.dias_confirmados(self.job_id)
+
+    def cancelacion_solicitada(self) -> bool:
+        return self.manager.cancelacion_solicitada(self.job_id)
+
+    def iniciar_dia(self, fecha: str):
+        self.manager.iniciar_dia(self.job_id, fecha)
+
+    def confirmar_dia(self, fecha: str, estadisticas: Dict, conn: Optional[sqlite3.Connection] = None):
+        self.manager.confirmar_dia(self.job_id, fecha, estadisticas, conn)
@@ -0,0 +1,178 @@
+"""
+Ejecutor Local de Jobs
+Pool de hilos que ejecuta en segundo plano los jobs registrados en JobsManager.
+
+- La API registra el job (PENDIENTE) y despierta al supervisor
+- El supervisor reparte los jobs pendientes a los hilos libres, renueva el
+  latido de los jobs en curso y devuelve a la cola los jobs cuyo proceso murió
+- Cada hilo reclama el job de forma atómica antes de ejecutarlo, por lo que
+  varios procesos pueden compartir la misma BD sin ejecutar dos veces un job
+- El ejecutor corre en un solo proceso designado (scripts/ejecutar_jobs.py o
+  la API con JOBS_EN_API=1), no en cada worker de la API
+
+El latido compite por la escritura con la transacción de cada día, que puede
+durar minutos: usa su propia conexión de espera corta y, si falla, solo se
+registra en el log. Por eso el límite de latido debe superar con holgura el
+busy_timeout de SQLite más el día más largo; si no, otro proceso devolvería a
+la cola un job vivo y se ejecutaría dos veces.
+"""
+import logging
+import os
+import queue
+import socket
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+try:
+    from core.sqlite_pool import obtener_pool
+except ImportError:
+    from sqlite_pool import obtener_pool
+
+logger = logging.getLogger(__name__)
+
+
+class JobsRunner:
+    """Ejecuta los jobs pendientes con un número fijo de hilos"""
+
+    def __init__(self, manager, max_workers: int = 1,
+                 intervalo_latido: float = 15, limite_latido: float = 900,
+                 timeout_latido: float = 2):
+        """
+        Args:
+            manager: JobsManager con la persistencia de los jobs
+            max_workers: Jobs ejecutándose a la vez en este proceso
+            intervalo_latido: Segundos entre revisiones del supervisor
+            limite_latido: Segundos sin latido tras los cuales un job EN_PROCESO
+                se considera interrumpido y vuelve a la cola. Como mínimo el
+                busy_timeout del pool más cuatro intervalos de latido
+            timeout_latido: Espera máxima (s) del latido por el bloqueo de escritura
+        """
+        self.manager = manager
+        self.max_workers = max(max_workers, 1)
+        self.intervalo_latido = intervalo_latido
+        minimo = obtener_pool(manager.db_path).busy_timeout_ms / 1000 + 4 * intervalo_latido
+        if limite_latido < minimo:
+            logger.warning(f"Límite de latido {limite_latido:g} s demasiado corto para el busy_timeout "
+                           f"de SQLite; se usa {minimo:g} s")
+            limite_latido = minimo
+        self.limite_latido = limite_latido
+        self.timeout_latido = timeout_latido
+        self.trabajador = f"{socket.gethostname()}:{os.getpid()}"
+
+        self._funciones: Dict[str, Callable[[Dict, object], Dict]] = {}
+        self._cola: 'queue.Queue[Optional[int]]' = queue.Queue()
+        self._activos = set()
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilos = []
+
+    def registrar(self, tipo: str, funcion: Callable[[Dict, object], Dict]):
+        """
+        Asocia un tipo de job con la función que lo ejecuta
+
+        La función recibe (parametros, SeguimientoJob) y retorna el resultado (dict).
+        Si el resultado trae 'cancelado': True el job termina CANCELADO.
+        """
+        self._funciones[tipo] = funcion
+
+    def encolar(self, tipo: str, parametros: Dict, usuario: Optional[str] = None,
+                dias_total: int = 0) -> int:
+        """Registra un job y lo pone en marcha apenas haya un hilo libre"""
+        if tipo not in self._funciones:
+            raise ValueError(f"Tipo de job no registrado: {tipo}")
+        job_id = self.manager.crear_job(tipo, parametros, usuario, dias_total)
+        self.despertar()
+        return job_id
+
+    def despertar(self):
+        """Pide al supervisor revisar la cola de inmediato"""
+        self._despertar.set()
+
+    def iniciar(self):
+        """Arranca los hilos del pool y el supervisor (idempotente)"""
+        if self._hilos:
+            return
+        for i in range(self.max_workers):
+            hilo = threading.Thread(target=self._trabajar, name=f'jobs-worker-{i}', daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        supervisor = threading.Thread(target=self._supervisar, name='jobs-supervisor', daemon=True)
+        supervisor.start()
+        self._hilos.append(supervisor)
+        logger.info(f"Ejecutor de jobs iniciado: {self.max_workers} hilo(s), trabajador {self.trabajador}")
+
+    def detener(self, timeout: Optional[float] = None):
+        """Detiene el pool tras el job en curso (los pendientes quedan en la cola de la BD)"""
+        self._detener.set()
+        self._despertar.set()
+        for _ in range(self.max_workers):
+            self._cola.put(None)
+        for hilo in self._hilos:
+            hilo.join(timeout)
+        self._hilos = []
+
+    def _supervisar(self):
+        while not self._detener.is_set():
+            self._despertar.clear()
+            try:
+                with self._lock:
+                    activos = list(self._activos)
+                self._latir(activos)
+                self.manager.recuperar_interrumpidos(self.limite_latido, excluir=activos)
+
+                for job_id in self.manager.jobs_pendientes():
+                    with self._lock:
+                        if len(self._activos) >= self.max_workers:
+                            break
+                        if job_id in self._activos:
+                            continue
+                        self._activos.add(job_id)
+                    self._cola.put(job_id)
+            except Exception as e:
+                logger.error(f"Error en el supervisor de jobs: {e}")
+
+            self._despertar.wait(self.intervalo_latido)
+
+    def _latir(self, activos: List[int]):
+        """Renueva el latido; si la BD está ocupada se reintenta en la próxima vuelta"""
+        try:
+            self.manager.registrar_latido(activos, timeout=self.timeout_latido)
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo renovar el latido de los jobs {activos}: {e}")
+
+    def _trabajar(self):
+        while True:
+            job_id = self._cola.get()
+            if job_id is None:
+                return
+            try:
+                self._ejecutar(job_id)
+            except Exception as e:
+                logger.error(f"Error administrando el job {job_id}: {e}")
+            finally:
+                with self._lock:
+                    self._activos.discard(job_id)
+                self._despertar.set()
+
+    def _ejecutar(self, job_id: int):
+        if not self.manager.tomar_job(job_id, self.trabajador):
+            # Otro proceso lo tomó o se canceló antes de empezar
+            return
+
+        job = self.manager.obtener_job(job_id)
+        funcion = self._funciones.get(job['tipo'])
+        if funcion is None:
+            self.manager.finalizar_job(job_id, self.manager.ERROR,
+                                       error=f"Tipo de job no registrado: {job['tipo']}")
+            return
+
+        logger.info(f"Ejecutando job {job_id} ({job['tipo']}), intento {job['intentos']}")
+        try:
+            resultado = funcion(job['parametros'], self.manager.seguimiento(job_id))
+            estado = self.manager.CANCELADO if resultado.get('cancelado') else self.manager.COMPLETADO
+            self.manager.finalizar_job(job_id, estado, resultado=resultado)
+        except Exception as e:
+            logger.error(f"Error ejecutando job {job_id}: {e}", exc_info=True)
+            self.manager.finalizar_job(job_id, self.manager.ERROR, error=str(e))
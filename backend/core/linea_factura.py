@@ -0,0 +1,182 @@
+"""
+Línea de Factura Normalizada
+Registro compacto (__slots__) de una línea de la consulta de SIESA, construido
+una sola vez al ingresar al procesamiento (BusinessRulesValidator.filtrar_facturas)
+con número de factura, fecha, montos, cliente, producto y tipo de inventario
+ya normalizados.
+
+- Las etapas siguientes (ExcelProcessor.transformar_factura y el registro y la
+  aplicación de notas de NotasCreditoManager) lo consumen sin volver a leer
+  los campos f_*; también aceptan la fila cruda, que convierten con desde()
+- NotasCreditoManager acepta además facturas en el formato del Excel, que
+  convierte con desde_transformada() al recibirlas
+- Al quedar solo los registros se libera el dict de cada fila de la API
+- Condición de pago, grupo impositivo, ciudad y unidad de medida se guardan
+  tal como vienen: su normalización es propia del Excel
+"""
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _texto(valor) -> str:
+    """Texto sin espacios en los extremos ('' si no viene)"""
+    return '' if valor is None else str(valor).strip()
+
+
+def _fecha(valor) -> Optional[datetime]:
+    """f_fecha ('YYYY-MM-DDT00:00:00'), date o datetime como datetime, None si no viene o no es válida"""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime.combine(valor, datetime.min.time())
+    try:
+        return datetime.fromisoformat(str(valor).replace('T00:00:00', ''))
+    except ValueError:
+        logger.warning(f"Error parseando fecha: {valor}")
+        return None
+
+
+class LineaFactura:
+    """Línea de factura o nota crédito de SIESA con sus campos normalizados"""
+
+    __slots__ = ('numero_factura', 'es_nota', 'fecha', 'nit_cliente', 'nombre_cliente',
+                 'codigo_producto', 'producto', 'cantidad', 'valor_total', 'tipo_inventario',
+                 'agente_retencion', 'descripcion_tipo_inventario', 'um_base', 'causal_devolucion',
+                 'condicion_pago', 'grupo_impositivo', 'ciudad', 'unidad_medida', 'indice_linea',
+                 'agente_retencion_api')
+
+    def __init__(self, numero_factura: str, fecha: Optional[datetime] = None, nit_cliente: str = '',
+                 nombre_cliente: str = '', codigo_producto: str = '', producto: str = '',
+                 cantidad: float = 0.0, valor_total: float = 0.0, tipo_inventario: str = '',
+                 agente_retencion: str = '', descripcion_tipo_inventario: str = '', um_base: str = '',
+                 causal_devolucion: Optional[str] = None, condicion_pago=None, grupo_impositivo=None,
+                 ciudad=None, unidad_medida=None, indice_linea: Optional[int] = None,
+                 agente_retencion_api: Optional[str] = None):
+        self.numero_factura = numero_factura
+        # Prefijo que empieza por N: nota crédito
+        self.es_nota = numero_factura[:1] in ('N', 'n')
+        self.fecha = fecha
+        self.nit_cliente = nit_cliente
+        self.nombre_cliente = nombre_cliente
+        self.codigo_producto = codigo_producto
+        self.producto = producto
+        self.cantidad = cantidad
+        self.valor_total = valor_total
+        self.tipo_inventario = tipo_inventario
+        self.agente_retencion = agente_retencion
+        self.descripcion_tipo_inventario = descripcion_tipo_inventario
+        self.um_base = um_base
+        self.causal_devolucion = causal_devolucion
+        self.condicion_pago = condicion_pago
+        self.grupo_impositivo = grupo_impositivo
+        self.ciudad = ciudad
+        self.unidad_medida = unidad_medida
+        self.indice_linea = indice_linea
+        # f_02_014 tal como viene de la API: el texto del rechazo lo cita sin normalizar
+        self.agente_retencion_api = agente_retencion_api
+
+    @property
+    def fecha_dia(self) -> Optional[date]:
+        return self.fecha.date() if self.fecha is not None else None
+
+    def __repr__(self) -> str:
+        return f"LineaFactura({self.numero_factura} {self.codigo_producto} #{self.indice_linea})"
+
+    @classmethod
+    def desde_filas(cls, filas: Iterable[Union[Dict, 'LineaFactura']],
+                    avisar_espacios: bool = True) -> Iterator['LineaFactura']:
+        """
+        Convierte en orden las filas de la API (las que ya son LineaFactura pasan igual)
+
+        Las líneas de un documento llegan consecutivas y las de un día
+        comparten f_fecha: número de factura y fecha se recalculan solo
+        cuando cambian respecto a la línea anterior. Los textos (cliente,
+        producto, tipos) se repiten mucho: se normalizan una vez por valor
+        distinto y las líneas comparten el mismo objeto. Recorre `filas` una
+        sola vez, así que puede ser un generador.
+        """
+        documento_anterior = fecha_anterior = None
+        numero = ''
+        fecha = None
+        con_espacios = set()
+        normalizados = {}
+        texto = normalizados.get
+
+        def normalizar(valor):
+            resultado = normalizados[valor] = _texto(valor)
+            return resultado
+
+        for fila in filas:
+            if isinstance(fila, cls):
+                yield fila
+                continue
+
+            get = fila.get
+            documento = (get('f_prefijo'), get('f_nrodocto'))
+            if documento != documento_anterior:
+                documento_anterior = documento
+                numero = f"{_texto(documento[0])}{_texto(documento[1])}"
+            fecha_raw = get('f_fecha')
+            if fecha_raw != fecha_anterior:
+                fecha_anterior = fecha_raw
+                fecha = _fecha(fecha_raw)
+
+            tipo_raw = get('f_cod_tipo_inv') or get('f_tipo_inv') or ''
+            tipo = texto(tipo_raw) or normalizar(tipo_raw)
+            if tipo != tipo_raw and isinstance(tipo_raw, str):
+                con_espacios.add(tipo_raw)
+            nit, nombre, codigo, producto, agente, descripcion, um_base = (
+                get('f_cliente_desp'), get('f_cliente_fact_razon_soc'), get('f_cod_item'),
+                get('f_desc_item'), get('f_02_014'), get('f_desc_tipo_inv'), get('f_um_base'))
+            causal = get('f_notas_causal_dev')
+            indice = get('_indice_linea', get('indice_linea'))
+
+            # Posicional: con 20 campos, los argumentos por nombre pesan en la construcción
+            yield cls(
+                numero, fecha, texto(nit) or normalizar(nit), texto(nombre) or normalizar(nombre),
+                texto(codigo) or normalizar(codigo), texto(producto) or normalizar(producto),
+                float(get('f_cant_base') or 0.0), float(get('f_valor_subtotal_local') or 0.0),
+                tipo, texto(agente) or normalizar(agente), texto(descripcion) or normalizar(descripcion),
+                texto(um_base) or normalizar(um_base), (_texto(causal) or None) if causal else None,
+                get('f_desc_cond_pago', ''), get('f_desc_grupo_impositivo', ''),
+                get('f_ciudad_punto_envio'), get('f_um_inv_desc', ''),
+                None if indice is None else int(indice), agente,
+            )
+
+        if con_espacios and avisar_espacios:
+            logger.warning(f"⚠️ Tipos de inventario con espacios normalizados: "
+                           f"{', '.join(repr(raw) for raw in sorted(con_espacios))}")
+
+    @classmethod
+    def desde(cls, factura: Union[Dict, 'LineaFactura']) -> 'LineaFactura':
+        """La misma línea si ya es LineaFactura; si no, la convierte desde la fila cruda"""
+        if isinstance(factura, cls):
+            return factura
+        return next(cls.desde_filas((factura,), avisar_espacios=False))
+
+    @classmethod
+    def desde_transformada(cls, factura: Dict) -> 'LineaFactura':
+        """
+        Convierte una factura en el formato de ExcelProcessor.transformar_factura
+
+        Solo trae los campos que usan el registro y la aplicación de notas: la
+        cantidad es cantidad_original (unidad base, la de las notas) y el tipo
+        de inventario, la descripción que lleva el Excel.
+        """
+        get = factura.get
+        cantidad = get('cantidad_original')
+        if cantidad is None:
+            cantidad = get('cantidad')
+        indice = get('indice_linea', get('_indice_linea'))
+        descripcion = _texto(get('descripcion'))
+        return cls(
+            _texto(get('numero_factura')), _fecha(get('fecha_factura')), _texto(get('nit_comprador')),
+            _texto(get('nombre_comprador')), _texto(get('codigo_producto_api')), _texto(get('nombre_producto')),
+            float(cantidad or 0.0), float(get('valor_total') or 0.0), descripcion,
+            descripcion_tipo_inventario=descripcion, indice_linea=None if indice is None else int(indice),
+        )
@@ -0,0 +1,252 @@
+"""
+Métricas del Procesamiento
+Registro en memoria del proceso (sin dependencias) de tiempos y contadores
+del procesamiento diario, la BD y SIESA, exportable en formato de texto de
+Prometheus (/api/metrics).
+
+- Medicion: tiempos por etapa de una ejecución de procesar_fecha o
+  procesar_rango_fechas. Cada llamada a etapa() cierra la etapa anterior,
+  así que los pasos numerados de main.py se marcan sin reindentarlos; las
+  etapas repetidas (un rango) acumulan su tiempo
+- medir_bd: decorador de los métodos de NotasCreditoManager; mide tiempo,
+  sentencias SQL (execute/executemany) y filas afectadas por método
+- CursorMedido: cursor de las conexiones del pool (sqlite_pool) que cuenta
+  las sentencias del método medido en curso; fuera de uno no hace nada
+- Las solicitudes a SIESA se registran desde api_client
+
+Solo se mide el método más externo: las llamadas anidadas se cuentan en él.
+"""
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+
+# Texto de ayuda (# HELP) de cada métrica exportada
+AYUDAS = {
+    'cipa_etapa_duracion_segundos': 'Duración de cada etapa del procesamiento',
+    'cipa_procesos_total': 'Ejecuciones de procesar_fecha / procesar_rango_fechas por resultado',
+    'cipa_bd_metodo_duracion_segundos': 'Duración de los métodos de NotasCreditoManager',
+    'cipa_bd_sentencias_total': 'Sentencias SQL ejecutadas por método (executemany cuenta una)',
+    'cipa_bd_filas_total': 'Filas afectadas por executemany por método',
+    'cipa_siesa_solicitud_duracion_segundos': 'Duración de las solicitudes a SIESA (con lectura del cuerpo)',
+    'cipa_siesa_reintentos_total': 'Reintentos de solicitudes a SIESA',
+    'cipa_siesa_bytes_total': 'Bytes recibidos de SIESA',
+    'cipa_http_solicitud_duracion_segundos': 'Duración de las solicitudes a la API por endpoint',
+}
+
+_NOMBRE_VALIDO = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatear(nombre: str, etiquetas: tuple, valor: float) -> str:
+    """Línea `nombre{etiqueta="valor",...} número` de una serie"""
+    numero = repr(float(valor)) if isinstance(valor, float) else str(int(valor))
+    if not etiquetas:
+        return f'{nombre} {numero}'
+    texto = ','.join(f'{clave}="{_escapar(v)}"' for clave, v in etiquetas)
+    return f'{nombre}{{{texto}}} {numero}'
+
+
+class RegistroMetricas:
+    """Contadores, resúmenes (count/sum/max) e indicadores etiquetados, thread-safe"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores: Dict[str, Dict[tuple, float]] = {}
+        self._resumenes: Dict[str, Dict[tuple, list]] = {}
+        self._indicadores: Dict[str, Dict[tuple, float]] = {}
+        self._ayudas: Dict[str, str] = {}
+
+    @staticmethod
+    def _clave(etiquetas: Dict) -> tuple:
+        return tuple(sorted(etiquetas.items()))
+
+    def incrementar(self, nombre: str, valor: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            serie = self._contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+
+    def observar(self, nombre: str, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            resumen = self._resumenes.setdefault(nombre, {}).get(clave)
+            if resumen is None:
+                self._resumenes[nombre][clave] = [1, valor, valor]
+            else:
+                resumen[0] += 1
+                resumen[1] += valor
+                resumen[2] = max(resumen[2], valor)
+
+    def fijar(self, nombre: str, valor: float, ayuda: str = '', **etiquetas):
+        """Indicador (gauge) calculado por quien exporta, p. ej. estadísticas de la caché"""
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._indicadores.setdefault(nombre, {})[clave] = valor
+            if ayuda:
+                self._ayudas[nombre] = ayuda
+
+    def resumen(self, nombre: str) -> Dict[tuple, Dict]:
+        """{etiquetas: {'cantidad', 'suma', 'maximo'}} de un resumen"""
+        with self._lock:
+            return {clave: {'cantidad': r[0], 'suma': r[1], 'maximo': r[2]}
+                    for clave, r in self._resumenes.get(nombre, {}).items()}
+
+    def contador(self, nombre: str) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._contadores.get(nombre, {}))
+
+    def reiniciar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._resumenes.clear()
+            self._indicadores.clear()
+
+    def exportar_prometheus(self) -> str:
+        """Todas las series en formato de texto de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            contadores = {n: dict(s) for n, s in self._contadores.items()}
+            resumenes = {n: {c: list(r) for c, r in s.items()} for n, s in self._resumenes.items()}
+            indicadores = {n: dict(s) for n, s in self._indicadores.items()}
+            ayudas = dict(AYUDAS, **self._ayudas)
+
+        lineas = []
+        for nombre in sorted(contadores):
+            lineas += [f'# HELP {nombre} {ayudas.get(nombre, nombre)}', f'# TYPE {nombre} counter']
+            lineas += [_formatear(nombre, c, v) for c, v in sorted(contadores[nombre].items())]
+        for nombre in sorted(resumenes):
+            lineas += [f'# HELP {nombre} {ayudas.get(nombre, nombre)}', f'# TYPE {nombre} summary']
+            for clave, (cantidad, suma, _) in sorted(resumenes[nombre].items()):
+                lineas.append(_formatear(f'{nombre}_count', clave, cantidad))
+                lineas.append(_formatear(f'{nombre}_sum', clave, float(suma)))
+            # El máximo no es parte del tipo summary: se exporta como indicador aparte
+            lineas += [f'# HELP {nombre}_max Máximo observado de {nombre}', f'# TYPE {nombre}_max gauge']
+            lineas += [_formatear(f'{nombre}_max', c, float(r[2])) for c, r in sorted(resumenes[nombre].items())]
+        for nombre in sorted(indicadores):
+            nombre_valido = _NOMBRE_VALIDO.sub('_', nombre)
+            lineas += [f'# HELP {nombre_valido} {ayudas.get(nombre, nombre)}', f'# TYPE {nombre_valido} gauge']
+            lineas += [_formatear(nombre_valido, c, v) for c, v in sorted(indicadores[nombre].items())]
+        return '\n'.join(lineas) + '\n'
+
+
+# Registro del proceso (API o ejecución de main.py)
+METRICAS = RegistroMetricas()
+
+# [sentencias, filas] del método medido en curso en este hilo / contexto
+_METODO_EN_CURSO: ContextVar[Optional[list]] = ContextVar('metodo_bd_en_curso', default=None)
+# Medición de la ejecución en curso, para atribuirle los métodos de BD
+_MEDICION_EN_CURSO: ContextVar[Optional['Medicion']] = ContextVar('medicion_en_curso', default=None)
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que cuenta sentencias y filas del método medido en curso"""
+
+    def execute(self, sql, parametros=()):
+        contador = _METODO_EN_CURSO.get()
+        if contador is not None:
+            contador[0] += 1
+        return super().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        contador = _METODO_EN_CURSO.get()
+        resultado = super().executemany(sql, parametros)
+        if contador is not None:
+            contador[0] += 1
+            if self.rowcount > 0:
+                contador[1] += self.rowcount
+        return resultado
+
+
+def medir_bd(funcion):
+    """Decorador: tiempo, sentencias y filas de un método de NotasCreditoManager"""
+    metodo = funcion.__name__.lstrip('_')
+
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if _METODO_EN_CURSO.get() is not None:
+            return funcion(*args, **kwargs)
+        contador = [0, 0]
+        token = _METODO_EN_CURSO.set(contador)
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            duracion = time.perf_counter() - inicio
+            _METODO_EN_CURSO.reset(token)
+            METRICAS.observar('cipa_bd_metodo_duracion_segundos', duracion, metodo=metodo)
+            METRICAS.incrementar('cipa_bd_sentencias_total', contador[0], metodo=metodo)
+            METRICAS.incrementar('cipa_bd_filas_total', contador[1], metodo=metodo)
+            medicion = _MEDICION_EN_CURSO.get()
+            if medicion is not None:
+                medicion.registrar_bd(metodo, duracion, contador[0], contador[1])
+
+    return envoltura
+
+
+class Medicion:
+    """Tiempos por etapa y métodos de BD de una ejecución del procesamiento"""
+
+    def __init__(self, proceso: str):
+        self.proceso = proceso
+        self.inicio = time.perf_counter()
+        self.etapas: Dict[str, float] = {}
+        self.bd: Dict[str, Dict] = {}
+        self._etapa: Optional[str] = None
+        self._inicio_etapa = self.inicio
+        self._token = _MEDICION_EN_CURSO.set(self)
+
+    def etapa(self, nombre: Optional[str]):
+        """Cierra la etapa en curso y abre `nombre` (None solo cierra)"""
+        ahora = time.perf_counter()
+        if self._etapa is not None:
+            duracion = ahora - self._inicio_etapa
+            self.etapas[self._etapa] = self.etapas.get(self._etapa, 0.0) + duracion
+            METRICAS.observar('cipa_etapa_duracion_segundos', duracion, proceso=self.proceso, etapa=self._etapa)
+        self._etapa = nombre
+        self._inicio_etapa = ahora
+
+    def registrar_bd(self, metodo: str, duracion: float, sentencias: int, filas: int):
+        actual = self.bd.setdefault(metodo, {'llamadas': 0, 'duracion_s': 0.0, 'sentencias': 0, 'filas': 0})
+        actual['llamadas'] += 1
+        actual['duracion_s'] += duracion
+        actual['sentencias'] += sentencias
+        actual['filas'] += filas
+
+    def terminar(self, exito: bool = True, cliente_siesa=None, procesador_excel=None) -> Dict:
+        """
+        Cierra la medición y devuelve el resumen para el resultado
+
+        Args:
+            exito: Resultado de la ejecución (para cipa_procesos_total)
+            cliente_siesa: SiesaAPIClient usado, para incluir sus tiempos
+            procesador_excel: ExcelProcessor usado, para incluir el uso de sus
+                tablas de normalización
+
+        Returns:
+            {'duracion_total_s', 'etapas_s', 'bd': {metodo: {...}}, 'siesa': {...},
+             'normalizacion_excel': {...}}
+        """
+        self.etapa(None)
+        if _MEDICION_EN_CURSO.get() is self:
+            _MEDICION_EN_CURSO.reset(self._token)
+        METRICAS.incrementar('cipa_procesos_total', proceso=self.proceso, resultado='exito' if exito else 'error')
+
+        resumen = {
+            'duracion_total_s': round(time.perf_counter() - self.inicio, 4),
+            'etapas_s': {nombre: round(duracion, 4) for nombre, duracion in self.etapas.items()},
+            'bd': {metodo: dict(datos, duracion_s=round(datos['duracion_s'], 4))
+                   for metodo, datos in self.bd.items()},
+        }
+        if cliente_siesa is not None:
+            siesa = cliente_siesa.obtener_metricas()
+            siesa.pop('detalle', None)
+            resumen['siesa'] = siesa
+        if procesador_excel is not None:
+            resumen['normalizacion_excel'] = procesador_excel.obtener_estadisticas_normalizacion()
+        return resumen
@@ -0,0 +1,712 @@
+"""
+Migraciones del Esquema de la BD
+La versión del esquema se guarda en PRAGMA user_version y cada migración la
+lleva a la siguiente. Con el esquema al día, inicializar un gestor
+(NotasCreditoManager, AuthManager, JobsManager) es una sola lectura de
+user_version: sin CREATE TABLE/INDEX, sin commit y sin revisar el admin.
+
+- Las migraciones se aplican en orden, cada una en su transacción
+  (BEGIN IMMEDIATE) junto con su user_version; si falla se revierte solo esa
+- Un proceso que encuentra la BD a medio migrar por otro espera el bloqueo y
+  vuelve a leer la versión antes de aplicar cada migración
+- Las BD anteriores a este sistema tienen user_version 0 y ya tienen parte
+  del esquema: las migraciones 1-5 usan IF NOT EXISTS y lo reconocen
+- Una migración nueva se agrega al final con @_migracion(N + 1, ...) y nunca
+  se modifica una ya publicada
+- Cada migración lleva su propio SQL (tablas, triggers, catálogos) tal como
+  era al publicarla y corre en la conexión del runner sin confirmar: no llama
+  a los instalar() de los gestores, que siguen el código actual y son solo
+  para tiempo de ejecución
+
+CLI: python backend/scripts/migrar_bd.py estado | aplicar
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from core.sqlite_pool import conectar
+except ImportError:
+    from sqlite_pool import conectar
+
+logger = logging.getLogger(__name__)
+
+# (versión, descripción, función que recibe la conexión), en orden de versión
+MIGRACIONES: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = []
+
+
+def _migracion(version: int, descripcion: str):
+    """Registra una migración; las versiones deben ser consecutivas"""
+    def registrar(funcion):
+        if version != len(MIGRACIONES) + 1:
+            raise ValueError(f"Migración {version} fuera de orden (se esperaba {len(MIGRACIONES) + 1})")
+        MIGRACIONES.append((version, descripcion, funcion))
+        return funcion
+    return registrar
+
+
+# =========================================================================
+# MIGRACIONES
+# =========================================================================
+
+def _agregar_indice_linea_facturas(conn: sqlite3.Connection):
+    """
+    Recrea facturas con la columna indice_linea y el UNIQUE que la incluye
+    (BD creadas antes de ese cambio). Debe ir antes de crear los índices.
+    """
+    existe = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='facturas'").fetchone()
+    if existe is None:
+        return
+    columnas = [col[1] for col in conn.execute("PRAGMA table_info(facturas)").fetchall()]
+    if 'indice_linea' in columnas:
+        return
+
+    logger.info("Migrando tabla facturas: agregando columna indice_linea...")
+
+    # SQLite requiere recrear la tabla para cambiar el UNIQUE constraint
+    conn.execute('ALTER TABLE facturas RENAME TO facturas_old')
+    conn.execute('''
+        CREATE TABLE facturas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_linea TEXT NOT NULL,
+            numero_factura TEXT NOT NULL,
+            indice_linea INTEGER DEFAULT 0,
+            producto TEXT NOT NULL,
+            codigo_producto TEXT NOT NULL,
+            nit_cliente TEXT NOT NULL,
+            nombre_cliente TEXT NOT NULL,
+            cantidad_original REAL NOT NULL,
+            precio_unitario REAL NOT NULL,
+            valor_total REAL NOT NULL,
+            nota_aplicada INTEGER DEFAULT 0,
+            numero_nota_aplicada TEXT,
+            descuento_cantidad REAL DEFAULT 0,
+            descuento_valor REAL DEFAULT 0,
+            cantidad_restante REAL,
+            valor_restante REAL,
+            tipo_inventario TEXT,
+            fecha_factura DATE NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_proceso DATE,
+            estado TEXT DEFAULT 'PROCESADA',
+            UNIQUE(numero_factura, codigo_producto, indice_linea, fecha_proceso)
+        )
+    ''')
+    # Los datos existentes quedan con indice_linea=0
+    conn.execute('''
+        INSERT INTO facturas (
+            id, numero_linea, numero_factura, indice_linea, producto, codigo_producto,
+            nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
+            valor_total, nota_aplicada, numero_nota_aplicada, descuento_cantidad,
+            descuento_valor, cantidad_restante, valor_restante, tipo_inventario,
+            fecha_factura, fecha_registro, fecha_proceso, estado
+        )
+        SELECT
+            id, numero_linea, numero_factura, 0, producto, codigo_producto,
+            nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
+            valor_total, nota_aplicada, numero_nota_aplicada, descuento_cantidad,
+            descuento_valor, cantidad_restante, valor_restante, tipo_inventario,
+            fecha_factura, fecha_registro, fecha_proceso, estado
+        FROM facturas_old
+    ''')
+    conn.execute('DROP TABLE facturas_old')
+    logger.info("Migración completada: tabla facturas actualizada con indice_linea")
+
+
+@_migracion(1, 'Facturas, facturas rechazadas, notas crédito y aplicaciones')
+def _tablas_notas_credito(conn: sqlite3.Connection):
+    _agregar_indice_linea_facturas(conn)
+
+    # =========================================================================
+    # TABLA FACTURAS
+    # Guarda cada línea de factura válida con toda la información requerida
+    # IMPORTANTE: indice_linea permite guardar múltiples líneas del mismo
+    # producto en la misma factura sin que se sobrescriban
+    # =========================================================================
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facturas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            -- Identificación de la línea
+            numero_linea TEXT NOT NULL,
+            numero_factura TEXT NOT NULL,
+            indice_linea INTEGER DEFAULT 0,
+            producto TEXT NOT NULL,
+            codigo_producto TEXT NOT NULL,
+
+            -- Datos del cliente
+            nit_cliente TEXT NOT NULL,
+            nombre_cliente TEXT NOT NULL,
+
+            -- Valores originales
+            cantidad_original REAL NOT NULL,
+            precio_unitario REAL NOT NULL,
+            valor_total REAL NOT NULL,
+
+            -- Información de nota aplicada
+            nota_aplicada INTEGER DEFAULT 0,
+            numero_nota_aplicada TEXT,
+            descuento_cantidad REAL DEFAULT 0,
+            descuento_valor REAL DEFAULT 0,
+            cantidad_restante REAL,
+            valor_restante REAL,
+
+            -- Metadata
+            tipo_inventario TEXT,
+            fecha_factura DATE NOT NULL,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_proceso DATE,
+            estado TEXT DEFAULT 'PROCESADA',
+
+            UNIQUE(numero_factura, codigo_producto, indice_linea, fecha_proceso)
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_numero ON facturas(numero_factura)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_linea ON facturas(numero_linea)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_producto ON facturas(codigo_producto)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha_factura)')
+    # Filtros del listado paginado por (fecha_factura, id): el índice entrega las
+    # filas ya ordenadas y la búsqueda de continuación no recorre páginas previas
+    conn.execute('DROP INDEX IF EXISTS idx_facturas_cliente')
+    conn.execute('DROP INDEX IF EXISTS idx_facturas_nota')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_cliente_fecha ON facturas(nit_cliente, fecha_factura)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_nota_fecha ON facturas(nota_aplicada, fecha_factura)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_facturas_indice ON facturas(indice_linea)')
+
+    # =========================================================================
+    # TABLA FACTURAS_RECHAZADAS
+    # Facturas que no cumplen con las reglas de negocio
+    # =========================================================================
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS facturas_rechazadas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_factura TEXT NOT NULL,
+            numero_linea TEXT,
+            codigo_producto TEXT,
+            producto TEXT,
+            nit_cliente TEXT,
+            nombre_cliente TEXT,
+            cantidad REAL,
+            valor_total REAL,
+            tipo_inventario TEXT,
+            razon_rechazo TEXT NOT NULL,
+            fecha_factura DATE,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rechazadas_fecha ON facturas_rechazadas(fecha_factura)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rechazadas_razon ON facturas_rechazadas(razon_rechazo)')
+
+    # =========================================================================
+    # TABLA NOTAS_CREDITO
+    # Notas de crédito que cumplen con las reglas de negocio
+    # =========================================================================
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notas_credito (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            numero_nota TEXT NOT NULL,
+            fecha_nota DATE NOT NULL,
+
+            -- Cliente
+            nit_cliente TEXT NOT NULL,
+            nombre_cliente TEXT NOT NULL,
+
+            -- Producto
+            codigo_producto TEXT NOT NULL,
+            nombre_producto TEXT NOT NULL,
+            tipo_inventario TEXT,
+
+            -- Valores originales
+            valor_total REAL NOT NULL,
+            cantidad REAL NOT NULL,
+
+            -- Saldos pendientes
+            saldo_pendiente REAL NOT NULL,
+            cantidad_pendiente REAL NOT NULL,
+
+            -- Estado y tracking
+            estado TEXT DEFAULT 'PENDIENTE',
+            causal_devolucion TEXT,
+            fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_aplicacion_completa TIMESTAMP NULL,
+
+            UNIQUE(numero_nota, codigo_producto)
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_producto ON notas_credito(codigo_producto)')
+    # Listado paginado por (fecha_nota, id), solo o filtrado por cliente / estado
+    conn.execute('DROP INDEX IF EXISTS idx_notas_cliente')
+    conn.execute('DROP INDEX IF EXISTS idx_notas_estado')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_fecha ON notas_credito(fecha_nota)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_cliente_fecha ON notas_credito(nit_cliente, fecha_nota)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_estado_fecha ON notas_credito(estado, fecha_nota)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_notas_registro ON notas_credito(fecha_registro)')
+
+    # =========================================================================
+    # TABLA APLICACIONES_NOTAS
+    # Historial de aplicaciones de notas a facturas
+    # =========================================================================
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS aplicaciones_notas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_nota INTEGER NOT NULL,
+            numero_nota TEXT NOT NULL,
+            numero_factura TEXT NOT NULL,
+            numero_linea TEXT,
+            fecha_factura DATE NOT NULL,
+            nit_cliente TEXT NOT NULL,
+            codigo_producto TEXT NOT NULL,
+            cantidad_aplicada REAL NOT NULL,
+            valor_aplicado REAL NOT NULL,
+            fecha_aplicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (id_nota) REFERENCES notas_credito(id)
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_aplicaciones_nota ON aplicaciones_notas(numero_nota)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_aplicaciones_factura ON aplicaciones_notas(numero_factura)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_aplicaciones_fecha ON aplicaciones_notas(fecha_aplicacion)')
+
+
+@_migracion(2, 'Usuarios, sesiones e intentos de login del dashboard; usuario admin inicial')
+def _tablas_autenticacion(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            rol TEXT DEFAULT 'viewer',
+            activo INTEGER DEFAULT 1,
+            intentos_fallidos INTEGER DEFAULT 0,
+            bloqueado_hasta TIMESTAMP NULL,
+            ultimo_acceso TIMESTAMP NULL,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_modificacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sesiones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_jti TEXT NOT NULL UNIQUE,
+            refresh_jti TEXT UNIQUE,
+            ip_address TEXT,
+            user_agent TEXT,
+            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            fecha_expiracion TIMESTAMP NOT NULL,
+            activa INTEGER DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES usuarios(id)
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS intentos_login (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            ip_address TEXT,
+            exitoso INTEGER NOT NULL,
+            razon_fallo TEXT,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_user ON sesiones(user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sesiones_jti ON sesiones(token_jti)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_intentos_ip ON intentos_login(ip_address, fecha)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_intentos_user ON intentos_login(username, fecha)')
+
+    # Usuario admin por defecto (solo al crear el esquema, no en cada inicio)
+    existe = conn.execute('SELECT COUNT(*) FROM usuarios WHERE username = ?', ('admin',)).fetchone()[0]
+    if existe == 0:
+        import bcrypt
+        password_hash = bcrypt.hashpw('admin123'.encode('utf-8'), bcrypt.gensalt())
+        conn.execute('''
+            INSERT INTO usuarios (username, password_hash, email, rol)
+            VALUES (?, ?, ?, ?)
+        ''', ('admin', password_hash.decode('utf-8'), 'admin@cipa.com', 'admin'))
+
+        logger.warning("⚠️  Usuario admin creado con contraseña por defecto. CAMBIAR INMEDIATAMENTE!")
+
+
+@_migracion(3, 'Jobs en segundo plano y checkpoint por día')
+def _tablas_jobs(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            estado TEXT NOT NULL DEFAULT 'PENDIENTE',
+            parametros TEXT NOT NULL,
+            usuario TEXT,
+
+            -- Avance
+            dias_total INTEGER DEFAULT 0,
+            dias_procesados INTEGER DEFAULT 0,
+            dia_actual TEXT,
+            ultimo_dia_confirmado TEXT,
+
+            -- Control
+            cancelar INTEGER DEFAULT 0,
+            trabajador TEXT,
+            intentos INTEGER DEFAULT 0,
+
+            -- Salida
+            resultado TEXT,
+            error TEXT,
+
+            fecha_creacion TIMESTAMP NOT NULL,
+            fecha_inicio TIMESTAMP NULL,
+            fecha_fin TIMESTAMP NULL,
+            fecha_latido TIMESTAMP NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_estado ON jobs(estado)')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs_dias (
+            job_id INTEGER NOT NULL,
+            fecha TEXT NOT NULL,
+            notas_credito INTEGER DEFAULT 0,
+            facturas_validas INTEGER DEFAULT 0,
+            facturas_rechazadas INTEGER DEFAULT 0,
+            aplicaciones INTEGER DEFAULT 0,
+            fecha_confirmacion TIMESTAMP NOT NULL,
+            PRIMARY KEY (job_id, fecha),
+            FOREIGN KEY (job_id) REFERENCES jobs(id)
+        )
+    ''')
+
+
+@_migracion(4, 'Meses archivados (archivo histórico)')
+def _tabla_archivo(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archivo_meses (
+            tabla TEXT NOT NULL,
+            mes TEXT NOT NULL,
+            archivo TEXT NOT NULL,
+            filas INTEGER NOT NULL,
+            id_min INTEGER NOT NULL,
+            id_max INTEGER NOT NULL,
+            fecha_min TEXT NOT NULL,
+            fecha_max TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            totales TEXT NOT NULL,
+            fecha_archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tabla, mes)
+        )
+    ''')
+
+
+# Columnas de resumen_totales en la versión 5: (columna, tabla base, tipo, expresión con X = NEW/OLD)
+_V5_TOTALES = [
+    ('facturas_cantidad', 'facturas', 'INTEGER', '1'),
+    ('facturas_valor_total', 'facturas', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('facturas_con_nota', 'facturas', 'INTEGER', 'CASE WHEN X.nota_aplicada = 1 THEN 1 ELSE 0 END'),
+    ('facturas_descuento_cantidad', 'facturas', 'REAL', 'COALESCE(X.descuento_cantidad, 0)'),
+    ('facturas_descuento_valor', 'facturas', 'REAL', 'COALESCE(X.descuento_valor, 0)'),
+    ('facturas_descuento_con_nota', 'facturas', 'REAL',
+     'CASE WHEN X.nota_aplicada = 1 THEN COALESCE(X.descuento_valor, 0) ELSE 0 END'),
+    ('rechazadas_cantidad', 'facturas_rechazadas', 'INTEGER', '1'),
+    ('rechazadas_valor_total', 'facturas_rechazadas', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('notas_cantidad', 'notas_credito', 'INTEGER', '1'),
+    ('notas_valor_total', 'notas_credito', 'REAL', 'COALESCE(X.valor_total, 0)'),
+    ('aplicaciones_cantidad', 'aplicaciones_notas', 'INTEGER', '1'),
+    ('aplicaciones_valor', 'aplicaciones_notas', 'REAL', 'COALESCE(X.valor_aplicado, 0)'),
+]
+
+_V5_VIGILADAS = {
+    'facturas': ['valor_total', 'nota_aplicada', 'descuento_cantidad', 'descuento_valor'],
+    'facturas_rechazadas': ['valor_total'],
+    'notas_credito': ['valor_total'],
+    'aplicaciones_notas': ['valor_aplicado'],
+}
+
+
+def _v5_triggers() -> List[Tuple[str, str]]:
+    """(nombre, CREATE TRIGGER) de los agregados en la versión 5"""
+    triggers = []
+    for tabla, vigiladas in _V5_VIGILADAS.items():
+        columnas = [(col, expr) for col, t, _, expr in _V5_TOTALES if t == tabla]
+
+        def delta(signo: str, fila: str) -> str:
+            return ', '.join([f"{col} = {col} {signo} {expr.replace('X.', fila + '.')}"
+                              for col, expr in columnas] + ['version_datos = version_datos + 1'])
+
+        triggers.append((f'trg_resumen_{tabla}_ins', f'''
+            CREATE TRIGGER trg_resumen_{tabla}_ins AFTER INSERT ON {tabla}
+            BEGIN
+                UPDATE resumen_totales SET {delta('+', 'NEW')} WHERE id = 1;
+            END
+        '''))
+        triggers.append((f'trg_resumen_{tabla}_del', f'''
+            CREATE TRIGGER trg_resumen_{tabla}_del AFTER DELETE ON {tabla}
+            BEGIN
+                UPDATE resumen_totales SET {delta('-', 'OLD')} WHERE id = 1;
+            END
+        '''))
+        triggers.append((f'trg_resumen_{tabla}_upd', f'''
+            CREATE TRIGGER trg_resumen_{tabla}_upd
+            AFTER UPDATE OF {', '.join(vigiladas)} ON {tabla}
+            BEGIN
+                UPDATE resumen_totales SET {delta('-', 'OLD')} WHERE id = 1;
+                UPDATE resumen_totales SET {delta('+', 'NEW')} WHERE id = 1;
+            END
+        '''))
+        triggers.append((f'trg_resumen_{tabla}_version', f'''
+            CREATE TRIGGER trg_resumen_{tabla}_version
+            AFTER UPDATE ON {tabla}
+            BEGIN
+                UPDATE resumen_totales SET version_datos = version_datos + 1 WHERE id = 1;
+            END
+        '''))
+
+    triggers.append(('trg_resumen_notas_estado_ins', '''
+        CREATE TRIGGER trg_resumen_notas_estado_ins AFTER INSERT ON notas_credito
+        BEGIN
+            INSERT OR IGNORE INTO resumen_notas_estado (estado) VALUES (IFNULL(NEW.estado, ''));
+            UPDATE resumen_notas_estado
+            SET cantidad = cantidad + 1, saldo_pendiente = saldo_pendiente + COALESCE(NEW.saldo_pendiente, 0)
+            WHERE estado = IFNULL(NEW.estado, '');
+        END
+    '''))
+    triggers.append(('trg_resumen_notas_estado_del', '''
+        CREATE TRIGGER trg_resumen_notas_estado_del AFTER DELETE ON notas_credito
+        BEGIN
+            UPDATE resumen_notas_estado
+            SET cantidad = cantidad - 1, saldo_pendiente = saldo_pendiente - COALESCE(OLD.saldo_pendiente, 0)
+            WHERE estado = IFNULL(OLD.estado, '');
+        END
+    '''))
+    triggers.append(('trg_resumen_notas_estado_upd', '''
+        CREATE TRIGGER trg_resumen_notas_estado_upd
+        AFTER UPDATE OF estado, saldo_pendiente ON notas_credito
+        BEGIN
+            UPDATE resumen_notas_estado
+            SET cantidad = cantidad - 1, saldo_pendiente = saldo_pendiente - COALESCE(OLD.saldo_pendiente, 0)
+            WHERE estado = IFNULL(OLD.estado, '');
+            INSERT OR IGNORE INTO resumen_notas_estado (estado) VALUES (IFNULL(NEW.estado, ''));
+            UPDATE resumen_notas_estado
+            SET cantidad = cantidad + 1, saldo_pendiente = saldo_pendiente + COALESCE(NEW.saldo_pendiente, 0)
+            WHERE estado = IFNULL(NEW.estado, '');
+        END
+    '''))
+    return triggers
+
+
+@_migracion(5, 'Agregados del dashboard (tablas de resumen y triggers)')
+def _agregados(conn: sqlite3.Connection):
+    # Las BD que ya tenían los agregados (instalados al vuelo antes de esta
+    # migración) pueden venir sin version_datos o con triggers anteriores:
+    # se reemplazan y todo se recalcula desde las tablas base
+    columnas_tabla = {fila[1] for fila in conn.execute('PRAGMA table_info(resumen_totales)')}
+    columnas = ',\n'.join(f'{col} {tipo} NOT NULL DEFAULT 0' for col, _, tipo, _ in _V5_TOTALES)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS resumen_totales (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            {columnas},
+            version_datos INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    if columnas_tabla and 'version_datos' not in columnas_tabla:
+        conn.execute('ALTER TABLE resumen_totales ADD COLUMN version_datos INTEGER NOT NULL DEFAULT 0')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resumen_notas_estado (
+            estado TEXT PRIMARY KEY,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            saldo_pendiente REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    for nombre, sentencia in _v5_triggers():
+        conn.execute(f'DROP TRIGGER IF EXISTS {nombre}')
+        conn.execute(sentencia)
+
+    # Recalculo: tablas base más los totales de los meses ya archivados
+    totales = {}
+    for tabla in _V5_VIGILADAS:
+        columnas_base = [(col, expr) for col, t, _, expr in _V5_TOTALES if t == tabla]
+        sumas = ', '.join(f"COALESCE(SUM({expr.replace('X.', '')}), 0)" for _, expr in columnas_base)
+        fila = conn.execute(f'SELECT {sumas} FROM {tabla}').fetchone()
+        totales.update({col: valor for (col, _), valor in zip(columnas_base, fila)})
+    for (texto,) in conn.execute('SELECT totales FROM archivo_meses'):
+        for col, valor in json.loads(texto).items():
+            totales[col] += valor
+
+    nombres = [col for col, _, _, _ in _V5_TOTALES]
+    conn.execute(f'''
+        INSERT INTO resumen_totales (id, {', '.join(nombres)})
+        VALUES (1, {', '.join('?' for _ in nombres)})
+        ON CONFLICT(id) DO UPDATE SET
+            {', '.join(f'{col} = excluded.{col}' for col in nombres)},
+            version_datos = version_datos + 1
+    ''', [totales[col] for col in nombres])
+    conn.execute('DELETE FROM resumen_notas_estado')
+    conn.execute('''
+        INSERT INTO resumen_notas_estado (estado, cantidad, saldo_pendiente)
+        SELECT IFNULL(estado, ''), COUNT(*), COALESCE(SUM(saldo_pendiente), 0)
+        FROM notas_credito GROUP BY IFNULL(estado, '')
+    ''')
+
+
+# Catálogo de razones de rechazo en la versión 6: (codigo, clave, descripción, patrón del texto)
+_V6_RAZONES = [
+    (0, 'OTRA', 'Otra razón', None),
+    (1, 'NOTA_TIPO_INVENTARIO', 'Nota crédito con tipo de inventario excluido',
+     re.compile(r'Nota crédito con tipo de inventario excluido: (?P<tipo_inventario>.*)\Z', re.S)),
+    (2, 'NO_AGENTE_RETENCION', 'No agente de retención (f_02_014)',
+     re.compile(r"NO AGENTE DE RETENCION \(f_02_014='(?P<agente_retencion>.*)'\) - No debe registrarse\Z", re.S)),
+    (3, 'TIPO_INVENTARIO', 'Tipo de inventario excluido',
+     re.compile(r'Tipo de inventario excluido: (?P<tipo_inventario>.*)\Z', re.S)),
+    (4, 'MONTO_MINIMO', 'Factura acoplada bajo el monto mínimo',
+     re.compile(r'Valor total acoplado de líneas válidas \$(?P<total_procesable>-?[\d,]+\.\d+) '
+                r'no cumple monto mínimo \$(?P<monto_minimo>-?[\d,]+\.\d+)\Z')),
+]
+
+
+def _v6_codigo(texto: str) -> int:
+    if texto:
+        for codigo, _, _, patron in _V6_RAZONES:
+            if patron and patron.match(texto):
+                return codigo
+    return 0
+
+
+@_migracion(6, 'Catálogo de razones de rechazo (codigo_rechazo en facturas_rechazadas)')
+def _razones_rechazo(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS razones_rechazo (
+            codigo INTEGER PRIMARY KEY,
+            clave TEXT NOT NULL UNIQUE,
+            descripcion TEXT NOT NULL
+        )
+    ''')
+    conn.executemany('INSERT OR REPLACE INTO razones_rechazo (codigo, clave, descripcion) VALUES (?, ?, ?)',
+                     [(codigo, clave, descripcion) for codigo, clave, descripcion, _ in _V6_RAZONES])
+
+    columnas = {fila[1] for fila in conn.execute('PRAGMA table_info(facturas_rechazadas)')}
+    if 'codigo_rechazo' not in columnas:
+        conn.execute('ALTER TABLE facturas_rechazadas ADD COLUMN codigo_rechazo INTEGER')
+    # El índice por texto agrupaba sobre valores casi únicos; nada más filtra por razon_rechazo
+    conn.execute('DROP INDEX IF EXISTS idx_rechazadas_razon')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_rechazadas_codigo
+        ON facturas_rechazadas(codigo_rechazo, fecha_registro, valor_total)
+    ''')
+
+    # Clasifica las rechazadas existentes a partir de su texto
+    conn.create_function('codigo_razon_rechazo_v6', 1, _v6_codigo, deterministic=True)
+    cursor = conn.execute('''
+        UPDATE facturas_rechazadas SET codigo_rechazo = codigo_razon_rechazo_v6(razon_rechazo)
+        WHERE codigo_rechazo IS NULL
+    ''')
+    if cursor.rowcount:
+        logger.info(f"Razones de rechazo clasificadas: {cursor.rowcount} fila(s)")
+
+
+VERSION_ACTUAL = len(MIGRACIONES)
+
+
+# =========================================================================
+# APLICACIÓN
+# =========================================================================
+
+def _crear_directorio(db_path: str):
+    """Carpeta de la BD, solo si el archivo aún no existe"""
+    if not os.path.exists(db_path):
+        directorio = os.path.dirname(db_path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+
+def _leer_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def version_esquema(db_path: str) -> int:
+    """PRAGMA user_version de la BD (0 si es anterior a las migraciones o nueva)"""
+    _crear_directorio(db_path)
+    conn = conectar(db_path)
+    try:
+        return _leer_version(conn)
+    finally:
+        conn.close()
+
+
+def estado_migraciones(db_path: str) -> Dict:
+    """Versión de la BD, versión del código y migraciones aplicadas / pendientes"""
+    version = version_esquema(db_path)
+    return {
+        'version': version,
+        'version_actual': VERSION_ACTUAL,
+        'migraciones': [{'version': numero, 'descripcion': descripcion, 'aplicada': numero <= version}
+                        for numero, descripcion, _ in MIGRACIONES],
+    }
+
+
+def aplicar_migraciones(db_path: str, hasta: Optional[int] = None) -> List[int]:
+    """
+    Aplica en orden las migraciones pendientes
+
+    Args:
+        db_path: Ruta de la base de datos (se crea si no existe)
+        hasta: Última versión a aplicar (por defecto todas)
+
+    Returns:
+        Versiones aplicadas por esta llamada
+    """
+    _crear_directorio(db_path)
+    conn = conectar(db_path)
+    aplicadas = []
+    try:
+        for numero, descripcion, funcion in MIGRACIONES:
+            if hasta is not None and numero > hasta:
+                break
+            if conn.in_transaction:
+                conn.commit()
+            # Bloqueo de escritura antes de releer la versión: otro proceso
+            # pudo aplicar esta migración mientras esperábamos
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if _leer_version(conn) >= numero:
+                    conn.rollback()
+                    continue
+                funcion(conn)
+                conn.execute(f'PRAGMA user_version = {numero}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Error en la migración {numero} ({descripcion}); se revierte")
+                raise
+            aplicadas.append(numero)
+            logger.info(f"Migración {numero} aplicada: {descripcion}")
+    finally:
+        conn.close()
+    return aplicadas
+
+
+def asegurar_esquema(db_path: str) -> int:
+    """
+    Deja la BD en la versión actual del esquema
+
+    Con el esquema al día es una sola lectura de PRAGMA user_version.
+
+    Returns:
+        Versión del esquema de la BD
+    """
+    version = version_esquema(db_path)
+    if version == VERSION_ACTUAL:
+        return version
+    if version > VERSION_ACTUAL:
+        logger.warning(f"La BD {db_path} tiene el esquema {version}, más nuevo que el de este "
+                       f"código ({VERSION_ACTUAL})")
+        return version
+    aplicadas = aplicar_migraciones(db_path)
+    if aplicadas:
+        logger.info(f"Esquema de {db_path} migrado de la versión {version} a la {aplicadas[-1]}")
+    return max([version] + aplicadas)
@@ -7,12 +7,32 @@ ESTRUCTURA DE BD:
 - facturas_rechazadas: Facturas que no cumplen reglas de negocio
 - notas_credito: Notas de crédito que cumplen reglas de negocio
 - usuarios: Usuarios del dashboard
+- resumen_totales / resumen_notas_estado: Agregados del dashboard (ver agregados_manager)
+
+El esquema se crea y actualiza con las migraciones versionadas de core/migraciones.py
 """
+import hashlib
+import json
 import sqlite3
 import logging
+from contextlib import contextmanager
+from itertools import groupby
+from collections import defaultdict
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-import os
+
+try:
+    from core.sqlite_pool import conectar
+    from core.migraciones import asegurar_esquema
+    from core.metricas import medir_bd
+    from core.linea_factura import LineaFactura
+    from core.razones_rechazo import codigo_de
+except ImportError:
+    from sqlite_pool import conectar
+    from migraciones import asegurar_esquema
+    from metricas import medir_bd
+    from linea_factura import LineaFactura
+    from razones_rechazo import codigo_de
 
 logger = logging.getLogger(__name__)
 
@@ -28,304 +48,242 @@ class NotasCreditoManager:
             db_path: Ruta de la base de datos SQLite
         """
         self.db_path = db_path
+        # Conexión compartida mientras hay un lote (unidad de trabajo) activo
+        self._conn_lote = None
         self._crear_base_datos()
         logger.info(f"NotasCreditoManager inicializado con BD: {db_path}")
 
-    def _crear_base_datos(self):
-        """Crea las tablas necesarias en la base de datos si no existen"""
-        # Crear directorio si no existe
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-
-        # =========================================================================
-        # PRIMERO: Verificar si necesitamos migrar la tabla facturas existente
-        # =========================================================================
-        self._migrar_tabla_facturas_si_necesario(cursor)
-
-        # =========================================================================
-        # TABLA FACTURAS
-        # Guarda cada línea de factura válida con toda la información requerida
-        # IMPORTANTE: indice_linea permite guardar múltiples líneas del mismo
-        # producto en la misma factura sin que se sobrescriban
-        # =========================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS facturas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                -- Identificación de la línea
-                numero_linea TEXT NOT NULL,
-                numero_factura TEXT NOT NULL,
-                indice_linea INTEGER DEFAULT 0,
-                producto TEXT NOT NULL,
-                codigo_producto TEXT NOT NULL,
-
-                -- Datos del cliente
-                nit_cliente TEXT NOT NULL,
-                nombre_cliente TEXT NOT NULL,
-
-                -- Valores originales
-                cantidad_original REAL NOT NULL,
-                precio_unitario REAL NOT NULL,
-                valor_total REAL NOT NULL,
-
-                -- Información de nota aplicada
-                nota_aplicada INTEGER DEFAULT 0,
-                numero_nota_aplicada TEXT,
-                descuento_cantidad REAL DEFAULT 0,
-                descuento_valor REAL DEFAULT 0,
-                cantidad_restante REAL,
-                valor_restante REAL,
-
-                -- Metadata
-                tipo_inventario TEXT,
-                fecha_factura DATE NOT NULL,
-                fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_proceso DATE,
-                estado TEXT DEFAULT 'PROCESADA',
-
-                UNIQUE(numero_factura, codigo_producto, indice_linea, fecha_proceso)
-            )
-        ''')
+    # =========================================================================
+    # UNIDAD DE TRABAJO (LOTE)
+    # =========================================================================
 
-        # Índices para facturas (solo después de asegurar que la tabla tiene el esquema correcto)
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_numero ON facturas(numero_factura)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_linea ON facturas(numero_linea)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_cliente ON facturas(nit_cliente)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_producto ON facturas(codigo_producto)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_nota ON facturas(nota_aplicada)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_fecha ON facturas(fecha_factura)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_facturas_indice ON facturas(indice_linea)')
-
-        # =========================================================================
-        # TABLA FACTURAS_RECHAZADAS
-        # Facturas que no cumplen con las reglas de negocio
-        # =========================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS facturas_rechazadas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero_factura TEXT NOT NULL,
-                numero_linea TEXT,
-                codigo_producto TEXT,
-                producto TEXT,
-                nit_cliente TEXT,
-                nombre_cliente TEXT,
-                cantidad REAL,
-                valor_total REAL,
-                tipo_inventario TEXT,
-                razon_rechazo TEXT NOT NULL,
-                fecha_factura DATE,
-                fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    @contextmanager
+    def lote(self):
+        """
+        Abre una unidad de trabajo: una sola conexión y una sola transacción
+        para todo lo que se registre dentro del bloque.
 
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rechazadas_fecha ON facturas_rechazadas(fecha_factura)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rechazadas_razon ON facturas_rechazadas(razon_rechazo)')
+        Mientras el lote está activo, todos los métodos del gestor reutilizan
+        la misma conexión y no hacen commit. Al salir del bloque se confirma
+        todo de una vez; si ocurre un error se revierte el lote completo.
 
-        # =========================================================================
-        # TABLA NOTAS_CREDITO
-        # Notas de crédito que cumplen con las reglas de negocio
-        # =========================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notas_credito (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                numero_nota TEXT NOT NULL,
-                fecha_nota DATE NOT NULL,
-
-                -- Cliente
-                nit_cliente TEXT NOT NULL,
-                nombre_cliente TEXT NOT NULL,
-
-                -- Producto
-                codigo_producto TEXT NOT NULL,
-                nombre_producto TEXT NOT NULL,
-                tipo_inventario TEXT,
-
-                -- Valores originales
-                valor_total REAL NOT NULL,
-                cantidad REAL NOT NULL,
-
-                -- Saldos pendientes
-                saldo_pendiente REAL NOT NULL,
-                cantidad_pendiente REAL NOT NULL,
-
-                -- Estado y tracking
-                estado TEXT DEFAULT 'PENDIENTE',
-                causal_devolucion TEXT,
-                fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_aplicacion_completa TIMESTAMP NULL,
-
-                UNIQUE(numero_nota, codigo_producto)
-            )
-        ''')
+        Uso:
+            with manager.lote():
+                manager.registrar_facturas(facturas_validas)
+                manager.procesar_notas_para_facturas(facturas_validas)
+        """
+        if self._conn_lote is not None:
+            # Lote anidado: se integra en la transacción ya abierta
+            yield self
+            return
 
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_cliente ON notas_credito(nit_cliente)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_producto ON notas_credito(codigo_producto)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notas_estado ON notas_credito(estado)')
+        conn = conectar(self.db_path)
+        self._conn_lote = conn
+        try:
+            yield self
+            self._confirmar_lote(conn)
+        except Exception:
+            conn.rollback()
+            logger.error("Error dentro del lote, se revierte la transacción completa")
+            raise
+        finally:
+            self._conn_lote = None
+            conn.close()
 
-        # =========================================================================
-        # TABLA APLICACIONES_NOTAS
-        # Historial de aplicaciones de notas a facturas
-        # =========================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS aplicaciones_notas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                id_nota INTEGER NOT NULL,
-                numero_nota TEXT NOT NULL,
-                numero_factura TEXT NOT NULL,
-                numero_linea TEXT,
-                fecha_factura DATE NOT NULL,
-                nit_cliente TEXT NOT NULL,
-                codigo_producto TEXT NOT NULL,
-                cantidad_aplicada REAL NOT NULL,
-                valor_aplicado REAL NOT NULL,
-                fecha_aplicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (id_nota) REFERENCES notas_credito(id)
-            )
-        ''')
+    @medir_bd
+    def _confirmar_lote(self, conn: sqlite3.Connection):
+        conn.commit()
 
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_aplicaciones_nota ON aplicaciones_notas(numero_nota)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_aplicaciones_factura ON aplicaciones_notas(numero_factura)')
+    def _conectar(self) -> sqlite3.Connection:
+        """Retorna la conexión del lote activo o abre una nueva"""
+        if self._conn_lote is not None:
+            return self._conn_lote
+        return conectar(self.db_path)
+
+    def _liberar(self, conn: sqlite3.Connection, commit: bool = True):
+        """Confirma y cierra la conexión salvo que pertenezca al lote activo"""
+        if conn is self._conn_lote:
+            return
+        if commit:
+            conn.commit()
+        conn.close()
 
-        # =========================================================================
-        # TABLA USUARIOS
-        # Usuarios del dashboard
-        # =========================================================================
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                email TEXT,
-                rol TEXT DEFAULT 'viewer',
-                activo INTEGER DEFAULT 1,
-                intentos_fallidos INTEGER DEFAULT 0,
-                bloqueado_hasta TIMESTAMP NULL,
-                ultimo_acceso TIMESTAMP NULL,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_modificacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Tablas de soporte para autenticación
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sesiones (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                token_jti TEXT NOT NULL UNIQUE,
-                refresh_jti TEXT UNIQUE,
-                ip_address TEXT,
-                user_agent TEXT,
-                fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                fecha_expiracion TIMESTAMP NOT NULL,
-                activa INTEGER DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES usuarios(id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS intentos_login (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                ip_address TEXT,
-                exitoso INTEGER NOT NULL,
-                razon_fallo TEXT,
-                fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    @contextmanager
+    def _conexion(self, commit: bool = True):
+        """
+        Conexión para una operación suelta: la del lote activo o una nueva que
+        al salir se confirma y se cierra. Si hay un error la nueva se revierte
+        y se cierra igual, para no dejarla tomada en el pool; la del lote la
+        revierte lote() al propagarse el error.
+        """
+        conn = self._conectar()
+        propia = conn is not self._conn_lote
+        try:
+            yield conn
+            if propia and commit:
+                conn.commit()
+        except Exception:
+            if propia:
+                conn.rollback()
+            raise
+        finally:
+            if propia:
+                conn.close()
 
-        conn.commit()
-        conn.close()
+    @property
+    def en_lote(self) -> bool:
+        """True si hay una unidad de trabajo activa"""
+        return self._conn_lote is not None
 
-        logger.info("Base de datos inicializada correctamente con todas las tablas")
+    @property
+    def conexion_lote(self) -> Optional[sqlite3.Connection]:
+        """Conexión del lote activo, para escribir otros datos (p. ej. el
+        checkpoint de un job) en la misma transacción"""
+        return self._conn_lote
 
-    def _migrar_tabla_facturas_si_necesario(self, cursor):
+    def _crear_base_datos(self):
         """
-        Migra la tabla facturas para agregar la columna indice_linea y actualizar
-        el constraint UNIQUE. Esto es necesario para BD creadas antes de este cambio.
-
-        IMPORTANTE: Esta función se llama ANTES de crear índices para evitar errores.
+        Deja la BD en la versión actual del esquema (core/migraciones.py);
+        con el esquema al día es una sola lectura de PRAGMA user_version
         """
-        try:
-            # Verificar si la tabla facturas existe
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='facturas'")
-            tabla_existe = cursor.fetchone() is not None
+        asegurar_esquema(self.db_path)
+
+    # =========================================================================
+    # CONSTRUCCIÓN DE FILAS (compartido entre registro individual y por lote)
+    # =========================================================================
+
+    # NOT EXISTS en lugar de INSERT OR IGNORE: un conflicto no debe consumir
+    # valores de AUTOINCREMENT (los ids de notas deben ser los mismos que antes)
+    SQL_INSERT_NOTA = '''
+        INSERT INTO notas_credito
+        (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
+         codigo_producto, nombre_producto, tipo_inventario, valor_total, cantidad,
+         saldo_pendiente, cantidad_pendiente, causal_devolucion, estado)
+        SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?12, 'PENDIENTE'
+        WHERE NOT EXISTS (
+            SELECT 1 FROM notas_credito WHERE numero_nota = ?1 AND codigo_producto = ?5
+        )
+    '''
+
+    SQL_UPSERT_FACTURA = '''
+        INSERT INTO facturas (
+            numero_linea, numero_factura, indice_linea, producto, codigo_producto,
+            nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
+            valor_total, cantidad_restante, valor_restante, tipo_inventario,
+            fecha_factura, fecha_proceso, estado
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'PROCESADA')
+        ON CONFLICT(numero_factura, codigo_producto, indice_linea, fecha_proceso) DO UPDATE SET
+            cantidad_original = excluded.cantidad_original,
+            valor_total = excluded.valor_total,
+            precio_unitario = excluded.precio_unitario
+    '''
+
+    SQL_INSERT_RECHAZADA = '''
+        INSERT INTO facturas_rechazadas
+        (numero_factura, numero_linea, codigo_producto, producto,
+         nit_cliente, nombre_cliente, cantidad, valor_total,
+         tipo_inventario, razon_rechazo, fecha_factura, codigo_rechazo)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def _fila_nota_credito(self, nota) -> Optional[Tuple]:
+        """
+        Construye la fila de notas_credito a partir de la nota (LineaFactura o cruda de la API)
 
-            if not tabla_existe:
-                # La tabla no existe, será creada después con el esquema correcto
-                logger.debug("Tabla facturas no existe, se creará con el nuevo esquema")
-                return
+        Returns:
+            Tupla de parámetros para SQL_INSERT_NOTA o None si la nota se filtra
+        """
+        linea = LineaFactura.desde(nota)
+        numero_nota = linea.numero_factura
+        fecha_nota = linea.fecha_dia or datetime.now().date()
+
+        nit_cliente = linea.nit_cliente
+        nombre_cliente = linea.nombre_cliente
+        codigo_producto = linea.codigo_producto or linea.producto
+        nombre_producto = linea.producto
+        valor_total = linea.valor_total
+        cantidad = linea.cantidad
+        tipo_inventario = linea.tipo_inventario.upper()
+        causal_devolucion = linea.causal_devolucion
+
+        # FILTRO: Rechazar notas con cantidad pero sin valor
+        if cantidad != 0 and valor_total == 0:
+            logger.warning(f"Nota crédito {numero_nota} rechazada: cantidad ({cantidad}) sin valor")
+            return None
 
-            # Verificar si la columna indice_linea existe
-            cursor.execute("PRAGMA table_info(facturas)")
-            columnas = [col[1] for col in cursor.fetchall()]
+        # Validación: código de producto no puede estar vacío
+        if not codigo_producto:
+            logger.error(f"Nota crédito {numero_nota} sin código de producto - Rechazada")
+            return None
 
-            if 'indice_linea' not in columnas:
-                logger.info("Migrando tabla facturas: agregando columna indice_linea...")
+        return (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
+                codigo_producto, nombre_producto, tipo_inventario, valor_total, cantidad,
+                valor_total, cantidad, causal_devolucion)
 
-                # SQLite requiere recrear la tabla para cambiar el UNIQUE constraint
-                # 1. Renombrar tabla actual
-                cursor.execute('ALTER TABLE facturas RENAME TO facturas_old')
+    @staticmethod
+    def _linea(factura) -> LineaFactura:
+        """
+        LineaFactura de una factura recibida: la misma si ya lo es; si no, la
+        convierte desde la fila cruda (f_*) o desde el formato de
+        ExcelProcessor.transformar_factura
+        """
+        if isinstance(factura, dict) and not any(k in factura for k in ('f_prefijo', 'f_nrodocto', 'f_cod_item')):
+            return LineaFactura.desde_transformada(factura)
+        return LineaFactura.desde(factura)
 
-                # 2. Crear nueva tabla con el nuevo esquema
-                cursor.execute('''
-                    CREATE TABLE facturas (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        numero_linea TEXT NOT NULL,
-                        numero_factura TEXT NOT NULL,
-                        indice_linea INTEGER DEFAULT 0,
-                        producto TEXT NOT NULL,
-                        codigo_producto TEXT NOT NULL,
-                        nit_cliente TEXT NOT NULL,
-                        nombre_cliente TEXT NOT NULL,
-                        cantidad_original REAL NOT NULL,
-                        precio_unitario REAL NOT NULL,
-                        valor_total REAL NOT NULL,
-                        nota_aplicada INTEGER DEFAULT 0,
-                        numero_nota_aplicada TEXT,
-                        descuento_cantidad REAL DEFAULT 0,
-                        descuento_valor REAL DEFAULT 0,
-                        cantidad_restante REAL,
-                        valor_restante REAL,
-                        tipo_inventario TEXT,
-                        fecha_factura DATE NOT NULL,
-                        fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        fecha_proceso DATE,
-                        estado TEXT DEFAULT 'PROCESADA',
-                        UNIQUE(numero_factura, codigo_producto, indice_linea, fecha_proceso)
-                    )
-                ''')
+    def _fila_factura(self, factura) -> Tuple:
+        """
+        Construye la fila de facturas (LineaFactura, fila cruda f_* o factura transformada)
 
-                # 3. Copiar datos existentes (con indice_linea=0)
-                cursor.execute('''
-                    INSERT INTO facturas (
-                        id, numero_linea, numero_factura, indice_linea, producto, codigo_producto,
-                        nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
-                        valor_total, nota_aplicada, numero_nota_aplicada, descuento_cantidad,
-                        descuento_valor, cantidad_restante, valor_restante, tipo_inventario,
-                        fecha_factura, fecha_registro, fecha_proceso, estado
-                    )
-                    SELECT
-                        id, numero_linea, numero_factura, 0, producto, codigo_producto,
-                        nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
-                        valor_total, nota_aplicada, numero_nota_aplicada, descuento_cantidad,
-                        descuento_valor, cantidad_restante, valor_restante, tipo_inventario,
-                        fecha_factura, fecha_registro, fecha_proceso, estado
-                    FROM facturas_old
-                ''')
-
-                # 4. Eliminar tabla antigua
-                cursor.execute('DROP TABLE facturas_old')
-
-                logger.info("Migración completada: tabla facturas actualizada con indice_linea")
-            else:
-                logger.debug("Columna indice_linea ya existe, no se requiere migración")
+        Returns:
+            Tupla de parámetros para SQL_UPSERT_FACTURA
+        """
+        linea = self._linea(factura)
+        fecha_factura = linea.fecha_dia or datetime.now().date()
+        cantidad_original = linea.cantidad
+        valor_total = linea.valor_total
+        precio_unitario = (valor_total / cantidad_original) if cantidad_original != 0 else 0.0
+
+        return (
+            linea.numero_factura, linea.numero_factura, linea.indice_linea or 0, linea.producto,
+            linea.codigo_producto, linea.nit_cliente, linea.nombre_cliente, cantidad_original,
+            precio_unitario, valor_total, cantidad_original, valor_total, linea.tipo_inventario,
+            fecha_factura, fecha_factura
+        )
+
+    def _fila_factura_rechazada(self, factura, razon_rechazo: str, codigo_rechazo: int = None) -> Tuple:
+        """
+        Construye la fila de facturas_rechazadas (LineaFactura o factura cruda)
 
-        except Exception as e:
-            logger.error(f"Error en migración de tabla facturas: {e}")
-            import traceback
-            traceback.print_exc()
+        Sin `codigo_rechazo` (rechazos que no vienen de filtrar_facturas) el
+        código se obtiene del texto de la razón.
 
+        Returns:
+            Tupla de parámetros para SQL_INSERT_RECHAZADA
+        """
+        linea = LineaFactura.desde(factura)
+        numero_factura = linea.numero_factura
+        numero_linea = numero_factura
+        fecha_factura = linea.fecha_dia
+
+        codigo_producto = linea.codigo_producto
+        producto = linea.producto
+        nit_cliente = linea.nit_cliente
+        nombre_cliente = linea.nombre_cliente
+        cantidad = linea.cantidad
+        valor_total = linea.valor_total
+        tipo_inventario = linea.tipo_inventario
+
+        return (numero_factura, numero_linea, codigo_producto, producto,
+                nit_cliente, nombre_cliente, cantidad, valor_total,
+                tipo_inventario, razon_rechazo, fecha_factura,
+                codigo_de(razon_rechazo) if codigo_rechazo is None else codigo_rechazo)
+
+    # =========================================================================
+    # REGISTRO INDIVIDUAL
+    # =========================================================================
+
+    @medir_bd
     def registrar_nota_credito(self, nota: Dict) -> bool:
         """
         Registra una nueva nota crédito en la base de datos
@@ -338,69 +296,20 @@ class NotasCreditoManager:
             True si se registró correctamente, False si ya existía o fue filtrada
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Extraer datos de la nota
-            numero_nota = f"{nota.get('f_prefijo', '')}{nota.get('f_nrodocto', '')}"
-            fecha_nota_str = nota.get('f_fecha', '')
-
-            # Parsear fecha
-            fecha_nota = None
-            if fecha_nota_str:
-                try:
-                    fecha_nota = datetime.fromisoformat(str(fecha_nota_str).replace('T00:00:00', '')).date()
-                except:
-                    fecha_nota = datetime.now().date()
-            else:
-                fecha_nota = datetime.now().date()
-
-            nit_cliente = str(nota.get('f_cliente_desp', '')).strip()
-            nombre_cliente = str(nota.get('f_cliente_fact_razon_soc', '')).strip()
-            codigo_producto = str(nota.get('f_cod_item') or nota.get('f_desc_item', '')).strip()
-            nombre_producto = str(nota.get('f_desc_item', '')).strip()
-            valor_total = float(nota.get('f_valor_subtotal_local', 0.0) or 0.0)
-            cantidad = float(nota.get('f_cant_base', 0.0) or 0.0)
-            tipo_inventario = str(nota.get('f_cod_tipo_inv') or nota.get('f_tipo_inv') or '').strip().upper()
-            causal_devolucion = str(nota.get('f_notas_causal_dev', '') or '').strip() or None
-
-            # FILTRO: Rechazar notas con cantidad pero sin valor
-            if cantidad != 0 and valor_total == 0:
-                logger.warning(f"Nota crédito {numero_nota} rechazada: cantidad ({cantidad}) sin valor")
-                conn.close()
+            fila = self._fila_nota_credito(nota)
+            if fila is None:
                 return False
 
-            # Validación: código de producto no puede estar vacío
-            if not codigo_producto:
-                logger.error(f"Nota crédito {numero_nota} sin código de producto - Rechazada")
-                conn.close()
-                return False
+            numero_nota, codigo_producto = fila[0], fila[4]
+            valor_total, cantidad = fila[7], fila[8]
 
-            # Verificar si ya existe
-            cursor.execute(
-                'SELECT id FROM notas_credito WHERE numero_nota = ? AND codigo_producto = ?',
-                (numero_nota, codigo_producto)
-            )
+            with self._conexion() as conn:
+                insertada = conn.execute(self.SQL_INSERT_NOTA, fila).rowcount > 0
 
-            if cursor.fetchone():
+            if not insertada:
                 logger.info(f"Nota crédito {numero_nota} - Producto {codigo_producto[:30]}... ya existe")
-                conn.close()
                 return False
 
-            # Insertar nota crédito
-            cursor.execute('''
-                INSERT INTO notas_credito
-                (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
-                 codigo_producto, nombre_producto, tipo_inventario, valor_total, cantidad,
-                 saldo_pendiente, cantidad_pendiente, causal_devolucion, estado)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'PENDIENTE')
-            ''', (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
-                  codigo_producto, nombre_producto, tipo_inventario, valor_total, cantidad,
-                  valor_total, cantidad, causal_devolucion))
-
-            conn.commit()
-            conn.close()
-
             logger.info(f"Nota crédito registrada: {numero_nota} - Producto: {codigo_producto[:30]}... - "
                        f"Valor: ${valor_total:,.2f} - Cantidad: {cantidad}")
 
@@ -408,8 +317,11 @@ class NotasCreditoManager:
 
         except Exception as e:
             logger.error(f"Error al registrar nota crédito: {e}")
+            if self.en_lote:
+                raise
             return False
 
+    @medir_bd
     def registrar_factura(self, factura: Dict) -> bool:
         """
         Registra una línea de factura en la base de datos.
@@ -427,147 +339,391 @@ class NotasCreditoManager:
             True si se registró correctamente
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Detectar formato de entrada
-            es_factura_cruda = any(k in factura for k in ('f_prefijo', 'f_nrodocto', 'f_cod_item'))
+            fila = self._fila_factura(factura)
 
-            # Parsear fecha
-            if es_factura_cruda:
-                fecha_raw = factura.get('f_fecha')
-            else:
-                fecha_raw = factura.get('fecha_factura')
-
-            fecha_factura = None
-            if isinstance(fecha_raw, str):
-                try:
-                    fecha_factura = datetime.fromisoformat(str(fecha_raw).replace('T00:00:00', '')).date()
-                except:
-                    try:
-                        fecha_factura = datetime.strptime(fecha_raw, '%Y-%m-%d').date()
-                    except:
-                        fecha_factura = datetime.now().date()
-            elif hasattr(fecha_raw, 'date'):
-                fecha_factura = fecha_raw.date() if callable(fecha_raw.date) else fecha_raw
-            else:
-                fecha_factura = datetime.now().date()
-
-            # Extraer datos según formato
-            if es_factura_cruda:
-                prefijo = str(factura.get('f_prefijo', '')).strip()
-                nrodocto = str(factura.get('f_nrodocto', '')).strip()
-                numero_factura = f"{prefijo}{nrodocto}"
-                indice_linea = int(factura.get('_indice_linea', factura.get('indice_linea', 0)) or 0)
-                codigo_producto = str(factura.get('f_cod_item', '')).strip()
-                producto = str(factura.get('f_desc_item', '')).strip()
-                nit_cliente = str(factura.get('f_cliente_desp', '')).strip()
-                nombre_cliente = str(factura.get('f_cliente_fact_razon_soc', '')).strip()
-                cantidad_original = float(factura.get('f_cant_base', 0.0) or 0.0)
-                valor_total = float(factura.get('f_valor_subtotal_local', 0.0) or 0.0)
-                precio_unitario = (valor_total / cantidad_original) if cantidad_original != 0 else 0.0
-                tipo_inventario = str(factura.get('f_cod_tipo_inv') or factura.get('f_tipo_inv') or '').strip()
-            else:
-                numero_factura = str(factura.get('numero_factura', '')).strip()
-                indice_linea = int(factura.get('indice_linea', factura.get('_indice_linea', 0)) or 0)
-                codigo_producto = str(factura.get('codigo_producto_api', '')).strip()
-                producto = str(factura.get('nombre_producto', '')).strip()
-                nit_cliente = str(factura.get('nit_comprador', '')).strip()
-                nombre_cliente = str(factura.get('nombre_comprador', '')).strip()
-                cantidad_original = float(factura.get('cantidad_original', factura.get('cantidad', 0.0)) or 0.0)
-                valor_total = float(factura.get('valor_total', 0.0) or 0.0)
-                precio_unitario = float(factura.get('precio_unitario', 0.0) or 0.0)
-                tipo_inventario = str(factura.get('descripcion', '')).strip()
-
-            numero_linea = numero_factura
-            fecha_proceso = fecha_factura
-
-            cursor.execute('''
-                INSERT INTO facturas (
-                    numero_linea, numero_factura, indice_linea, producto, codigo_producto,
-                    nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
-                    valor_total, cantidad_restante, valor_restante, tipo_inventario,
-                    fecha_factura, fecha_proceso, estado
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'PROCESADA')
-                ON CONFLICT(numero_factura, codigo_producto, indice_linea, fecha_proceso) DO UPDATE SET
-                    cantidad_original = excluded.cantidad_original,
-                    valor_total = excluded.valor_total,
-                    precio_unitario = excluded.precio_unitario
-            ''', (
-                numero_linea, numero_factura, indice_linea, producto, codigo_producto,
-                nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
-                valor_total, cantidad_original, valor_total, tipo_inventario,
-                fecha_factura, fecha_proceso
-            ))
+            with self._conexion() as conn:
+                conn.execute(self.SQL_UPSERT_FACTURA, fila)
 
-            conn.commit()
-            conn.close()
-
-            logger.debug(f"Factura registrada: {numero_linea} línea {indice_linea} - {codigo_producto}")
+            logger.debug(f"Factura registrada: {fila[0]} línea {fila[2]} - {fila[4]}")
             return True
 
         except Exception as e:
             logger.error(f"Error al registrar factura: {e}")
+            if self.en_lote:
+                raise
             import traceback
             traceback.print_exc()
             return False
 
-    def registrar_factura_rechazada(self, factura: Dict, razon_rechazo: str) -> bool:
+    @medir_bd
+    def registrar_factura_rechazada(self, factura: Dict, razon_rechazo: str, codigo_rechazo: int = None) -> bool:
         """
         Registra una factura rechazada en la base de datos
 
         Args:
             factura: Datos de la factura desde la API
             razon_rechazo: Razón por la cual fue rechazada
+            codigo_rechazo: Código del catálogo (core/razones_rechazo.py); por defecto se deduce del texto
 
         Returns:
             True si se registró correctamente
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            fila = self._fila_factura_rechazada(factura, razon_rechazo, codigo_rechazo)
 
-            prefijo = str(factura.get('f_prefijo', '')).strip()
-            nrodocto = factura.get('f_nrodocto', '')
-            numero_factura = f"{prefijo}{nrodocto}"
-            numero_linea = numero_factura
-
-            fecha_str = factura.get('f_fecha', '')
-            fecha_factura = None
-            if fecha_str:
-                try:
-                    fecha_factura = datetime.fromisoformat(str(fecha_str).replace('T00:00:00', '')).date()
-                except:
-                    fecha_factura = datetime.now().date()
-
-            codigo_producto = str(factura.get('f_cod_item', '')).strip()
-            producto = str(factura.get('f_desc_item', '')).strip()
-            nit_cliente = str(factura.get('f_cliente_desp', '')).strip()
-            nombre_cliente = str(factura.get('f_cliente_fact_razon_soc', '')).strip()
-            cantidad = float(factura.get('f_cant_base', 0.0) or 0.0)
-            valor_total = float(factura.get('f_valor_subtotal_local', 0.0) or 0.0)
-            tipo_inventario = str(factura.get('f_cod_tipo_inv', '')).strip()
+            with self._conexion() as conn:
+                conn.execute(self.SQL_INSERT_RECHAZADA, fila)
 
-            cursor.execute('''
-                INSERT INTO facturas_rechazadas
-                (numero_factura, numero_linea, codigo_producto, producto,
-                 nit_cliente, nombre_cliente, cantidad, valor_total,
-                 tipo_inventario, razon_rechazo, fecha_factura)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (numero_factura, numero_linea, codigo_producto, producto,
-                  nit_cliente, nombre_cliente, cantidad, valor_total,
-                  tipo_inventario, razon_rechazo, fecha_factura))
-
-            conn.commit()
-            conn.close()
-
-            logger.debug(f"Factura rechazada registrada: {numero_factura} - {razon_rechazo}")
+            logger.debug(f"Factura rechazada registrada: {fila[0]} - {razon_rechazo}")
             return True
 
         except Exception as e:
             logger.error(f"Error al registrar factura rechazada: {e}")
+            if self.en_lote:
+                raise
             return False
 
+    # =========================================================================
+    # REGISTRO POR LOTE (executemany)
+    # =========================================================================
+
+    @medir_bd
+    def registrar_notas_credito(self, notas: List[Dict]) -> int:
+        """
+        Registra un lote de notas crédito con una sola sentencia executemany.
+        Aplica los mismos filtros que registrar_nota_credito.
+
+        Las notas ya existentes (numero_nota, codigo_producto) se ignoran.
+
+        Args:
+            notas: Notas crédito crudas desde la API
+
+        Returns:
+            Número de notas nuevas insertadas
+        """
+        filas = [f for f in (self._fila_nota_credito(nota) for nota in notas) if f is not None]
+        if not filas:
+            return 0
+
+        conn = self._conectar()
+        try:
+            # rowcount no incluye las filas que modifican los triggers de agregados
+            nuevas = conn.executemany(self.SQL_INSERT_NOTA, filas).rowcount
+            self._liberar(conn)
+        except Exception as e:
+            logger.error(f"Error al registrar lote de notas crédito: {e}")
+            if conn is not self._conn_lote:
+                conn.rollback()
+                conn.close()
+            raise
+
+        logger.info(f"Notas crédito registradas en lote: {nuevas} nuevas de {len(filas)}")
+        return nuevas
+
+    @medir_bd
+    def registrar_facturas(self, facturas: List[Dict]) -> int:
+        """
+        Registra (upsert) un lote de líneas de factura con executemany
+
+        Args:
+            facturas: Facturas crudas o transformadas
+
+        Returns:
+            Número de líneas registradas
+        """
+        if not facturas:
+            return 0
+
+        filas = [self._fila_factura(factura) for factura in facturas]
+
+        conn = self._conectar()
+        try:
+            conn.executemany(self.SQL_UPSERT_FACTURA, filas)
+            self._liberar(conn)
+        except Exception as e:
+            logger.error(f"Error al registrar lote de facturas: {e}")
+            if conn is not self._conn_lote:
+                conn.rollback()
+                conn.close()
+            raise
+
+        logger.debug(f"Facturas registradas en lote: {len(filas)}")
+        return len(filas)
+
+    @medir_bd
+    def registrar_facturas_rechazadas(self, rechazadas: List[Dict]) -> int:
+        """
+        Registra un lote de facturas rechazadas con executemany
+
+        Args:
+            rechazadas: Lista de {'factura': ..., 'razon_rechazo': ..., 'codigo_rechazo': ...}
+                        tal como la retorna BusinessRulesValidator.filtrar_facturas
+                        (sin 'codigo_rechazo' se deduce del texto)
+
+        Returns:
+            Número de rechazos registrados
+        """
+        if not rechazadas:
+            return 0
+
+        filas = [
+            self._fila_factura_rechazada(item['factura'], item['razon_rechazo'], item.get('codigo_rechazo'))
+            for item in rechazadas
+        ]
+
+        conn = self._conectar()
+        try:
+            conn.executemany(self.SQL_INSERT_RECHAZADA, filas)
+            self._liberar(conn)
+        except Exception as e:
+            logger.error(f"Error al registrar lote de facturas rechazadas: {e}")
+            if conn is not self._conn_lote:
+                conn.rollback()
+                conn.close()
+            raise
+
+        logger.debug(f"Facturas rechazadas registradas en lote: {len(filas)}")
+        return len(filas)
+
+    # =========================================================================
+    # SINCRONIZACIÓN INCREMENTAL DEL DÍA
+    # Cada fila de origen se resume en una huella de sus columnas tomadas de
+    # la API; comparándola con la de lo guardado para las mismas fechas se
+    # escriben solo las altas, cambios y bajas. Un reproceso del mismo día o
+    # un rango que se superpone con días ya cargados no vuelve a escribir nada.
+    # =========================================================================
+
+    # Posiciones de _fila_factura que vienen de la API, sin indice_linea (que es
+    # la posición de la línea en la respuesta del día y se corre si cambia una
+    # línea anterior) ni los saldos restantes (que dependen de las notas)
+    POSICIONES_ORIGEN_FACTURA = (0, 1, 3, 4, 5, 6, 7, 8, 9, 12, 13, 14)
+    COLUMNAS_ORIGEN_FACTURA = ('numero_linea', 'numero_factura', 'producto', 'codigo_producto',
+                               'nit_cliente', 'nombre_cliente', 'cantidad_original', 'precio_unitario',
+                               'valor_total', 'tipo_inventario', 'fecha_factura', 'fecha_proceso')
+    # Mismo orden que _fila_factura_rechazada
+    COLUMNAS_ORIGEN_RECHAZADA = ('numero_factura', 'numero_linea', 'codigo_producto', 'producto',
+                                 'nit_cliente', 'nombre_cliente', 'cantidad', 'valor_total',
+                                 'tipo_inventario', 'razon_rechazo', 'fecha_factura', 'codigo_rechazo')
+
+    SQL_ACTUALIZAR_FACTURA_ORIGEN = '''
+        UPDATE facturas
+        SET numero_linea = ?, indice_linea = ?, producto = ?, nit_cliente = ?, nombre_cliente = ?,
+            cantidad_original = ?, precio_unitario = ?, valor_total = ?,
+            cantidad_restante = ? - COALESCE(descuento_cantidad, 0),
+            valor_restante = ? - COALESCE(descuento_valor, 0),
+            tipo_inventario = ?
+        WHERE id = ?
+    '''
+
+    @staticmethod
+    def huella_fila(valores) -> str:
+        """Huella de los valores de origen de una fila (las fechas se comparan como texto)"""
+        texto = json.dumps([v if v is None or isinstance(v, (int, float)) else str(v) for v in valores],
+                           ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:16]
+
+    def _clave_factura_nota(self, factura: Dict) -> Tuple[str, str]:
+        datos = self._datos_factura_para_nota(factura)
+        return datos['nit_cliente'], datos['codigo_producto']
+
+    def _guardadas_por_dia(self, conn: sqlite3.Connection, tabla: str, columnas: str,
+                           fechas: List[str]) -> List[tuple]:
+        filas = []
+        for dia in fechas:
+            filas += conn.execute(
+                f'SELECT {columnas} FROM {tabla} WHERE fecha_factura >= ? AND fecha_factura < ?',
+                self.rango_dias(dia)).fetchall()
+        return filas
+
+    def _emparejar_lineas(self, origen: List[tuple], guardadas: List[tuple]) -> Tuple[list, list, list]:
+        """
+        Empareja las líneas de un mismo (numero_factura, codigo_producto, fecha):
+        primero las de igual huella y luego, en orden de indice_linea, las demás
+
+        Args:
+            origen: (fila, factura) en el orden recibido
+            guardadas: (indice_linea, id, nota_aplicada, huella) ordenadas por indice_linea
+
+        Returns:
+            (pares [(fila, factura, huella_origen, guardada)], origen sin pareja, guardadas sin pareja)
+        """
+        por_huella = defaultdict(list)
+        for guardada in reversed(guardadas):
+            por_huella[guardada[3]].append(guardada)
+        pares, sueltas = [], []
+        for fila, factura in origen:
+            huella = self.huella_fila([fila[i] for i in self.POSICIONES_ORIGEN_FACTURA])
+            iguales = por_huella.get(huella)
+            if iguales:
+                pares.append((fila, factura, huella, iguales.pop()))
+            else:
+                sueltas.append((fila, factura, huella))
+        emparejadas = {id(par[3]) for par in pares}
+        restantes = [guardada for guardada in guardadas if id(guardada) not in emparejadas]
+        cantidad = min(len(sueltas), len(restantes))
+        pares += [(fila, factura, huella, guardada)
+                  for (fila, factura, huella), guardada in zip(sueltas[:cantidad], restantes[:cantidad])]
+        return pares, sueltas[cantidad:], restantes[cantidad:]
+
+    @medir_bd
+    def sincronizar_dia(self, facturas: List[Dict], rechazadas: List[Dict], fecha=None) -> Dict:
+        """
+        Sincroniza las facturas válidas y rechazadas de un día con lo guardado
+
+        - facturas: las líneas de cada (numero_factura, codigo_producto,
+          fecha_proceso) se emparejan con las guardadas (ver _emparejar_lineas);
+          se actualizan las que cambiaron o se corrieron de indice_linea, se
+          insertan las que sobran en el origen y se eliminan las que ya no
+          vienen, salvo las que tienen nota aplicada: esas se conservan y, si
+          su indice_linea quedó ocupado por otra línea, pasan a -id
+        - rechazadas: no tienen clave única; se comparan como multiconjunto de
+          huellas (cada fila guardada cubre una fila de origen igual)
+
+        Las fechas sincronizadas son `fecha` más las de las filas recibidas.
+        Debe llamarse después de registrar las notas del día: las líneas sin
+        cambios solo se ofrecen a la aplicación si su (cliente, producto)
+        tiene notas pendientes.
+
+        Args:
+            facturas: Facturas válidas (LineaFactura, crudas o transformadas)
+            rechazadas: Lista de {'factura': ..., 'razon_rechazo': ..., 'codigo_rechazo': ...}
+            fecha: Día procesado (date, datetime o YYYY-MM-DD)
+
+        Returns:
+            {'facturas': {nuevas, actualizadas, reindexadas, eliminadas, conservadas, sin_cambios},
+             'rechazadas': {nuevas, eliminadas, sin_cambios},
+             'facturas_para_notas': LineaFactura de las facturas (en el orden
+             recibido) a las que procesar_notas_para_facturas debe intentar aplicar notas}
+        """
+        # Misma clave que el UNIQUE de facturas: una línea repetida reemplaza a la anterior
+        # Cada factura se convierte una vez; las etapas siguientes reciben la LineaFactura
+        origen = {}
+        for factura in map(self._linea, facturas):
+            fila = self._fila_factura(factura)
+            origen[(fila[1], fila[4], fila[2], str(fila[14]))] = (fila, factura)
+        filas_rechazadas = [self._fila_factura_rechazada(item['factura'], item['razon_rechazo'],
+                                                         item.get('codigo_rechazo'))
+                            for item in rechazadas]
+
+        fechas = {str(fila[13]) for fila, _ in origen.values()}
+        fechas.update(str(fila[10]) for fila in filas_rechazadas if fila[10] is not None)
+        if fecha is not None:
+            fechas.add(fecha.strftime('%Y-%m-%d') if hasattr(fecha, 'strftime') else str(fecha)[:10])
+        fechas = sorted(fechas)
+
+        conn = self._conectar()
+        try:
+            # --- Facturas: emparejar por grupo y comparar huellas ---
+            grupos_origen = defaultdict(list)
+            for clave, (fila, factura) in origen.items():
+                grupos_origen[(clave[0], clave[1], clave[3])].append((fila, factura))
+            grupos_guardados = defaultdict(list)
+            columnas = ', '.join(self.COLUMNAS_ORIGEN_FACTURA)
+            for fila in self._guardadas_por_dia(conn, 'facturas',
+                                                f'indice_linea, id, nota_aplicada, {columnas}', fechas):
+                valores = fila[3:]
+                grupos_guardados[(valores[1], valores[3], str(valores[11]))].append(
+                    (fila[0], fila[1], fila[2], self.huella_fila(valores)))
+
+            actualizadas, reubicadas, sobrantes, ocupadas = [], [], [], []
+            resultado_lineas = {}  # id(factura) -> ¿sin cambios? (None si es nueva)
+            reindexadas = 0
+            for grupo in dict.fromkeys(list(grupos_origen) + list(grupos_guardados)):
+                lineas = grupos_origen.get(grupo, [])
+                pares, sueltas, restantes = self._emparejar_lineas(
+                    lineas, sorted(grupos_guardados.get(grupo, [])))
+                for fila, factura, huella_origen, (indice, fila_id, _, huella) in pares:
+                    sin_cambio = huella == huella_origen
+                    if not sin_cambio or indice != fila[2]:
+                        actualizadas.append((fila[0], fila[2], fila[3], fila[5], fila[6], fila[7], fila[8],
+                                             fila[9], fila[7], fila[9], fila[12], fila_id))
+                    if indice != fila[2]:
+                        reubicadas.append((fila_id,))
+                        reindexadas += sin_cambio
+                    resultado_lineas[id(factura)] = sin_cambio
+                for _, factura, _ in sueltas:
+                    resultado_lineas[id(factura)] = None
+                sobrantes += restantes
+                indices_origen = {fila[2] for fila, _ in lineas}
+                ocupadas += [(fila_id,) for indice, fila_id, nota_aplicada, _ in restantes
+                             if nota_aplicada and indice in indices_origen]
+
+            # Altas y facturas a las que intentar aplicar notas, en el orden recibido
+            nuevas = [fila for fila, factura in origen.values() if resultado_lineas[id(factura)] is None]
+            para_notas = [(factura, bool(resultado_lineas[id(factura)])) for _, factura in origen.values()]
+            sin_cambios = sum(1 for _, sin_cambio in para_notas if sin_cambio)
+
+            # Una línea sin cambios solo puede recibir notas que sigan pendientes
+            if sin_cambios:
+                claves_pendientes = set(conn.execute('''
+                    SELECT DISTINCT nit_cliente, codigo_producto FROM notas_credito
+                    WHERE estado = 'PENDIENTE' AND saldo_pendiente > 0
+                ''').fetchall())
+                para_notas = [(factura, sin_cambio) for factura, sin_cambio in para_notas
+                              if not sin_cambio or self._clave_factura_nota(factura) in claves_pendientes]
+
+            eliminadas = [(fila_id,) for _, fila_id, nota_aplicada, _ in sobrantes if not nota_aplicada]
+            conservadas = len(sobrantes) - len(eliminadas)
+            if conservadas:
+                logger.warning(f"{conservadas} línea(s) con nota aplicada ya no vienen de la API; se conservan")
+
+            # --- Rechazadas: multiconjunto de huellas ---
+            columnas = ', '.join(self.COLUMNAS_ORIGEN_RECHAZADA)
+            por_huella = defaultdict(list)
+            for fila in self._guardadas_por_dia(conn, 'facturas_rechazadas', f'id, {columnas}', fechas):
+                por_huella[self.huella_fila(fila[1:])].append(fila[0])
+            # Sin fecha no hay día al que acotarlas: solo se evita duplicarlas, nunca se eliminan
+            sin_fecha = defaultdict(list)
+            if any(fila[10] is None for fila in filas_rechazadas):
+                for fila in conn.execute(
+                        f'SELECT id, {columnas} FROM facturas_rechazadas WHERE fecha_factura IS NULL'):
+                    sin_fecha[self.huella_fila(fila[1:])].append(fila[0])
+
+            rechazadas_nuevas = []
+            for fila in filas_rechazadas:
+                coincidencias = (sin_fecha if fila[10] is None else por_huella).get(self.huella_fila(fila))
+                if coincidencias:
+                    coincidencias.pop()
+                else:
+                    rechazadas_nuevas.append(fila)
+            rechazadas_eliminadas = [(fila_id,) for ids in por_huella.values() for fila_id in ids]
+
+            # --- Escritura del delta ---
+            # Bajas primero y luego cambios de indice_linea en dos pasos (-id
+            # como valor temporal) para no chocar con el UNIQUE de facturas
+            if eliminadas:
+                conn.executemany('DELETE FROM facturas WHERE id = ?', eliminadas)
+            if reubicadas or ocupadas:
+                conn.executemany('UPDATE facturas SET indice_linea = -id WHERE id = ?', reubicadas + ocupadas)
+            if actualizadas:
+                conn.executemany(self.SQL_ACTUALIZAR_FACTURA_ORIGEN, actualizadas)
+            if nuevas:
+                conn.executemany(self.SQL_UPSERT_FACTURA, nuevas)
+            if rechazadas_nuevas:
+                conn.executemany(self.SQL_INSERT_RECHAZADA, rechazadas_nuevas)
+            if rechazadas_eliminadas:
+                conn.executemany('DELETE FROM facturas_rechazadas WHERE id = ?', rechazadas_eliminadas)
+            self._liberar(conn)
+        except Exception as e:
+            logger.error(f"Error al sincronizar facturas del día: {e}")
+            if conn is not self._conn_lote:
+                conn.rollback()
+                conn.close()
+            raise
+
+        resultado = {
+            'facturas': {'nuevas': len(nuevas), 'actualizadas': len(actualizadas) - reindexadas,
+                         'reindexadas': reindexadas, 'eliminadas': len(eliminadas),
+                         'conservadas': conservadas, 'sin_cambios': sin_cambios - reindexadas},
+            'rechazadas': {'nuevas': len(rechazadas_nuevas), 'eliminadas': len(rechazadas_eliminadas),
+                           'sin_cambios': len(filas_rechazadas) - len(rechazadas_nuevas)},
+            'facturas_para_notas': [factura for factura, _ in para_notas],
+        }
+        logger.info(f"Sincronización {', '.join(fechas)}: facturas {resultado['facturas']}, "
+                    f"rechazadas {resultado['rechazadas']}")
+        return resultado
+
+    @medir_bd
     def obtener_notas_pendientes(self, nit_cliente: str, codigo_producto: str) -> List[Dict]:
         """
         Obtiene notas crédito pendientes para un cliente y producto
@@ -580,28 +736,198 @@ class NotasCreditoManager:
             Lista de notas crédito pendientes
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
+            with self._conexion(commit=False) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
 
-            cursor.execute('''
-                SELECT * FROM notas_credito
-                WHERE nit_cliente = ?
-                AND codigo_producto = ?
-                AND estado = 'PENDIENTE'
-                AND saldo_pendiente > 0
-                ORDER BY fecha_nota ASC
-            ''', (nit_cliente, codigo_producto))
+                cursor.execute('''
+                    SELECT * FROM notas_credito
+                    WHERE nit_cliente = ?
+                    AND codigo_producto = ?
+                    AND estado = 'PENDIENTE'
+                    AND saldo_pendiente > 0
+                    ORDER BY fecha_nota ASC, id ASC
+                ''', (nit_cliente, codigo_producto))
 
-            notas = [dict(row) for row in cursor.fetchall()]
-            conn.close()
+                notas = [dict(row) for row in cursor.fetchall()]
 
             return notas
 
         except Exception as e:
             logger.error(f"Error al obtener notas pendientes: {e}")
+            if self.en_lote:
+                raise
             return []
 
+    # =========================================================================
+    # APLICACIÓN DE NOTAS
+    # =========================================================================
+
+    SQL_INSERT_APLICACION = '''
+        INSERT INTO aplicaciones_notas
+        (id_nota, numero_nota, numero_factura, numero_linea, fecha_factura,
+         nit_cliente, codigo_producto, cantidad_aplicada, valor_aplicado)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    SQL_UPDATE_NOTA = '''
+        UPDATE notas_credito
+        SET saldo_pendiente = ?,
+            cantidad_pendiente = ?,
+            estado = ?,
+            fecha_aplicacion_completa = ?
+        WHERE id = ?
+    '''
+
+    SQL_UPDATE_FACTURA_PRODUCTO = '''
+        UPDATE facturas
+        SET nota_aplicada = 1,
+            numero_nota_aplicada = ?,
+            descuento_cantidad = descuento_cantidad + ?,
+            descuento_valor = descuento_valor + ?,
+            cantidad_restante = ?,
+            valor_restante = ?
+        WHERE numero_factura = ? AND codigo_producto = ?
+    '''
+
+    SQL_UPDATE_FACTURA_LINEA = '''
+        UPDATE facturas
+        SET nota_aplicada = 1,
+            numero_nota_aplicada = ?,
+            descuento_cantidad = descuento_cantidad + ?,
+            descuento_valor = descuento_valor + ?,
+            cantidad_restante = ?,
+            valor_restante = ?
+        WHERE numero_factura = ?
+          AND codigo_producto = ?
+          AND indice_linea = ?
+          AND fecha_proceso = ?
+    '''
+
+    # Máximo de claves (nit, producto) por consulta: 2 parámetros por clave,
+    # por debajo del límite histórico de 999 variables de SQLite
+    CLAVES_POR_CONSULTA = 400
+
+    def _datos_factura_para_nota(self, factura) -> Dict:
+        """
+        Extrae de la factura (LineaFactura, cruda de API o formato transformado)
+        los campos que necesita la aplicación de notas.
+        """
+        linea = self._linea(factura)
+        return {
+            'numero_factura': linea.numero_factura,
+            'nit_cliente': linea.nit_cliente,
+            'codigo_producto': linea.codigo_producto,
+            'fecha_factura': linea.fecha_dia or datetime.now().date(),
+            'indice_linea': linea.indice_linea,
+            'cantidad': abs(linea.cantidad),
+            'valor': abs(linea.valor_total),
+        }
+
+    def _evaluar_aplicacion(self, nota: Dict, datos: Dict) -> Optional[Dict]:
+        """
+        Evalúa las reglas de aplicación de una nota sobre una línea de factura
+        sin escribir en la BD.
+
+        Args:
+            nota: Nota crédito (desde BD)
+            datos: Campos de la factura según _datos_factura_para_nota
+
+        Returns:
+            Diccionario con la aplicación calculada y los parámetros SQL,
+            o None si la nota no puede aplicarse
+        """
+        numero_factura = datos['numero_factura']
+        codigo_factura = datos['codigo_producto']
+
+        # Validar cliente y producto
+        if nota['nit_cliente'] != datos['nit_cliente']:
+            return None
+
+        if nota['codigo_producto'] != codigo_factura:
+            return None
+
+        cantidad_factura = datos['cantidad']
+        valor_factura = datos['valor']
+
+        cantidad_nota = abs(nota['cantidad_pendiente'])
+        valor_nota = abs(nota['saldo_pendiente'])
+
+        # =========================================================================
+        # VALIDACIÓN CRÍTICA: El valor de la nota NO puede superar el valor de la línea
+        # Esto previene el caso extraño donde nota tiene valor mayor a la factura
+        # =========================================================================
+        if valor_nota > valor_factura:
+            logger.warning(
+                f"Nota {nota['numero_nota']} NO puede aplicarse a factura {numero_factura}: "
+                f"Valor nota (${valor_nota:,.2f}) > Valor factura (${valor_factura:,.2f})"
+            )
+            return None
+
+        # La cantidad de la nota no puede superar la cantidad de la factura
+        if cantidad_nota > cantidad_factura:
+            logger.warning(
+                f"Nota {nota['numero_nota']} NO puede aplicarse a factura {numero_factura}: "
+                f"Cantidad nota ({cantidad_nota}) > Cantidad factura ({cantidad_factura})"
+            )
+            return None
+
+        # Si pasa las validaciones, aplicar la nota
+        cantidad_aplicar = cantidad_nota
+        valor_aplicar = valor_nota
+        numero_linea = numero_factura
+
+        # Actualizar saldos de la nota
+        nuevo_saldo = nota['saldo_pendiente'] - valor_aplicar
+        nueva_cantidad = nota['cantidad_pendiente'] - cantidad_aplicar
+
+        # Determinar nuevo estado
+        if nuevo_saldo <= 0.01:
+            estado = 'APLICADA'
+            fecha_aplicacion_completa = datetime.now()
+        else:
+            estado = 'PARCIAL'
+            fecha_aplicacion_completa = None
+
+        # Actualizar la factura con la nota aplicada
+        cantidad_restante = cantidad_factura - cantidad_aplicar
+        valor_restante = valor_factura - valor_aplicar
+
+        fila_aplicacion = (nota['id'], nota['numero_nota'], numero_factura, numero_linea,
+                           datos['fecha_factura'], nota['nit_cliente'],
+                           nota['codigo_producto'], cantidad_aplicar, valor_aplicar)
+        fila_nota = (max(0, nuevo_saldo), max(0, nueva_cantidad),
+                     estado, fecha_aplicacion_completa, nota['id'])
+        if datos['indice_linea'] is None:
+            sql_factura = self.SQL_UPDATE_FACTURA_PRODUCTO
+            fila_factura = (nota['numero_nota'], cantidad_aplicar, valor_aplicar,
+                            cantidad_restante, valor_restante, numero_factura, codigo_factura)
+        else:
+            sql_factura = self.SQL_UPDATE_FACTURA_LINEA
+            fila_factura = (nota['numero_nota'], cantidad_aplicar, valor_aplicar,
+                            cantidad_restante, valor_restante,
+                            numero_factura, codigo_factura, datos['indice_linea'],
+                            datos['fecha_factura'])
+
+        return {
+            'resultado': {
+                'numero_nota': nota['numero_nota'],
+                'numero_factura': numero_factura,
+                'numero_linea': numero_linea,
+                'cantidad_aplicada': cantidad_aplicar,
+                'valor_aplicado': valor_aplicar,
+                'cantidad_restante_factura': cantidad_restante,
+                'valor_restante_factura': valor_restante,
+                'saldo_restante_nota': max(0, nuevo_saldo),
+                'estado_nota': estado
+            },
+            'fila_aplicacion': fila_aplicacion,
+            'fila_nota': fila_nota,
+            'sql_factura': sql_factura,
+            'fila_factura': fila_factura,
+        }
+
+    @medir_bd
     def aplicar_nota_a_factura(self, nota: Dict, factura: Dict) -> Optional[Dict]:
         """
         Aplica una nota crédito a una factura si cumple las condiciones:
@@ -620,217 +946,164 @@ class NotasCreditoManager:
         """
         try:
             # Permitir factura en formato transformado o crudo (API)
-            numero_factura = str(factura.get('numero_factura', '')).strip()
-            if not numero_factura:
-                prefijo = str(factura.get('f_prefijo', '')).strip()
-                nrodocto = str(factura.get('f_nrodocto', '')).strip()
-                numero_factura = f"{prefijo}{nrodocto}"
-
-            nit_factura = str(factura.get('nit_comprador') or factura.get('f_cliente_desp', '')).strip()
-            codigo_factura = str(factura.get('codigo_producto_api') or factura.get('f_cod_item', '')).strip()
-
-            # Parsear fecha de factura
-            fecha_factura = factura.get('fecha_factura')
-            if not fecha_factura:
-                fecha_factura = factura.get('f_fecha')
-
-            if isinstance(fecha_factura, str):
-                try:
-                    fecha_factura = datetime.fromisoformat(str(fecha_factura).replace('T00:00:00', '')).date()
-                except:
-                    try:
-                        fecha_factura = datetime.strptime(fecha_factura, '%Y-%m-%d').date()
-                    except:
-                        fecha_factura = datetime.now().date()
-            elif hasattr(fecha_factura, 'date'):
-                fecha_factura = fecha_factura.date() if callable(fecha_factura.date) else fecha_factura
-            else:
-                fecha_factura = datetime.now().date()
-
-            # Índice de línea (si existe) para actualizar solo la línea exacta
-            indice_linea = factura.get('indice_linea', factura.get('_indice_linea'))
-            if indice_linea is not None:
-                try:
-                    indice_linea = int(indice_linea)
-                except (TypeError, ValueError):
-                    indice_linea = None
-
-            # Validar cliente y producto
-            if nota['nit_cliente'] != nit_factura:
-                return None
-
-            if nota['codigo_producto'] != codigo_factura:
-                return None
+            datos = self._datos_factura_para_nota(factura)
 
-            # Obtener valores
-            cantidad_origen = factura.get('cantidad_original')
-            if cantidad_origen is None:
-                cantidad_origen = factura.get('cantidad')
-            if cantidad_origen is None:
-                cantidad_origen = factura.get('f_cant_base', 0)
-            cantidad_factura = abs(float(cantidad_origen or 0))
-
-            valor_origen = factura.get('valor_total')
-            if valor_origen is None:
-                valor_origen = factura.get('f_valor_subtotal_local', 0)
-            valor_factura = abs(float(valor_origen or 0))
-
-            cantidad_nota = abs(nota['cantidad_pendiente'])
-            valor_nota = abs(nota['saldo_pendiente'])
-
-            # =========================================================================
-            # VALIDACIÓN CRÍTICA: El valor de la nota NO puede superar el valor de la línea
-            # Esto previene el caso extraño donde nota tiene valor mayor a la factura
-            # =========================================================================
-            if valor_nota > valor_factura:
-                logger.warning(
-                    f"Nota {nota['numero_nota']} NO puede aplicarse a factura {numero_factura}: "
-                    f"Valor nota (${valor_nota:,.2f}) > Valor factura (${valor_factura:,.2f})"
-                )
+            evaluacion = self._evaluar_aplicacion(nota, datos)
+            if evaluacion is None:
                 return None
 
-            # La cantidad de la nota no puede superar la cantidad de la factura
-            if cantidad_nota > cantidad_factura:
-                logger.warning(
-                    f"Nota {nota['numero_nota']} NO puede aplicarse a factura {numero_factura}: "
-                    f"Cantidad nota ({cantidad_nota}) > Cantidad factura ({cantidad_factura})"
-                )
-                return None
-
-            # Si pasa las validaciones, aplicar la nota
-            cantidad_aplicar = cantidad_nota
-            valor_aplicar = valor_nota
-
             # Registrar aplicación
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            numero_linea = numero_factura
-
-            cursor.execute('''
-                INSERT INTO aplicaciones_notas
-                (id_nota, numero_nota, numero_factura, numero_linea, fecha_factura,
-                 nit_cliente, codigo_producto, cantidad_aplicada, valor_aplicado)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (nota['id'], nota['numero_nota'], numero_factura, numero_linea,
-                  fecha_factura, nota['nit_cliente'],
-                  nota['codigo_producto'], cantidad_aplicar, valor_aplicar))
-
-            # Actualizar saldos de la nota
-            nuevo_saldo = nota['saldo_pendiente'] - valor_aplicar
-            nueva_cantidad = nota['cantidad_pendiente'] - cantidad_aplicar
-
-            # Determinar nuevo estado
-            if nuevo_saldo <= 0.01:
-                estado = 'APLICADA'
-                fecha_aplicacion_completa = datetime.now()
-            else:
-                estado = 'PARCIAL'
-                fecha_aplicacion_completa = None
-
-            cursor.execute('''
-                UPDATE notas_credito
-                SET saldo_pendiente = ?,
-                    cantidad_pendiente = ?,
-                    estado = ?,
-                    fecha_aplicacion_completa = ?
-                WHERE id = ?
-            ''', (max(0, nuevo_saldo), max(0, nueva_cantidad),
-                  estado, fecha_aplicacion_completa, nota['id']))
-
-            # Actualizar la factura con la nota aplicada
-            cantidad_restante = cantidad_factura - cantidad_aplicar
-            valor_restante = valor_factura - valor_aplicar
-
-            if indice_linea is None:
-                cursor.execute('''
-                    UPDATE facturas
-                    SET nota_aplicada = 1,
-                        numero_nota_aplicada = ?,
-                        descuento_cantidad = descuento_cantidad + ?,
-                        descuento_valor = descuento_valor + ?,
-                        cantidad_restante = ?,
-                        valor_restante = ?
-                    WHERE numero_factura = ? AND codigo_producto = ?
-                ''', (nota['numero_nota'], cantidad_aplicar, valor_aplicar,
-                      cantidad_restante, valor_restante, numero_factura, codigo_factura))
-            else:
-                cursor.execute('''
-                    UPDATE facturas
-                    SET nota_aplicada = 1,
-                        numero_nota_aplicada = ?,
-                        descuento_cantidad = descuento_cantidad + ?,
-                        descuento_valor = descuento_valor + ?,
-                        cantidad_restante = ?,
-                        valor_restante = ?
-                    WHERE numero_factura = ?
-                      AND codigo_producto = ?
-                      AND indice_linea = ?
-                      AND fecha_proceso = ?
-                ''', (nota['numero_nota'], cantidad_aplicar, valor_aplicar,
-                      cantidad_restante, valor_restante,
-                      numero_factura, codigo_factura, indice_linea, fecha_factura))
-
-            conn.commit()
-            conn.close()
+            with self._conexion() as conn:
+                cursor = conn.cursor()
+                cursor.execute(self.SQL_INSERT_APLICACION, evaluacion['fila_aplicacion'])
+                cursor.execute(self.SQL_UPDATE_NOTA, evaluacion['fila_nota'])
+                cursor.execute(evaluacion['sql_factura'], evaluacion['fila_factura'])
 
+            resultado = evaluacion['resultado']
             logger.info(
-                f"Nota {nota['numero_nota']} aplicada a línea {numero_linea}: "
-                f"Cantidad: {cantidad_aplicar} | Valor: ${valor_aplicar:,.2f} | "
-                f"Cantidad restante en línea: {cantidad_restante} | Estado nota: {estado}"
+                f"Nota {resultado['numero_nota']} aplicada a línea {resultado['numero_linea']}: "
+                f"Cantidad: {resultado['cantidad_aplicada']} | Valor: ${resultado['valor_aplicado']:,.2f} | "
+                f"Cantidad restante en línea: {resultado['cantidad_restante_factura']} | "
+                f"Estado nota: {resultado['estado_nota']}"
             )
 
-            return {
-                'numero_nota': nota['numero_nota'],
-                'numero_factura': numero_factura,
-                'numero_linea': numero_linea,
-                'cantidad_aplicada': cantidad_aplicar,
-                'valor_aplicado': valor_aplicar,
-                'cantidad_restante_factura': cantidad_restante,
-                'valor_restante_factura': valor_restante,
-                'saldo_restante_nota': max(0, nuevo_saldo),
-                'estado_nota': estado
-            }
+            return resultado
 
         except Exception as e:
             logger.error(f"Error al aplicar nota: {e}")
+            if self.en_lote:
+                raise
             import traceback
             traceback.print_exc()
             return None
 
+    def _cargar_notas_pendientes(self, conn: sqlite3.Connection,
+                                 claves: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        Carga en memoria las notas pendientes de todas las claves
+        (nit_cliente, codigo_producto) del lote, ordenadas FIFO por fecha_nota.
+
+        Returns:
+            Índice {(nit_cliente, codigo_producto): [notas...]}
+        """
+        indice = defaultdict(list)
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+
+        for inicio in range(0, len(claves), self.CLAVES_POR_CONSULTA):
+            bloque = claves[inicio:inicio + self.CLAVES_POR_CONSULTA]
+            valores = ', '.join(['(?, ?)'] * len(bloque))
+            params = [v for clave in bloque for v in clave]
+
+            cursor.execute(f'''
+                SELECT * FROM notas_credito
+                WHERE (nit_cliente, codigo_producto) IN (VALUES {valores})
+                AND estado = 'PENDIENTE'
+                AND saldo_pendiente > 0
+                ORDER BY fecha_nota ASC, id ASC
+            ''', params)
+
+            for row in cursor.fetchall():
+                nota = dict(row)
+                indice[(nota['nit_cliente'], nota['codigo_producto'])].append(nota)
+
+        return indice
+
+    @medir_bd
     def procesar_notas_para_facturas(self, facturas: List[Dict]) -> List[Dict]:
         """
         Procesa la aplicación de notas crédito pendientes a un lote de facturas
 
+        Carga todas las notas pendientes del lote en una sola consulta, aplica
+        las reglas (FIFO por fecha_nota, valor y cantidad <= línea) en memoria
+        y escribe aplicaciones, notas y facturas con executemany. Las tablas
+        resultantes son idénticas a las de la implementación línea por línea
+        de benchmarks/referencia_notas.py.
+
         Args:
             facturas: Lista de facturas transformadas o crudas (API)
 
         Returns:
             Lista de aplicaciones realizadas
         """
-        aplicaciones = []
-
+        # Extraer una sola vez los datos de cada línea con clave válida
+        lineas = []
         for factura in facturas:
-            nit_cliente = str(factura.get('nit_comprador') or factura.get('f_cliente_desp', '')).strip()
-            codigo_producto = str(factura.get('codigo_producto_api') or factura.get('f_cod_item', '')).strip()
-
-            if not nit_cliente or not codigo_producto:
+            datos = self._datos_factura_para_nota(factura)
+            if not datos['nit_cliente'] or not datos['codigo_producto']:
                 continue
+            lineas.append(datos)
 
-            notas_pendientes = self.obtener_notas_pendientes(nit_cliente, codigo_producto)
+        if not lineas:
+            logger.info("Se realizaron 0 aplicaciones de notas crédito")
+            return []
 
-            for nota in notas_pendientes:
-                aplicacion = self.aplicar_nota_a_factura(nota, factura)
+        conn = self._conectar()
+        try:
+            claves = list(dict.fromkeys((d['nit_cliente'], d['codigo_producto']) for d in lineas))
+            indice = self._cargar_notas_pendientes(conn, claves)
+
+            aplicaciones = []
+            filas_aplicacion = []
+            filas_nota = []
+            filas_factura = []  # (sql, params) en orden de aplicación
+
+            for datos in lineas:
+                notas_pendientes = indice.get((datos['nit_cliente'], datos['codigo_producto']))
+                if not notas_pendientes:
+                    continue
+
+                # Igual que antes: cada línea ve la lista de pendientes vigente
+                for nota in list(notas_pendientes):
+                    evaluacion = self._evaluar_aplicacion(nota, datos)
+                    if evaluacion is None:
+                        continue
+
+                    # La nota deja de estar PENDIENTE (APLICADA o PARCIAL)
+                    notas_pendientes.remove(nota)
+
+                    filas_aplicacion.append(evaluacion['fila_aplicacion'])
+                    filas_nota.append(evaluacion['fila_nota'])
+                    filas_factura.append((evaluacion['sql_factura'], evaluacion['fila_factura']))
+
+                    resultado = evaluacion['resultado']
+                    aplicaciones.append(resultado)
+
+                    logger.info(
+                        f"Nota {resultado['numero_nota']} aplicada a línea {resultado['numero_linea']}: "
+                        f"Cantidad: {resultado['cantidad_aplicada']} | Valor: ${resultado['valor_aplicado']:,.2f} | "
+                        f"Cantidad restante en línea: {resultado['cantidad_restante_factura']} | "
+                        f"Estado nota: {resultado['estado_nota']}"
+                    )
+                    if resultado['estado_nota'] == 'APLICADA':
+                        logger.info(f"Nota {resultado['numero_nota']} aplicada completamente")
+
+            # Escritura en bloque
+            if aplicaciones:
+                conn.executemany(self.SQL_INSERT_APLICACION, filas_aplicacion)
+                conn.executemany(self.SQL_UPDATE_NOTA, filas_nota)
 
-                if aplicacion:
-                    aplicaciones.append(aplicacion)
+                # Las actualizaciones de facturas acumulan descuentos: se agrupan
+                # en tramos consecutivos de la misma sentencia para respetar el orden
+                for sql, tramo in groupby(filas_factura, key=lambda item: item[0]):
+                    conn.executemany(sql, [params for _, params in tramo])
 
-                    if aplicacion['estado_nota'] == 'APLICADA':
-                        logger.info(f"Nota {aplicacion['numero_nota']} aplicada completamente")
+            self._liberar(conn)
+
+        except Exception as e:
+            logger.error(f"Error al aplicar notas al lote de facturas: {e}")
+            if conn is self._conn_lote:
+                raise
+            conn.rollback()
+            conn.close()
+            import traceback
+            traceback.print_exc()
+            return []
 
         logger.info(f"Se realizaron {len(aplicaciones)} aplicaciones de notas crédito")
         return aplicaciones
 
+    @medir_bd
     def obtener_resumen_notas(self) -> Dict:
         """
         Obtiene un resumen del estado de las notas crédito
@@ -839,7 +1112,7 @@ class NotasCreditoManager:
             Diccionario con estadísticas
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar(self.db_path)
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -868,6 +1141,7 @@ class NotasCreditoManager:
             logger.error(f"Error al obtener resumen: {e}")
             return {}
 
+    @medir_bd
     def obtener_resumen_facturas(self) -> Dict:
         """
         Obtiene un resumen del estado de las facturas
@@ -876,7 +1150,7 @@ class NotasCreditoManager:
             Diccionario con estadísticas
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar(self.db_path)
             cursor = conn.cursor()
 
             cursor.execute('SELECT COUNT(*), SUM(valor_total) FROM facturas')
@@ -905,12 +1179,70 @@ class NotasCreditoManager:
             logger.error(f"Error al obtener resumen facturas: {e}")
             return {}
 
+    # =========================================================================
+    # MOVIMIENTOS DEL DÍA (reporte operativo)
+    # Rangos semiabiertos [día, día siguiente) sobre la columna sin funciones:
+    # DATE(columna) = ? obliga a recorrer la tabla completa, el rango usa el índice
+    # y cubre tanto fechas 'YYYY-MM-DD' como timestamps 'YYYY-MM-DD HH:MM:SS'
+    # =========================================================================
+
+    SQL_REPORTE_NOTAS = '''
+        SELECT * FROM notas_credito
+        WHERE (fecha_nota >= ?1 AND fecha_nota < ?2)
+           OR (fecha_registro >= ?1 AND fecha_registro < ?2)
+        ORDER BY fecha_nota DESC
+    '''
+
+    SQL_REPORTE_APLICACIONES = '''
+        SELECT * FROM aplicaciones_notas
+        WHERE fecha_aplicacion >= ? AND fecha_aplicacion < ?
+        ORDER BY fecha_aplicacion DESC
+    '''
+
+    SQL_REPORTE_RECHAZADAS = '''
+        SELECT * FROM facturas_rechazadas
+        WHERE fecha_factura >= ? AND fecha_factura < ?
+        ORDER BY fecha_factura DESC
+    '''
+
+    @staticmethod
+    def rango_dias(fecha_desde: str, fecha_hasta: str = None) -> Tuple[str, str]:
+        """
+        Límites [inicio, fin) de los días fecha_desde..fecha_hasta (inclusive)
+
+        Raises:
+            ValueError: Si alguna fecha no tiene formato YYYY-MM-DD
+        """
+        inicio = datetime.strptime(fecha_desde, '%Y-%m-%d')
+        fin = datetime.strptime(fecha_hasta, '%Y-%m-%d') if fecha_hasta else inicio
+        return inicio.strftime('%Y-%m-%d'), (fin + timedelta(days=1)).strftime('%Y-%m-%d')
+
+    @classmethod
+    def obtener_movimientos_dia(cls, conn: sqlite3.Connection, fecha: str) -> Dict:
+        """
+        Notas (emitidas o registradas), aplicaciones y rechazos de un día
+
+        Args:
+            conn: Conexión (con row_factory=sqlite3.Row)
+            fecha: Día YYYY-MM-DD
+
+        Returns:
+            {'notas_credito': [...], 'aplicaciones': [...], 'facturas_rechazadas': [...]}
+        """
+        rango = cls.rango_dias(fecha)
+        return {
+            'notas_credito': [dict(row) for row in conn.execute(cls.SQL_REPORTE_NOTAS, rango)],
+            'aplicaciones': [dict(row) for row in conn.execute(cls.SQL_REPORTE_APLICACIONES, rango)],
+            'facturas_rechazadas': [dict(row) for row in conn.execute(cls.SQL_REPORTE_RECHAZADAS, rango)]
+        }
+
+    @medir_bd
     def obtener_historial_nota(self, numero_nota: str) -> List[Dict]:
         """
         Obtiene el historial de aplicaciones de una nota específica
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar(self.db_path)
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
@@ -929,37 +1261,42 @@ class NotasCreditoManager:
             logger.error(f"Error al obtener historial: {e}")
             return []
 
+    @medir_bd
     def obtener_resumen_rechazos(self, dias: int = 7) -> Dict:
         """
         Obtiene un resumen de facturas rechazadas en los últimos días
+
+        Agrupa por codigo_rechazo (catálogo razones_rechazo) sobre el índice
+        idx_rechazadas_codigo, que cubre la consulta. Las filas sin código
+        aparecen como 'Sin clasificar'.
         """
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = conectar(self.db_path)
             cursor = conn.cursor()
 
             fecha_limite = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
 
             cursor.execute('''
-                SELECT COUNT(*), SUM(valor_total)
-                FROM facturas_rechazadas WHERE fecha_registro >= ?
-            ''', (fecha_limite,))
-            total_rechazos, valor_total = cursor.fetchone()
-
-            cursor.execute('''
-                SELECT razon_rechazo, COUNT(*), SUM(valor_total)
-                FROM facturas_rechazadas WHERE fecha_registro >= ?
-                GROUP BY razon_rechazo ORDER BY COUNT(*) DESC
+                SELECT r.codigo_rechazo, z.clave, z.descripcion, r.cantidad, r.valor
+                FROM (
+                    SELECT codigo_rechazo, COUNT(*) AS cantidad, SUM(valor_total) AS valor
+                    FROM facturas_rechazadas WHERE fecha_registro >= ?
+                    GROUP BY codigo_rechazo
+                ) r
+                LEFT JOIN razones_rechazo z ON z.codigo = r.codigo_rechazo
+                ORDER BY r.cantidad DESC
             ''', (fecha_limite,))
             por_razon = [
-                {'razon': row[0], 'cantidad': row[1], 'valor': row[2]}
+                {'codigo': row[0], 'clave': row[1], 'razon': row[2] or 'Sin clasificar',
+                 'cantidad': row[3], 'valor': row[4]}
                 for row in cursor.fetchall()
             ]
 
             conn.close()
 
             return {
-                'total_rechazos': total_rechazos or 0,
-                'valor_total_rechazado': valor_total or 0.0,
+                'total_rechazos': sum(r['cantidad'] for r in por_razon),
+                'valor_total_rechazado': sum(r['valor'] or 0.0 for r in por_razon),
                 'por_razon': por_razon
             }
 
@@ -968,30 +1305,27 @@ class NotasCreditoManager:
             return {}
 
     # Alias para compatibilidad con código existente
+    @medir_bd
     def registrar_factura_completa(self, factura_transformada: Dict) -> bool:
         """Alias para registrar_factura por compatibilidad"""
         return self.registrar_factura(factura_transformada)
 
+    @medir_bd
     def actualizar_factura_con_nota(self, numero_factura: str, codigo_producto: str,
                                     numero_nota: str, valor_aplicado: float,
                                     cantidad_aplicada: float) -> bool:
         """Actualiza una factura marcándola con nota de crédito aplicada - Compatibilidad"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE facturas
-                SET nota_aplicada = 1,
-                    numero_nota_aplicada = ?,
-                    descuento_valor = descuento_valor + ?,
-                    descuento_cantidad = descuento_cantidad + ?
-                WHERE numero_factura = ? AND codigo_producto = ?
-            ''', (numero_nota, abs(valor_aplicado), abs(cantidad_aplicada),
-                  numero_factura, codigo_producto))
-
-            conn.commit()
-            conn.close()
+            with self._conexion() as conn:
+                conn.execute('''
+                    UPDATE facturas
+                    SET nota_aplicada = 1,
+                        numero_nota_aplicada = ?,
+                        descuento_valor = descuento_valor + ?,
+                        descuento_cantidad = descuento_cantidad + ?
+                    WHERE numero_factura = ? AND codigo_producto = ?
+                ''', (numero_nota, abs(valor_aplicado), abs(cantidad_aplicada),
+                      numero_factura, codigo_producto))
             return True
 
         except Exception as e:
@@ -0,0 +1,156 @@
+"""
+Paginación por Cursor (keyset) para los Listados de la API
+Reemplaza LIMIT/OFFSET en /api/facturas, /api/notas y /api/facturas/rechazadas:
+cada página continúa desde la última fila entregada usando (fecha, id)
+descendente, de modo que el costo no crece con la profundidad de la página.
+
+- El cursor es opaco para el cliente (base64 de la última clave + huella de
+  los filtros); un cursor usado con otros filtros se rechaza
+- Los filtros se expresan como condiciones SQL con parámetros y se combinan
+  con la condición de continuación `(fecha, id) < (?, ?)`, que SQLite resuelve
+  sobre los índices compuestos (filtro, fecha)
+- El total es opcional: contarlo exige recorrer el índice del filtro
+- Con un ArchivoManager, las filas de los meses archivados se mezclan con las
+  de la BD por la misma clave (fecha, id)
+"""
+import base64
+import hashlib
+import json
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+LIMITE_MAXIMO = 1000
+
+
+class CursorInvalido(ValueError):
+    """El cursor no se pudo decodificar o no corresponde a los filtros"""
+
+
+class PaginadorKeyset:
+    """Consulta páginas de una tabla ordenada por (columna_fecha DESC, id DESC)"""
+
+    def __init__(self, tabla: str, columna_fecha: str, admite_nulos: bool = False, archivo=None):
+        """
+        Args:
+            tabla: Tabla a listar
+            columna_fecha: Columna de fecha de la clave de orden
+            admite_nulos: La columna de fecha puede ser NULL (esas filas van al final)
+            archivo: ArchivoManager con los meses archivados de la tabla (opcional)
+        """
+        self.tabla = tabla
+        self.columna_fecha = columna_fecha
+        self.admite_nulos = admite_nulos
+        self.archivo = archivo
+
+    # =========================================================================
+    # CURSOR
+    # =========================================================================
+
+    @staticmethod
+    def _huella(condiciones: List[Tuple[str, list]]) -> str:
+        contenido = json.dumps(condiciones, default=str, sort_keys=True)
+        return hashlib.sha1(contenido.encode('utf-8')).hexdigest()[:12]
+
+    def codificar_cursor(self, fecha, fila_id: int, condiciones: List[Tuple[str, list]]) -> str:
+        datos = {'f': fecha, 'i': fila_id, 'h': self._huella(condiciones)}
+        texto = json.dumps(datos, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decodificar_cursor(self, cursor: str, condiciones: List[Tuple[str, list]]) -> Tuple[Optional[str], int]:
+        try:
+            relleno = '=' * (-len(cursor) % 4)
+            datos = json.loads(base64.urlsafe_b64decode(cursor + relleno).decode('utf-8'))
+            fecha, fila_id, huella = datos['f'], int(datos['i']), datos['h']
+        except (ValueError, TypeError, KeyError) as e:
+            raise CursorInvalido("Cursor inválido") from e
+        if huella != self._huella(condiciones):
+            raise CursorInvalido("El cursor no corresponde a los filtros de la consulta")
+        return fecha, fila_id
+
+    # =========================================================================
+    # CONSULTA
+    # =========================================================================
+
+    def _condicion_continuacion(self, fecha, fila_id: int) -> Tuple[str, list]:
+        col = self.columna_fecha
+        if fecha is None:
+            # Ya se entregaron todas las filas con fecha: seguir por las nulas
+            return f"{col} IS NULL AND id < ?", [fila_id]
+        return f"({col}, id) < (?, ?)", [fecha, fila_id]
+
+    @staticmethod
+    def _where(condiciones: List[Tuple[str, list]]) -> Tuple[str, list]:
+        if not condiciones:
+            return '', []
+        sql = ' WHERE ' + ' AND '.join(condicion for condicion, _ in condiciones)
+        params = [p for _, valores in condiciones for p in valores]
+        return sql, params
+
+    def pagina(self, conn: sqlite3.Connection, condiciones: List[Tuple[str, list]],
+               limite: int, cursor: str = None) -> Dict:
+        """
+        Obtiene una página
+
+        Args:
+            conn: Conexión (con row_factory=sqlite3.Row)
+            condiciones: Filtros [(sql, [parámetros])]
+            limite: Filas por página (se acota a 1..LIMITE_MAXIMO)
+            cursor: Cursor devuelto por la página anterior
+
+        Returns:
+            {'items', 'limite', 'siguiente_cursor', 'hay_mas'}
+
+        Raises:
+            CursorInvalido: Si el cursor no es válido para estos filtros
+        """
+        limite = max(1, min(int(limite), LIMITE_MAXIMO))
+        tramos = [list(condiciones)]
+        fecha = fila_id = None
+        if cursor:
+            fecha, fila_id = self.decodificar_cursor(cursor, condiciones)
+            tramos[0].append(self._condicion_continuacion(fecha, fila_id))
+            if fecha is not None and self.admite_nulos:
+                # Las filas sin fecha van al final: consulta aparte para que la
+                # continuación siga siendo un rango sobre el índice
+                tramos.append(list(condiciones) + [(f"{self.columna_fecha} IS NULL", [])])
+
+        filas = []
+        for filtros in tramos:
+            faltan = limite + 1 - len(filas)
+            if faltan <= 0:
+                break
+            where, params = self._where(filtros)
+            filas += conn.execute(
+                f"SELECT * FROM {self.tabla}{where} "
+                f"ORDER BY {self.columna_fecha} DESC, id DESC LIMIT ?",
+                params + [faltan]
+            ).fetchall()
+        filas = [dict(fila) for fila in filas]
+
+        if self.archivo is not None:
+            archivadas = self.archivo.filas(self.tabla, condiciones, limite + 1,
+                                            (fecha, fila_id) if cursor else None, conn)
+            if archivadas:
+                filas = sorted(filas + archivadas, key=self._clave, reverse=True)
+
+        hay_mas = len(filas) > limite
+        items = filas[:limite]
+        siguiente = None
+        if hay_mas:
+            ultima = items[-1]
+            siguiente = self.codificar_cursor(ultima[self.columna_fecha], ultima['id'], condiciones)
+
+        return {'items': items, 'limite': limite, 'siguiente_cursor': siguiente, 'hay_mas': hay_mas}
+
+    def _clave(self, fila: Dict) -> tuple:
+        """Clave de orden (las filas sin fecha van al final en orden descendente)"""
+        fecha = fila[self.columna_fecha]
+        return (fecha is not None, fecha or '', fila['id'])
+
+    def contar(self, conn: sqlite3.Connection, condiciones: List[Tuple[str, list]]) -> int:
+        """Total de filas que cumplen los filtros (recorre el índice del filtro y los meses archivados)"""
+        where, params = self._where(condiciones)
+        total = conn.execute(f"SELECT COUNT(*) FROM {self.tabla}{where}", params).fetchone()[0]
+        if self.archivo is not None:
+            total += self.archivo.contar(self.tabla, condiciones, conn)
+        return total
@@ -0,0 +1,116 @@
+"""
+Catálogo de Razones de Rechazo
+Cada línea rechazada por BusinessRulesValidator.filtrar_facturas lleva,
+además del texto legible (razon_rechazo), un código de razón y sus
+parámetros. El texto incluye montos y tipos de inventario, así que es casi
+único por línea; los resúmenes por razón agrupan por el código entero.
+
+ESTRUCTURA DE BD:
+- razones_rechazo: codigo, clave y descripción de cada razón del catálogo
+- facturas_rechazadas.codigo_rechazo: código de la razón (índice
+  idx_rechazadas_codigo, que cubre también fecha_registro y valor_total).
+  NULL solo en filas insertadas sin pasar por NotasCreditoManager o meses
+  restaurados de un archivo anterior al catálogo; clasificar_pendientes()
+  los obtiene del texto
+
+La tabla razones_rechazo y la columna codigo_rechazo las crea la migración 6
+(core/migraciones.py). Para agregar una razón: nueva constante y entrada en
+RAZONES, y una migración nueva que inserte su fila en razones_rechazo.
+"""
+import logging
+import re
+import sqlite3
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Códigos del catálogo (estables: se guardan en la BD)
+OTRA = 0
+NOTA_TIPO_INVENTARIO = 1
+NO_AGENTE_RETENCION = 2
+TIPO_INVENTARIO = 3
+MONTO_MINIMO = 4
+
+# codigo -> (clave, descripción, plantilla del texto, patrón que reconoce el texto)
+RAZONES: Dict[int, Tuple[str, str, str, Any]] = {
+    OTRA: ('OTRA', 'Otra razón', '{texto}', None),
+    NOTA_TIPO_INVENTARIO: (
+        'NOTA_TIPO_INVENTARIO', 'Nota crédito con tipo de inventario excluido',
+        'Nota crédito con tipo de inventario excluido: {tipo_inventario}',
+        re.compile(r'Nota crédito con tipo de inventario excluido: (?P<tipo_inventario>.*)\Z', re.S)),
+    NO_AGENTE_RETENCION: (
+        'NO_AGENTE_RETENCION', 'No agente de retención (f_02_014)',
+        "NO AGENTE DE RETENCION (f_02_014='{agente_retencion}') - No debe registrarse",
+        re.compile(r"NO AGENTE DE RETENCION \(f_02_014='(?P<agente_retencion>.*)'\) - No debe registrarse\Z", re.S)),
+    TIPO_INVENTARIO: (
+        'TIPO_INVENTARIO', 'Tipo de inventario excluido',
+        'Tipo de inventario excluido: {tipo_inventario}',
+        re.compile(r'Tipo de inventario excluido: (?P<tipo_inventario>.*)\Z', re.S)),
+    MONTO_MINIMO: (
+        'MONTO_MINIMO', 'Factura acoplada bajo el monto mínimo',
+        'Valor total acoplado de líneas válidas ${total_procesable:,.2f} no cumple monto mínimo ${monto_minimo:,.2f}',
+        re.compile(r'Valor total acoplado de líneas válidas \$(?P<total_procesable>-?[\d,]+\.\d+) '
+                   r'no cumple monto mínimo \$(?P<monto_minimo>-?[\d,]+\.\d+)\Z')),
+}
+
+# Parámetros numéricos (el texto los trae con separador de miles)
+_NUMERICOS = {'total_procesable', 'monto_minimo'}
+
+
+def razon(codigo: int, **parametros) -> Dict:
+    """
+    Razón de rechazo estructurada con su texto
+
+    Returns:
+        {'razon_rechazo', 'codigo_rechazo', 'parametros_rechazo'}, para
+        combinar con 'factura' en los rechazos de filtrar_facturas
+    """
+    return {
+        'razon_rechazo': RAZONES[codigo][2].format(**parametros),
+        'codigo_rechazo': codigo,
+        'parametros_rechazo': parametros,
+    }
+
+
+def clasificar(texto: str) -> Tuple[int, Dict]:
+    """
+    Obtiene el código y los parámetros de un texto de razón_rechazo
+
+    Los textos que no corresponden a ninguna plantilla son OTRA.
+
+    Returns:
+        (codigo, parametros)
+    """
+    if texto:
+        for codigo, (_, _, _, patron) in RAZONES.items():
+            coincidencia = patron.match(texto) if patron else None
+            if coincidencia:
+                parametros = coincidencia.groupdict()
+                for nombre in _NUMERICOS & parametros.keys():
+                    parametros[nombre] = float(parametros[nombre].replace(',', ''))
+                return codigo, parametros
+    return OTRA, {'texto': texto}
+
+
+def codigo_de(texto: str) -> int:
+    """Código de la razón de un texto de razon_rechazo"""
+    return clasificar(texto)[0]
+
+
+def clasificar_pendientes(conn: sqlite3.Connection) -> int:
+    """
+    Completa codigo_rechazo de las filas que no lo tienen, a partir del texto
+
+    No confirma: corre en la transacción de quien llama.
+
+    Returns:
+        Filas clasificadas
+    """
+    conn.create_function('codigo_razon_rechazo', 1, codigo_de, deterministic=True)
+    cursor = conn.execute('''
+        UPDATE facturas_rechazadas SET codigo_rechazo = codigo_razon_rechazo(razon_rechazo)
+        WHERE codigo_rechazo IS NULL
+    ''')
+    if cursor.rowcount:
+        logger.info(f"Razones de rechazo clasificadas: {cursor.rowcount} fila(s)")
+    return cursor.rowcount
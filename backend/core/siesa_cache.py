@@ -0,0 +1,182 @@
+"""
+Caché Local de Respuestas SIESA
+Guarda en disco las respuestas crudas (comprimidas) de Api_Consulta_Fac_Correagro
+para no volver a consultar SIESA al reprocesar días cuyos datos no cambian.
+
+Cada respuesta se identifica por el hash de (idCompania, descripcion, parametros)
+y se almacena como <dir>/<hh>/<hash>.json.gz. La vigencia depende de la
+antigüedad del día consultado:
+- Días cerrados (anteriores a ayer): no expiran
+- Hoy y ayer: expiran tras `ttl_minutos`
+
+En modo 'offline' solo se lee la caché (reproducción sin red, incluso con
+entradas vencidas); una consulta sin respuesta guardada es un error.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EscrituraCache:
+    """Escritura atómica de una respuesta: se publica solo al confirmar"""
+
+    def __init__(self, ruta_final: str, nivel_compresion: int, al_confirmar=None):
+        self.ruta_final = ruta_final
+        self._al_confirmar = al_confirmar
+        fd, self.ruta_temporal = tempfile.mkstemp(dir=os.path.dirname(ruta_final), suffix='.tmp')
+        self._archivo = gzip.GzipFile(fileobj=os.fdopen(fd, 'wb'), mode='wb',
+                                      compresslevel=nivel_compresion, mtime=0)
+
+    def escribir(self, bloque: bytes):
+        self._archivo.write(bloque)
+
+    def confirmar(self):
+        """Cierra el archivo y lo publica en su ruta definitiva"""
+        self._cerrar()
+        os.replace(self.ruta_temporal, self.ruta_final)
+        if self._al_confirmar:
+            self._al_confirmar()
+
+    def descartar(self):
+        """Elimina la respuesta parcial (error o lectura interrumpida)"""
+        self._cerrar()
+        if os.path.exists(self.ruta_temporal):
+            os.remove(self.ruta_temporal)
+
+    def _cerrar(self):
+        if not self._archivo.closed:
+            fileobj = self._archivo.fileobj
+            self._archivo.close()
+            fileobj.close()
+
+
+class SiesaCache:
+    """Caché de respuestas SIESA direccionada por contenido de la consulta"""
+
+    MODOS = ('normal', 'offline', 'refrescar')
+
+    def __init__(self, directorio: str = './data/siesa_cache', ttl_minutos: float = 10,
+                 modo: str = 'normal', nivel_compresion: int = 6):
+        """
+        Args:
+            directorio: Carpeta donde se guardan las respuestas
+            ttl_minutos: Vigencia de las respuestas de hoy y ayer
+            modo: 'normal' (lee y escribe), 'offline' (solo lee, sin red) o
+                'refrescar' (ignora lo guardado y lo reemplaza)
+            nivel_compresion: Nivel gzip (1-9)
+        """
+        if modo not in self.MODOS:
+            raise ValueError(f"Modo de caché no válido: {modo} (opciones: {', '.join(self.MODOS)})")
+
+        self.directorio = directorio
+        self.ttl_minutos = ttl_minutos
+        self.modo = modo
+        self.nivel_compresion = nivel_compresion
+        os.makedirs(directorio, exist_ok=True)
+
+        self._estadisticas = {'aciertos': 0, 'fallos': 0, 'vencidas': 0, 'escrituras': 0}
+        self._lock = threading.Lock()
+
+    @property
+    def offline(self) -> bool:
+        return self.modo == 'offline'
+
+    @staticmethod
+    def clave(params: Dict) -> str:
+        """Hash SHA-256 de (idCompania, descripcion, parametros)"""
+        contenido = json.dumps([params.get('idCompania'), params.get('descripcion'), params.get('parametros')],
+                               ensure_ascii=False)
+        return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+    def ruta(self, params: Dict) -> str:
+        clave = self.clave(params)
+        return os.path.join(self.directorio, clave[:2], f"{clave}.json.gz")
+
+    def vigente(self, ruta: str, fecha_fin, ahora: Optional[datetime] = None) -> bool:
+        """
+        Indica si una respuesta guardada sigue vigente
+
+        Args:
+            ruta: Archivo de la respuesta
+            fecha_fin: Último día incluido en la consulta (date o datetime)
+            ahora: Momento de referencia (por defecto datetime.now())
+        """
+        ahora = ahora or datetime.now()
+        dia_fin = fecha_fin.date() if isinstance(fecha_fin, datetime) else fecha_fin
+        if dia_fin < ahora.date() - timedelta(days=1):
+            return True
+        edad_s = ahora.timestamp() - os.path.getmtime(ruta)
+        return edad_s < self.ttl_minutos * 60
+
+    def leer(self, params: Dict, fecha_fin, tamano_bloque: int = 64 * 1024) -> Optional[Iterator[bytes]]:
+        """
+        Busca la respuesta de una consulta
+
+        Returns:
+            Iterador de bloques del cuerpo JSON descomprimido, o None si no hay
+            respuesta vigente (en modo offline se ignora la vigencia)
+        """
+        if self.modo == 'refrescar':
+            return None
+
+        ruta = self.ruta(params)
+        if not os.path.exists(ruta):
+            self._contar('fallos')
+            return None
+
+        if not self.offline and not self.vigente(ruta, fecha_fin):
+            self._contar('vencidas')
+            return None
+
+        self._contar('aciertos')
+        logger.info(f"Respuesta SIESA desde caché: {params.get('parametros')} ({os.path.basename(ruta)})")
+        return self._bloques(ruta, tamano_bloque)
+
+    @staticmethod
+    def _bloques(ruta: str, tamano_bloque: int) -> Iterator[bytes]:
+        with gzip.open(ruta, 'rb') as archivo:
+            while True:
+                bloque = archivo.read(tamano_bloque)
+                if not bloque:
+                    return
+                yield bloque
+
+    def escritor(self, params: Dict) -> Optional[EscrituraCache]:
+        """Prepara la escritura de la respuesta de una consulta (None en modo offline)"""
+        if self.offline:
+            return None
+        ruta = self.ruta(params)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        return EscrituraCache(ruta, self.nivel_compresion, al_confirmar=lambda: self._contar('escrituras'))
+
+    def _contar(self, evento: str):
+        with self._lock:
+            self._estadisticas[evento] += 1
+
+    def obtener_estadisticas(self) -> Dict:
+        """Aciertos, fallos, vencidas y escrituras desde que se creó la caché"""
+        with self._lock:
+            return dict(self._estadisticas)
+
+    @classmethod
+    def desde_config(cls, config: Dict) -> Optional['SiesaCache']:
+        """
+        Crea la caché según la configuración del proceso
+
+        Claves: SIESA_CACHE_DIR (vacío = sin caché), SIESA_CACHE_TTL_MINUTOS,
+        SIESA_CACHE_MODO
+        """
+        directorio = config.get('SIESA_CACHE_DIR')
+        if not directorio:
+            return None
+        return cls(directorio,
+                   ttl_minutos=float(config.get('SIESA_CACHE_TTL_MINUTOS') or 10),
+                   modo=config.get('SIESA_CACHE_MODO') or 'normal')
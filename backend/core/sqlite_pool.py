@@ -0,0 +1,224 @@
+"""
+Pool de Conexiones SQLite
+Proveedor de conexiones compartido por la API, AuthManager, NotasCreditoManager
+y JobsManager para que el escritor diario y los lectores del dashboard no se
+bloqueen entre sí.
+
+- Modo WAL: los lectores leen la última versión confirmada mientras el
+  escritor mantiene su transacción abierta
+- synchronous=NORMAL, cache_size, mmap_size y busy_timeout configurables
+- Las conexiones se reutilizan: `conn.close()` la devuelve al pool (con
+  rollback de lo no confirmado) y la caché de sentencias preparadas de
+  sqlite3 (`cached_statements`) sobrevive entre llamadas
+- Cada conexión la usa un solo hilo a la vez; las libres se comparten entre
+  hilos, de modo que servidores con un hilo por petición también las reutilizan
+- Los cursores son metricas.CursorMedido: cuentan las sentencias de los
+  métodos medidos con metricas.medir_bd
+
+Configuración por variables de entorno (leídas al crear el pool de cada BD):
+SQLITE_JOURNAL_MODE (WAL), SQLITE_SYNCHRONOUS (NORMAL), SQLITE_CACHE_SIZE_KB
+(16384), SQLITE_MMAP_SIZE_MB (256), SQLITE_BUSY_TIMEOUT_MS (30000),
+SQLITE_POOL_MAX (8 conexiones libres; 0 = sin reutilización)
+
+Al terminar el proceso se cierran todas las conexiones para que SQLite
+integre el WAL en el archivo principal (la BD se versiona en el repositorio).
+"""
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import weakref
+from typing import Dict, Optional
+
+try:
+    from core.metricas import CursorMedido
+except ImportError:
+    from metricas import CursorMedido
+
+logger = logging.getLogger(__name__)
+
+
+class ConexionPool(sqlite3.Connection):
+    """Conexión SQLite que al cerrarse vuelve a su pool"""
+
+    pool: Optional['SQLitePool'] = None
+    archivo: Optional[tuple] = None
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    # Connection.execute no pasa por cursor(): se redirigen para contarlas
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool._devolver(self)
+
+    def cerrar_definitivamente(self):
+        self.pool = None
+        super().close()
+
+
+class SQLitePool:
+    """Conexiones reutilizables a una base de datos SQLite"""
+
+    def __init__(self, db_path: str, journal_mode: str = 'WAL', synchronous: str = 'NORMAL',
+                 cache_size_kb: int = 16384, mmap_size_mb: int = 256,
+                 busy_timeout_ms: int = 30000, max_libres: int = 8,
+                 cached_statements: int = 256):
+        """
+        Args:
+            db_path: Ruta de la base de datos
+            journal_mode: Modo de journal (WAL para lectores concurrentes)
+            synchronous: Nivel de sincronización (NORMAL es seguro con WAL)
+            cache_size_kb: Caché de páginas por conexión, en KiB
+            mmap_size_mb: Tamaño máximo de la lectura por memoria mapeada
+            busy_timeout_ms: Espera máxima por un bloqueo antes de fallar
+            max_libres: Conexiones libres que se conservan (0 = cerrar siempre)
+            cached_statements: Sentencias preparadas que guarda cada conexión
+        """
+        self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size_mb = mmap_size_mb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_libres = max_libres
+        self.cached_statements = cached_statements
+
+        self._libres = []
+        self._todas = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._estadisticas = {'creadas': 0, 'reutilizadas': 0, 'descartadas': 0}
+
+    def _identidad_archivo(self) -> Optional[tuple]:
+        """(dispositivo, inodo) del archivo actual, para detectar si fue reemplazado"""
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def conectar(self) -> ConexionPool:
+        """
+        Entrega una conexión lista para usar (libre del pool o nueva)
+
+        La conexión no se comparte con otro hilo hasta que se llame close().
+        """
+        archivo = self._identidad_archivo()
+        obsoletas = []
+        conn = None
+        with self._lock:
+            if self._libres and self._libres[-1].archivo != archivo:
+                # El archivo se eliminó o reemplazó: las conexiones libres apuntan al anterior
+                obsoletas, self._libres = self._libres, []
+            if self._libres:
+                conn = self._libres.pop()
+                self._estadisticas['reutilizadas'] += 1
+
+        for vieja in obsoletas:
+            vieja.cerrar_definitivamente()
+
+        if conn is None:
+            conn = self._crear()
+        return conn
+
+    def _crear(self) -> ConexionPool:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               factory=ConexionPool, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA journal_mode = {self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size_mb) * 1024 * 1024}')
+        conn.pool = self
+        conn.archivo = self._identidad_archivo()
+        with self._lock:
+            self._estadisticas['creadas'] += 1
+            self._todas.add(conn)
+        return conn
+
+    def _devolver(self, conn: ConexionPool):
+        """Deja la conexión como estaba al entregarla y la guarda si hay cupo"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error as e:
+            logger.warning(f"Conexión descartada al devolverla al pool: {e}")
+            conn.cerrar_definitivamente()
+            return
+
+        with self._lock:
+            if len(self._libres) < self.max_libres and conn.archivo == self._identidad_archivo():
+                self._libres.append(conn)
+                return
+            self._estadisticas['descartadas'] += 1
+        conn.cerrar_definitivamente()
+
+    def cerrar(self, incluir_en_uso: bool = False):
+        """
+        Cierra las conexiones libres; con `incluir_en_uso` también las
+        prestadas (solo al terminar el proceso)
+        """
+        with self._lock:
+            conexiones = list(self._todas) if incluir_en_uso else self._libres
+            self._libres = []
+        for conn in conexiones:
+            try:
+                conn.cerrar_definitivamente()
+            except sqlite3.Error:
+                pass
+
+    def obtener_estadisticas(self) -> Dict:
+        """Conexiones creadas, reutilizadas, descartadas y libres"""
+        with self._lock:
+            estadisticas = dict(self._estadisticas)
+            estadisticas['libres'] = len(self._libres)
+        return estadisticas
+
+    @classmethod
+    def desde_entorno(cls, db_path: str) -> 'SQLitePool':
+        return cls(db_path,
+                   journal_mode=os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+                   synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+                   cache_size_kb=int(os.getenv('SQLITE_CACHE_SIZE_KB', '16384')),
+                   mmap_size_mb=int(os.getenv('SQLITE_MMAP_SIZE_MB', '256')),
+                   busy_timeout_ms=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '30000')),
+                   max_libres=int(os.getenv('SQLITE_POOL_MAX', '8')))
+
+
+_pools: Dict[str, SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def obtener_pool(db_path: str) -> SQLitePool:
+    """Pool compartido del proceso para una base de datos"""
+    clave = os.path.abspath(str(db_path))
+    with _pools_lock:
+        pool = _pools.get(clave)
+        if pool is None:
+            pool = SQLitePool.desde_entorno(str(db_path))
+            _pools[clave] = pool
+        return pool
+
+
+@atexit.register
+def _cerrar_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.cerrar(incluir_en_uso=True)
+
+
+def conectar(db_path: str) -> ConexionPool:
+    """Conexión del pool compartido; `close()` la devuelve al pool"""
+    return obtener_pool(db_path).conectar()
@@ -1,5 +1,7 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from itertools import chain
 from dotenv import load_dotenv
 import logging
 from core.api_client import SiesaAPIClient
@@ -7,6 +9,9 @@ from core.excel_processor import ExcelProcessor
 from core.email_sender import EmailSender
 from core.business_rules import BusinessRulesValidator
 from core.notas_credito_manager import NotasCreditoManager
+from core.archivo_manager import ArchivoManager
+from core.siesa_cache import SiesaCache
+from core.metricas import Medicion
 
 # Configurar logging
 logging.basicConfig(
@@ -15,6 +20,85 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Consultas a SIESA que se descargan en paralelo durante un rango
+DIAS_PREFETCH_DEFAULT = 4
+
+# Días por consulta a SIESA durante un rango (la ventana se parte si es muy grande)
+DIAS_VENTANA_DEFAULT = 7
+
+
+def _crear_cliente_siesa(config, **opciones):
+    """
+    Crea el cliente SIESA con la caché local de respuestas si está configurada
+    (SIESA_CACHE_DIR, SIESA_CACHE_TTL_MINUTOS, SIESA_CACHE_MODO)
+    """
+    return SiesaAPIClient(config.get('CONNI_KEY') or '', config.get('CONNI_TOKEN') or '',
+                          cache=SiesaCache.desde_config(config), **opciones)
+
+
+def _descargar_dias(api_client, fecha_desde, fecha_hasta, dias_prefetch, dias_ventana=1):
+    """
+    Descarga las facturas de un rango con un pool acotado de hilos y las
+    entrega día por día en orden estricto de fecha.
+
+    El rango se divide en ventanas de `dias_ventana` días; cada ventana es una
+    consulta a SIESA (obtener_facturas_rango la parte si es demasiado grande)
+    cuyas filas se agrupan por f_fecha. Como máximo hay `dias_prefetch`
+    ventanas descargándose por delante de la que se está procesando; el
+    consumidor (un solo hilo escritor) recibe los días en orden, de modo que
+    la aplicación FIFO de notas no cambia.
+
+    Args:
+        api_client: SiesaAPIClient a usar (compartido entre hilos)
+        fecha_desde: Fecha inicial (datetime)
+        fecha_hasta: Fecha final (datetime)
+        dias_prefetch: Número máximo de ventanas descargándose a la vez
+        dias_ventana: Días por consulta (1 = una consulta por día)
+
+    Yields:
+        Tuplas (fecha, facturas_raw)
+    """
+    dias_ventana = max(dias_ventana, 1)
+    ventanas = []
+    inicio = fecha_desde
+    while inicio <= fecha_hasta:
+        fin = min(inicio + timedelta(days=dias_ventana - 1), fecha_hasta)
+        ventanas.append((inicio, fin))
+        inicio = fin + timedelta(days=1)
+
+    def descargar(ventana):
+        ini, fin = ventana
+        if dias_ventana == 1:
+            return [(ini, api_client.obtener_facturas(ini))]
+        por_dia = api_client.obtener_facturas_rango(ini, fin)
+        return [(ini + timedelta(days=(dia - ini.date()).days), filas) for dia, filas in por_dia.items()]
+
+    if dias_prefetch <= 1:
+        for ventana in ventanas:
+            yield from descargar(ventana)
+        return
+
+    executor = ThreadPoolExecutor(max_workers=dias_prefetch, thread_name_prefix='siesa-prefetch')
+    pendientes = []
+    siguiente = 0
+    try:
+        while siguiente < len(ventanas) and len(pendientes) < dias_prefetch:
+            pendientes.append(executor.submit(descargar, ventanas[siguiente]))
+            siguiente += 1
+
+        for _ in ventanas:
+            futuro = pendientes.pop(0)
+            dias = futuro.result()
+
+            # Mantener la ventana de descargas llena antes de ceder los días al escritor
+            if siguiente < len(ventanas):
+                pendientes.append(executor.submit(descargar, ventanas[siguiente]))
+                siguiente += 1
+
+            yield from dias
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 
 def procesar_fecha(fecha, config, enviar_email=True):
     """
@@ -26,8 +110,13 @@ def procesar_fecha(fecha, config, enviar_email=True):
         enviar_email: bool - Si debe enviar email o solo generar archivo
 
     Returns:
-        dict - Resultado del procesamiento con rutas de archivos y estadísticas
+        dict - Resultado del procesamiento con rutas de archivos y estadísticas;
+        'metricas' trae los tiempos por etapa, de la BD y de SIESA y el uso de
+        las tablas de normalización del Excel
     """
+    medicion = Medicion('procesar_fecha')
+    api_client = None
+    filas_api = None
     try:
         logger.info(f"={'='*60}")
         logger.info(f"Procesando fecha: {fecha.strftime('%Y-%m-%d')}")
@@ -36,30 +125,56 @@ def procesar_fecha(fecha, config, enviar_email=True):
         # ============================================================
         # 1. OBTENER FACTURAS DE LA API
         # ============================================================
-        api_client = SiesaAPIClient(config['CONNI_KEY'], config['CONNI_TOKEN'])
-        facturas_raw = api_client.obtener_facturas(fecha)
-
-        if not facturas_raw:
+        medicion.etapa('descarga')
+        # Modo streaming: las filas se leen de la respuesta a medida que
+        # filtrar_facturas las consume, sin cargar el cuerpo completo en memoria
+        api_client = _crear_cliente_siesa(config)
+        filas_api = api_client.iterar_facturas(fecha)
+        primera_fila = next(filas_api, None)
+
+        if primera_fila is None:
             logger.warning("No se encontraron facturas para la fecha especificada")
             return {
                 'exito': True,
                 'mensaje': 'No se encontraron facturas',
-                'facturas_procesadas': 0
+                'facturas_procesadas': 0,
+                'metricas': medicion.terminar(cliente_siesa=api_client)
             }
 
-        logger.info(f"Total de documentos obtenidos de la API: {len(facturas_raw)}")
+        facturas_raw = chain([primera_fila], filas_api)
 
         # ============================================================
         # 2. INICIALIZAR GESTOR DE NOTAS CRÉDITO
         # ============================================================
-        notas_manager = NotasCreditoManager(config.get('DB_PATH', './data/notas_credito.db'))
+        medicion.etapa('inicializacion')
+        db_path = config.get('DB_PATH', './data/notas_credito.db')
+        notas_manager = NotasCreditoManager(db_path)
+
+        # Un mes archivado no admite nueva ingesta: las notas se aplicarían
+        # contra facturas que ya no están en la BD
+        if ArchivoManager(db_path).mes_archivado(fecha.strftime('%Y-%m-%d')):
+            mes = fecha.strftime('%Y-%m')
+            mensaje = f"El mes {mes} está archivado; restaurarlo con scripts/archivar_meses.py antes de reprocesarlo"
+            logger.error(mensaje)
+            return {
+                'exito': False,
+                'mensaje': mensaje,
+                'facturas_procesadas': 0,
+                'metricas': medicion.terminar(exito=False, cliente_siesa=api_client)
+            }
 
         # ============================================================
         # 3. APLICAR REGLAS DE NEGOCIO Y SEPARAR NOTAS CRÉDITO
+        # (incluye el resto de la descarga, que se lee en streaming)
         # ============================================================
+        medicion.etapa('filtrado')
         validator = BusinessRulesValidator()
         facturas_validas, notas_credito, facturas_rechazadas = validator.filtrar_facturas(facturas_raw)
 
+        # Cada línea de la API queda en exactamente una de las tres listas
+        logger.info(f"Total de documentos obtenidos de la API: "
+                    f"{len(facturas_validas) + len(notas_credito) + len(facturas_rechazadas)}")
+
         logger.info(f"\n{'='*60}")
         logger.info(f"RESULTADOS DEL FILTRADO:")
         logger.info(f"  - Facturas válidas: {len(facturas_validas)}")
@@ -67,68 +182,72 @@ def procesar_fecha(fecha, config, enviar_email=True):
         logger.info(f"  - Facturas rechazadas: {len(facturas_rechazadas)}")
         logger.info(f"{'='*60}\n")
 
-        # Registrar facturas rechazadas
-        if facturas_rechazadas:
-            logger.info("Registrando facturas rechazadas...")
-            for item in facturas_rechazadas:
-                notas_manager.registrar_factura_rechazada(item['factura'], item['razon_rechazo'])
-
         # ============================================================
-        # 4. GESTIONAR NOTAS CRÉDITO
+        # 4-6. REGISTRO EN BD EN UNA SOLA TRANSACCIÓN (LOTE DEL DÍA)
+        # Notas, facturas, rechazadas y aplicaciones se confirman juntas;
+        # si algo falla, el día completo se revierte.
         # ============================================================
-        notas_nuevas = 0
-        notas_filtradas = 0
-
-        if notas_credito:
+        with notas_manager.lote():
+            # ========================================================
+            # 4. GESTIONAR NOTAS CRÉDITO
+            # ========================================================
+            medicion.etapa('registro_notas')
+            notas_nuevas = 0
+            notas_filtradas = 0
+
+            if notas_credito:
+                logger.info(f"\n{'='*60}")
+                logger.info(f"PROCESANDO NOTAS CRÉDITO")
+                logger.info(f"{'='*60}")
+
+                notas_nuevas = notas_manager.registrar_notas_credito(notas_credito)
+                notas_filtradas = sum(1 for nota in notas_credito
+                                      if nota.cantidad != 0 and nota.valor_total == 0)
+
+                logger.info(f"Notas crédito nuevas registradas: {notas_nuevas}")
+                if notas_filtradas > 0:
+                    logger.info(f"Notas crédito filtradas (cantidad sin valor): {notas_filtradas}")
+
+            # ========================================================
+            # 5. SINCRONIZAR FACTURAS Y RECHAZADAS DEL DÍA
+            # Solo se escriben las líneas nuevas, cambiadas o eliminadas
+            # respecto a lo guardado; reprocesar el día no duplica nada.
+            # ========================================================
+            medicion.etapa('sincronizacion')
             logger.info(f"\n{'='*60}")
-            logger.info(f"PROCESANDO NOTAS CRÉDITO")
+            logger.info(f"SINCRONIZANDO FACTURAS CRUDAS CON LA BASE DE DATOS")
             logger.info(f"{'='*60}")
 
-            for nota in notas_credito:
-                if notas_manager.registrar_nota_credito(nota):
-                    notas_nuevas += 1
-                else:
-                    valor = float(nota.get('f_valor_subtotal_local', 0.0) or 0.0)
-                    cantidad = float(nota.get('f_cant_base', 0.0) or 0.0)
-                    if cantidad != 0 and valor == 0:
-                        notas_filtradas += 1
-
-            logger.info(f"Notas crédito nuevas registradas: {notas_nuevas}")
-            if notas_filtradas > 0:
-                logger.info(f"Notas crédito filtradas (cantidad sin valor): {notas_filtradas}")
-
-        # ============================================================
-        # 5. REGISTRAR FACTURAS CRUDAS Y APLICAR NOTAS EN CRUDO
-        # ============================================================
-        if not facturas_validas:
-            logger.warning("No hay facturas válidas para procesar")
-            return {
-                'exito': True,
-                'mensaje': 'No hay facturas válidas',
-                'facturas_procesadas': 0,
-                'notas_credito': len(notas_credito),
-                'facturas_rechazadas': len(facturas_rechazadas)
-            }
-
-        logger.info(f"\n{'='*60}")
-        logger.info(f"REGISTRANDO FACTURAS CRUDAS EN BASE DE DATOS")
-        logger.info(f"{'='*60}")
-
-        facturas_registradas = 0
-        for factura in facturas_validas:
-            if notas_manager.registrar_factura(factura):
-                facturas_registradas += 1
-
-        logger.info(f"Facturas registradas en BD: {facturas_registradas} de {len(facturas_validas)}")
-
-        # ============================================================
-        # 6. APLICAR NOTAS CRÉDITO A FACTURAS CRUDAS
-        # ============================================================
-        logger.info(f"\n{'='*60}")
-        logger.info(f"APLICANDO NOTAS CRÉDITO A FACTURAS CRUDAS")
-        logger.info(f"{'='*60}")
+            sincronizacion = notas_manager.sincronizar_dia(facturas_validas, facturas_rechazadas, fecha)
+
+            if not facturas_validas:
+                logger.warning("No hay facturas válidas para procesar")
+                return {
+                    'exito': True,
+                    'mensaje': 'No hay facturas válidas',
+                    'facturas_procesadas': 0,
+                    'notas_credito': len(notas_credito),
+                    'facturas_rechazadas': len(facturas_rechazadas),
+                    'metricas': medicion.terminar(cliente_siesa=api_client)
+                }
+
+            delta = sincronizacion['facturas']
+            facturas_registradas = (delta['nuevas'] + delta['actualizadas'] + delta['reindexadas'] +
+                                    delta['sin_cambios'])
+            logger.info(f"Facturas en BD: {delta['nuevas']} nuevas, {delta['actualizadas']} actualizadas, "
+                        f"{delta['reindexadas']} reindexadas, {delta['eliminadas']} eliminadas, "
+                        f"{delta['sin_cambios']} sin cambios de {len(facturas_validas)}")
+
+            # ========================================================
+            # 6. APLICAR NOTAS CRÉDITO A FACTURAS CRUDAS
+            # (la etapa incluye la confirmación del lote)
+            # ========================================================
+            medicion.etapa('aplicacion_notas')
+            logger.info(f"\n{'='*60}")
+            logger.info(f"APLICANDO NOTAS CRÉDITO A FACTURAS CRUDAS")
+            logger.info(f"{'='*60}")
 
-        aplicaciones = notas_manager.procesar_notas_para_facturas(facturas_validas)
+            aplicaciones = notas_manager.procesar_notas_para_facturas(sincronizacion['facturas_para_notas'])
 
         logger.info(f"Aplicaciones de notas realizadas: {len(aplicaciones)}")
 
@@ -142,6 +261,7 @@ def procesar_fecha(fecha, config, enviar_email=True):
         # ============================================================
         # 7. TRANSFORMAR FACTURAS VÁLIDAS PARA EXCEL
         # ============================================================
+        medicion.etapa('transformacion')
         logger.info(f"\n{'='*60}")
         logger.info(f"TRANSFORMANDO FACTURAS PARA EXCEL")
         logger.info(f"{'='*60}")
@@ -157,6 +277,7 @@ def procesar_fecha(fecha, config, enviar_email=True):
         # ============================================================
         # 8. GENERAR ARCHIVOS
         # ============================================================
+        medicion.etapa('excel')
         logger.info(f"\n{'='*60}")
         logger.info(f"GENERANDO ARCHIVOS DE SALIDA")
         logger.info(f"{'='*60}")
@@ -171,6 +292,7 @@ def procesar_fecha(fecha, config, enviar_email=True):
         # ============================================================
         # 9. GENERAR REPORTE DE RESUMEN
         # ============================================================
+        medicion.etapa('resumen')
         resumen_path = os.path.join('./output', f"resumen_{fecha.strftime('%Y%m%d')}.txt")
         with open(resumen_path, 'w', encoding='utf-8') as f:
             f.write(f"REPORTE DE PROCESAMIENTO - {fecha.strftime('%Y-%m-%d')}\n")
@@ -195,11 +317,33 @@ def procesar_fecha(fecha, config, enviar_email=True):
             f.write(f"  - Notas aplicadas (histórico): {resumen_notas.get('notas_aplicadas', 0)}\n")
             f.write(f"  - Total aplicaciones (histórico): {resumen_notas.get('total_aplicaciones', 0)}\n\n")
 
+            # Etapas cerradas hasta aquí (el resumen y el email quedan en 'metricas')
+            f.write(f"TIEMPOS POR ETAPA:\n")
+            for etapa, duracion in medicion.etapas.items():
+                f.write(f"  - {etapa}: {duracion:.3f} s\n")
+            f.write(f"\nBASE DE DATOS (llamadas, sentencias, tiempo):\n")
+            for metodo, datos in medicion.bd.items():
+                f.write(f"  - {metodo}: {datos['llamadas']} llamada(s), {datos['sentencias']} sentencia(s), "
+                        f"{datos['filas']} fila(s), {datos['duracion_s']:.3f} s\n")
+            siesa = api_client.obtener_metricas()
+            f.write(f"\nSIESA:\n")
+            f.write(f"  - Solicitudes: {siesa['solicitudes']} ({siesa['reintentos']} reintento(s), "
+                    f"{siesa['errores']} error(es))\n")
+            f.write(f"  - Tiempo total: {siesa['tiempo_total_s']:.3f} s, "
+                    f"{siesa['bytes_total']:,} bytes\n")
+            normalizacion = excel_processor.obtener_estadisticas_normalizacion()
+            f.write(f"\nNORMALIZACIÓN EXCEL (aciertos, valores distintos):\n")
+            for campo, datos in normalizacion['campos'].items():
+                f.write(f"  - {campo}: {datos['tasa_aciertos']:.1%} de {normalizacion['lineas']} línea(s), "
+                        f"{datos['entradas']} valor(es)\n")
+            f.write("\n")
+
         logger.info(f"Reporte de resumen generado: {resumen_path}")
 
         # ============================================================
         # 10. ENVIAR EMAIL (OPCIONAL)
         # ============================================================
+        medicion.etapa('email')
         if enviar_email and config.get('EMAIL_USERNAME') and config.get('DESTINATARIOS'):
             logger.info(f"\n{'='*60}")
             logger.info(f"ENVIANDO EMAIL A OPERATIVA")
@@ -251,15 +395,25 @@ def procesar_fecha(fecha, config, enviar_email=True):
             'facturas_rechazadas': len(facturas_rechazadas),
             'aplicaciones': len(aplicaciones),
             'archivo_generado': output_path,
-            'resumen_generado': resumen_path
+            'resumen_generado': resumen_path,
+            'metricas': medicion.terminar(cliente_siesa=api_client, procesador_excel=excel_processor)
         }
 
     except Exception as e:
         logger.error(f"Error procesando fecha {fecha}: {e}", exc_info=True)
+        medicion.terminar(exito=False)
         raise
 
+    finally:
+        # También en los retornos anticipados (p. ej. mes archivado) y con error:
+        # cerrar el generador libera la respuesta en streaming y su conexión
+        if filas_api is not None:
+            filas_api.close()
+        if api_client is not None:
+            api_client.close()
+
 
-def procesar_rango_fechas(fecha_desde, fecha_hasta, config):
+def procesar_rango_fechas(fecha_desde, fecha_hasta, config, seguimiento=None):
     """
     Procesa un rango de fechas y genera un Excel consolidado
 
@@ -267,16 +421,24 @@ def procesar_rango_fechas(fecha_desde, fecha_hasta, config):
         fecha_desde: datetime - Fecha inicial
         fecha_hasta: datetime - Fecha final
         config: dict - Configuración con claves API, SMTP, etc.
+        seguimiento: SeguimientoJob opcional (ejecución en segundo plano).
+            El checkpoint de cada día se confirma en la misma transacción que
+            sus datos; al reanudar, los días ya confirmados solo se escriben
+            en el Excel (normalmente desde la caché SIESA). Entre días se
+            atiende la cancelación.
 
     Returns:
         dict - Resultado del procesamiento consolidado
     """
+    medicion = Medicion('procesar_rango_fechas')
+    api_client = None
+    dias = None
     try:
+        medicion.etapa('inicializacion')
         logger.info(f"={'='*60}")
         logger.info(f"Procesando rango: {fecha_desde.strftime('%Y-%m-%d')} a {fecha_hasta.strftime('%Y-%m-%d')}")
         logger.info(f"={'='*60}")
 
-        todas_facturas_transformadas = []
         total_notas = 0
         total_rechazadas = 0
         total_aplicaciones = 0
@@ -284,72 +446,134 @@ def procesar_rango_fechas(fecha_desde, fecha_hasta, config):
 
         # Inicializar managers y processors
         notas_manager = NotasCreditoManager(config.get('DB_PATH', './data/notas_credito.db'))
+        archivo_manager = ArchivoManager(notas_manager.db_path)
         excel_processor = ExcelProcessor(config.get('TEMPLATE_PATH', './templates/plantilla.xlsx'))
-        api_client = SiesaAPIClient(config['CONNI_KEY'], config['CONNI_TOKEN'])
         validator = BusinessRulesValidator()
 
-        # Procesar cada día en el rango
-        fecha_actual = fecha_desde
-        while fecha_actual <= fecha_hasta:
-            logger.info(f"Procesando día: {fecha_actual.strftime('%Y-%m-%d')}")
+        # La descarga se adelanta en paralelo por ventanas de varios días y el
+        # registro en BD se hace en este hilo, en orden estricto de fecha
+        dias_prefetch = int(config.get('RANGO_PREFETCH_DIAS') or DIAS_PREFETCH_DEFAULT)
+        dias_ventana = int(config.get('RANGO_VENTANA_DIAS') or DIAS_VENTANA_DEFAULT)
+        logger.info(f"Descarga anticipada: {dias_prefetch} consultas en paralelo, ventanas de {dias_ventana} días")
 
-            # Obtener facturas de la API para esta fecha
-            facturas_raw = api_client.obtener_facturas(fecha_actual)
+        # Una conexión keep-alive por hilo de descarga
+        api_client = _crear_cliente_siesa(config, pool_size=max(dias_prefetch, 1))
 
-            if facturas_raw:
-                # Filtrar facturas
-                facturas_validas, notas_credito, facturas_rechazadas = validator.filtrar_facturas(facturas_raw)
-
-                # Acumular estadísticas
-                total_notas += len(notas_credito)
-                total_rechazadas += len(facturas_rechazadas)
-
-                # Registrar notas crédito
-                for nota in notas_credito:
-                    notas_manager.registrar_nota_credito(nota)
-
-                # Registrar facturas rechazadas
-                for item in facturas_rechazadas:
-                    notas_manager.registrar_factura_rechazada(item['factura'], item['razon_rechazo'])
-
-                # Registrar y aplicar notas en facturas crudas
-                if facturas_validas:
-                    for factura in facturas_validas:
-                        notas_manager.registrar_factura(factura)
-
-                    aplicaciones = notas_manager.procesar_notas_para_facturas(facturas_validas)
-                    total_aplicaciones += len(aplicaciones)
-
-                    # Transformar para archivo Excel
-                    facturas_transformadas = [
-                        excel_processor.transformar_factura(factura)
-                        for factura in facturas_validas
-                    ]
-
-                    # Acumular facturas
-                    todas_facturas_transformadas.extend(facturas_transformadas)
-                    total_facturas_procesadas += len(facturas_transformadas)
-
-                    logger.info(f"  - Facturas procesadas: {len(facturas_transformadas)}")
-
-            fecha_actual += timedelta(days=1)
-
-        # Generar Excel consolidado
+        # Excel consolidado: se escribe en streaming a medida que se procesa cada
+        # día (se abre con la primera factura válida)
         output_filename = f"facturas_rango_{fecha_desde.strftime('%Y%m%d')}_{fecha_hasta.strftime('%Y%m%d')}.xlsx"
         output_path = os.path.join('./output', output_filename)
-        os.makedirs('./output', exist_ok=True)
-
-        if todas_facturas_transformadas:
-            excel_processor.generar_excel(todas_facturas_transformadas, output_path)
+        escritor_excel = None
+
+        # Días ya confirmados por una ejecución anterior del mismo job
+        dias_confirmados = seguimiento.dias_confirmados() if seguimiento else {}
+        if dias_confirmados:
+            logger.info(f"Reanudando: {len(dias_confirmados)} día(s) ya confirmados, "
+                        f"último {max(dias_confirmados)}")
+        cancelado = False
+
+        # Procesar cada día en el rango (la espera de cada día cuenta como descarga)
+        medicion.etapa('descarga')
+        dias = _descargar_dias(api_client, fecha_desde, fecha_hasta, dias_prefetch, dias_ventana)
+        for fecha_actual, facturas_raw in dias:
+            dia = fecha_actual.strftime('%Y-%m-%d')
+            medicion.etapa('filtrado')
+
+            if seguimiento:
+                if seguimiento.cancelacion_solicitada():
+                    logger.warning(f"Cancelación solicitada, se detiene antes de {dia}")
+                    cancelado = True
+                    break
+                seguimiento.iniciar_dia(dia)
+
+            logger.info(f"Procesando día: {dia}")
+            confirmado = dias_confirmados.get(dia)
+
+            if not facturas_raw:
+                if seguimiento and confirmado is None:
+                    seguimiento.confirmar_dia(dia, {})
+                medicion.etapa('descarga')
+                continue
+
+            # Filtrar facturas
+            facturas_validas, notas_credito, facturas_rechazadas = validator.filtrar_facturas(facturas_raw)
+
+            if confirmado is not None:
+                # Día registrado antes de la interrupción: solo falta escribirlo en el Excel
+                logger.info("  - Día ya confirmado, no se vuelve a registrar en BD")
+                total_notas += confirmado['notas_credito']
+                total_rechazadas += confirmado['facturas_rechazadas']
+                total_aplicaciones += confirmado['aplicaciones']
+            elif archivo_manager.mes_archivado(dia):
+                # Mes movido al archivo histórico: solo se escribe en el Excel
+                logger.warning(f"  - El mes {dia[:7]} está archivado, no se registra en BD "
+                               f"(restaurarlo con scripts/archivar_meses.py)")
+                if seguimiento:
+                    seguimiento.confirmar_dia(dia, {'notas_credito': 0, 'facturas_validas': 0,
+                                                    'facturas_rechazadas': 0, 'aplicaciones': 0})
+            else:
+                # Registrar el día completo en una sola transacción
+                medicion.etapa('registro_bd')
+                with notas_manager.lote():
+                    # Registrar notas crédito
+                    notas_manager.registrar_notas_credito(notas_credito)
+
+                    # Sincronizar facturas y rechazadas (solo el delta) y aplicar notas
+                    sincronizacion = notas_manager.sincronizar_dia(facturas_validas, facturas_rechazadas,
+                                                                   fecha_actual)
+                    medicion.etapa('aplicacion_notas')
+                    aplicaciones = []
+                    if sincronizacion['facturas_para_notas']:
+                        aplicaciones = notas_manager.procesar_notas_para_facturas(
+                            sincronizacion['facturas_para_notas'])
+
+                    # Checkpoint del día en la misma transacción
+                    if seguimiento:
+                        seguimiento.confirmar_dia(dia, {
+                            'notas_credito': len(notas_credito),
+                            'facturas_validas': len(facturas_validas),
+                            'facturas_rechazadas': len(facturas_rechazadas),
+                            'aplicaciones': len(aplicaciones)
+                        }, notas_manager.conexion_lote)
+
+                # Acumular estadísticas (solo días confirmados)
+                total_notas += len(notas_credito)
+                total_rechazadas += len(facturas_rechazadas)
+                total_aplicaciones += len(aplicaciones)
+
+            if facturas_validas:
+                # Transformación y escritura van juntas (streaming)
+                medicion.etapa('excel')
+                if escritor_excel is None:
+                    os.makedirs('./output', exist_ok=True)
+                    escritor_excel = excel_processor.abrir_excel(output_path)
+
+                # Transformar y escribir directamente en el Excel consolidado
+                procesadas = escritor_excel.agregar(
+                    excel_processor.transformar_factura(factura)
+                    for factura in facturas_validas
+                )
+                total_facturas_procesadas += procesadas
+
+                logger.info(f"  - Facturas procesadas: {procesadas}")
+
+            medicion.etapa('descarga')
+
+        # Guardar Excel consolidado
+        medicion.etapa('excel')
+        if escritor_excel is not None:
+            escritor_excel.guardar()
             logger.info(f"Excel consolidado generado: {output_path}")
         else:
             logger.warning("No se generaron facturas, no se crea Excel")
 
+        medicion.etapa('resumen')
         resumen_notas = notas_manager.obtener_resumen_notas()
 
         return {
             'exito': True,
-            'mensaje': 'Rango procesado exitosamente',
+            'cancelado': cancelado,
+            'mensaje': 'Rango cancelado por el usuario' if cancelado else 'Rango procesado exitosamente',
             'fecha_desde': fecha_desde.strftime('%Y-%m-%d'),
             'fecha_hasta': fecha_hasta.strftime('%Y-%m-%d'),
             'total_dias': (fecha_hasta - fecha_desde).days + 1,
@@ -360,13 +584,23 @@ def procesar_rango_fechas(fecha_desde, fecha_hasta, config):
             'notas_pendientes': resumen_notas.get('notas_pendientes', 0),
             'notas_aplicadas': resumen_notas.get('notas_aplicadas', 0),
             'saldo_pendiente_total': resumen_notas.get('saldo_pendiente_total', 0.0),
-            'archivo_generado': output_filename
+            'archivo_generado': output_filename,
+            'metricas': medicion.terminar(cliente_siesa=api_client, procesador_excel=excel_processor)
         }
 
     except Exception as e:
         logger.error(f"Error procesando rango de fechas: {e}", exc_info=True)
+        medicion.terminar(exito=False)
         raise
 
+    finally:
+        # Al cancelar o con error: descarta las descargas anticipadas pendientes
+        # antes de cerrar las conexiones del cliente
+        if dias is not None:
+            dias.close()
+        if api_client is not None:
+            api_client.close()
+
 
 def main():
     """Función principal del proceso con reglas de negocio y gestión de notas crédito"""
@@ -384,11 +618,16 @@ def main():
             'EMAIL_PASSWORD': os.getenv('EMAIL_PASSWORD'),
             'DESTINATARIOS': os.getenv('DESTINATARIOS', '').split(',') if os.getenv('DESTINATARIOS') else [],
             'TEMPLATE_PATH': os.getenv('TEMPLATE_PATH', './templates/plantilla.xlsx'),
-            'DB_PATH': os.getenv('DB_PATH', './data/notas_credito.db')
+            'DB_PATH': os.getenv('DB_PATH', './data/notas_credito.db'),
+            'RANGO_PREFETCH_DIAS': int(os.getenv('RANGO_PREFETCH_DIAS', str(DIAS_PREFETCH_DEFAULT))),
+            'RANGO_VENTANA_DIAS': int(os.getenv('RANGO_VENTANA_DIAS', str(DIAS_VENTANA_DEFAULT))),
+            'SIESA_CACHE_DIR': os.getenv('SIESA_CACHE_DIR', './data/siesa_cache'),
+            'SIESA_CACHE_TTL_MINUTOS': os.getenv('SIESA_CACHE_TTL_MINUTOS'),
+            'SIESA_CACHE_MODO': os.getenv('SIESA_CACHE_MODO')
         }
 
-        # Validar configuración mínima
-        if not all([config['CONNI_KEY'], config['CONNI_TOKEN']]):
+        # Validar configuración mínima (en modo offline no se consulta SIESA)
+        if config['SIESA_CACHE_MODO'] != 'offline' and not all([config['CONNI_KEY'], config['CONNI_TOKEN']]):
             raise ValueError("Faltan variables de entorno: CONNI_KEY y CONNI_TOKEN son requeridas")
 
         # Calcular fecha del día anterior
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Archivo Histórico de Facturas
+=============================
+
+Mueve los meses cerrados de facturas y facturas_rechazadas a archivos
+columnares comprimidos (data/archivo) y los devuelve a la BD si hace falta
+reprocesarlos.
+
+Uso:
+    python backend/scripts/archivar_meses.py archivar [--meses-retencion 3] [--mes YYYY-MM] [--sin-compactar]
+    python backend/scripts/archivar_meses.py listar
+    python backend/scripts/archivar_meses.py verificar
+    python backend/scripts/archivar_meses.py restaurar --mes YYYY-MM [--tabla facturas]
+
+Opciones comunes: --db-path data/notas_credito.db, --directorio data/archivo
+
+Código de salida: 0 si todo terminó bien, 1 si hubo errores o problemas.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.archivo_manager import ArchivoManager, TABLAS_ARCHIVABLES
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+def archivar(manager, args):
+    if args.mes:
+        resultados = [manager.archivar_mes(tabla, args.mes) for tabla in TABLAS_ARCHIVABLES]
+    else:
+        resultados = manager.archivar(meses_retencion=args.meses_retencion)
+
+    archivados = [r for r in resultados if r['archivado']]
+    if not archivados:
+        print("✅ No hay meses para archivar")
+    for r in archivados:
+        print(f"📦 {r['tabla']} {r['mes']}: {r['filas_movidas']} fila(s) movidas, "
+              f"{r['filas']} en {r['archivo']} ({r['bytes']:,} bytes)")
+    if archivados and not args.sin_compactar:
+        tamanos = manager.compactar()
+        print(f"🗜️  BD compactada: {tamanos['bytes_antes']:,} -> {tamanos['bytes_despues']:,} bytes")
+    return 0
+
+
+def listar(manager, args):
+    meses = manager.meses()
+    if not meses:
+        print("No hay meses archivados")
+    for m in meses:
+        print(f"{m['mes']}  {m['tabla']:<20} {m['filas']:>9,} filas  {m['bytes']:>12,} bytes  "
+              f"{m['archivo']}  ({m['fecha_archivado']})")
+    return 0
+
+
+def verificar(manager, args):
+    resultado = manager.verificar()
+    for m in resultado['meses']:
+        if m['problemas']:
+            print(f"❌ {m['tabla']} {m['mes']}: {'; '.join(m['problemas'])}")
+        else:
+            print(f"✅ {m['tabla']} {m['mes']}: {m['filas']:,} filas")
+    if resultado['consistente']:
+        print("✅ Archivo histórico consistente")
+    return 0 if resultado['consistente'] else 1
+
+
+def restaurar(manager, args):
+    tablas = [args.tabla] if args.tabla else list(TABLAS_ARCHIVABLES)
+    archivados = {(m['tabla'], m['mes']) for m in manager.meses()}
+    pendientes = [tabla for tabla in tablas if (tabla, args.mes) in archivados]
+    if not pendientes:
+        print(f"❌ {args.mes} no está archivado")
+        return 1
+    for tabla in pendientes:
+        r = manager.restaurar_mes(tabla, args.mes)
+        print(f"♻️  {r['tabla']} {r['mes']}: {r['filas']} fila(s) restauradas")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archivo histórico de facturas por mes')
+    parser.add_argument('--db-path', default=os.getenv('DB_PATH', './data/notas_credito.db'),
+                        help='Ruta de la base de datos')
+    parser.add_argument('--directorio', default=os.getenv('ARCHIVO_DIR'),
+                        help='Carpeta de los archivos (por defecto <carpeta de la BD>/archivo)')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_archivar = subparsers.add_parser('archivar', help='Archivar los meses cerrados')
+    p_archivar.add_argument('--meses-retencion', type=int, default=3,
+                            help='Meses cerrados que se mantienen en la BD además del actual')
+    p_archivar.add_argument('--mes', help='Archivar solo este mes (YYYY-MM)')
+    p_archivar.add_argument('--sin-compactar', action='store_true',
+                            help='No ejecutar VACUUM después de archivar')
+    p_archivar.set_defaults(funcion=archivar)
+
+    subparsers.add_parser('listar', help='Listar los meses archivados').set_defaults(funcion=listar)
+    subparsers.add_parser('verificar', help='Verificar archivos y huellas').set_defaults(funcion=verificar)
+
+    p_restaurar = subparsers.add_parser('restaurar', help='Devolver un mes archivado a la BD')
+    p_restaurar.add_argument('--mes', required=True, help='Mes a restaurar (YYYY-MM)')
+    p_restaurar.add_argument('--tabla', choices=sorted(TABLAS_ARCHIVABLES), help='Solo esta tabla')
+    p_restaurar.set_defaults(funcion=restaurar)
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ No existe la base de datos: {args.db_path}")
+        return 1
+
+    try:
+        return args.funcion(ArchivoManager(args.db_path, args.directorio), args)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
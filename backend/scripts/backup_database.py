@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Respaldos de la Base de Datos
+=============================
+
+Respalda notas_credito.db en caliente (API de respaldo en línea de SQLite,
+por pasos) en archivos comprimidos con zstd o gzip y huellas sha256, y los
+depura, verifica y restaura. Solo requiere la biblioteca estándar (zstd con
+el paquete opcional `zstandard`).
+
+Uso:
+    python backend/scripts/backup_database.py crear [--db-path data/notas_credito.db]
+        [--compresion auto|zstd|gzip] [--paginas-por-paso 4096] [--pausa-ms 0] [--sin-verificar]
+    python backend/scripts/backup_database.py limpiar --dias 90 [--minimo 1]
+    python backend/scripts/backup_database.py listar [--json]
+    python backend/scripts/backup_database.py verificar [--nombre NOMBRE] [--completo]
+    python backend/scripts/backup_database.py restaurar --nombre NOMBRE|ultimo [--db-path ...]
+        [--sin-respaldo-previo]
+
+Opciones comunes: --backup-dir backups
+
+Código de salida: 0 si todo terminó bien, 1 si hubo errores o problemas.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.backup_manager import BackupManager, compresiones_disponibles
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+DB_PATH_DEFAULT = os.getenv('DB_PATH', './data/notas_credito.db')
+
+
+def _megas(n: int) -> str:
+    return f"{n / 1024 / 1024:,.1f} MB"
+
+
+def crear(args):
+    manager = BackupManager(args.backup_dir, compresion=args.compresion,
+                            paginas_por_paso=args.paginas_por_paso, pausa_ms=args.pausa_ms)
+    m = manager.crear(args.db_path, verificar_integridad=not args.sin_verificar)
+    print(f"💾 {m['archivo']}: {_megas(m['bytes_bd'])} -> {_megas(m['bytes_archivo'])} ({m['compresion']}), "
+          f"{m['pasos']} paso(s), {m['duracion_copia_s']:.2f} s copia + {m['duracion_compresion_s']:.2f} s compresión")
+    print(f"   sha256 BD: {m['sha256_bd']}")
+    return 0
+
+
+def limpiar(args):
+    eliminados = BackupManager(args.backup_dir).limpiar(args.dias, minimo=args.minimo)
+    if not eliminados:
+        print(f"✅ No hay respaldos con más de {args.dias} días")
+    for nombre in eliminados:
+        print(f"🗑️  {nombre}")
+    return 0
+
+
+def listar(args):
+    respaldos = BackupManager(args.backup_dir).listar()
+    if args.json:
+        print(json.dumps(respaldos, indent=2, ensure_ascii=False))
+        return 0
+    if not respaldos:
+        print("No hay respaldos")
+    for m in respaldos:
+        print(f"{m['fecha']}  {m['archivo']:<40} {_megas(m['bytes_archivo']):>12}  "
+              f"(BD {_megas(m['bytes_bd'])}, esquema {m['version_esquema']})")
+    return 0
+
+
+def verificar(args):
+    resultado = BackupManager(args.backup_dir).verificar(args.nombre, completo=args.completo)
+    if not resultado['respaldos']:
+        print("No hay respaldos")
+    for r in resultado['respaldos']:
+        if r['problemas']:
+            print(f"❌ {r['archivo']}: {'; '.join(r['problemas'])}")
+        else:
+            print(f"✅ {r['archivo']}")
+    return 0 if resultado['consistente'] else 1
+
+
+def restaurar(args):
+    manager = BackupManager(args.backup_dir)
+    nombre = args.nombre
+    if nombre == 'ultimo':
+        respaldos = manager.listar()
+        if not respaldos:
+            print("❌ No hay respaldos")
+            return 1
+        nombre = respaldos[-1]['nombre']
+    r = manager.restaurar(nombre, args.db_path, respaldar_actual=not args.sin_respaldo_previo)
+    print(f"♻️  {r['db_path']} restaurada desde {r['nombre']} ({_megas(r['bytes'])})")
+    if r['respaldo_previo']:
+        print(f"   BD anterior respaldada como {r['respaldo_previo']}")
+    return 0
+
+
+def main():
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument('--backup-dir', default=os.getenv('BACKUP_DIR', './backups'),
+                         help='Carpeta de los respaldos')
+
+    parser = argparse.ArgumentParser(description='Respaldos comprimidos de la base de datos')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_crear = subparsers.add_parser('crear', parents=[comunes], help='Respaldar la BD en caliente')
+    p_crear.add_argument('--db-path', default=DB_PATH_DEFAULT, help='Ruta de la base de datos')
+    p_crear.add_argument('--compresion', default='auto', choices=['auto'] + compresiones_disponibles(),
+                         help='Compresión (auto: zstd si está instalado, si no gzip)')
+    p_crear.add_argument('--paginas-por-paso', type=int, default=4096,
+                         help='Páginas copiadas por paso (-1: todo en un paso)')
+    p_crear.add_argument('--pausa-ms', type=float, default=0,
+                         help='Espera entre pasos (en modo rollback cede el bloqueo al escritor)')
+    p_crear.add_argument('--sin-verificar', action='store_true', help='No ejecutar quick_check sobre la copia')
+    p_crear.set_defaults(funcion=crear)
+
+    p_limpiar = subparsers.add_parser('limpiar', parents=[comunes], help='Eliminar respaldos antiguos')
+    p_limpiar.add_argument('--dias', type=int, default=90, help='Antigüedad máxima en días')
+    p_limpiar.add_argument('--minimo', type=int, default=1,
+                           help='Respaldos más recientes que se conservan siempre')
+    p_limpiar.set_defaults(funcion=limpiar)
+
+    p_listar = subparsers.add_parser('listar', parents=[comunes], help='Listar los respaldos')
+    p_listar.add_argument('--json', action='store_true', help='Imprimir los manifiestos en JSON')
+    p_listar.set_defaults(funcion=listar)
+
+    p_verificar = subparsers.add_parser('verificar', parents=[comunes], help='Verificar huellas e integridad')
+    p_verificar.add_argument('--nombre', help='Solo este respaldo')
+    p_verificar.add_argument('--completo', action='store_true',
+                             help='Además ejecutar PRAGMA integrity_check sobre la BD descomprimida')
+    p_verificar.set_defaults(funcion=verificar)
+
+    p_restaurar = subparsers.add_parser('restaurar', parents=[comunes], help='Restaurar la BD desde un respaldo')
+    p_restaurar.add_argument('--nombre', required=True, help="Respaldo a restaurar ('ultimo': el más reciente)")
+    p_restaurar.add_argument('--db-path', default=DB_PATH_DEFAULT, help='Ruta de la base de datos')
+    p_restaurar.add_argument('--sin-respaldo-previo', action='store_true',
+                             help='No respaldar la BD actual antes de reemplazarla')
+    p_restaurar.set_defaults(funcion=restaurar)
+
+    args = parser.parse_args()
+
+    try:
+        return args.funcion(args)
+    except (FileNotFoundError, ValueError, sqlite3.Error) as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
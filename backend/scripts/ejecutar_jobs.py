@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Ejecutor de Jobs en Segundo Plano
+=================================
+
+Proceso designado para ejecutar los jobs que registra la API (p. ej.
+procesar-rango). Con un servidor WSGI de varios workers la API solo los
+registra; este proceso, uno por BD, los toma de la cola, renueva su latido y
+recupera los que quedaron interrumpidos.
+
+Uso:
+    python backend/scripts/ejecutar_jobs.py
+
+Usa la configuración de la API (.env): DB_PATH, JOBS_WORKERS,
+JOBS_INTERVALO_LATIDO, JOBS_LIMITE_LATIDO y las credenciales de SIESA.
+Se detiene con SIGTERM o Ctrl+C: el día en curso de un job se revierte y el
+job vuelve a la cola al vencer su latido (JOBS_LIMITE_LATIDO); al reanudarse
+no repite los días ya confirmados.
+"""
+
+import logging
+import os
+import signal
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from api.app import jobs_runner
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    detener = threading.Event()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(senal, lambda *_: detener.set())
+
+    jobs_runner.iniciar()
+    detener.wait()
+
+    logger.info("Deteniendo el ejecutor de jobs")
+    jobs_runner.detener(timeout=5)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Migraciones del Esquema de la BD
+================================
+
+Muestra la versión del esquema (PRAGMA user_version) y aplica las
+migraciones pendientes de core/migraciones.py. Los gestores también las
+aplican al inicializarse; este script permite hacerlo antes de desplegar.
+
+Uso:
+    python backend/scripts/migrar_bd.py estado [--json]
+    python backend/scripts/migrar_bd.py aplicar [--hasta N]
+
+Opciones comunes: --db-path data/notas_credito.db
+
+Código de salida: 0 si todo terminó bien (en `estado`, si no hay
+migraciones pendientes), 1 si hay pendientes o errores.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.migraciones import VERSION_ACTUAL, aplicar_migraciones, estado_migraciones
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+def estado(args):
+    resultado = estado_migraciones(args.db_path)
+    pendientes = [m for m in resultado['migraciones'] if not m['aplicada']]
+
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        return 1 if pendientes else 0
+
+    print(f"Esquema de la BD: versión {resultado['version']} (código: {resultado['version_actual']})")
+    for m in resultado['migraciones']:
+        print(f"{'✅' if m['aplicada'] else '⏳'} {m['version']:>3}  {m['descripcion']}")
+    if resultado['version'] > resultado['version_actual']:
+        print("⚠️  La BD tiene un esquema más nuevo que este código")
+    elif pendientes:
+        print(f"⏳ {len(pendientes)} migración(es) pendiente(s): ejecutar `aplicar`")
+    else:
+        print("✅ Esquema al día")
+    return 1 if pendientes else 0
+
+
+def aplicar(args):
+    if args.hasta is not None and not 1 <= args.hasta <= VERSION_ACTUAL:
+        print(f"❌ --hasta debe estar entre 1 y {VERSION_ACTUAL}")
+        return 1
+    aplicadas = aplicar_migraciones(args.db_path, hasta=args.hasta)
+    if not aplicadas:
+        print("✅ No hay migraciones pendientes")
+    for numero in aplicadas:
+        print(f"🔧 Migración {numero} aplicada")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Versión del esquema y migraciones de la BD')
+    parser.add_argument('--db-path', default=os.getenv('DB_PATH', './data/notas_credito.db'),
+                        help='Ruta de la base de datos')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_estado = subparsers.add_parser('estado', help='Mostrar la versión y las migraciones pendientes')
+    p_estado.add_argument('--json', action='store_true', help='Imprimir el resultado en JSON')
+    p_estado.set_defaults(funcion=estado)
+
+    p_aplicar = subparsers.add_parser('aplicar', help='Aplicar las migraciones pendientes')
+    p_aplicar.add_argument('--hasta', type=int, help='Última versión a aplicar (por defecto todas)')
+    p_aplicar.set_defaults(funcion=aplicar)
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ No existe la base de datos: {args.db_path}")
+        return 1
+
+    try:
+        return args.funcion(args)
+    except (ValueError, sqlite3.Error) as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Verificación de Agregados del Dashboard
+=======================================
+
+Recalcula desde cero los contadores y sumas materializados por los triggers
+(resumen_totales, resumen_notas_estado) y los compara con los almacenados.
+
+Uso:
+    python backend/scripts/verificar_agregados.py [--db-path data/notas_credito.db]
+        [--reparar] [--json]
+
+Código de salida: 0 si son consistentes (o se repararon), 1 si hay diferencias.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from core.agregados_manager import AgregadosManager
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verifica los agregados materializados del dashboard')
+    parser.add_argument('--db-path', default=os.getenv('DB_PATH', './data/notas_credito.db'),
+                        help='Ruta de la base de datos')
+    parser.add_argument('--reparar', action='store_true',
+                        help='Reemplazar los valores materializados si hay diferencias')
+    parser.add_argument('--json', action='store_true', help='Imprimir el resultado en JSON')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        print(f"❌ No existe la base de datos: {args.db_path}")
+        return 1
+
+    resultado = AgregadosManager(args.db_path).verificar(reparar=args.reparar)
+
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    elif resultado['consistente']:
+        print("✅ Agregados consistentes con las tablas base")
+    else:
+        print(f"⚠️  {len(resultado['diferencias'])} diferencia(s) encontradas:")
+        for d in resultado['diferencias']:
+            print(f"   {d['clave']}: materializado={d['materializado']} "
+                  f"recalculado={d['recalculado']} diferencia={d['diferencia']}")
+        if resultado['reparado']:
+            print("🔧 Valores materializados reemplazados por los recalculados")
+
+    return 0 if resultado['consistente'] or resultado['reparado'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
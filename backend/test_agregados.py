@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test de los Agregados del Dashboard
+===================================
+
+Verifica que los triggers de resumen_totales y resumen_notas_estado:
+1. Sigan inserciones, actualizaciones (valores, notas aplicadas, cambios de
+   estado y saldo de las notas) y eliminaciones en las cuatro tablas base sin
+   diferencias con el recálculo de verificar()
+2. Aumenten version_datos con cada escritura, incluidas las columnas que no
+   suman en los totales
+3. Coincidan también tras la ingesta y aplicación de notas del gestor
+4. Que verificar() detecte y repare una diferencia
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.agregados_manager import AgregadosManager
+from core.notas_credito_manager import NotasCreditoManager
+
+FECHA = date(2025, 3, 5)
+
+# (descripción, sentencia): cada una escribe al menos una fila de una tabla base
+ESCRITURAS = [
+    ("insertar facturas", '''
+        INSERT INTO facturas (numero_linea, numero_factura, indice_linea, producto, codigo_producto, nit_cliente,
+                              nombre_cliente, cantidad_original, precio_unitario, valor_total, cantidad_restante,
+                              valor_restante, fecha_factura, fecha_proceso)
+        VALUES ('FE1_P01', 'FE1', 0, 'PRODUCTO P01', 'P01', '900100', 'CLIENTE', 10, 10000, 100000, 10, 100000,
+                '2025-03-05', '2025-03-05'),
+               ('FE1_P02', 'FE1', 1, 'PRODUCTO P02', 'P02', '900100', 'CLIENTE', 5, 10000, 50000, 5, 50000,
+                '2025-03-05', '2025-03-05'),
+               ('FE2_P01', 'FE2', 0, 'PRODUCTO P01', 'P01', '900200', 'OTRO', 2, 20000, 40000, 2, 40000,
+                '2025-03-05', '2025-03-05')'''),
+    ("insertar notas", '''
+        INSERT INTO notas_credito (numero_nota, fecha_nota, nit_cliente, nombre_cliente, codigo_producto,
+                                   nombre_producto, valor_total, cantidad, saldo_pendiente, cantidad_pendiente)
+        VALUES ('NC1', '2025-03-05', '900100', 'CLIENTE', 'P01', 'PRODUCTO P01', 30000, 3, 30000, 3),
+               ('NC2', '2025-03-05', '900100', 'CLIENTE', 'P02', 'PRODUCTO P02', 20000, 2, 20000, 2),
+               ('NC3', '2025-03-05', '900200', 'OTRO', 'P01', 'PRODUCTO P01', 5000, 1, 5000, 1)'''),
+    ("insertar rechazadas", '''
+        INSERT INTO facturas_rechazadas (numero_factura, codigo_producto, valor_total, razon_rechazo,
+                                         fecha_factura, codigo_rechazo)
+        VALUES ('FE9', 'X01', 300, 'Valor menor al mínimo', '2025-03-05', 0),
+               ('FE9', 'X02', NULL, 'Tipo de inventario excluido: INVFLETEPT', '2025-03-05', 3)'''),
+    ("insertar aplicación", '''
+        INSERT INTO aplicaciones_notas (id_nota, numero_nota, numero_factura, numero_linea, fecha_factura,
+                                        nit_cliente, codigo_producto, cantidad_aplicada, valor_aplicado)
+        VALUES (1, 'NC1', 'FE1', 'FE1_P01', '2025-03-05', '900100', 'P01', 3, 30000)'''),
+    ("aplicar nota a la factura", '''
+        UPDATE facturas SET nota_aplicada = 1, numero_nota_aplicada = 'NC1', descuento_cantidad = 3,
+                            descuento_valor = 30000, cantidad_restante = 7, valor_restante = 70000
+        WHERE numero_linea = 'FE1_P01' '''),
+    ("nota pasa a APLICADA", '''
+        UPDATE notas_credito SET saldo_pendiente = 0, cantidad_pendiente = 0, estado = 'APLICADA',
+                                 fecha_aplicacion_completa = CURRENT_TIMESTAMP
+        WHERE numero_nota = 'NC1' '''),
+    ("aplicación parcial (solo saldo)",
+     "UPDATE notas_credito SET saldo_pendiente = 12000, cantidad_pendiente = 1 WHERE numero_nota = 'NC2'"),
+    ("nota sin estado", "UPDATE notas_credito SET estado = NULL WHERE numero_nota = 'NC3'"),
+    ("nota vuelve a PENDIENTE", "UPDATE notas_credito SET estado = 'PENDIENTE' WHERE numero_nota = 'NC3'"),
+    ("cambiar valor de una factura", "UPDATE facturas SET valor_total = 45000 WHERE numero_linea = 'FE2_P01'"),
+    ("cambiar valor de una rechazada", "UPDATE facturas_rechazadas SET valor_total = 700 WHERE codigo_producto = 'X02'"),
+    ("cambiar valor de una nota", "UPDATE notas_credito SET valor_total = 21000 WHERE numero_nota = 'NC2'"),
+    ("cambiar valor aplicado", "UPDATE aplicaciones_notas SET valor_aplicado = 29000 WHERE numero_nota = 'NC1'"),
+    ("columna que no suma (factura)", "UPDATE facturas SET estado = 'REVISADA' WHERE numero_factura = 'FE1'"),
+    ("columna que no suma (rechazada)",
+     "UPDATE facturas_rechazadas SET razon_rechazo = 'Otra' WHERE codigo_producto = 'X01'"),
+    ("quitar la nota de la factura", '''
+        UPDATE facturas SET nota_aplicada = 0, numero_nota_aplicada = NULL, descuento_cantidad = 0,
+                            descuento_valor = 0
+        WHERE numero_linea = 'FE1_P01' '''),
+    ("eliminar aplicación", "DELETE FROM aplicaciones_notas WHERE numero_nota = 'NC1'"),
+    ("eliminar nota APLICADA", "DELETE FROM notas_credito WHERE numero_nota = 'NC1'"),
+    ("eliminar facturas", "DELETE FROM facturas WHERE numero_factura = 'FE1'"),
+    ("eliminar rechazadas", "DELETE FROM facturas_rechazadas"),
+]
+
+
+def linea(nrodocto, item, cantidad, valor, indice):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': indice,
+    }
+
+
+def nota(nrodocto, item, cantidad, valor):
+    return {
+        'f_prefijo': 'NC', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT',
+    }
+
+
+class TestAgregados:
+    """Clase para probar los agregados materializados"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_agregados'
+        self.limpiar()
+        os.makedirs(self.directorio)
+        self.db_path = os.path.join(self.directorio, 'agregados.db')
+        self.manager = NotasCreditoManager(db_path=self.db_path)
+        self.agregados = AgregadosManager(self.db_path)
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def escribir(self, sql):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(sql)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Escrituras directas sobre las tablas base")
+        for descripcion, sql in ESCRITURAS:
+            antes = self.agregados.obtener_version()
+            self.escribir(sql)
+            despues = self.agregados.obtener_version()
+            verificacion = self.agregados.verificar()
+            self.registrar(f"{descripcion}: sin diferencias y versión {antes} -> {despues}",
+                           verificacion['consistente'] and despues > antes,
+                           str(verificacion['diferencias']))
+
+        por_estado = self.agregados.obtener()['notas_por_estado']
+        self.registrar("notas por estado", por_estado == {
+            'PENDIENTE': {'cantidad': 2, 'saldo_pendiente': 17000.0}}, str(por_estado))
+
+        print("\n2. Ingesta y aplicación de notas del gestor")
+        antes = self.agregados.obtener_version()
+        with self.manager.lote():
+            self.manager.registrar_notas_credito([nota(500, 'P05', 2, 20000), nota(501, 'P06', 1, 90000)])
+            resultado = self.manager.sincronizar_dia(
+                [linea(10, 'P05', 10, 100000, 0), linea(10, 'P05', 1, 10000, 1), linea(11, 'P06', 4, 40000, 2)],
+                [], FECHA)
+            aplicaciones = self.manager.procesar_notas_para_facturas(resultado['facturas_para_notas'])
+        verificacion = self.agregados.verificar()
+        self.registrar("sin diferencias tras el lote", verificacion['consistente'] and len(aplicaciones) > 0,
+                       str(verificacion['diferencias']))
+        self.registrar("versión avanza con el lote", self.agregados.obtener_version() > antes)
+        estados = self.agregados.obtener()['notas_por_estado']
+        self.registrar("nota aplicada por completo y nota parcial", estados.get('APLICADA', {}).get('cantidad') == 1 and
+                       estados['PENDIENTE']['cantidad'] == 3, str(estados))
+
+        print("\n3. Detección y reparación")
+        self.escribir('UPDATE resumen_totales SET facturas_cantidad = facturas_cantidad + 1')
+        verificacion = self.agregados.verificar()
+        self.registrar("detecta la diferencia",
+                       [d['clave'] for d in verificacion['diferencias']] == ['facturas_cantidad'],
+                       str(verificacion['diferencias']))
+        self.agregados.verificar(reparar=True)
+        self.registrar("repara", self.agregados.verificar()['consistente'])
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina la base de datos temporal"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestAgregados()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Test del Cliente SIESA contra un Servidor HTTP Local
+====================================================
+
+Este script levanta un servidor HTTP de prueba en localhost que imita
+el endpoint ejecutarconsulta de SIESA y verifica que SiesaAPIClient:
+
+1. Reutiliza conexiones (keep-alive) entre consultas
+2. Reintenta ante 5xx y timeouts con backoff
+3. No reintenta errores definitivos (4xx) y se rinde tras max_reintentos
+4. Registra métricas de tiempo por solicitud
+5. Consulta rangos con ventanas de ancho variable y agrupa las filas por día
+6. Lee la respuesta en streaming con las mismas filas que response.json()
+7. Guarda las respuestas en la caché local y las reproduce en modo offline
+"""
+
+import sys
+import os
+import json
+import threading
+import re
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Agregar el directorio core al path para imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+
+import requests
+from api_client import SiesaAPIClient
+from siesa_cache import SiesaCache
+
+
+class ServidorSiesaFalso:
+    """Servidor HTTP local que responde según un guion de respuestas"""
+
+    def __init__(self):
+        self.guion = []          # Lista de (status, cuerpo, demora_s)
+        self.responder = None    # Alternativa al guion: función(parametros) -> (status, cuerpo, demora_s)
+        self.solicitudes = []    # Parámetros recibidos
+        self.conexiones = set()  # Puertos cliente distintos (una por conexión TCP)
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                servidor.conexiones.add(self.client_address[1])
+                servidor.solicitudes.append({
+                    'params': parse_qs(urlparse(self.path).query),
+                    'headers': dict(self.headers)
+                })
+                if servidor.responder:
+                    parametros = parse_qs(urlparse(self.path).query)['parametros'][0]
+                    status, cuerpo, demora = servidor.responder(parametros)
+                elif servidor.guion:
+                    status, cuerpo, demora = servidor.guion.pop(0)
+                else:
+                    status, cuerpo, demora = (200, {'detalle': {'Table': []}}, 0)
+                if demora:
+                    time.sleep(demora)
+                datos = json.dumps(cuerpo).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(datos)))
+                    self.end_headers()
+                    self.wfile.write(datos)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/ejecutarconsulta"
+        self.hilo = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.hilo.start()
+
+    def reiniciar(self, guion, responder=None):
+        self.guion = list(guion)
+        self.responder = responder
+        self.solicitudes = []
+        self.conexiones = set()
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class TestSiesaAPIClient:
+    """Clase para probar el cliente SIESA con un servidor local"""
+
+    def __init__(self):
+        self.servidor = ServidorSiesaFalso()
+        self.resultados = []
+
+    def crear_cliente(self, **kwargs):
+        """Crea un cliente apuntando al servidor local con backoff corto"""
+        opciones = {'timeout': 2, 'max_reintentos': 3, 'backoff_base': 0.01, 'backoff_max': 0.05}
+        opciones.update(kwargs)
+        return SiesaAPIClient('key-test', 'token-test', base_url=self.servidor.url, **opciones)
+
+    def ejecutar_caso(self, nombre, funcion):
+        """Ejecuta un caso y registra si pasó"""
+        print(f"\n{'='*80}")
+        print(f"CASO: {nombre}")
+        print(f"{'='*80}")
+        try:
+            funcion()
+            exito = True
+            print("✅ TEST PASADO")
+        except AssertionError as e:
+            exito = False
+            print(f"❌ TEST FALLIDO: {e}")
+        self.resultados.append({'nombre': nombre, 'exito': exito})
+        return exito
+
+    def caso_respuesta_normal(self):
+        filas = [{'f_prefijo': 'FEM', 'f_nrodocto': 1}, {'f_prefijo': 'FEM', 'f_nrodocto': 2}]
+        self.servidor.reiniciar([(200, {'codigo': 0, 'detalle': {'Table': filas}}, 0)])
+        with self.crear_cliente() as cliente:
+            facturas = cliente.obtener_facturas(datetime(2025, 11, 10))
+            metricas = cliente.obtener_metricas()
+
+        assert facturas == filas, f"Filas inesperadas: {facturas}"
+        solicitud = self.servidor.solicitudes[0]
+        assert solicitud['params']['parametros'] == ["FECHA_INI='2025-11-10'|FECHA_FIN='2025-11-10'"]
+        assert solicitud['headers'].get('Connikey') == 'key-test'
+        assert metricas['solicitudes'] == 1 and metricas['reintentos'] == 0
+        assert metricas['bytes_total'] > 0 and metricas['tiempo_total_s'] > 0
+
+    def caso_keep_alive(self):
+        self.servidor.reiniciar([])
+        with self.crear_cliente() as cliente:
+            for dia in range(1, 6):
+                cliente.obtener_facturas(datetime(2025, 11, dia))
+
+        assert len(self.servidor.solicitudes) == 5
+        assert len(self.servidor.conexiones) == 1, \
+            f"Se abrieron {len(self.servidor.conexiones)} conexiones, se esperaba 1"
+
+    def caso_reintento_5xx(self):
+        self.servidor.reiniciar([
+            (503, {'mensaje': 'ocupado'}, 0),
+            (502, {'mensaje': 'gateway'}, 0),
+            (200, {'detalle': {'Table': [{'f_prefijo': 'FEM'}]}}, 0),
+        ])
+        with self.crear_cliente() as cliente:
+            facturas = cliente.obtener_facturas(datetime(2025, 11, 10))
+            metricas = cliente.obtener_metricas()
+
+        assert len(facturas) == 1
+        assert len(self.servidor.solicitudes) == 3
+        assert metricas['intentos'] == 3 and metricas['reintentos'] == 2
+
+    def caso_reintento_timeout(self):
+        self.servidor.reiniciar([
+            (200, {'detalle': {'Table': []}}, 1.0),
+            (200, {'detalle': {'Table': [{'f_prefijo': 'FEM'}]}}, 0),
+        ])
+        with self.crear_cliente(timeout=0.3) as cliente:
+            facturas = cliente.obtener_facturas(datetime(2025, 11, 10))
+
+        assert len(facturas) == 1, "El reintento tras timeout debió retornar la fila"
+
+    def caso_agota_reintentos(self):
+        self.servidor.reiniciar([(500, {'mensaje': 'error'}, 0)] * 10)
+        with self.crear_cliente(max_reintentos=2) as cliente:
+            try:
+                cliente.obtener_facturas(datetime(2025, 11, 10))
+                assert False, "Se esperaba HTTPError"
+            except requests.exceptions.HTTPError:
+                pass
+            metricas = cliente.obtener_metricas()
+
+        assert len(self.servidor.solicitudes) == 3, f"Intentos: {len(self.servidor.solicitudes)}"
+        assert metricas['errores'] == 1
+
+    def caso_no_reintenta_4xx(self):
+        self.servidor.reiniciar([(400, {'mensaje': 'parametros invalidos'}, 0)] * 5)
+        with self.crear_cliente() as cliente:
+            try:
+                cliente.obtener_facturas(datetime(2025, 11, 10))
+                assert False, "Se esperaba HTTPError"
+            except requests.exceptions.HTTPError:
+                pass
+
+        assert len(self.servidor.solicitudes) == 1, "Un 400 no debe reintentarse"
+
+    def responder_por_fecha(self, filas_por_dia, demora_si_mas_de_dias=None, demora=0):
+        """Crea un responder que genera `filas_por_dia` filas para cada día de FECHA_INI..FECHA_FIN"""
+        def responder(parametros):
+            ini, fin = [date.fromisoformat(f) for f in re.findall(r"'(\d{4}-\d{2}-\d{2})'", parametros)]
+            dias = (fin - ini).days + 1
+            filas = []
+            for i in range(dias):
+                dia = ini + timedelta(days=i)
+                for n in range(filas_por_dia(dia)):
+                    filas.append({'f_prefijo': 'FEM', 'f_nrodocto': f"{dia:%m%d}{n}",
+                                  'f_fecha': f"{dia.isoformat()}T00:00:00"})
+            espera = demora if demora_si_mas_de_dias and dias > demora_si_mas_de_dias else 0
+            return 200, {'detalle': {'Table': filas}}, espera
+        return responder
+
+    def caso_rango_semana_tranquila(self):
+        # Domingo sin facturas, resto con 3
+        self.servidor.reiniciar([], self.responder_por_fecha(lambda d: 0 if d.weekday() == 6 else 3))
+        with self.crear_cliente() as cliente:
+            por_dia = cliente.obtener_facturas_rango(datetime(2025, 11, 3), datetime(2025, 11, 9))
+
+        assert len(self.servidor.solicitudes) == 1, f"Solicitudes: {len(self.servidor.solicitudes)}"
+        assert list(por_dia) == [date(2025, 11, 3) + timedelta(days=i) for i in range(7)]
+        assert por_dia[date(2025, 11, 9)] == [], "El domingo debe quedar como día vacío"
+        assert all(len(por_dia[d]) == 3 for d in list(por_dia)[:6])
+        assert all(f['f_fecha'].startswith(d.isoformat()) for d, filas in por_dia.items() for f in filas)
+
+    def caso_rango_ventana_grande(self):
+        self.servidor.reiniciar([], self.responder_por_fecha(lambda d: 4))
+        with self.crear_cliente(max_filas_ventana=10) as cliente:
+            por_dia = cliente.obtener_facturas_rango(datetime(2025, 11, 3), datetime(2025, 11, 9))
+
+        total = sum(len(f) for f in por_dia.values())
+        assert total == 28, f"Se esperaban 28 filas (sin duplicados), hubo {total}"
+        assert all(len(f) == 4 for f in por_dia.values())
+        assert len(self.servidor.solicitudes) > 1, "La ventana debió partirse"
+
+    def caso_rango_timeout_parte_ventana(self):
+        # Ventanas de más de 2 días tardan más que el timeout
+        self.servidor.reiniciar([], self.responder_por_fecha(lambda d: 2, demora_si_mas_de_dias=2, demora=1.0))
+        with self.crear_cliente(timeout=0.3) as cliente:
+            por_dia = cliente.obtener_facturas_rango(datetime(2025, 11, 3), datetime(2025, 11, 9))
+
+        assert sum(len(f) for f in por_dia.values()) == 14
+        consultas = [s['params']['parametros'][0] for s in self.servidor.solicitudes]
+        # 7 días (timeout) -> 3 (timeout) + 4 (timeout) -> 1 + 2 + 2 + 2: sin reintentos de la misma ventana
+        assert len(consultas) == len(set(consultas)), "Una ventana multi-día no debe reintentarse tras timeout"
+
+    def caso_streaming_bloques_pequenos(self):
+        filas = [{'f_prefijo': 'FEM', 'f_nrodocto': 10 ** 12 + i, 'f_valor_subtotal_local': 1234.5678 * i,
+                  'f_desc_item': 'ÁCIDO FÓLICO ñandú 😀 "comillas" \\ barra', 'f_notas': None,
+                  'f_extra': {'anidado': [1, 2, {'x': True}]}} for i in range(50)]
+        cuerpo = {'codigo': 0, 'mensaje': 'ok', 'detalle': {'Table': filas}}
+        self.servidor.reiniciar([(200, cuerpo, 0)])
+        with self.crear_cliente() as cliente:
+            cliente.TAMANO_BLOQUE = 7  # Fuerza cortes en medio de números, strings y UTF-8
+            recibidas = list(cliente.iterar_facturas(datetime(2025, 11, 10)))
+            metricas = cliente.obtener_metricas()
+
+        assert recibidas == filas, "Las filas en streaming difieren de las originales"
+        assert metricas['bytes_total'] == len(json.dumps(cuerpo).encode('utf-8'))
+
+    def caso_streaming_estructuras_alternativas(self):
+        filas = [{'f_prefijo': 'FEM', 'f_nrodocto': 1}, {'f_prefijo': 'NCE', 'f_nrodocto': 2}]
+        estructuras = [
+            {'detalle': {'table': filas}},
+            {'codigo': 0, 'detalle': {'Resumen': 'x', 'Filas': filas}},
+            {'codigo': 0, 'data': filas},
+            {'rows': filas, 'detalle': 'sin tabla'},
+            filas,
+        ]
+        with self.crear_cliente() as cliente:
+            for cuerpo in estructuras:
+                self.servidor.reiniciar([(200, cuerpo, 0)])
+                assert cliente.obtener_facturas(datetime(2025, 11, 10)) == filas, f"Estructura: {cuerpo}"
+
+            for cuerpo in [{'codigo': 5, 'mensaje': 'sin permisos', 'detalle': {'Table': filas}},
+                           {'codigo': 0, 'detalle': {'Resumen': 'x'}}]:
+                self.servidor.reiniciar([(200, cuerpo, 0)])
+                try:
+                    cliente.obtener_facturas(datetime(2025, 11, 10))
+                    assert False, f"Se esperaba ValueError para {cuerpo}"
+                except ValueError as e:
+                    assert not isinstance(e, json.JSONDecodeError)
+
+    def caso_cache_dia_cerrado(self):
+        filas = [{'f_prefijo': 'FEM', 'f_nrodocto': 1, 'f_desc_item': 'AÑO'}]
+        directorio = tempfile.mkdtemp(prefix='siesa_cache_')
+        try:
+            self.servidor.reiniciar([(200, {'codigo': 0, 'detalle': {'Table': filas}}, 0)])
+            cache = SiesaCache(directorio)
+            with self.crear_cliente(cache=cache) as cliente:
+                primera = cliente.obtener_facturas(datetime(2025, 11, 10))
+                segunda = list(cliente.iterar_facturas(datetime(2025, 11, 10)))
+
+            assert primera == segunda == filas
+            assert len(self.servidor.solicitudes) == 1, "La segunda consulta debió salir de la caché"
+            assert cache.obtener_estadisticas()['aciertos'] == 1
+
+            # Reproducción offline: sin red y con otra instancia de la caché
+            self.servidor.reiniciar([])
+            with self.crear_cliente(cache=SiesaCache(directorio, modo='offline')) as cliente:
+                assert cliente.obtener_facturas(datetime(2025, 11, 10)) == filas
+                try:
+                    cliente.obtener_facturas(datetime(2025, 11, 11))
+                    assert False, "Se esperaba LookupError para un día sin caché"
+                except LookupError:
+                    pass
+            assert self.servidor.solicitudes == [], "El modo offline no debe consultar la red"
+        finally:
+            shutil.rmtree(directorio)
+
+    def caso_cache_ttl_y_errores(self):
+        filas = [{'f_prefijo': 'FEM', 'f_nrodocto': 1}]
+        directorio = tempfile.mkdtemp(prefix='siesa_cache_')
+        try:
+            hoy = datetime.now()
+            self.servidor.reiniciar([
+                (200, {'codigo': 0, 'detalle': {'Table': filas}}, 0),
+                (200, {'codigo': 0, 'detalle': {'Table': filas}}, 0),
+            ])
+            with self.crear_cliente(cache=SiesaCache(directorio, ttl_minutos=0)) as cliente:
+                cliente.obtener_facturas(hoy)
+                cliente.obtener_facturas(hoy)
+            assert len(self.servidor.solicitudes) == 2, "El día de hoy vencido debió consultarse de nuevo"
+
+            # Las respuestas con error no se guardan
+            self.servidor.reiniciar([(200, {'codigo': 3, 'mensaje': 'error', 'detalle': {'Table': []}}, 0)] * 2)
+            with self.crear_cliente(cache=SiesaCache(directorio)) as cliente:
+                for _ in range(2):
+                    try:
+                        cliente.obtener_facturas(datetime(2025, 1, 2))
+                        assert False, "Se esperaba ValueError"
+                    except ValueError:
+                        pass
+            assert len(self.servidor.solicitudes) == 2, "Una respuesta con error no debe quedar en caché"
+        finally:
+            shutil.rmtree(directorio)
+
+    def ejecutar_todos_los_casos(self):
+        """Ejecuta todos los casos de prueba"""
+        print("\n" + "="*80)
+        print("TEST DEL CLIENTE SIESA (SERVIDOR LOCAL)")
+        print("="*80)
+
+        self.ejecutar_caso("Caso 1: Respuesta normal y métricas", self.caso_respuesta_normal)
+        self.ejecutar_caso("Caso 2: Conexión keep-alive reutilizada", self.caso_keep_alive)
+        self.ejecutar_caso("Caso 3: Reintento ante 503/502", self.caso_reintento_5xx)
+        self.ejecutar_caso("Caso 4: Reintento ante timeout", self.caso_reintento_timeout)
+        self.ejecutar_caso("Caso 5: Se rinde tras max_reintentos", self.caso_agota_reintentos)
+        self.ejecutar_caso("Caso 6: No reintenta errores 4xx", self.caso_no_reintenta_4xx)
+        self.ejecutar_caso("Caso 7: Semana tranquila en una sola consulta", self.caso_rango_semana_tranquila)
+        self.ejecutar_caso("Caso 8: Ventana demasiado grande se parte", self.caso_rango_ventana_grande)
+        self.ejecutar_caso("Caso 9: Timeout en ventana se parte sin reintentar", self.caso_rango_timeout_parte_ventana)
+        self.ejecutar_caso("Caso 10: Streaming con bloques pequeños", self.caso_streaming_bloques_pequenos)
+        self.ejecutar_caso("Caso 11: Streaming con estructuras alternativas", self.caso_streaming_estructuras_alternativas)
+        self.ejecutar_caso("Caso 12: Caché de días cerrados y modo offline", self.caso_cache_dia_cerrado)
+        self.ejecutar_caso("Caso 13: Vigencia de hoy y respuestas con error", self.caso_cache_ttl_y_errores)
+
+        total = len(self.resultados)
+        fallidos = sum(1 for r in self.resultados if not r['exito'])
+
+        print(f"\n{'='*80}")
+        print(f"Total de tests: {total}")
+        print(f"Tests exitosos: {total - fallidos}")
+        print(f"Tests fallidos: {fallidos}")
+        print(f"{'='*80}\n")
+
+        return fallidos == 0
+
+    def limpiar(self):
+        """Detiene el servidor local"""
+        self.servidor.detener()
+
+
+if __name__ == '__main__':
+    test = TestSiesaAPIClient()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Test del Archivo Histórico por Mes
+==================================
+
+Verifica que ArchivoManager:
+1. Archive solo los meses anteriores a la retención, sin cambiar los agregados
+2. Conserve las filas completas (lectura columnar igual a la fila original)
+3. Una las filas archivadas con las vivas en los listados por cursor, los
+   conteos, las exportaciones y el detalle por id
+4. Combine filas nuevas al volver a archivar un mes y lo restaure a la BD
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date
+
+# Agregar el directorio core al path para imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+
+from notas_credito_manager import NotasCreditoManager
+from agregados_manager import AgregadosManager
+from archivo_manager import ArchivoManager
+from archivo_columnar import LectorColumnar
+from paginacion import PaginadorKeyset
+
+CASOS = [
+    ('facturas sin filtros', 'facturas', False, []),
+    ('facturas por cliente', 'facturas', False, [("nit_cliente = ?", ['9002'])]),
+    ('facturas con nota', 'facturas', False, [("nota_aplicada = ?", [1])]),
+    ('facturas por rango (archivo y BD)', 'facturas', False,
+     [("fecha_factura >= ?", ['2025-02-15']), ("fecha_factura <= ?", ['2025-04-10'])]),
+    ('rechazadas sin filtros (con fechas nulas)', 'facturas_rechazadas', True, []),
+    ('rechazadas desde marzo', 'facturas_rechazadas', True, [("fecha_factura >= ?", ['2025-03-01'])]),
+]
+
+
+class TestArchivoHistorico:
+    """Clase para probar el archivo histórico de facturas"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_archivo_historico.db'
+        self.directorio = '/tmp/test_archivo_historico'
+        self._borrar()
+
+        NotasCreditoManager(db_path=self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.archivo = ArchivoManager(self.db_path, self.directorio)
+        self.agregados = AgregadosManager(self.db_path)
+        self.resultados = []
+        self._cargar_datos()
+
+    def _borrar(self):
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+    def _cargar_datos(self):
+        """Facturas y rechazadas de enero a abril de 2025, con empates de fecha"""
+        facturas, rechazadas = [], []
+        for i in range(800):
+            fecha = f'2025-{i % 4 + 1:02d}-{i % 28 + 1:02d}'
+            nit = f'900{i % 5}'
+            facturas.append((f'FE{i}', f'FE{i}-1', 'P', 'PROD', nit, 'Cliente', 1.5, 1000.0,
+                             1000.0 + i, i % 3 == 0, f'NC{i}' if i % 3 == 0 else None,
+                             10.0 if i % 3 == 0 else 0.0, fecha))
+            rechazadas.append((f'FR{i}', 'Cliente', 'Razón', 50.0, None if i % 50 == 0 else fecha))
+
+        self.conn.executemany('''
+            INSERT INTO facturas (numero_factura, numero_linea, producto, codigo_producto,
+                                  nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
+                                  valor_total, nota_aplicada, numero_nota_aplicada, descuento_valor,
+                                  fecha_factura)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', facturas)
+        self.conn.executemany('''
+            INSERT INTO facturas_rechazadas (numero_factura, nombre_cliente, razon_rechazo, valor_total,
+                                             fecha_factura)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rechazadas)
+        self.conn.commit()
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def recorrer(self, paginador, condiciones, limite):
+        ids, cursor = [], None
+        while True:
+            pagina = paginador.pagina(self.conn, condiciones, limite, cursor)
+            ids += [fila['id'] for fila in pagina['items']]
+            if not pagina['hay_mas']:
+                return ids
+            cursor = pagina['siguiente_cursor']
+
+    def ejecutar_todos_los_casos(self):
+        # Referencia antes de archivar: recorrido de cada listado y filas completas
+        paginadores = {}
+        esperados = {}
+        for nombre, tabla, nulos, condiciones in CASOS:
+            paginadores[nombre] = PaginadorKeyset(tabla, 'fecha_factura', nulos, archivo=self.archivo)
+            esperados[nombre] = self.recorrer(PaginadorKeyset(tabla, 'fecha_factura', nulos), condiciones, 1000)
+        originales = {fila['id']: dict(fila) for fila in self.conn.execute('SELECT * FROM facturas')}
+        totales = self.agregados.obtener()['totales']
+
+        print("\n1. Archivar meses cerrados")
+        resultados = self.archivo.archivar(meses_retencion=1, hoy=date(2025, 5, 10))
+        meses = sorted({(r['tabla'], r['mes']) for r in resultados if r['archivado']})
+        esperado = [(t, m) for m in ('2025-01', '2025-02', '2025-03') for t in ('facturas', 'facturas_rechazadas')]
+        self.registrar("meses archivados", meses == sorted(esperado), str(len(meses)))
+        vivas = self.conn.execute('SELECT COUNT(*) FROM facturas').fetchone()[0]
+        self.registrar("filas que quedan en la BD", vivas == 200, str(vivas))
+        self.registrar("totales del dashboard sin cambios", self.agregados.obtener()['totales'] == totales)
+        self.registrar("agregados recalculados consistentes", self.agregados.verificar()['consistente'])
+        self.registrar("archivo verificado", self.archivo.verificar()['consistente'])
+
+        registro = self.archivo.meses('facturas')[0]
+        with LectorColumnar(os.path.join(self.directorio, registro['archivo'])) as lector:
+            codificaciones = {c: lector._especificaciones[c]['codificacion']
+                              for c in ('id', 'fecha_factura', 'valor_total', 'numero_factura')}
+        self.registrar("codificación por columna", codificaciones == {
+            'id': 'entero', 'fecha_factura': 'diccionario', 'valor_total': 'real',
+            'numero_factura': 'json'}, str(codificaciones))
+
+        print("\n2. Filas completas")
+        archivadas = self.archivo.filas('facturas', [])
+        iguales = all(fila == originales[fila['id']] for fila in archivadas)
+        self.registrar("filas archivadas iguales a las originales", iguales and len(archivadas) == 600,
+                       f"{len(archivadas)} filas")
+        fila_id = archivadas[123]['id']
+        self.registrar("detalle por id", self.archivo.obtener_por_id('facturas', fila_id) == originales[fila_id])
+        self.registrar("id inexistente", self.archivo.obtener_por_id('facturas', 10 ** 6) is None)
+
+        print("\n3. Listados por cursor (BD + archivo)")
+        for nombre, tabla, nulos, condiciones in CASOS:
+            for limite in (7, 1000):
+                ids = self.recorrer(paginadores[nombre], condiciones, limite)
+                ok = ids == esperados[nombre]
+                if not ok or limite == 7:
+                    self.registrar(f"{nombre} (limite {limite})", ok, f"{len(ids)} filas")
+            total = paginadores[nombre].contar(self.conn, condiciones)
+            self.registrar(f"{nombre}: total", total == len(esperados[nombre]), str(total))
+
+        print("\n4. Exportación por rango")
+        condiciones = [("fecha_factura >= ?", ['2025-03-01']), ("fecha_factura < ?", ['2025-03-15'])]
+        exportadas = [fila for lote in self.archivo.lotes('facturas', ['id', 'fecha_factura'], condiciones, 50)
+                      for fila in lote]
+        referencia = sorted((i, f['fecha_factura']) for i, f in originales.items()
+                            if '2025-03-01' <= f['fecha_factura'] < '2025-03-15')
+        self.registrar("lotes del archivo", sorted(exportadas) == referencia, f"{len(exportadas)} filas")
+
+        print("\n5. Volver a archivar y restaurar")
+        self.conn.execute('''
+            INSERT INTO facturas (numero_factura, numero_linea, producto, codigo_producto, nit_cliente,
+                                  nombre_cliente, cantidad_original, precio_unitario, valor_total,
+                                  fecha_factura)
+            VALUES ('FE-TARDIA', 'FE-TARDIA-1', 'P', 'PROD', '9001', 'Cliente', 1, 500, 500, '2025-02-20')
+        ''')
+        self.conn.commit()
+        anterior = self.archivo.meses('facturas')
+        anterior = next(m for m in anterior if m['mes'] == '2025-02')
+        self.registrar("fila viva en mes archivado detectada", not self.archivo.verificar()['consistente'])
+        resultado = self.archivo.archivar_mes('facturas', '2025-02')
+        self.registrar("mes combinado", resultado['filas'] == anterior['filas'] + 1 and
+                       resultado['filas_movidas'] == 1, str(resultado['filas']))
+        self.registrar("archivo anterior eliminado",
+                       not os.path.exists(os.path.join(self.directorio, anterior['archivo'])))
+        self.registrar("archivo verificado tras combinar", self.archivo.verificar()['consistente'])
+
+        totales = self.agregados.obtener()['totales']
+        restaurado = self.archivo.restaurar_mes('facturas', '2025-02')
+        en_bd = self.conn.execute("SELECT COUNT(*) FROM facturas WHERE fecha_factura LIKE '2025-02%'").fetchone()[0]
+        self.registrar("mes restaurado a la BD", en_bd == restaurado['filas'] == anterior['filas'] + 1, str(en_bd))
+        self.registrar("totales sin cambios al restaurar", self.agregados.obtener()['totales'] == totales)
+        self.registrar("agregados consistentes al restaurar", self.agregados.verificar()['consistente'])
+        self.registrar("mes ya no archivado", not any(m['mes'] == '2025-02' for m in self.archivo.meses('facturas')))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos y el archivo temporales"""
+        self.conn.close()
+        self._borrar()
+
+
+if __name__ == '__main__':
+    test = TestArchivoHistorico()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
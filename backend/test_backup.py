@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test de Respaldos de la Base de Datos
+=====================================
+
+Verifica que:
+1. El respaldo se cree comprimido, con manifiesto y huellas, y se liste
+2. La verificación detecte un archivo dañado o modificado
+3. La restauración devuelva los datos respaldados y respalde antes la BD actual
+4. La retención elimine los respaldos antiguos conservando el mínimo
+5. En modo WAL la copia por pasos termine sin reinicios con un escritor activo
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.backup_manager import BackupManager
+from core.migraciones import VERSION_ACTUAL
+from core.notas_credito_manager import NotasCreditoManager
+from core.sqlite_pool import conectar
+
+
+def insertar_facturas(db_path, desde, hasta):
+    conn = conectar(db_path)
+    conn.executemany('''
+        INSERT INTO facturas (numero_linea, numero_factura, producto, codigo_producto, nit_cliente,
+                              nombre_cliente, cantidad_original, precio_unitario, valor_total, fecha_factura)
+        VALUES (?, ?, 'PRODUCTO', 'P01', '900100', 'CLIENTE', 10, 1000, 10000, '2025-03-05')
+    ''', [(f'FE{n}_P01', f'FE{n}') for n in range(desde, hasta)])
+    conn.commit()
+    conn.close()
+
+
+def contar_facturas(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM facturas').fetchone()[0]
+    finally:
+        conn.close()
+
+
+class TestBackup:
+    """Clase para probar los respaldos en caliente"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_backup'
+        self.limpiar()
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        db_path = os.path.join(self.directorio, 'data', 'notas_credito.db')
+        NotasCreditoManager(db_path)
+        insertar_facturas(db_path, 0, 2000)
+        manager = BackupManager(os.path.join(self.directorio, 'backups'), compresion='gzip', paginas_por_paso=16)
+
+        print("\n1. Crear y listar")
+        m = manager.crear(db_path)
+        self.registrar("archivo comprimido y manifiesto",
+                       (manager.directorio / m['archivo']).exists() and
+                       (manager.directorio / f"{m['nombre']}.json").exists() and
+                       m['bytes_archivo'] < m['bytes_bd'], f"{m['bytes_bd']} -> {m['bytes_archivo']} bytes")
+        self.registrar("copia por pasos de una BD WAL",
+                       m['journal_mode'] == 'wal' and m['pasos'] > 1 and m['reinicios'] == 0 and
+                       m['version_esquema'] == VERSION_ACTUAL, f"{m['pasos']} pasos")
+        self.registrar("listado", [r['nombre'] for r in manager.listar()] == [m['nombre']])
+        self.registrar("verificación completa", manager.verificar(completo=True)['consistente'])
+
+        print("\n2. Detección de daños")
+        archivo = manager.directorio / m['archivo']
+        original = archivo.read_bytes()
+        danado = bytearray(original)
+        danado[len(danado) // 2] ^= 0xFF
+        archivo.write_bytes(bytes(danado))
+        resultado = manager.verificar(m['nombre'])
+        self.registrar("archivo dañado", not resultado['consistente'] and resultado['respaldos'][0]['problemas'],
+                       '; '.join(resultado['respaldos'][0]['problemas']))
+        try:
+            manager.restaurar(m['nombre'], db_path)
+            self.registrar("no restaura un respaldo dañado", False)
+        except ValueError:
+            self.registrar("no restaura un respaldo dañado", contar_facturas(db_path) == 2000)
+        archivo.write_bytes(original)
+
+        print("\n3. Restauración")
+        insertar_facturas(db_path, 2000, 2500)
+        r = manager.restaurar(m['nombre'], db_path)
+        self.registrar("datos del respaldo", contar_facturas(db_path) == 2000, str(contar_facturas(db_path)))
+        previo = manager.obtener(r['respaldo_previo']) if r['respaldo_previo'] else None
+        self.registrar("BD actual respaldada antes", previo is not None and manager.verificar(previo['nombre'])['consistente'])
+        conn = conectar(db_path)
+        visibles = conn.execute('SELECT COUNT(*) FROM facturas').fetchone()[0]
+        conn.close()
+        self.registrar("el pool ve la BD restaurada", visibles == 2000, str(visibles))
+
+        print("\n4. Retención")
+        for manifiesto in manager.listar():
+            ruta = manager.directorio / f"{manifiesto['nombre']}.json"
+            manifiesto['fecha'] = (datetime.fromisoformat(manifiesto['fecha']) - timedelta(days=100)).isoformat()
+            ruta.write_text(json.dumps(manifiesto), encoding='utf-8')
+        eliminados = manager.limpiar(90, minimo=1)
+        restantes = manager.listar()
+        self.registrar("conserva el más reciente", eliminados == [m['nombre']] and
+                       [x['nombre'] for x in restantes] == [previo['nombre']] and
+                       not (manager.directorio / m['archivo']).exists(), str(eliminados))
+
+        print("\n5. Escritor concurrente")
+        insertar_facturas(db_path, 2500, 20000)
+        detener = threading.Event()
+        commits = []
+
+        def escribir():
+            conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+            while not detener.is_set():
+                conn.execute("UPDATE facturas SET estado = 'PROCESADA' WHERE id = ?", (len(commits) % 100 + 1,))
+                commits.append(1)
+            conn.close()
+
+        hilo = threading.Thread(target=escribir)
+        hilo.start()
+        try:
+            concurrente = BackupManager(manager.directorio, compresion='gzip', paginas_por_paso=8, pausa_ms=1).crear(db_path)
+        finally:
+            detener.set()
+            hilo.join()
+        self.registrar("sin reinicios ni bloqueos",
+                       concurrente['reinicios'] == 0 and concurrente['pasos'] > 10 and len(commits) > 0 and
+                       manager.verificar(concurrente['nombre'], completo=True)['consistente'],
+                       f"{concurrente['pasos']} pasos, {len(commits)} commits durante la copia")
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina la BD y los respaldos temporales"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestBackup()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
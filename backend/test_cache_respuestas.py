@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test de la Caché de Respuestas de la API
+========================================
+
+Verifica con el cliente de pruebas de Flask que respuesta_cacheada:
+1. Sirva la segunda lectura desde la caché con el mismo ETag y responda 304
+   a If-None-Match
+2. Tras una escritura en la BD (nueva version_datos) vuelva a generar el
+   cuerpo y un ETag viejo ya no dé 304
+3. No comparta entradas entre parámetros de consulta distintos (el orden de
+   los parámetros no importa)
+4. No comparta entradas entre usuarios
+5. No guarde respuestas de error
+"""
+
+import os
+import shutil
+import sys
+
+DIRECTORIO = '/tmp/test_cache_respuestas'
+shutil.rmtree(DIRECTORIO, ignore_errors=True)
+os.makedirs(DIRECTORIO)
+# La API lee la configuración al importarse
+os.environ['DB_PATH'] = os.path.join(DIRECTORIO, 'api.db')
+os.environ.pop('JOBS_EN_API', None)
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api.app import app, auth_manager, cache_respuestas
+from core.notas_credito_manager import NotasCreditoManager
+
+
+def linea(nrodocto, item, valor):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': 1,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': 0,
+    }
+
+
+class TestCacheRespuestas:
+    """Clase para probar la caché de respuestas de la API"""
+
+    def __init__(self):
+        self.directorio = DIRECTORIO
+        self.cliente = app.test_client()
+        self.manager = NotasCreditoManager(os.environ['DB_PATH'])
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def token(self, username, password):
+        respuesta = self.cliente.post('/api/auth/login', json={'username': username, 'password': password})
+        return {'Authorization': f"Bearer {respuesta.get_json()['access_token']}"}
+
+    def get(self, url, usuario, etag=None):
+        encabezados = dict(usuario)
+        if etag:
+            encabezados['If-None-Match'] = f'"{etag}"'
+        return self.cliente.get(url, headers=encabezados)
+
+    def ejecutar_todos_los_casos(self):
+        self.manager.registrar_facturas([linea(1, 'P01', 100000), linea(2, 'P02', 200000)])
+        auth_manager.crear_usuario('consulta', 'consulta123', None, 'viewer')
+        admin = self.token('admin', 'admin123')
+        consulta = self.token('consulta', 'consulta123')
+        url = '/api/facturas/estadisticas'
+
+        print("\n1. Acierto y 304")
+        primera = self.get(url, admin)
+        etag = primera.get_etag()[0]
+        segunda = self.get(url, admin)
+        self.registrar("primera lectura generada", primera.status_code == 200 and
+                       primera.headers.get('X-Cache') == 'MISS', primera.headers.get('X-Cache'))
+        self.registrar("segunda lectura desde la caché con el mismo ETag",
+                       segunda.headers.get('X-Cache') == 'HIT' and segunda.get_etag()[0] == etag and
+                       segunda.get_data() == primera.get_data())
+        no_modificado = self.get(url, admin, etag)
+        self.registrar("If-None-Match responde 304 sin cuerpo",
+                       no_modificado.status_code == 304 and no_modificado.get_data() == b'',
+                       str(no_modificado.status_code))
+        self.registrar("304 contado", cache_respuestas.obtener_estadisticas()['no_modificado'] == 1)
+
+        print("\n2. Escritura en la BD")
+        self.manager.registrar_facturas([linea(3, 'P03', 300000)])
+        tras_escritura = self.get(url, admin, etag)
+        self.registrar("la versión nueva no da 304", tras_escritura.status_code == 200 and
+                       tras_escritura.headers.get('X-Cache') == 'MISS', str(tras_escritura.status_code))
+        self.registrar("cuerpo y ETag nuevos",
+                       tras_escritura.get_json()['facturas_validas'] == 3 and
+                       primera.get_json()['facturas_validas'] == 2 and tras_escritura.get_etag()[0] != etag,
+                       str(tras_escritura.get_json()))
+
+        print("\n3. Parámetros de consulta")
+        uno = self.get('/api/facturas?limite=1&incluir_total=true', admin)
+        dos = self.get('/api/facturas?limite=2&incluir_total=true', admin)
+        self.registrar("parámetros distintos no comparten entrada",
+                       uno.headers.get('X-Cache') == 'MISS' and dos.headers.get('X-Cache') == 'MISS' and
+                       len(uno.get_json()['items']) == 1 and len(dos.get_json()['items']) == 2,
+                       str([len(r.get_json()['items']) for r in (uno, dos)]))
+        reordenado = self.get('/api/facturas?incluir_total=true&limite=1', admin)
+        self.registrar("el orden de los parámetros no importa", reordenado.headers.get('X-Cache') == 'HIT' and
+                       reordenado.get_data() == uno.get_data())
+        sin_parametros = self.get('/api/facturas', admin)
+        self.registrar("sin parámetros es otra entrada", sin_parametros.headers.get('X-Cache') == 'MISS' and
+                       'total' not in sin_parametros.get_json())
+
+        print("\n4. Usuarios")
+        entradas = cache_respuestas.obtener_estadisticas()['entradas']
+        otro = self.get(url, consulta)
+        self.registrar("otro usuario no usa la entrada del primero", otro.headers.get('X-Cache') == 'MISS' and
+                       cache_respuestas.obtener_estadisticas()['entradas'] == entradas + 1)
+        self.registrar("otro usuario con su entrada", self.get(url, consulta).headers.get('X-Cache') == 'HIT')
+        self.registrar("sin token no se sirve desde la caché", self.cliente.get(url).status_code == 401)
+
+        print("\n5. Respuestas de error")
+        entradas = cache_respuestas.obtener_estadisticas()['entradas']
+        error = self.get('/api/facturas?cursor=no-es-un-cursor', admin)
+        repetido = self.get('/api/facturas?cursor=no-es-un-cursor', admin)
+        self.registrar("error no guardado", error.status_code == 400 and repetido.status_code == 400 and
+                       repetido.headers.get('X-Cache') is None and
+                       cache_respuestas.obtener_estadisticas()['entradas'] == entradas, str(error.status_code))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina la base de datos temporal"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestCacheRespuestas()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
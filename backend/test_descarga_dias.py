@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Test de la Descarga Anticipada de un Rango
+==========================================
+
+Verifica que main._descargar_dias:
+1. Entregue los días en orden estricto de fecha aunque SIESA responda antes
+   los días posteriores (latencias invertidas), con consultas en paralelo y
+   nunca más de dias_prefetch a la vez
+2. Haga lo mismo con ventanas de varios días (obtener_facturas_rango)
+3. Propague el error de un día sin esperar a las descargas en curso, no pida
+   días posteriores y no deje hilos de descarga vivos
+4. Al cerrar el generador antes de terminar (cancelación) tampoco pida más días
+5. En procesar_rango_fechas el error de un día se propague, los días
+   anteriores queden confirmados y el cliente SIESA se cierre sin consultas
+   posteriores al cierre
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para compartir el pool de conexiones
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+
+DESDE = datetime(2025, 3, 1)
+
+
+def dias(cantidad):
+    return [DESDE + timedelta(days=i) for i in range(cantidad)]
+
+
+def fila(dia):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': int(dia.strftime('%d')), 'f_fecha': dia.strftime('%Y-%m-%dT00:00:00'),
+        'f_cod_item': 'P01', 'f_desc_item': 'PRODUCTO P01', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': 1,
+        'f_valor_subtotal_local': 600000, 'f_cod_tipo_inv': 'INVPT',
+    }
+
+
+class ErrorSiesa(Exception):
+    """Simula una consulta fallida a SIESA"""
+
+
+class ClienteLento:
+    """
+    Cliente SIESA falso: cada consulta tarda lo indicado en `latencias` (por
+    fecha inicial), puede fallar en `fallar_en` y bloquearse en `bloquear_en`
+    hasta que se libere `liberar`
+    """
+
+    def __init__(self, latencias, fallar_en=None, bloquear_en=None):
+        self.latencias = latencias
+        self.fallar_en = fallar_en
+        self.bloquear_en = bloquear_en
+        self.liberar = threading.Event()
+        self.candado = threading.Lock()
+        self.consultas = []
+        self.terminadas = []
+        self.en_vuelo = 0
+        self.max_en_vuelo = 0
+        self.cerrado = False
+        self.consultas_tras_cierre = 0
+
+    def _consultar(self, fecha):
+        with self.candado:
+            if self.cerrado:
+                self.consultas_tras_cierre += 1
+            self.consultas.append(fecha)
+            self.en_vuelo += 1
+            self.max_en_vuelo = max(self.max_en_vuelo, self.en_vuelo)
+        try:
+            if fecha == self.bloquear_en:
+                self.liberar.wait(5)
+            time.sleep(self.latencias.get(fecha, 0))
+            if fecha == self.fallar_en:
+                raise ErrorSiesa(fecha.strftime('%Y-%m-%d'))
+        finally:
+            with self.candado:
+                self.en_vuelo -= 1
+                self.terminadas.append(fecha)
+
+    def obtener_facturas(self, fecha):
+        self._consultar(fecha)
+        return [fila(fecha)]
+
+    def obtener_facturas_rango(self, desde, hasta):
+        self._consultar(desde)
+        return {(desde + timedelta(days=i)).date(): [fila(desde + timedelta(days=i))]
+                for i in range((hasta - desde).days + 1)}
+
+    def obtener_metricas(self):
+        return {'consultas': len(self.consultas)}
+
+    def close(self):
+        self.cerrado = True
+
+
+def latencias_invertidas(fechas, paso=0.05):
+    """Los primeros días son los más lentos"""
+    return {fecha: paso * (len(fechas) - i) for i, fecha in enumerate(fechas)}
+
+
+def hasta(consultas, fechas):
+    """Las consultas cubren los días necesarios y ninguno posterior a las ya encargadas"""
+    return fechas[:-1] == sorted(consultas)[:len(fechas) - 1] and set(consultas) <= set(fechas)
+
+
+def hilos_descarga(espera=2.0):
+    """Hilos del pool de descarga que siguen vivos tras esperar a que terminen"""
+    limite = time.time() + espera
+    while True:
+        vivos = [h for h in threading.enumerate() if h.name.startswith('siesa-prefetch') and h.is_alive()]
+        if not vivos or time.time() > limite:
+            return vivos
+        time.sleep(0.02)
+
+
+class TestDescargaDias:
+    """Clase para probar la descarga anticipada de un rango"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_descarga_dias'
+        self.limpiar()
+        os.makedirs(self.directorio)
+        # El Excel consolidado se escribe en ./output
+        self.directorio_original = os.getcwd()
+        os.chdir(self.directorio)
+        self.crear_cliente = main._crear_cliente_siesa
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Un día por consulta con latencias invertidas")
+        fechas = dias(6)
+        cliente = ClienteLento(latencias_invertidas(fechas))
+        entregados = list(main._descargar_dias(cliente, fechas[0], fechas[-1], 3))
+        self.registrar("días en orden de fecha", [fecha for fecha, _ in entregados] == fechas,
+                       str([fecha.strftime('%d') for fecha, _ in entregados]))
+        self.registrar("cada día con sus filas",
+                       all(filas == [fila(fecha)] for fecha, filas in entregados))
+        self.registrar("SIESA respondió antes días posteriores", cliente.terminadas != sorted(cliente.terminadas),
+                       str([fecha.strftime('%d') for fecha in cliente.terminadas]))
+        self.registrar("consultas en paralelo sin pasar de dias_prefetch", 1 < cliente.max_en_vuelo <= 3,
+                       str(cliente.max_en_vuelo))
+        self.registrar("sin hilos de descarga vivos", not hilos_descarga())
+
+        print("\n2. Ventanas de varios días")
+        fechas = dias(7)
+        inicios = fechas[::2]
+        cliente = ClienteLento(latencias_invertidas(inicios))
+        entregados = list(main._descargar_dias(cliente, fechas[0], fechas[-1], 3, dias_ventana=2))
+        self.registrar("días en orden de fecha", [fecha for fecha, _ in entregados] == fechas,
+                       str([fecha.strftime('%d') for fecha, _ in entregados]))
+        self.registrar("una consulta por ventana (la última de un día)", sorted(cliente.consultas) == inicios)
+        self.registrar("ventanas en paralelo", 1 < cliente.max_en_vuelo <= 3, str(cliente.max_en_vuelo))
+
+        print("\n3. Error en un día")
+        fechas = dias(8)
+        cliente = ClienteLento({}, fallar_en=fechas[2], bloquear_en=fechas[3])
+        entregados = []
+        inicio = time.time()
+        try:
+            for fecha, _ in main._descargar_dias(cliente, fechas[0], fechas[-1], 2):
+                entregados.append(fecha)
+            self.registrar("el error se propaga", False)
+        except ErrorSiesa:
+            self.registrar("el error se propaga sin esperar la descarga en curso", time.time() - inicio < 2,
+                           f"{time.time() - inicio:.2f}s")
+        self.registrar("días anteriores entregados", entregados == fechas[:2])
+        cliente.liberar.set()
+        self.registrar("sin hilos de descarga vivos", not hilos_descarga())
+        self.registrar("no se piden días posteriores", hasta(cliente.consultas, fechas[:4]),
+                       str([fecha.strftime('%d') for fecha in cliente.consultas]))
+
+        print("\n4. Generador cerrado antes de terminar")
+        cliente = ClienteLento({}, bloquear_en=fechas[3])
+        generador = main._descargar_dias(cliente, fechas[0], fechas[-1], 3)
+        primero = next(generador)
+        generador.close()
+        cliente.liberar.set()
+        self.registrar("primer día entregado", primero[0] == fechas[0])
+        self.registrar("sin hilos de descarga vivos", not hilos_descarga())
+        self.registrar("no se piden días posteriores", hasta(cliente.consultas, fechas[:4]),
+                       str([fecha.strftime('%d') for fecha in cliente.consultas]))
+
+        print("\n5. Error en procesar_rango_fechas")
+        clientes = []
+
+        def cliente_falso(config, **opciones):
+            clientes.append(ClienteLento(latencias_invertidas(fechas[:4]), fallar_en=fechas[2]))
+            return clientes[-1]
+
+        main._crear_cliente_siesa = cliente_falso
+        db_path = os.path.join(self.directorio, 'rango.db')
+        config = {'DB_PATH': db_path, 'RANGO_PREFETCH_DIAS': 2, 'RANGO_VENTANA_DIAS': 1}
+        try:
+            main.procesar_rango_fechas(fechas[0], fechas[-1], config)
+            self.registrar("el error se propaga", False)
+        except ErrorSiesa:
+            self.registrar("el error se propaga", True)
+        cliente = clientes[0]
+        self.registrar("cliente SIESA cerrado", cliente.cerrado)
+        self.registrar("sin hilos de descarga vivos", not hilos_descarga())
+        self.registrar("sin consultas tras el cierre ni días posteriores",
+                       cliente.consultas_tras_cierre == 0 and hasta(cliente.consultas, fechas[:4]),
+                       str([fecha.strftime('%d') for fecha in cliente.consultas]))
+        conn = sqlite3.connect(db_path)
+        registrados = [r[0] for r in conn.execute('SELECT DISTINCT fecha_factura FROM facturas ORDER BY 1')]
+        conn.close()
+        self.registrar("días anteriores al error confirmados",
+                       registrados == [fecha.strftime('%Y-%m-%d') for fecha in fechas[:2]], str(registrados))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Restaura el cliente SIESA y elimina los archivos temporales"""
+        if hasattr(self, 'crear_cliente'):
+            main._crear_cliente_siesa = self.crear_cliente
+            os.chdir(self.directorio_original)
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    # procesar_rango_fechas registra el error simulado con su traza
+    logging.getLogger().setLevel(logging.CRITICAL)
+    test = TestDescargaDias()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test de la Exportación por Rango de la API
+==========================================
+
+Verifica con el cliente de pruebas de Flask que /api/admin/exportar-excel:
+1. Genere CSV y CSV comprimido con el encabezado de la exportación y una
+   fila por registro del rango (total_registros igual a las filas del archivo)
+2. Incluya los meses archivados del rango después de las filas vivas, que
+   conservan el orden de la consulta
+3. Produzca el mismo contenido en csv y csv.gz
+4. Haga lo mismo con las rechazadas (incluidas las de fecha nula, que quedan
+   fuera del rango)
+5. Rechace formatos inválidos y usuarios que no son admin
+"""
+
+import csv
+import gzip
+import io
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+
+DIRECTORIO = '/tmp/test_exportacion'
+shutil.rmtree(DIRECTORIO, ignore_errors=True)
+os.makedirs(DIRECTORIO)
+# La API lee la configuración al importarse
+os.environ['DB_PATH'] = os.path.join(DIRECTORIO, 'api.db')
+os.environ['ARCHIVO_DIR'] = os.path.join(DIRECTORIO, 'archivo')
+os.environ.pop('JOBS_EN_API', None)
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import api.app as api
+from api.app import EXPORTACIONES, app, archivo_manager, auth_manager
+
+DESDE, HASTA = '2025-02-15', '2025-04-20'
+
+
+class TestExportacion:
+    """Clase para probar la exportación por rango"""
+
+    def __init__(self):
+        self.directorio = DIRECTORIO
+        # Los archivos generados van a <PROJECT_ROOT>/output: se dejan en el directorio temporal
+        self.project_root = api.PROJECT_ROOT
+        api.PROJECT_ROOT = Path(self.directorio)
+        self.cliente = app.test_client()
+        self.db_path = os.environ['DB_PATH']
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def token(self, username, password):
+        respuesta = self.cliente.post('/api/auth/login', json={'username': username, 'password': password})
+        return {'Authorization': f"Bearer {respuesta.get_json()['access_token']}"}
+
+    def cargar_datos(self):
+        """Facturas y rechazadas de enero a abril de 2025, con empates de fecha y rechazadas sin fecha"""
+        facturas, rechazadas = [], []
+        for i in range(240):
+            fecha = f'2025-{i % 4 + 1:02d}-{i % 28 + 1:02d}'
+            facturas.append((f'FE{i}', f'FE{i}_P{i % 3}', 'PRODUCTO', f'P{i % 3}', f'900{i % 5}', 'Cliente',
+                             1.0, 1000.0, 1000.0 + i, i % 3 == 0, f'NC{i}' if i % 3 == 0 else None, fecha))
+            rechazadas.append((f'FR{i}', 'Cliente', 'Valor menor al mínimo', 50.0 + i,
+                               None if i % 40 == 0 else fecha))
+
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('''
+            INSERT INTO facturas (numero_factura, numero_linea, producto, codigo_producto, nit_cliente,
+                                  nombre_cliente, cantidad_original, precio_unitario, valor_total,
+                                  nota_aplicada, numero_nota_aplicada, fecha_factura)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', facturas)
+        conn.executemany('''
+            INSERT INTO facturas_rechazadas (numero_factura, nombre_cliente, razon_rechazo, valor_total,
+                                             fecha_factura)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rechazadas)
+        conn.commit()
+        conn.close()
+
+    def filas_esperadas(self, tipo):
+        """Filas del rango antes de archivar, como texto del CSV"""
+        query, _ = EXPORTACIONES[tipo]
+        conn = sqlite3.connect(self.db_path)
+        try:
+            filas = conn.execute(query, (DESDE, '2025-04-21')).fetchall()
+        finally:
+            conn.close()
+        return [['' if valor is None else str(valor) for valor in fila] for fila in filas]
+
+    def exportar(self, admin, tipo, formato):
+        """Genera la exportación y la descarga; devuelve (respuesta, filas del CSV)"""
+        respuesta = self.cliente.post('/api/admin/exportar-excel', headers=admin, json={
+            'fecha_desde': DESDE, 'fecha_hasta': HASTA, 'tipo': tipo, 'formato': formato})
+        if respuesta.status_code != 200:
+            return respuesta, []
+        descarga = self.cliente.get(f"/api/admin/descargar/{respuesta.get_json()['archivo']}", headers=admin)
+        contenido = descarga.get_data()
+        if formato == 'csv.gz':
+            contenido = gzip.decompress(contenido)
+        filas = list(csv.reader(io.StringIO(contenido.decode('utf-8-sig'), newline='')))
+        descarga.close()
+        return respuesta, filas
+
+    def verificar_exportacion(self, admin, tipo, esperadas):
+        _, columnas = EXPORTACIONES[tipo]
+        vivas = [fila for fila in esperadas if fila[-1] >= '2025-04-01']
+        archivadas = [fila for fila in esperadas if fila[-1] < '2025-04-01']
+        por_formato = {}
+        for formato in ('csv', 'csv.gz'):
+            respuesta, filas = self.exportar(admin, tipo, formato)
+            por_formato[formato] = filas
+            if respuesta.status_code != 200:
+                self.registrar(f"{tipo} {formato}: generado", False, str(respuesta.get_json()))
+                continue
+            encabezado, datos = filas[0], filas[1:]
+            self.registrar(f"{tipo} {formato}: encabezado", encabezado == columnas, str(encabezado))
+            self.registrar(f"{tipo} {formato}: filas del rango",
+                           len(datos) == len(esperadas) == respuesta.get_json()['total_registros'],
+                           f"{len(datos)} filas, {respuesta.get_json()['total_registros']} informadas, "
+                           f"{len(esperadas)} esperadas")
+            self.registrar(f"{tipo} {formato}: vivas primero, en el orden de la consulta",
+                           datos[:len(vivas)] == vivas)
+            self.registrar(f"{tipo} {formato}: después los meses archivados",
+                           sorted(datos[len(vivas):]) == sorted(archivadas) and
+                           all(fila[-1] < '2025-04-01' for fila in datos[len(vivas):]),
+                           f"{len(datos) - len(vivas)} archivadas")
+        self.registrar(f"{tipo}: mismo contenido en csv y csv.gz", por_formato['csv'] == por_formato['csv.gz'])
+
+    def ejecutar_todos_los_casos(self):
+        self.cargar_datos()
+        esperadas = {tipo: self.filas_esperadas(tipo) for tipo in ('facturas', 'rechazadas')}
+        archivados = archivo_manager.archivar(meses_retencion=1, hoy=date(2025, 5, 10))
+        meses = sorted({r['mes'] for r in archivados if r['archivado']})
+        admin = self.token('admin', 'admin123')
+
+        print("\n1. Meses archivados")
+        self.registrar("enero a marzo archivados", meses == ['2025-01', '2025-02', '2025-03'], str(meses))
+
+        print("\n2. Facturas")
+        self.verificar_exportacion(admin, 'facturas', esperadas['facturas'])
+
+        print("\n3. Rechazadas")
+        self.verificar_exportacion(admin, 'rechazadas', esperadas['rechazadas'])
+
+        print("\n4. Errores")
+        invalido = self.cliente.post('/api/admin/exportar-excel', headers=admin, json={
+            'fecha_desde': DESDE, 'fecha_hasta': HASTA, 'formato': 'parquet'})
+        self.registrar("formato inválido", invalido.status_code == 400, str(invalido.status_code))
+        auth_manager.crear_usuario('consulta', 'consulta123', None, 'viewer')
+        viewer = self.cliente.post('/api/admin/exportar-excel', headers=self.token('consulta', 'consulta123'),
+                                   json={'fecha_desde': DESDE, 'fecha_hasta': HASTA, 'formato': 'csv'})
+        self.registrar("solo admins", viewer.status_code == 403, str(viewer.status_code))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Restaura el directorio de salida y elimina los archivos temporales"""
+        api.PROJECT_ROOT = self.project_root
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestExportacion()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Test de Jobs en Segundo Plano
+=============================
+
+Verifica que:
+1. tomar_job sea atómico: entre varios trabajadores a la vez solo uno lo toma
+2. Un job sin latido reciente vuelva a la cola y uno con latido reciente o
+   excluido (en ejecución en el proceso que recupera) no
+3. El ejecutor renueve el latido de un job largo y otro proceso no lo devuelva
+   a la cola mientras sigue vivo
+4. La cancelación se atienda entre días, después del último día confirmado
+5. Un job interrumpido después de un día se reanude desde jobs_dias sin volver
+   a registrar los días confirmados ni duplicar filas, con los mismos totales
+   que una ejecución sin interrupción
+"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para compartir el pool de conexiones
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from core.jobs_manager import JobsManager
+from core.jobs_runner import JobsRunner
+
+DIAS = ['2025-03-01', '2025-03-02', '2025-03-03', '2025-03-04']
+
+
+def fila(prefijo, numero, dia, item, cantidad, valor, cliente='900100', tipo_inventario='INVPT'):
+    return {
+        'f_prefijo': prefijo, 'f_nrodocto': numero, 'f_fecha': f'{dia}T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': cliente,
+        'f_cliente_fact_razon_soc': f'CLIENTE {cliente}', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': tipo_inventario,
+    }
+
+
+# Respuesta de SIESA por día: notas que se aplican en días posteriores, una
+# factura bajo el monto mínimo, dos líneas del mismo producto, un tipo de
+# inventario excluido y un día sin movimientos
+RESPUESTAS = {
+    '2025-03-01': [fila('FE', 1, '2025-03-01', 'P01', 10, 1000000), fila('FE', 1, '2025-03-01', 'P02', 5, 600000),
+                   fila('NC', 1, '2025-03-01', 'P03', 2, 100000), fila('FE', 2, '2025-03-01', 'P04', 1, 100)],
+    '2025-03-02': [fila('FE', 3, '2025-03-02', 'P03', 8, 800000), fila('NC', 2, '2025-03-02', 'P01', 1, 100000)],
+    '2025-03-03': [fila('FE', 4, '2025-03-03', 'P01', 6, 700000), fila('FE', 4, '2025-03-03', 'P01', 4, 400000),
+                   fila('FE', 5, '2025-03-03', 'P05', 1, 600000, tipo_inventario='INVFLETEPT')],
+    '2025-03-04': [],
+}
+
+
+class ClienteFalso:
+    """Cliente SIESA que responde desde RESPUESTAS y cuenta las consultas"""
+
+    def __init__(self):
+        self.consultas = []
+        self.cerrado = False
+
+    def obtener_facturas(self, fecha):
+        self.consultas.append(fecha.strftime('%Y-%m-%d'))
+        return [dict(f) for f in RESPUESTAS[fecha.strftime('%Y-%m-%d')]]
+
+    def obtener_metricas(self):
+        return {'consultas': len(self.consultas)}
+
+    def close(self):
+        self.cerrado = True
+
+
+class Interrupcion(Exception):
+    """Simula la caída del proceso en medio de un día"""
+
+
+class SeguimientoVigilado:
+    """SeguimientoJob que registra los días confirmados y puede fallar o cancelar en un día dado"""
+
+    def __init__(self, seguimiento, fallar_en=None, cancelar_tras=None):
+        self.seguimiento = seguimiento
+        self.fallar_en = fallar_en
+        self.cancelar_tras = cancelar_tras
+        self.confirmados = []
+
+    def dias_confirmados(self):
+        return self.seguimiento.dias_confirmados()
+
+    def cancelacion_solicitada(self):
+        if self.cancelar_tras is not None and self.confirmados[-1:] == [self.cancelar_tras]:
+            # Otro proceso pide cancelar después de confirmado el día
+            self.seguimiento.manager.solicitar_cancelacion(self.seguimiento.job_id)
+        return self.seguimiento.cancelacion_solicitada()
+
+    def iniciar_dia(self, fecha):
+        self.seguimiento.iniciar_dia(fecha)
+
+    def confirmar_dia(self, fecha, estadisticas, conn=None):
+        if fecha == self.fallar_en:
+            # Los datos del día ya están escritos en la transacción del lote
+            raise Interrupcion(fecha)
+        self.seguimiento.confirmar_dia(fecha, estadisticas, conn)
+        self.confirmados.append(fecha)
+
+
+def consultar(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def contenido(db_path):
+    """Filas de las tablas de datos (sin ids ni fechas de registro) y agregados"""
+    return {
+        'facturas': consultar(db_path, '''
+            SELECT numero_factura, codigo_producto, indice_linea, valor_total, nota_aplicada,
+                   descuento_valor, valor_restante, fecha_factura
+            FROM facturas ORDER BY numero_factura, codigo_producto, indice_linea'''),
+        'rechazadas': consultar(db_path, '''
+            SELECT numero_factura, codigo_producto, codigo_rechazo, fecha_factura
+            FROM facturas_rechazadas ORDER BY numero_factura, codigo_producto'''),
+        'notas': consultar(db_path, '''
+            SELECT numero_nota, codigo_producto, saldo_pendiente, cantidad_pendiente, estado
+            FROM notas_credito ORDER BY numero_nota, codigo_producto'''),
+        'aplicaciones': consultar(db_path, '''
+            SELECT numero_nota, numero_factura, codigo_producto, cantidad_aplicada, valor_aplicado
+            FROM aplicaciones_notas ORDER BY numero_nota, numero_factura, id'''),
+        'resumen': consultar(db_path, '''
+            SELECT facturas_cantidad, facturas_valor_total, rechazadas_cantidad, notas_cantidad,
+                   aplicaciones_cantidad, aplicaciones_valor
+            FROM resumen_totales'''),
+    }
+
+
+TOTALES = ('total_facturas_procesadas', 'total_notas_credito', 'total_facturas_rechazadas', 'total_aplicaciones')
+
+
+class TestJobs:
+    """Clase para probar los jobs en segundo plano"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_jobs'
+        self.limpiar()
+        os.makedirs(self.directorio)
+        # El Excel consolidado se escribe en ./output
+        self.directorio_original = os.getcwd()
+        os.chdir(self.directorio)
+        self.resultados = []
+
+        self.crear_cliente = main._crear_cliente_siesa
+        self.clientes = []
+
+        def cliente_falso(config, **opciones):
+            cliente = ClienteFalso()
+            self.clientes.append(cliente)
+            return cliente
+
+        main._crear_cliente_siesa = cliente_falso
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def config(self, db_path):
+        return {'DB_PATH': db_path, 'RANGO_PREFETCH_DIAS': 1, 'RANGO_VENTANA_DIAS': 1}
+
+    def procesar(self, db_path, seguimiento=None):
+        return main.procesar_rango_fechas(datetime.strptime(DIAS[0], '%Y-%m-%d'),
+                                          datetime.strptime(DIAS[-1], '%Y-%m-%d'),
+                                          self.config(db_path), seguimiento)
+
+    def envejecer_latido(self, db_path, job_id, segundos):
+        viejo = (datetime.now() - timedelta(seconds=segundos)).isoformat(timespec='seconds')
+        conn = sqlite3.connect(db_path)
+        conn.execute('UPDATE jobs SET fecha_latido = ? WHERE id = ?', (viejo, job_id))
+        conn.commit()
+        conn.close()
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. tomar_job atómico")
+        db_path = os.path.join(self.directorio, 'tomar.db')
+        manager = JobsManager(db_path)
+        job_id = manager.crear_job('prueba', {})
+        barrera = threading.Barrier(8)
+        tomados = []
+
+        def tomar(i):
+            barrera.wait()
+            if manager.tomar_job(job_id, f'trabajador-{i}'):
+                tomados.append(i)
+
+        hilos = [threading.Thread(target=tomar, args=(i,)) for i in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        job = manager.obtener_job(job_id)
+        self.registrar("un solo trabajador lo toma", len(tomados) == 1 and
+                       job['trabajador'] == f'trabajador-{tomados[0]}', str(tomados))
+        self.registrar("un intento y EN_PROCESO", job['intentos'] == 1 and job['estado'] == JobsManager.EN_PROCESO)
+        self.registrar("tomado no se vuelve a tomar", not manager.tomar_job(job_id, 'otro'))
+
+        print("\n2. Latido y recuperación de interrumpidos")
+        vencido = manager.crear_job('prueba', {})
+        vivo = manager.crear_job('prueba', {})
+        excluido = manager.crear_job('prueba', {})
+        for nuevo in (vencido, vivo, excluido):
+            manager.tomar_job(nuevo, 'caido')
+        for nuevo in (job_id, vencido, excluido):
+            self.envejecer_latido(db_path, nuevo, 120)
+        manager.registrar_latido([vivo])
+
+        recuperados = manager.recuperar_interrumpidos(60, excluir=[excluido])
+        estados = {j: manager.obtener_job(j) for j in (job_id, vencido, vivo, excluido)}
+        self.registrar("vuelven a la cola los vencidos", recuperados == 2 and
+                       [estados[j]['estado'] for j in (job_id, vencido)] == [JobsManager.PENDIENTE] * 2 and
+                       estados[vencido]['trabajador'] is None, str(recuperados))
+        self.registrar("latido reciente sigue EN_PROCESO", estados[vivo]['estado'] == JobsManager.EN_PROCESO)
+        self.registrar("excluido sigue EN_PROCESO", estados[excluido]['estado'] == JobsManager.EN_PROCESO)
+        self.registrar("recuperado se vuelve a tomar con otro intento",
+                       manager.tomar_job(vencido, 'nuevo') and manager.obtener_job(vencido)['intentos'] == 2)
+
+        print("\n3. El ejecutor mantiene vivo un job largo")
+        db_path = os.path.join(self.directorio, 'ejecutor.db')
+        manager = JobsManager(db_path)
+        runner = JobsRunner(manager, intervalo_latido=0.2)
+        liberar = threading.Event()
+        ejecuciones = []
+
+        def lento(parametros, seguimiento):
+            ejecuciones.append(seguimiento.job_id)
+            liberar.wait(10)
+            return {'ok': True}
+
+        runner.registrar('lento', lento)
+        runner.iniciar()
+        try:
+            job_id = runner.encolar('lento', {})
+            recuperados = 0
+            fin = time.monotonic() + 3
+            while time.monotonic() < fin:
+                # Otro proceso con un límite corto revisa mientras el job corre
+                recuperados += manager.recuperar_interrumpidos(2)
+                time.sleep(0.2)
+            en_curso = manager.obtener_job(job_id)
+            liberar.set()
+            while manager.obtener_job(job_id)['estado'] not in JobsManager.ESTADOS_FINALES and \
+                    time.monotonic() < fin + 5:
+                time.sleep(0.05)
+        finally:
+            liberar.set()
+            runner.detener(timeout=5)
+        job = manager.obtener_job(job_id)
+        self.registrar("no vuelve a la cola mientras late", recuperados == 0 and
+                       en_curso['estado'] == JobsManager.EN_PROCESO, str(recuperados))
+        self.registrar("se ejecuta una sola vez", ejecuciones == [job_id] and job['intentos'] == 1 and
+                       job['estado'] == JobsManager.COMPLETADO, f"{ejecuciones} {job['estado']}")
+
+        print("\n4. Cancelación entre días")
+        db_path = os.path.join(self.directorio, 'cancelar.db')
+        manager = JobsManager(db_path)
+        job_id = manager.crear_job('procesar_rango', {}, dias_total=len(DIAS))
+        manager.tomar_job(job_id, 'prueba')
+        seguimiento = SeguimientoVigilado(manager.seguimiento(job_id), cancelar_tras=DIAS[1])
+        resultado = self.procesar(db_path, seguimiento)
+        self.registrar("se detiene tras el día que pidió cancelar",
+                       resultado['cancelado'] and seguimiento.confirmados == DIAS[:2], str(seguimiento.confirmados))
+        self.registrar("solo los días confirmados quedan en la BD",
+                       sorted(manager.dias_confirmados(job_id)) == DIAS[:2] and
+                       consultar(db_path, 'SELECT DISTINCT fecha_factura FROM facturas ORDER BY 1') ==
+                       [(DIAS[0],), (DIAS[1],)],
+                       str(consultar(db_path, 'SELECT DISTINCT fecha_factura FROM facturas ORDER BY 1')))
+        self.registrar("cliente SIESA cerrado", self.clientes[-1].cerrado)
+
+        print("\n5. Reanudación tras una interrupción")
+        referencia_db = os.path.join(self.directorio, 'referencia.db')
+        JobsManager(referencia_db)
+        referencia = self.procesar(referencia_db)
+
+        db_path = os.path.join(self.directorio, 'reanudar.db')
+        manager = JobsManager(db_path)
+        job_id = manager.crear_job('procesar_rango', {}, dias_total=len(DIAS))
+        manager.tomar_job(job_id, 'caido')
+        seguimiento = SeguimientoVigilado(manager.seguimiento(job_id), fallar_en=DIAS[2])
+        try:
+            self.procesar(db_path, seguimiento)
+            self.registrar("la interrupción se propaga", False)
+        except Interrupcion:
+            self.registrar("la interrupción se propaga", True)
+        self.registrar("el día interrumpido se revierte",
+                       sorted(manager.dias_confirmados(job_id)) == DIAS[:2] and
+                       consultar(db_path, 'SELECT COUNT(*) FROM facturas WHERE fecha_factura = ?', (DIAS[2],)) ==
+                       [(0,)])
+        filas_antes = consultar(db_path, 'SELECT id, numero_factura, indice_linea FROM facturas ORDER BY id')
+
+        # El proceso murió: su latido envejece y otro proceso lo devuelve a la cola
+        self.envejecer_latido(db_path, job_id, 3600)
+        manager.recuperar_interrumpidos(900)
+        reanudacion = {}
+
+        def procesar_rango(parametros, seguimiento_job):
+            reanudacion['seguimiento'] = SeguimientoVigilado(seguimiento_job)
+            return self.procesar(db_path, reanudacion['seguimiento'])
+
+        runner = JobsRunner(manager, intervalo_latido=0.2)
+        runner.registrar('procesar_rango', procesar_rango)
+        runner.iniciar()
+        try:
+            fin = time.monotonic() + 30
+            while manager.obtener_job(job_id)['estado'] not in JobsManager.ESTADOS_FINALES and \
+                    time.monotonic() < fin:
+                time.sleep(0.05)
+        finally:
+            runner.detener(timeout=5)
+
+        job = manager.obtener_job(job_id)
+        self.registrar("completado en el segundo intento",
+                       job['estado'] == JobsManager.COMPLETADO and job['intentos'] == 2,
+                       f"{job['estado']} {job['intentos']} {job['error']}")
+        self.registrar("solo registra los días sin checkpoint",
+                       reanudacion['seguimiento'].confirmados == DIAS[2:], str(reanudacion['seguimiento'].confirmados))
+        self.registrar("filas de los días confirmados intactas",
+                       consultar(db_path, 'SELECT id, numero_factura, indice_linea FROM facturas WHERE id <= ? '
+                                          'ORDER BY id', (filas_antes[-1][0],)) == filas_antes)
+        self.registrar("mismas filas que sin interrupción", contenido(db_path) == contenido(referencia_db))
+        self.registrar("mismos totales que sin interrupción",
+                       all(job['resultado'][clave] == referencia[clave] for clave in TOTALES) and
+                       job['dias_procesados'] == len(DIAS),
+                       str({clave: (job['resultado'][clave], referencia[clave]) for clave in TOTALES}))
+        self.registrar("la referencia aplica notas y rechaza líneas",
+                       referencia['total_aplicaciones'] > 0 and referencia['total_facturas_rechazadas'] > 0)
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Restaura el cliente SIESA y elimina las bases de datos temporales"""
+        if hasattr(self, 'crear_cliente'):
+            main._crear_cliente_siesa = self.crear_cliente
+            os.chdir(self.directorio_original)
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.WARNING)
+    test = TestJobs()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test de LineaFactura
+====================
+
+Verifica que:
+1. LineaFactura normalice una sola vez número de factura, fecha, montos y
+   textos de la fila de la API, y que las líneas compartan los textos iguales
+2. filtrar_facturas entregue LineaFactura con su indice_linea
+3. Excel y BD produzcan lo mismo desde la LineaFactura que desde la fila cruda
+"""
+
+import os
+import sys
+from datetime import datetime
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para que isinstance(…, LineaFactura) use la misma clase
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.business_rules import BusinessRulesValidator
+from core.excel_processor import ExcelProcessor
+from core.linea_factura import LineaFactura
+from core.notas_credito_manager import NotasCreditoManager
+
+
+def fila(prefijo, nrodocto, item, cantidad, valor, tipo='INVPT'):
+    return {
+        'f_prefijo': prefijo, 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': f' {item} ', 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': ' 900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100 ', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': tipo, 'f_desc_tipo_inv': 'PRODUCTO TERMINADO',
+        'f_desc_cond_pago': 'CREDITO 30 DIAS', 'f_desc_grupo_impositivo': 'IVA 5% RTF',
+        'f_ciudad_punto_envio': '001-Pereira', 'f_um_inv_desc': 'BULTO', 'f_um_base': 'BT40 ',
+        'f_02_014': '0001 - AGENTE', 'f_notas_causal_dev': None,
+    }
+
+
+class TestLineaFactura:
+    """Clase para probar el registro normalizado de líneas"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_linea_factura.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        self.manager = NotasCreditoManager(db_path=self.db_path)
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Normalización al ingresar")
+        filas = [fila(' FEM', 1, 'P01', 10, 600000), fila(' FEM', 1, 'P02', 5, None, tipo=' invpt '),
+                 fila('NCE', 7, 'P01', 1, 1000)]
+        lineas = list(LineaFactura.desde_filas(filas))
+        primera = lineas[0]
+        self.registrar("número de factura", primera.numero_factura == 'FEM1', primera.numero_factura)
+        self.registrar("fecha", primera.fecha == datetime(2025, 3, 5))
+        self.registrar("textos sin espacios", (primera.nit_cliente, primera.codigo_producto, primera.um_base) ==
+                       ('900100', 'P01', 'BT40'))
+        self.registrar("montos numéricos", (lineas[1].cantidad, lineas[1].valor_total) == (5.0, 0.0))
+        self.registrar("nota crédito por prefijo", [l.es_nota for l in lineas] == [False, False, True])
+        self.registrar("textos iguales compartidos", lineas[0].nit_cliente is lineas[2].nit_cliente)
+        self.registrar("sin __dict__", not hasattr(primera, '__dict__'))
+
+        print("\n2. Filtrado")
+        validas, notas, rechazadas = BusinessRulesValidator().filtrar_facturas(iter(filas))
+        self.registrar("entrega LineaFactura", all(isinstance(l, LineaFactura) for l in validas + notas))
+        self.registrar("indice_linea asignado", [l.indice_linea for l in validas + notas] == [0, 1, 2],
+                       str([l.indice_linea for l in validas + notas]))
+
+        print("\n3. Misma salida desde la fila cruda")
+        processor = ExcelProcessor()
+        self.registrar("transformación para Excel",
+                       processor.transformar_factura(validas[0]) == processor.transformar_factura(
+                           dict(filas[0], _indice_linea=0)))
+        self.registrar("fila de facturas", self.manager._fila_factura(validas[1]) ==
+                       self.manager._fila_factura(dict(filas[1], _indice_linea=1)))
+        self.registrar("fila de notas crédito", self.manager._fila_nota_credito(notas[0]) ==
+                       self.manager._fila_nota_credito(filas[2]))
+        self.registrar("datos para aplicar notas", self.manager._datos_factura_para_nota(validas[0]) ==
+                       self.manager._datos_factura_para_nota(dict(filas[0], _indice_linea=0)))
+        self.registrar("datos desde la factura transformada", self.manager._datos_factura_para_nota(validas[0]) ==
+                       self.manager._datos_factura_para_nota(processor.transformar_factura(validas[0])))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos temporal"""
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    test = TestLineaFactura()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Test de la Unidad de Trabajo (lote)
+===================================
+
+Verifica que un error dentro de `with manager.lote():`:
+1. Revierta todo lo registrado en el bloque (notas, facturas, rechazadas,
+   aplicaciones y el resumen de los agregados, incluida version_datos)
+2. Se propague y deje el gestor fuera del lote
+3. No deje conexiones del pool en uso ni la BD bloqueada para otro escritor
+4. Revierta también el lote exterior cuando falla un lote anidado
+5. No impida confirmar un lote posterior
+"""
+
+import copy
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para compartir el pool de conexiones
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.agregados_manager import AgregadosManager
+from core.notas_credito_manager import NotasCreditoManager
+from core.sqlite_pool import obtener_pool
+
+FECHA = date(2025, 3, 5)
+FECHA_PREVIA = date(2025, 3, 3)
+TABLAS = ('facturas', 'facturas_rechazadas', 'notas_credito', 'aplicaciones_notas')
+
+
+def linea(nrodocto, item, cantidad, valor, indice=0, dia='2025-03-05'):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': f'{dia}T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': indice,
+    }
+
+
+def nota(nrodocto, item, cantidad, valor):
+    return {
+        'f_prefijo': 'NC', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT',
+    }
+
+
+class ErrorSimulado(Exception):
+    pass
+
+
+class TestLote:
+    """Clase para probar la reversión de lote()"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_lote'
+        self.limpiar()
+        os.makedirs(self.directorio)
+        self.db_path = os.path.join(self.directorio, 'lote.db')
+        self.manager = NotasCreditoManager(db_path=self.db_path)
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def volcado(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            datos = {tabla: conn.execute(f'SELECT * FROM {tabla} ORDER BY id').fetchall() for tabla in TABLAS}
+            datos['resumen_totales'] = conn.execute('SELECT * FROM resumen_totales').fetchall()
+            datos['resumen_notas_estado'] = conn.execute(
+                'SELECT * FROM resumen_notas_estado ORDER BY estado').fetchall()
+            return datos
+        finally:
+            conn.close()
+
+    def en_uso(self):
+        """Conexiones del pool prestadas y no devueltas"""
+        pool = obtener_pool(self.db_path)
+        return len(pool._todas) - len(pool._libres)
+
+    def bd_libre(self):
+        """Otro escritor obtiene el bloqueo de escritura sin esperar"""
+        conn = sqlite3.connect(self.db_path, timeout=0)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+            return True
+        except sqlite3.OperationalError:
+            return False
+        finally:
+            conn.close()
+
+    def registrar_dia(self):
+        """Registra con todos los métodos registrar_* y aplica notas, como un día de ingesta"""
+        self.manager.registrar_nota_credito(nota(501, 'P01', 2, 20000))
+        self.manager.registrar_notas_credito([nota(502, 'P02', 1, 5000), nota(503, 'P03', 1, 8000)])
+        # Otro día: sincronizar_dia reemplaza las líneas del suyo
+        self.manager.registrar_factura(linea(20, 'P09', 1, 9000, dia='2025-03-04'))
+        self.manager.registrar_facturas([linea(21, 'P08', 2, 16000, dia='2025-03-04')])
+        self.manager.registrar_factura_rechazada(linea(22, 'X01', 1, 100, dia='2025-03-04'), 'Valor menor al mínimo')
+        self.manager.registrar_facturas_rechazadas(
+            [{'factura': linea(23, 'X02', 1, 200, dia='2025-03-04'),
+              'razon_rechazo': 'Tipo de inventario excluido: INVFLETEPT'}])
+        facturas = [linea(30, 'P01', 10, 100000, 0), linea(30, 'P02', 5, 50000, 1), linea(31, 'P03', 4, 40000, 2)]
+        resultado = self.manager.sincronizar_dia(copy.deepcopy(facturas), [], FECHA)
+        return self.manager.procesar_notas_para_facturas(resultado['facturas_para_notas'])
+
+    def ejecutar_todos_los_casos(self):
+        # Datos previos: el lote fallido no debe tocarlos
+        with self.manager.lote():
+            self.manager.registrar_notas_credito([nota(500, 'P01', 1, 10000)])
+            resultado = self.manager.sincronizar_dia([linea(10, 'P01', 10, 100000, dia='2025-03-03')], [],
+                                                     FECHA_PREVIA)
+            self.manager.procesar_notas_para_facturas(resultado['facturas_para_notas'])
+        antes = self.volcado()
+        en_uso = self.en_uso()
+
+        print("\n1. Error después de registrar")
+        aplicaciones = []
+        try:
+            with self.manager.lote():
+                aplicaciones = self.registrar_dia()
+                raise ErrorSimulado('falla después de registrar')
+            self.registrar("el error se propaga", False)
+        except ErrorSimulado:
+            self.registrar("el error se propaga", True)
+        self.registrar("el bloque alcanzó a aplicar notas", len(aplicaciones) > 0, str(len(aplicaciones)))
+        despues = self.volcado()
+        for tabla in TABLAS + ('resumen_totales', 'resumen_notas_estado'):
+            self.registrar(f"{tabla} sin cambios", despues[tabla] == antes[tabla])
+        self.registrar("gestor fuera del lote", not self.manager.en_lote and self.manager._conn_lote is None)
+
+        print("\n2. Conexiones y bloqueo")
+        self.registrar("sin conexiones del pool en uso", self.en_uso() == en_uso, f"{self.en_uso()} vs {en_uso}")
+        self.registrar("BD libre para otro escritor", self.bd_libre())
+
+        print("\n3. Lote anidado")
+        try:
+            with self.manager.lote():
+                self.manager.registrar_facturas([linea(40, 'P07', 1, 7000)])
+                with self.manager.lote():
+                    self.manager.registrar_notas_credito([nota(504, 'P07', 1, 1000)])
+                    raise ErrorSimulado('falla en el lote anidado')
+            self.registrar("el error del anidado se propaga", False)
+        except ErrorSimulado:
+            self.registrar("el error del anidado se propaga", True)
+        self.registrar("lote exterior revertido", self.volcado() == antes)
+        self.registrar("sin conexiones del pool en uso tras el anidado", self.en_uso() == en_uso and self.bd_libre())
+
+        print("\n4. Lote posterior")
+        with self.manager.lote():
+            aplicaciones = self.registrar_dia()
+        despues = self.volcado()
+        self.registrar("se confirma completo",
+                       len(despues['facturas']) == len(antes['facturas']) + 5 and
+                       len(despues['notas_credito']) == len(antes['notas_credito']) + 3 and
+                       len(despues['facturas_rechazadas']) == 2 and
+                       len(despues['aplicaciones_notas']) == len(antes['aplicaciones_notas']) + len(aplicaciones),
+                       str({tabla: len(filas) for tabla, filas in despues.items()}))
+        self.registrar("agregados al día", AgregadosManager(self.db_path).verificar()['consistente'])
+        self.registrar("sin conexiones del pool en uso al final", self.en_uso() == en_uso and self.bd_libre())
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina la base de datos temporal"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestLote()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test de Métricas del Procesamiento
+==================================
+
+Verifica que:
+1. RegistroMetricas exporte contadores, resúmenes e indicadores en formato
+   de texto de Prometheus
+2. medir_bd cuente tiempo, sentencias y filas por método de
+   NotasCreditoManager (solo el método más externo)
+3. Medicion acumule los tiempos por etapa y le atribuya los métodos de BD
+"""
+
+import os
+import sys
+import time
+
+# Se importa como paquete `core`, igual que lo hace NotasCreditoManager, para
+# compartir el mismo registro de métricas
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.metricas import METRICAS, Medicion, RegistroMetricas
+from core.notas_credito_manager import NotasCreditoManager
+
+
+def linea(nrodocto, item, indice):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': 10,
+        'f_valor_subtotal_local': 100000, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': indice,
+    }
+
+
+class TestMetricas:
+    """Clase para probar el registro de métricas"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_metricas.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        self.manager = NotasCreditoManager(db_path=self.db_path)
+        self.resultados = []
+        METRICAS.reiniciar()
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Exportación en formato Prometheus")
+        registro = RegistroMetricas()
+        registro.incrementar('cipa_siesa_reintentos_total', 2)
+        registro.observar('cipa_etapa_duracion_segundos', 0.5, proceso='procesar_fecha', etapa='excel')
+        registro.observar('cipa_etapa_duracion_segundos', 1.5, proceso='procesar_fecha', etapa='excel')
+        registro.fijar('cipa_cache_respuestas_entradas', 3, 'Entradas en caché')
+        texto = registro.exportar_prometheus()
+        self.registrar("contador", '# TYPE cipa_siesa_reintentos_total counter\ncipa_siesa_reintentos_total 2'
+                       in texto)
+        self.registrar("resumen con _count y _sum",
+                       'cipa_etapa_duracion_segundos_count{etapa="excel",proceso="procesar_fecha"} 2' in texto and
+                       'cipa_etapa_duracion_segundos_sum{etapa="excel",proceso="procesar_fecha"} 2.0' in texto)
+        self.registrar("máximo como indicador",
+                       'cipa_etapa_duracion_segundos_max{etapa="excel",proceso="procesar_fecha"} 1.5' in texto)
+        self.registrar("indicador con ayuda", '# HELP cipa_cache_respuestas_entradas Entradas en caché' in texto and
+                       'cipa_cache_respuestas_entradas 3' in texto)
+
+        print("\n2. Métodos de BD")
+        facturas = [linea(1, f'P{i:02d}', i) for i in range(5)]
+        medicion = Medicion('procesar_fecha')
+        medicion.etapa('registro_bd')
+        with self.manager.lote():
+            self.manager.registrar_facturas(facturas)
+        medicion.etapa('resumen')
+        self.manager.obtener_resumen_notas()
+        resumen = medicion.terminar()
+
+        bd = resumen['bd']
+        self.registrar("método registrado en la medición", bd.get('registrar_facturas', {}).get('llamadas') == 1,
+                       str(bd.get('registrar_facturas')))
+        self.registrar("filas de executemany contadas", bd['registrar_facturas']['filas'] == 5,
+                       str(bd['registrar_facturas']))
+        self.registrar("sentencias contadas", bd['registrar_facturas']['sentencias'] >= 1 and
+                       bd['obtener_resumen_notas']['sentencias'] >= 1, str(bd['obtener_resumen_notas']))
+        self.registrar("confirmación del lote medida", 'confirmar_lote' in bd, str(sorted(bd)))
+        sentencias = METRICAS.contador('cipa_bd_sentencias_total')
+        self.registrar("contador global por método",
+                       sentencias.get((('metodo', 'registrar_facturas'),)) == bd['registrar_facturas']['sentencias'])
+
+        anidados = Medicion('procesar_fecha')
+        with self.manager.lote():
+            self.manager.registrar_factura_completa(linea(2, 'P10', 0))
+        anidados = anidados.terminar()['bd']
+        self.registrar("llamadas anidadas contadas en el método externo",
+                       'registrar_factura_completa' in anidados and 'registrar_factura' not in anidados,
+                       str(sorted(anidados)))
+
+        print("\n3. Etapas")
+        medicion = Medicion('procesar_rango_fechas')
+        for _ in range(2):
+            medicion.etapa('descarga')
+            time.sleep(0.01)
+            medicion.etapa('excel')
+        resumen = medicion.terminar()
+        self.registrar("etapa repetida acumula su tiempo", resumen['etapas_s']['descarga'] >= 0.02,
+                       str(resumen['etapas_s']))
+        self.registrar("sin métodos de BD ajenos a la medición", resumen['bd'] == {}, str(resumen['bd']))
+        procesos = METRICAS.contador('cipa_procesos_total')
+        self.registrar("ejecuciones contadas por resultado",
+                       procesos.get((('proceso', 'procesar_rango_fechas'), ('resultado', 'exito'))) == 1,
+                       str(procesos))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos temporal"""
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    test = TestMetricas()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
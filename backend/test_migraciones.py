@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Test de Migraciones del Esquema
+===============================
+
+Verifica que:
+1. Una BD nueva quede en la versión actual con todas las tablas y el admin
+2. Con el esquema al día, inicializar los gestores solo lea PRAGMA user_version
+3. Las BD anteriores a las migraciones (user_version 0) se actualicen sin
+   perder datos, incluida la tabla facturas sin indice_linea
+4. Una migración que falla se revierta sin subir la versión
+5. Cada migración corra en la transacción del runner, sin confirmar por su
+   cuenta: si falla después de ejecutarse, ni su SQL ni su versión quedan
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para compartir el pool de conexiones y la lista de migraciones
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from api.auth import AuthManager
+from core import migraciones
+from core.jobs_manager import JobsManager
+from core.migraciones import VERSION_ACTUAL, aplicar_migraciones, estado_migraciones
+from core.notas_credito_manager import NotasCreditoManager
+from core.sqlite_pool import conectar
+
+TABLAS = {'facturas', 'facturas_rechazadas', 'notas_credito', 'aplicaciones_notas', 'usuarios', 'sesiones',
+          'intentos_login', 'jobs', 'jobs_dias', 'archivo_meses', 'resumen_totales', 'resumen_notas_estado'}
+
+
+def consultar(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class TestMigraciones:
+    """Clase para probar las migraciones versionadas"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_migraciones'
+        self.limpiar()
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. BD nueva")
+        db_path = os.path.join(self.directorio, 'data', 'nueva.db')
+        NotasCreditoManager(db_path)
+        version = consultar(db_path, 'PRAGMA user_version')[0][0]
+        self.registrar("versión actual", version == VERSION_ACTUAL, str(version))
+        tablas = {fila[0] for fila in consultar(db_path, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.registrar("todas las tablas", TABLAS <= tablas, str(sorted(TABLAS - tablas)))
+        self.registrar("usuario admin", consultar(db_path, 'SELECT username FROM usuarios') == [('admin',)])
+
+        print("\n2. Inicio con el esquema al día")
+        sentencias = []
+        conn = conectar(db_path)
+        conn.set_trace_callback(sentencias.append)
+        conn.close()
+        NotasCreditoManager(db_path)
+        AuthManager(db_path)
+        JobsManager(db_path)
+        conn = conectar(db_path)
+        conn.set_trace_callback(None)
+        conn.close()
+        self.registrar("solo PRAGMA user_version", sentencias == ['PRAGMA user_version'] * 3, str(sentencias))
+
+        print("\n3. BD anterior a las migraciones")
+        db_path = os.path.join(self.directorio, 'anterior.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE facturas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, numero_linea TEXT NOT NULL, numero_factura TEXT NOT NULL,
+                producto TEXT NOT NULL, codigo_producto TEXT NOT NULL, nit_cliente TEXT NOT NULL,
+                nombre_cliente TEXT NOT NULL, cantidad_original REAL NOT NULL, precio_unitario REAL NOT NULL,
+                valor_total REAL NOT NULL, nota_aplicada INTEGER DEFAULT 0, numero_nota_aplicada TEXT,
+                descuento_cantidad REAL DEFAULT 0, descuento_valor REAL DEFAULT 0, cantidad_restante REAL,
+                valor_restante REAL, tipo_inventario TEXT, fecha_factura DATE NOT NULL,
+                fecha_registro TIMESTAMP DEFAULT CURRENT_TIMESTAMP, fecha_proceso DATE,
+                estado TEXT DEFAULT 'PROCESADA', UNIQUE(numero_factura, codigo_producto, fecha_proceso)
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO facturas (numero_linea, numero_factura, producto, codigo_producto, nit_cliente,
+                                  nombre_cliente, cantidad_original, precio_unitario, valor_total, fecha_factura)
+            VALUES ('FE1_P01', 'FE1', 'PRODUCTO', 'P01', '900100', 'CLIENTE', 10, 1000, 10000, '2025-03-05')
+        ''')
+        conn.commit()
+        conn.close()
+
+        self.registrar("pendientes antes de migrar",
+                       [m['aplicada'] for m in estado_migraciones(db_path)['migraciones']] == [False] * VERSION_ACTUAL)
+        self.registrar("aplicar hasta una versión", aplicar_migraciones(db_path, hasta=1) == [1] and
+                       estado_migraciones(db_path)['version'] == 1)
+        NotasCreditoManager(db_path)
+        self.registrar("indice_linea agregado sin perder datos",
+                       consultar(db_path, 'SELECT numero_factura, indice_linea, valor_total FROM facturas') ==
+                       [('FE1', 0, 10000.0)])
+        self.registrar("agregados recalculados",
+                       consultar(db_path, 'SELECT facturas_cantidad, facturas_valor_total FROM resumen_totales') ==
+                       [(1, 10000.0)], str(consultar(db_path, 'SELECT * FROM resumen_totales')))
+
+        print("\n4. Migración con error")
+
+        def migracion_con_error(conn):
+            conn.execute('CREATE TABLE tabla_temporal (id INTEGER)')
+            raise sqlite3.OperationalError('falla simulada')
+
+        migraciones.MIGRACIONES.append((VERSION_ACTUAL + 1, 'Migración con error', migracion_con_error))
+        try:
+            aplicar_migraciones(db_path)
+            self.registrar("el error se propaga", False)
+        except sqlite3.OperationalError:
+            self.registrar("el error se propaga", True)
+        finally:
+            migraciones.MIGRACIONES.pop()
+        self.registrar("cambios revertidos y versión sin subir",
+                       consultar(db_path, "SELECT name FROM sqlite_master WHERE name = 'tabla_temporal'") == [] and
+                       consultar(db_path, 'PRAGMA user_version')[0][0] == VERSION_ACTUAL)
+
+        print("\n5. Cada migración en la transacción del runner")
+        db_path = os.path.join(self.directorio, 'transaccion.db')
+        originales = list(migraciones.MIGRACIONES)
+        confirmadas = []
+
+        def vigilada(numero, funcion):
+            def ejecutar(conn):
+                funcion(conn)
+                if not conn.in_transaction:
+                    confirmadas.append(numero)
+            return ejecutar
+
+        migraciones.MIGRACIONES[:] = [(n, d, vigilada(n, f)) for n, d, f in originales]
+        try:
+            aplicar_migraciones(db_path)
+        finally:
+            migraciones.MIGRACIONES[:] = originales
+        self.registrar("ninguna confirma por su cuenta", confirmadas == [], str(confirmadas))
+
+        db_path = os.path.join(self.directorio, 'agregados.db')
+        aplicar_migraciones(db_path, hasta=4)
+        _, descripcion, agregados = originales[4]
+
+        def agregados_con_error(conn):
+            agregados(conn)
+            raise sqlite3.OperationalError('falla simulada')
+
+        migraciones.MIGRACIONES[4] = (5, descripcion, agregados_con_error)
+        try:
+            aplicar_migraciones(db_path)
+            self.registrar("la falla de la migración 5 se propaga", False)
+        except sqlite3.OperationalError:
+            self.registrar("la falla de la migración 5 se propaga", True)
+        finally:
+            migraciones.MIGRACIONES[:] = originales
+        self.registrar("tablas y triggers de agregados revertidos",
+                       consultar(db_path, "SELECT name FROM sqlite_master WHERE name LIKE '%resumen%'") == [] and
+                       consultar(db_path, 'PRAGMA user_version')[0][0] == 4,
+                       str(consultar(db_path, "SELECT name FROM sqlite_master WHERE name LIKE '%resumen%'")))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina las bases de datos temporales"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestMigraciones()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Test de Equivalencia del Motor de Aplicación de Notas
+=====================================================
+
+Verifica que procesar_notas_para_facturas (notas cargadas en bloque, reglas
+en memoria y executemany) deje exactamente las mismas tablas
+aplicaciones_notas, notas_credito y facturas que la implementación línea por
+línea de benchmarks/referencia_notas.py, con:
+1. Empates FIFO: varias notas del mismo cliente y producto con la misma fecha_nota
+2. Aplicaciones parciales de la línea (varias notas sobre la misma línea) y
+   notas que no caben en una línea y se aplican a otra posterior
+3. Varias líneas del mismo producto en una factura
+4. Notas pendientes de un día anterior que se aplican al día siguiente
+"""
+
+import copy
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import date
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.referencia_notas import procesar_notas_referencia
+from core.notas_credito_manager import NotasCreditoManager
+
+
+def linea(nrodocto, dia, item, cantidad, valor, cliente='900100', indice=0):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': f'{dia}T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': cliente,
+        'f_cliente_fact_razon_soc': f'CLIENTE {cliente}', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': indice,
+    }
+
+
+def nota(nrodocto, dia, item, cantidad, valor, cliente='900100'):
+    return {
+        'f_prefijo': 'NC', 'f_nrodocto': nrodocto, 'f_fecha': f'{dia}T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': cliente,
+        'f_cliente_fact_razon_soc': f'CLIENTE {cliente}', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT',
+    }
+
+
+def reindexar(lineas):
+    for indice, factura in enumerate(lineas):
+        factura['_indice_linea'] = indice
+    return lineas
+
+
+# (fecha, notas registradas ese día, facturas del día)
+DIAS = [
+    (date(2025, 3, 1), [
+        # Empates FIFO en P01: tres notas del mismo día, registradas fuera de orden numérico
+        nota(103, '2025-03-01', 'P01', 2, 20000), nota(101, '2025-03-01', 'P01', 1, 15000),
+        nota(102, '2025-03-01', 'P01', 4, 30000), nota(100, '2025-02-28', 'P01', 1, 5000),
+        # Demasiado grande para las primeras líneas de P02: se aplica a una posterior
+        nota(110, '2025-03-01', 'P02', 3, 90000),
+        # Cantidad mayor que cualquier línea de P03 del día: espera a la del día siguiente
+        nota(120, '2025-03-01', 'P03', 50, 1000),
+        # Otro cliente con el mismo producto
+        nota(130, '2025-03-01', 'P01', 1, 8000, cliente='900200'),
+    ], reindexar([
+        # Tres líneas de P01 en la misma factura
+        linea(10, '2025-03-01', 'P01', 3, 30000), linea(10, '2025-03-01', 'P01', 6, 60000),
+        linea(10, '2025-03-01', 'P01', 2, 25000),
+        linea(10, '2025-03-01', 'P02', 2, 40000), linea(11, '2025-03-01', 'P02', 5, 100000),
+        linea(11, '2025-03-01', 'P03', 10, 50000),
+        linea(12, '2025-03-01', 'P01', 4, 40000, cliente='900200'),
+        linea(13, '2025-03-01', 'P04', 1, 10000),
+    ])),
+    (date(2025, 3, 2), [
+        # Nuevos empates con notas que quedaron pendientes del día anterior
+        nota(141, '2025-03-02', 'P01', 1, 9000), nota(140, '2025-03-02', 'P01', 1, 9000),
+        nota(150, '2025-03-02', 'P04', 1, 4000),
+        # Cantidad mayor que cualquier línea de P04: queda pendiente
+        nota(151, '2025-03-02', 'P04', 5, 4000),
+    ], reindexar([
+        linea(20, '2025-03-02', 'P01', 1, 9000), linea(20, '2025-03-02', 'P01', 1, 9000),
+        linea(20, '2025-03-02', 'P01', 8, 80000),
+        linea(21, '2025-03-02', 'P03', 60, 600000), linea(21, '2025-03-02', 'P04', 2, 20000),
+    ])),
+]
+
+CONSULTAS = {
+    'aplicaciones_notas': '''
+        SELECT id, id_nota, numero_nota, numero_factura, numero_linea, fecha_factura, nit_cliente,
+               codigo_producto, cantidad_aplicada, valor_aplicado
+        FROM aplicaciones_notas ORDER BY id''',
+    'notas_credito': '''
+        SELECT id, numero_nota, fecha_nota, nit_cliente, codigo_producto, valor_total, cantidad,
+               saldo_pendiente, cantidad_pendiente, estado, fecha_aplicacion_completa IS NULL
+        FROM notas_credito ORDER BY id''',
+    'facturas': '''
+        SELECT id, numero_factura, indice_linea, codigo_producto, nit_cliente, cantidad_original, valor_total,
+               nota_aplicada, numero_nota_aplicada, descuento_cantidad, descuento_valor,
+               cantidad_restante, valor_restante, fecha_factura, fecha_proceso
+        FROM facturas ORDER BY id''',
+}
+
+
+class TestMotorNotas:
+    """Clase para comparar el motor de aplicación de notas con la referencia línea por línea"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_motor_notas'
+        self.limpiar()
+        os.makedirs(self.directorio)
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar(self, nombre, motor):
+        """Registra los días en una BD nueva aplicando las notas con `motor`"""
+        db_path = os.path.join(self.directorio, f'{nombre}.db')
+        manager = NotasCreditoManager(db_path=db_path)
+        aplicaciones = []
+        for fecha, notas, facturas in DIAS:
+            with manager.lote():
+                manager.registrar_notas_credito(copy.deepcopy(notas))
+                sincronizacion = manager.sincronizar_dia(copy.deepcopy(facturas), [], fecha)
+                aplicaciones.append(motor(manager, sincronizacion['facturas_para_notas']))
+
+        conn = sqlite3.connect(db_path)
+        try:
+            tablas = {tabla: conn.execute(sql).fetchall() for tabla, sql in CONSULTAS.items()}
+        finally:
+            conn.close()
+        return aplicaciones, tablas
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Mismo resultado que la referencia línea por línea")
+        aplicaciones, tablas = self.ejecutar(
+            'motor', lambda manager, facturas: manager.procesar_notas_para_facturas(facturas))
+        aplicaciones_ref, tablas_ref = self.ejecutar('referencia', procesar_notas_referencia)
+
+        self.registrar("mismas aplicaciones retornadas", aplicaciones == aplicaciones_ref,
+                       str([len(a) for a in aplicaciones]) + ' vs ' + str([len(a) for a in aplicaciones_ref]))
+        for tabla in CONSULTAS:
+            diferentes = [(a, b) for a, b in zip(tablas[tabla], tablas_ref[tabla]) if a != b]
+            self.registrar(f"{tabla} idéntica", tablas[tabla] == tablas_ref[tabla],
+                           str(diferentes[:2]) if diferentes else f"{len(tablas[tabla])} fila(s)")
+
+        print("\n2. El fixture cubre los casos")
+        por_nota = {fila[2]: fila for fila in tablas['aplicaciones_notas']}
+        orden_p01 = [fila[2] for fila in tablas['aplicaciones_notas']
+                     if fila[7] == 'P01' and fila[6] == '900100']
+        self.registrar("FIFO por fecha y empates por orden de registro",
+                       orden_p01[:4] == ['NC100', 'NC103', 'NC101', 'NC102'], str(orden_p01))
+        self.registrar("nota grande aplicada a una línea posterior",
+                       por_nota.get('NC110', (None,) * 4)[3] == 'FE11', str(por_nota.get('NC110')))
+        lineas_parciales = [fila for fila in tablas['facturas'] if fila[7] and fila[12] > 0]
+        self.registrar("líneas con saldo tras aplicar notas", len(lineas_parciales) > 0)
+        self.registrar("nota pendiente aplicada al día siguiente",
+                       por_nota.get('NC120', (None,) * 4)[3] == 'FE21', str(por_nota.get('NC120')))
+        pendientes = [fila[1] for fila in tablas['notas_credito'] if fila[9] == 'PENDIENTE']
+        self.registrar("notas que no caben quedan pendientes", pendientes == ['NC151'], str(pendientes))
+        lineas_fe10 = [fila for fila in tablas['facturas'] if fila[1] == 'FE10' and fila[3] == 'P01']
+        self.registrar("varias líneas del mismo producto en una factura",
+                       len(lineas_fe10) == 3 and sum(1 for fila in lineas_fe10 if fila[7]) >= 2,
+                       str([(fila[2], fila[8]) for fila in lineas_fe10]))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina las bases de datos temporales"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestMotorNotas()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test de Normalización Memorizada del Excel
+==========================================
+
+Verifica que:
+1. transformar_factura dé lo mismo con y sin tablas de normalización
+2. Los valores repetidos se resuelvan desde la tabla (aciertos) y los
+   nuevos se calculen una vez (fallos)
+3. Las tablas respeten su máximo y la precarga de valores conocidos
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.excel_processor import ExcelProcessor
+
+CONDICIONES = ['CREDITO 30 DIAS', 'CONTADO', '8 DIAS', 'PLAZO 45', '', None]
+GRUPOS = ['IVA 5% RTF', 'IVA 19%', 'EXCLUIDO', '0%', None]
+CIUDADES = ['001-Pereira', 'Cali', ' 002-Medellín ', None, '']
+UNIDADES = ['BULTO', 'KILO', 'UNIDAD', 'LITRO', 'CAJA', None]
+UM_BASE = ['BT40', 'KLS', 'UND', '800G', '']
+
+
+def fila(i):
+    return {
+        'f_prefijo': 'FEM', 'f_nrodocto': 100 + i, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': f'P{i % 7:02d}', 'f_desc_item': 'PRODUCTO', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE', 'f_cant_base': 1 + i % 5, 'f_valor_subtotal_local': 150000,
+        'f_cod_tipo_inv': 'INVPT', 'f_desc_tipo_inv': 'PRODUCTO TERMINADO',
+        'f_desc_cond_pago': CONDICIONES[i % len(CONDICIONES)],
+        'f_desc_grupo_impositivo': GRUPOS[i % len(GRUPOS)],
+        'f_ciudad_punto_envio': CIUDADES[i % len(CIUDADES)],
+        'f_um_inv_desc': UNIDADES[i % len(UNIDADES)], 'f_um_base': UM_BASE[i % len(UM_BASE)],
+        '_indice_linea': i,
+    }
+
+
+class TestNormalizacionExcel:
+    """Clase para probar las tablas de normalización de ExcelProcessor"""
+
+    def __init__(self):
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        filas = [fila(i) for i in range(300)]
+
+        print("\n1. Mismo resultado")
+        memorizado = ExcelProcessor(max_normalizaciones=1024)
+        sin_memoria = ExcelProcessor(max_normalizaciones=0)
+        iguales = all(memorizado.transformar_factura(f) == sin_memoria.transformar_factura(f) for f in filas)
+        self.registrar("filas transformadas idénticas", iguales)
+        numerico = dict(fila(0), f_ciudad_punto_envio=1, f_desc_grupo_impositivo=5.0)
+        self.registrar("valores no textuales sin memorizar",
+                       memorizado.transformar_factura(numerico)['municipio'] == '1' and
+                       1 not in memorizado._normalizados['ciudad'])
+
+        print("\n2. Aciertos y fallos")
+        estadisticas = memorizado.obtener_estadisticas_normalizacion()
+        ciudad = estadisticas['campos']['ciudad']
+        self.registrar("líneas contadas", estadisticas['lineas'] == 301, str(estadisticas['lineas']))
+        self.registrar("un fallo por valor distinto",
+                       estadisticas['campos']['condicion_pago']['fallos'] == len(CONDICIONES),
+                       str(estadisticas['campos']['condicion_pago']))
+        self.registrar("valor no textual cuenta como fallo", ciudad['fallos'] == len(CIUDADES) + 1 and
+                       ciudad['entradas'] == len(CIUDADES), str(ciudad))
+        self.registrar("tasa de aciertos", ciudad['tasa_aciertos'] == round(ciudad['aciertos'] / 301, 4))
+
+        print("\n3. Máximo y precarga")
+        acotado = ExcelProcessor(max_normalizaciones=2)
+        for f in filas[:20]:
+            acotado.transformar_factura(f)
+        unidad = acotado.obtener_estadisticas_normalizacion()['campos']['unidad_medida']
+        self.registrar("tabla acotada", unidad['entradas'] == 2 and unidad['sin_espacio'] > 0, str(unidad))
+
+        precargado = ExcelProcessor()
+        agregadas = precargado.precargar_normalizaciones({'condicion_pago': CONDICIONES, 'ciudad': [1, 'Cali']})
+        precargado.transformar_factura(fila(0))
+        condicion = precargado.obtener_estadisticas_normalizacion()['campos']['condicion_pago']
+        self.registrar("precarga evita el primer fallo", agregadas == len(CONDICIONES) + 1 and
+                       condicion['fallos'] == 0, f"{agregadas} agregadas, {condicion}")
+        try:
+            precargado.precargar_normalizaciones({'tipo_inventario': ['INVPT']})
+            self.registrar("campo desconocido rechazado", False)
+        except ValueError:
+            self.registrar("campo desconocido rechazado", True)
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+
+if __name__ == '__main__':
+    test = TestNormalizacionExcel()
+    try:
+        sys.exit(0 if test.ejecutar_todos_los_casos() else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
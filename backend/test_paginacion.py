@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test de Paginación por Cursor (keyset)
+======================================
+
+Verifica que PaginadorKeyset:
+1. Recorra todas las filas en el mismo orden que ORDER BY (fecha DESC, id DESC),
+   sin repetir ni saltar filas, con y sin filtros
+2. Incluya al final las filas con fecha NULL cuando la columna las admite
+3. Rechace cursores corruptos o generados con otros filtros
+4. Resuelva cada combinación de filtros del frontend con un índice, sin
+   ordenar en una tabla temporal (EXPLAIN QUERY PLAN)
+"""
+
+import os
+import sqlite3
+import sys
+
+# Agregar el directorio core al path para imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+
+from notas_credito_manager import NotasCreditoManager
+from paginacion import PaginadorKeyset, CursorInvalido
+
+
+class TestPaginacion:
+    """Clase para probar la paginación por cursor"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_paginacion.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        NotasCreditoManager(db_path=self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.resultados = []
+        self._cargar_datos()
+
+    def _cargar_datos(self):
+        """Facturas, rechazadas y notas con fechas repetidas (empates en la fecha)"""
+        facturas, rechazadas, notas = [], [], []
+        for i in range(600):
+            fecha = f'2025-03-{i % 7 + 1:02d}'
+            nit = f'900{i % 5}'
+            facturas.append((f'FE{i}', f'FE{i}-1', 'P', 'PROD', nit, 'Cliente',
+                             1, 1000, 1000, i % 3 == 0, fecha))
+            rechazadas.append((f'FR{i}', 'Cliente', 'Razón', None if i % 50 == 0 else fecha))
+            if i % 2 == 0:
+                notas.append((f'NC{i}', fecha, nit, 'Cliente', 'PROD', 'P', 1000, 1, 1000, 1,
+                              'PENDIENTE' if i % 4 == 0 else 'APLICADA'))
+
+        self.conn.executemany('''
+            INSERT INTO facturas (numero_factura, numero_linea, producto, codigo_producto,
+                                  nit_cliente, nombre_cliente, cantidad_original, precio_unitario,
+                                  valor_total, nota_aplicada, fecha_factura)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', facturas)
+        self.conn.executemany('''
+            INSERT INTO facturas_rechazadas (numero_factura, nombre_cliente, razon_rechazo, fecha_factura)
+            VALUES (?, ?, ?, ?)
+        ''', rechazadas)
+        self.conn.executemany('''
+            INSERT INTO notas_credito (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
+                                       codigo_producto, nombre_producto, valor_total, cantidad,
+                                       saldo_pendiente, cantidad_pendiente, estado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', notas)
+        self.conn.execute('ANALYZE')
+        self.conn.commit()
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def recorrer(self, paginador, condiciones, limite):
+        """Ids de todas las páginas siguiendo siguiente_cursor"""
+        ids, cursor = [], None
+        while True:
+            pagina = paginador.pagina(self.conn, condiciones, limite, cursor)
+            ids += [fila['id'] for fila in pagina['items']]
+            if not pagina['hay_mas']:
+                return ids
+            cursor = pagina['siguiente_cursor']
+
+    def esperado(self, paginador, condiciones):
+        where = ' AND '.join(c for c, _ in condiciones) or '1=1'
+        params = [p for _, valores in condiciones for p in valores]
+        sql = (f"SELECT id FROM {paginador.tabla} WHERE {where} "
+               f"ORDER BY {paginador.columna_fecha} DESC, id DESC")
+        return [fila[0] for fila in self.conn.execute(sql, params)]
+
+    def plan(self, paginador, condiciones):
+        """Plan de la consulta de una página intermedia (con condición de continuación)"""
+        filtros = condiciones + [paginador._condicion_continuacion('2025-03-04', 300)]
+        where, params = paginador._where(filtros)
+        sql = (f"SELECT * FROM {paginador.tabla}{where} "
+               f"ORDER BY {paginador.columna_fecha} DESC, id DESC LIMIT ?")
+        return ' | '.join(fila[-1] for fila in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params + [51]))
+
+    def ejecutar_todos_los_casos(self):
+        facturas = PaginadorKeyset('facturas', 'fecha_factura')
+        rechazadas = PaginadorKeyset('facturas_rechazadas', 'fecha_factura', admite_nulos=True)
+        notas = PaginadorKeyset('notas_credito', 'fecha_nota')
+
+        casos = [
+            ('facturas sin filtros', facturas, []),
+            ('facturas por cliente', facturas, [("nit_cliente = ?", ['9002'])]),
+            ('facturas con nota', facturas, [("nota_aplicada = ?", [1])]),
+            ('facturas por rango y sin nota', facturas,
+             [("fecha_factura >= ?", ['2025-03-02']), ("fecha_factura <= ?", ['2025-03-05']),
+              ("nota_aplicada = ?", [0])]),
+            ('rechazadas sin filtros (con fechas nulas)', rechazadas, []),
+            ('rechazadas por rango', rechazadas, [("fecha_factura >= ?", ['2025-03-03'])]),
+            ('notas por estado', notas, [("estado = ?", ['PENDIENTE'])]),
+            ('notas por cliente y rango', notas,
+             [("nit_cliente = ?", ['9000']), ("fecha_nota <= ?", ['2025-03-06'])]),
+        ]
+
+        print("\n1. Recorrido completo por cursor")
+        for nombre, paginador, condiciones in casos:
+            for limite in (1, 7, 1000):
+                ids = self.recorrer(paginador, condiciones, limite)
+                ok = ids == self.esperado(paginador, condiciones)
+                if not ok or limite == 7:
+                    self.registrar(f"{nombre} (limite {limite})", ok, f"{len(ids)} filas")
+            total = paginador.contar(self.conn, condiciones)
+            self.registrar(f"{nombre}: total", total == len(ids), str(total))
+
+        print("\n2. Cursores inválidos")
+        pagina = facturas.pagina(self.conn, [], 10)
+        for nombre, cursor, condiciones in [
+            ('cursor corrupto', 'no-es-un-cursor', []),
+            ('cursor de otros filtros', pagina['siguiente_cursor'], [("nota_aplicada = ?", [1])]),
+        ]:
+            try:
+                facturas.pagina(self.conn, condiciones, 10, cursor)
+                self.registrar(nombre, False, "no se rechazó")
+            except CursorInvalido as e:
+                self.registrar(nombre, True, str(e))
+
+        print("\n3. Planes de consulta")
+        planes = [
+            (facturas, [], 'idx_facturas_fecha'),
+            (facturas, [("nit_cliente = ?", ['9002'])], 'idx_facturas_cliente_fecha'),
+            (facturas, [("nota_aplicada = ?", [1])], 'idx_facturas_nota_fecha'),
+            (facturas, [("nota_aplicada = ?", [0]), ("fecha_factura >= ?", ['2025-03-02'])],
+             'idx_facturas_nota_fecha'),
+            (rechazadas, [], 'idx_rechazadas_fecha'),
+            (rechazadas, [("fecha_factura >= ?", ['2025-03-02'])], 'idx_rechazadas_fecha'),
+            (notas, [], 'idx_notas_fecha'),
+            (notas, [("estado = ?", ['PENDIENTE'])], 'idx_notas_estado_fecha'),
+            (notas, [("nit_cliente = ?", ['9000'])], 'idx_notas_cliente_fecha'),
+        ]
+        for paginador, condiciones, indice in planes:
+            plan = self.plan(paginador, condiciones)
+            ok = indice in plan and 'TEMP B-TREE' not in plan
+            filtros = ', '.join(c for c, _ in condiciones) or 'sin filtros'
+            self.registrar(f"{paginador.tabla} [{filtros}]", ok, plan)
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos temporal"""
+        self.conn.close()
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    test = TestPaginacion()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test del Catálogo de Razones de Rechazo
+=======================================
+
+Verifica que:
+1. filtrar_facturas (y la implementación de referencia) entregue código y
+   parámetros de cada rechazo, y que el texto se clasifique en lo mismo
+2. Los rechazos se guarden con codigo_rechazo y el resumen agrupe por código
+   sobre el índice idx_rechazadas_codigo
+3. La migración clasifique las rechazadas de una BD anterior al catálogo,
+   incluidas las de un mes archivado antes de la migración
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+
+# Se importa como paquete `core`, igual que entre sí lo hacen los módulos,
+# para compartir el pool de conexiones y la lista de migraciones
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmarks.referencia_reglas import filtrar_facturas_referencia
+from core import razones_rechazo
+from core.archivo_manager import ArchivoManager
+from core.business_rules import BusinessRulesValidator
+from core.migraciones import aplicar_migraciones
+from core.notas_credito_manager import NotasCreditoManager
+
+
+def fila(prefijo, nrodocto, item, valor, tipo='INVPT', agente='0001 - AGENTE'):
+    return {
+        'f_prefijo': prefijo, 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': '900100',
+        'f_cliente_fact_razon_soc': 'CLIENTE 900100', 'f_cant_base': 1,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': tipo, 'f_02_014': agente,
+    }
+
+
+def filas_del_dia():
+    return [
+        fila('FEM', 1, 'P01', 600000), fila('FEM', 1, 'P02', 5000, tipo='VS420510'),
+        fila('FEM', 2, 'P01', 1000),
+        fila('FEM', 3, 'P01', 900000, agente=' 0002 - NO AGENTE DE RETENCION '),
+        fila('NCE', 7, 'P01', 1000, tipo='VSMENOR'),
+    ]
+
+
+def consultar(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+class TestRazonesRechazo:
+    """Clase para probar el catálogo de razones de rechazo"""
+
+    def __init__(self):
+        self.directorio = '/tmp/test_razones_rechazo'
+        self.limpiar()
+        self.resultados = []
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Código y parámetros en filtrar_facturas")
+        validator = BusinessRulesValidator()
+        _, _, rechazadas = validator.filtrar_facturas(filas_del_dia())
+        codigos = sorted(r['codigo_rechazo'] for r in rechazadas)
+        self.registrar("un código por regla", codigos == [razones_rechazo.NOTA_TIPO_INVENTARIO,
+                                                           razones_rechazo.NO_AGENTE_RETENCION,
+                                                           razones_rechazo.TIPO_INVENTARIO,
+                                                           razones_rechazo.MONTO_MINIMO], str(codigos))
+        self.registrar("el texto se clasifica igual",
+                       all(razones_rechazo.clasificar(r['razon_rechazo']) ==
+                           (r['codigo_rechazo'], r['parametros_rechazo']) for r in rechazadas))
+        _, _, referencia = filtrar_facturas_referencia(validator, filas_del_dia())
+        self.registrar("igual a la referencia",
+                       sorted((r['codigo_rechazo'], r['razon_rechazo']) for r in referencia) ==
+                       sorted((r['codigo_rechazo'], r['razon_rechazo']) for r in rechazadas))
+        self.registrar("texto libre como OTRA",
+                       razones_rechazo.clasificar('Valor menor al mínimo')[0] == razones_rechazo.OTRA)
+
+        print("\n2. Registro y resumen")
+        db_path = os.path.join(self.directorio, 'nueva.db')
+        manager = NotasCreditoManager(db_path)
+        manager.sincronizar_dia([], rechazadas, '2025-03-05')
+        sincronizacion = manager.sincronizar_dia([], rechazadas, '2025-03-05')
+        self.registrar("reproceso sin cambios", sincronizacion['rechazadas'] ==
+                       {'nuevas': 0, 'eliminadas': 0, 'sin_cambios': 4}, str(sincronizacion['rechazadas']))
+        manager.registrar_factura_rechazada(fila('FEM', 9, 'P09', 10), 'Tipo de inventario excluido: VSMENOR')
+        guardados = consultar(db_path, 'SELECT razon_rechazo, codigo_rechazo FROM facturas_rechazadas')
+        self.registrar("codigo_rechazo guardado",
+                       all(codigo == razones_rechazo.codigo_de(texto) for texto, codigo in guardados) and
+                       len(guardados) == 5)
+        resumen = manager.obtener_resumen_rechazos(7)
+        por_clave = {r['clave']: r['cantidad'] for r in resumen['por_razon']}
+        self.registrar("resumen por código",
+                       resumen['total_rechazos'] == 5 and por_clave['TIPO_INVENTARIO'] == 2 and len(por_clave) == 4,
+                       str(por_clave))
+        plan = ' '.join(str(fila_plan[3]) for fila_plan in consultar(db_path, '''
+            EXPLAIN QUERY PLAN SELECT codigo_rechazo, COUNT(*), SUM(valor_total) FROM facturas_rechazadas
+            WHERE fecha_registro >= '2025-01-01' GROUP BY codigo_rechazo'''))
+        self.registrar("agrupa sobre el índice", 'COVERING INDEX idx_rechazadas_codigo' in plan, plan)
+
+        print("\n3. BD anterior al catálogo")
+        db_path = os.path.join(self.directorio, 'anterior.db')
+        aplicar_migraciones(db_path, hasta=5)
+        conn = sqlite3.connect(db_path)
+        conn.executemany('''
+            INSERT INTO facturas_rechazadas (numero_factura, razon_rechazo, valor_total, fecha_factura)
+            VALUES (?, ?, 1000, ?)
+        ''', [('FE1', rechazadas[0]['razon_rechazo'], '2025-01-10'),
+              ('FE2', 'Valor total acoplado de líneas válidas $1,000.00 no cumple monto mínimo $524,000.00',
+               '2025-03-10'),
+              ('FE3', 'Razón escrita a mano', '2025-03-11')])
+        conn.commit()
+        conn.close()
+        archivo = ArchivoManager(db_path, os.path.join(self.directorio, 'archivo'))
+        archivo.archivar_mes('facturas_rechazadas', '2025-01')
+
+        NotasCreditoManager(db_path)
+        indices = {f[0] for f in consultar(db_path, "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.registrar("índice por código en lugar del de texto",
+                       'idx_rechazadas_codigo' in indices and 'idx_rechazadas_razon' not in indices)
+        self.registrar("rechazadas clasificadas",
+                       consultar(db_path, 'SELECT numero_factura, codigo_rechazo FROM facturas_rechazadas '
+                                          'ORDER BY numero_factura') ==
+                       [('FE2', razones_rechazo.MONTO_MINIMO), ('FE3', razones_rechazo.OTRA)])
+        archivo.restaurar_mes('facturas_rechazadas', '2025-01')
+        self.registrar("mes archivado antes del catálogo",
+                       consultar(db_path, "SELECT codigo_rechazo FROM facturas_rechazadas WHERE numero_factura = 'FE1'")
+                       == [(rechazadas[0]['codigo_rechazo'],)])
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Elimina las bases de datos y archivos temporales"""
+        shutil.rmtree(self.directorio, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test = TestRazonesRechazo()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
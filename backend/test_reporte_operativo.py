@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Test de Consultas del Reporte Operativo
+=======================================
+
+Verifica que las consultas por día del reporte operativo
+(NotasCreditoManager.obtener_movimientos_dia):
+1. Devuelvan las mismas filas que el filtro anterior con DATE(columna) = ?,
+   tanto para columnas DATE ('YYYY-MM-DD') como TIMESTAMP ('YYYY-MM-DD HH:MM:SS')
+2. Usen los índices de fecha con un rango (EXPLAIN QUERY PLAN sin SCAN de la tabla)
+"""
+
+import os
+import sqlite3
+import sys
+
+# Agregar el directorio core al path para imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+
+from notas_credito_manager import NotasCreditoManager
+
+# Consultas anteriores (no sargables), como referencia de resultados
+CONSULTAS_REFERENCIA = {
+    'notas_credito': '''
+        SELECT id FROM notas_credito
+        WHERE DATE(fecha_nota) = ? OR DATE(fecha_registro) = ?
+    ''',
+    'aplicaciones': 'SELECT id FROM aplicaciones_notas WHERE DATE(fecha_aplicacion) = ?',
+    'facturas_rechazadas': 'SELECT id FROM facturas_rechazadas WHERE DATE(fecha_factura) = ?',
+}
+
+
+class TestReporteOperativo:
+    """Clase para probar las consultas por día del reporte operativo"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_reporte_operativo.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        NotasCreditoManager(db_path=self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.resultados = []
+        self._cargar_datos()
+
+    def _cargar_datos(self):
+        """Filas en días consecutivos, con horas en los extremos del día"""
+        horas = ['00:00:00', '12:30:00', '23:59:59']
+        notas, aplicaciones, rechazadas = [], [], []
+        for i in range(300):
+            dia = f'2025-03-{i % 10 + 1:02d}'
+            registro = f'2025-03-{(i + 3) % 10 + 1:02d} {horas[i % 3]}'
+            notas.append((f'NC{i}', dia, '900', 'Cliente', f'P{i}', 'Producto', 1000, 1, 1000, 1, registro))
+            aplicaciones.append((i + 1, f'NC{i}', f'FE{i}', f'FE{i}-1', dia, '900', f'P{i}', 1, 1000,
+                                 f'{dia} {horas[i % 3]}'))
+            rechazadas.append((f'FR{i}', 'Razón', dia))
+
+        self.conn.executemany('''
+            INSERT INTO notas_credito (numero_nota, fecha_nota, nit_cliente, nombre_cliente,
+                                       codigo_producto, nombre_producto, valor_total, cantidad,
+                                       saldo_pendiente, cantidad_pendiente, fecha_registro)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', notas)
+        self.conn.executemany('''
+            INSERT INTO aplicaciones_notas (id_nota, numero_nota, numero_factura, numero_linea,
+                                            fecha_factura, nit_cliente, codigo_producto,
+                                            cantidad_aplicada, valor_aplicado, fecha_aplicacion)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', aplicaciones)
+        self.conn.executemany('''
+            INSERT INTO facturas_rechazadas (numero_factura, razon_rechazo, fecha_factura)
+            VALUES (?, ?, ?)
+        ''', rechazadas)
+        self.conn.execute('ANALYZE')
+        self.conn.commit()
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Mismas filas que DATE(columna) = ?")
+        for fecha in ('2025-03-01', '2025-03-05', '2025-03-10', '2025-04-01'):
+            movimientos = NotasCreditoManager.obtener_movimientos_dia(self.conn, fecha)
+            for clave, sql in CONSULTAS_REFERENCIA.items():
+                params = (fecha,) * sql.count('?')
+                esperado = sorted(fila[0] for fila in self.conn.execute(sql, params))
+                obtenido = sorted(fila['id'] for fila in movimientos[clave])
+                self.registrar(f"{fecha} {clave}", obtenido == esperado, f"{len(obtenido)} filas")
+
+        print("\n2. Planes de consulta")
+        rango = NotasCreditoManager.rango_dias('2025-03-05')
+        planes = [
+            (NotasCreditoManager.SQL_REPORTE_NOTAS, 'notas_credito', ['idx_notas_fecha', 'idx_notas_registro']),
+            (NotasCreditoManager.SQL_REPORTE_APLICACIONES, 'aplicaciones_notas', ['idx_aplicaciones_fecha']),
+            (NotasCreditoManager.SQL_REPORTE_RECHAZADAS, 'facturas_rechazadas', ['idx_rechazadas_fecha']),
+        ]
+        for sql, tabla, indices in planes:
+            plan = ' | '.join(fila[-1] for fila in self.conn.execute('EXPLAIN QUERY PLAN ' + sql, rango))
+            ok = f'SCAN {tabla}' not in plan and all(indice in plan for indice in indices)
+            self.registrar(tabla, ok, plan)
+
+        print("\n3. Límites del rango")
+        casos = [
+            (('2025-03-01', None), ('2025-03-01', '2025-03-02')),
+            (('2025-02-28', None), ('2025-02-28', '2025-03-01')),
+            (('2025-03-01', '2025-03-31'), ('2025-03-01', '2025-04-01')),
+        ]
+        for (desde, hasta), esperado in casos:
+            obtenido = NotasCreditoManager.rango_dias(desde, hasta)
+            self.registrar(f"rango_dias({desde}, {hasta})", obtenido == esperado, str(obtenido))
+        try:
+            NotasCreditoManager.rango_dias('05/03/2025')
+            self.registrar("fecha inválida", False, "no se rechazó")
+        except ValueError:
+            self.registrar("fecha inválida", True, "ValueError")
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos temporal"""
+        self.conn.close()
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    test = TestReporteOperativo()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test de Sincronización Incremental del Día
+==========================================
+
+Verifica que NotasCreditoManager.sincronizar_dia:
+1. Registre todo en la primera carga y no escriba nada al reprocesar el día
+2. No duplique facturas rechazadas en reprocesos
+3. Actualice, inserte y elimine solo el delta cuando cambia la respuesta de la
+   API, corriendo indice_linea sin tocar las líneas iguales
+4. Conserve las líneas con nota aplicada que ya no vienen y mantenga sus saldos
+5. Ofrezca a la aplicación de notas solo las líneas nuevas o cambiadas y las
+   que tienen notas pendientes
+"""
+
+import copy
+import os
+import sqlite3
+import sys
+from datetime import date
+
+# Agregar el directorio core al path para imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'core'))
+
+from notas_credito_manager import NotasCreditoManager
+
+FECHA = date(2025, 3, 5)
+
+
+def linea(nrodocto, item, cantidad, valor, cliente='900100', indice=0):
+    return {
+        'f_prefijo': 'FE', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': cliente,
+        'f_cliente_fact_razon_soc': f'CLIENTE {cliente}', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT', '_indice_linea': indice,
+    }
+
+
+def nota(nrodocto, item, cantidad, valor, cliente='900100'):
+    return {
+        'f_prefijo': 'NC', 'f_nrodocto': nrodocto, 'f_fecha': '2025-03-05T00:00:00',
+        'f_cod_item': item, 'f_desc_item': f'PRODUCTO {item}', 'f_cliente_desp': cliente,
+        'f_cliente_fact_razon_soc': f'CLIENTE {cliente}', 'f_cant_base': cantidad,
+        'f_valor_subtotal_local': valor, 'f_cod_tipo_inv': 'INVPT',
+    }
+
+
+def reindexar(lineas):
+    for indice, factura in enumerate(lineas):
+        factura['_indice_linea'] = indice
+    return lineas
+
+
+class TestSincronizacionIncremental:
+    """Clase para probar la sincronización incremental del día"""
+
+    def __init__(self):
+        self.db_path = '/tmp/test_sincronizacion_incremental.db'
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+        self.manager = NotasCreditoManager(db_path=self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.resultados = []
+
+        # Dos líneas iguales del mismo producto en FE1 (P01) para probar el emparejamiento
+        self.facturas = reindexar([
+            linea(1, 'P01', 10, 100000), linea(1, 'P01', 10, 100000), linea(1, 'P02', 5, 50000),
+            linea(2, 'P03', 8, 80000, cliente='900200'), linea(3, 'P04', 4, 40000),
+        ])
+        self.rechazadas = [
+            {'factura': linea(10, 'X01', 1, 100), 'razon_rechazo': 'Valor menor al mínimo'},
+            {'factura': linea(10, 'X01', 1, 100), 'razon_rechazo': 'Valor menor al mínimo'},
+            {'factura': linea(11, 'X02', 1, 200), 'razon_rechazo': 'Tipo de inventario excluido'},
+        ]
+
+    def registrar(self, nombre, exito, detalle=''):
+        icono = "✅" if exito else "❌"
+        print(f"{icono} {nombre}{': ' + detalle if detalle else ''}")
+        self.resultados.append(exito)
+
+    def sincronizar(self, facturas, rechazadas, notas=()):
+        with self.manager.lote():
+            if notas:
+                self.manager.registrar_notas_credito(list(notas))
+            resultado = self.manager.sincronizar_dia(copy.deepcopy(facturas), copy.deepcopy(rechazadas), FECHA)
+            aplicaciones = self.manager.procesar_notas_para_facturas(resultado['facturas_para_notas'])
+        return resultado, aplicaciones
+
+    def volcado(self):
+        return {tabla: self.conn.execute(f'SELECT * FROM {tabla} ORDER BY id').fetchall()
+                for tabla in ('facturas', 'facturas_rechazadas', 'notas_credito', 'aplicaciones_notas')}
+
+    def ejecutar_todos_los_casos(self):
+        print("\n1. Primera carga y reproceso")
+        resultado, _ = self.sincronizar(self.facturas, self.rechazadas)
+        self.registrar("primera carga", resultado['facturas']['nuevas'] == 5 and
+                       resultado['rechazadas']['nuevas'] == 3, str(resultado['facturas']))
+        antes = self.volcado()
+        resultado, _ = self.sincronizar(self.facturas, self.rechazadas)
+        self.registrar("reproceso sin escrituras", resultado['facturas']['sin_cambios'] == 5 and
+                       resultado['rechazadas']['sin_cambios'] == 3, str(resultado['facturas']))
+        self.registrar("BD idéntica tras el reproceso", self.volcado() == antes)
+        self.registrar("sin líneas para aplicar notas", resultado['facturas_para_notas'] == [])
+
+        print("\n2. Notas solo sobre el delta")
+        resultado, aplicaciones = self.sincronizar(self.facturas, self.rechazadas,
+                                                   [nota(500, 'P04', 1, 10000)])
+        ofrecidas = [f.codigo_producto for f in resultado['facturas_para_notas']]
+        self.registrar("línea sin cambios con nota pendiente ofrecida", ofrecidas == ['P04'], str(ofrecidas))
+        self.registrar("nota aplicada", len(aplicaciones) == 1)
+
+        print("\n3. Cambios en la respuesta de la API")
+        cambiadas = copy.deepcopy(self.facturas)
+        cambiadas[2]['f_valor_subtotal_local'] = 55000  # FE1 P02 cambia de valor
+        del cambiadas[0]                                # FE1 P01 pierde una de sus dos líneas
+        cambiadas.append(linea(4, 'P05', 2, 20000))     # FE4 es nueva
+        reindexar(cambiadas)
+        rechazadas = self.rechazadas[1:] + [{'factura': linea(12, 'X03', 1, 300),
+                                            'razon_rechazo': 'Valor menor al mínimo'}]
+        del rechazadas[1]                               # FE11 ya no viene
+        resultado, _ = self.sincronizar(cambiadas, rechazadas)
+        esperado = {'nuevas': 1, 'actualizadas': 1, 'reindexadas': 2, 'eliminadas': 1,
+                    'conservadas': 0, 'sin_cambios': 1}
+        self.registrar("delta de facturas", resultado['facturas'] == esperado, str(resultado['facturas']))
+        self.registrar("delta de rechazadas", resultado['rechazadas'] ==
+                       {'nuevas': 1, 'eliminadas': 2, 'sin_cambios': 1}, str(resultado['rechazadas']))
+        ofrecidas = sorted(f.codigo_producto for f in resultado['facturas_para_notas'])
+        self.registrar("notas solo para líneas nuevas o cambiadas", ofrecidas == ['P02', 'P05'], str(ofrecidas))
+
+        filas = self.conn.execute('''
+            SELECT numero_factura, codigo_producto, indice_linea, valor_total, valor_restante
+            FROM facturas ORDER BY indice_linea
+        ''').fetchall()
+        self.registrar("índices corridos y valores actualizados", filas == [
+            ('FE1', 'P01', 0, 100000.0, 100000.0), ('FE1', 'P02', 1, 55000.0, 55000.0),
+            ('FE2', 'P03', 2, 80000.0, 80000.0), ('FE3', 'P04', 3, 40000.0, 30000.0),
+            ('FE4', 'P05', 4, 20000.0, 20000.0)], str(filas))
+        rechazadas_bd = self.conn.execute('SELECT COUNT(*) FROM facturas_rechazadas').fetchone()[0]
+        self.registrar("rechazadas sin duplicados", rechazadas_bd == 2, str(rechazadas_bd))
+
+        antes = self.volcado()
+        self.sincronizar(cambiadas, rechazadas)
+        self.registrar("reproceso del día cambiado sin escrituras", self.volcado() == antes)
+
+        print("\n4. Línea con nota aplicada que ya no viene")
+        sin_fe3 = reindexar([f for f in copy.deepcopy(cambiadas) if f['f_nrodocto'] != 3])
+        resultado, _ = self.sincronizar(sin_fe3, rechazadas)
+        self.registrar("línea con nota conservada", resultado['facturas']['conservadas'] == 1 and
+                       resultado['facturas']['eliminadas'] == 0, str(resultado['facturas']))
+        conservada = self.conn.execute(
+            "SELECT indice_linea, valor_restante FROM facturas WHERE numero_factura = 'FE3'").fetchone()
+        self.registrar("línea conservada con saldo intacto", conservada == (3, 30000.0), str(conservada))
+        resultado, _ = self.sincronizar(cambiadas, rechazadas)
+        self.registrar("línea conservada vuelve a emparejarse", resultado['facturas']['nuevas'] == 0 and
+                       resultado['facturas']['conservadas'] == 0, str(resultado['facturas']))
+
+        fallidos = self.resultados.count(False)
+        print(f"\nTotal: {len(self.resultados)} verificaciones, {fallidos} fallida(s)\n")
+        return fallidos == 0
+
+    def limpiar(self):
+        """Limpia la base de datos temporal"""
+        self.conn.close()
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+
+
+if __name__ == '__main__':
+    test = TestSincronizacionIncremental()
+    try:
+        exito = test.ejecutar_todos_los_casos()
+        test.limpiar()
+        sys.exit(0 if exito else 1)
+    except Exception as e:
+        print(f"\n❌ ERROR durante la ejecución del test: {e}")
+        import traceback
+        traceback.print_exc()
+        test.limpiar()
+        sys.exit(1)
@@ -16,7 +16,8 @@ export function useFacturas(params?: {
   fecha_hasta?: string
   es_valida?: boolean
   limite?: number
-  offset?: number
+  cursor?: string
+  incluir_total?: boolean
 }) {
   return useQuery({
     queryKey: ['facturas', params],
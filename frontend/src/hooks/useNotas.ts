@@ -7,7 +7,8 @@ export function useNotas(params?: {
   fecha_desde?: string
   fecha_hasta?: string
   limite?: number
-  offset?: number
+  cursor?: string
+  incluir_total?: boolean
 }) {
   return useQuery({
     queryKey: ['notas', params],
@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card'
 import { Button } from '@/components/ui/button'
 import { Input } from '@/components/ui/input'
@@ -31,6 +31,18 @@ interface ResultadoProcesamiento {
   archivo_generado: string
 }
 
+interface JobProcesamiento {
+  id: number
+  estado: 'PENDIENTE' | 'EN_PROCESO' | 'COMPLETADO' | 'ERROR' | 'CANCELADO'
+  dias_total: number
+  dias_procesados: number
+  dia_actual: string | null
+  progreso: number
+  cancelar: boolean
+  resultado: ResultadoProcesamiento | null
+  error: string | null
+}
+
 interface ResultadoExportacion {
   exito: boolean
   mensaje: string
@@ -40,6 +52,8 @@ interface ResultadoExportacion {
 
 type TipoExportacion = 'facturas' | 'notas' | 'rechazadas' | 'aplicaciones'
 
+const INTERVALO_CONSULTA_JOB_MS = 2000
+
 export default function AdminProcesarRangoPage() {
   // Estado para procesar desde API
   const [fechaDesde, setFechaDesde] = useState('')
@@ -47,6 +61,8 @@ export default function AdminProcesarRangoPage() {
   const [loading, setLoading] = useState(false)
   const [resultado, setResultado] = useState<ResultadoProcesamiento | null>(null)
   const [error, setError] = useState<string | null>(null)
+  const [job, setJob] = useState<JobProcesamiento | null>(null)
+  const consultaJob = useRef<number | null>(null)
 
   // Estado para exportar desde BD
   const [fechaExportDesde, setFechaExportDesde] = useState('')
@@ -56,12 +72,61 @@ export default function AdminProcesarRangoPage() {
   const [resultadoExport, setResultadoExport] = useState<ResultadoExportacion | null>(null)
   const [errorExport, setErrorExport] = useState<string | null>(null)
 
-  // Procesar rango desde API externa
+  const detenerConsultaJob = () => {
+    if (consultaJob.current !== null) {
+      window.clearInterval(consultaJob.current)
+      consultaJob.current = null
+    }
+  }
+
+  useEffect(() => detenerConsultaJob, [])
+
+  // Consultar el avance del job hasta que termine
+  const seguirJob = (jobId: number) => {
+    detenerConsultaJob()
+    consultaJob.current = window.setInterval(async () => {
+      try {
+        const response = await api.get<JobProcesamiento>(`/api/admin/jobs/${jobId}`)
+        const actual = response.data
+        setJob(actual)
+
+        if (actual.estado === 'COMPLETADO' || actual.estado === 'CANCELADO') {
+          detenerConsultaJob()
+          setResultado(actual.resultado)
+          setLoading(false)
+        } else if (actual.estado === 'ERROR') {
+          detenerConsultaJob()
+          setError(actual.error || 'Error al procesar el rango de fechas')
+          setLoading(false)
+        }
+      } catch (err: any) {
+        console.error('Error al consultar el job:', err)
+        detenerConsultaJob()
+        setError(err.response?.data?.error || 'Error al consultar el avance del proceso')
+        setLoading(false)
+      }
+    }, INTERVALO_CONSULTA_JOB_MS)
+  }
+
+  const handleCancelar = async () => {
+    if (!job) return
+    try {
+      await api.post(`/api/admin/jobs/${job.id}/cancelar`)
+      setJob({ ...job, cancelar: true })
+    } catch (err: any) {
+      console.error('Error al cancelar:', err)
+      setError(err.response?.data?.error || 'Error al cancelar el proceso')
+    }
+  }
+
+  // Procesar rango desde API externa (se ejecuta en segundo plano)
   const handleProcesar = async () => {
+    let encolado = false
     try {
       setLoading(true)
       setError(null)
       setResultado(null)
+      setJob(null)
 
       if (!fechaDesde || !fechaHasta) {
         setError('Debe seleccionar ambas fechas')
@@ -89,12 +154,13 @@ export default function AdminProcesarRangoPage() {
         fecha_hasta: fechaHasta,
       })
 
-      setResultado(response.data)
+      encolado = true
+      seguirJob(response.data.job_id)
     } catch (err: any) {
       console.error('Error al procesar rango:', err)
       setError(err.response?.data?.error || 'Error al procesar el rango de fechas')
     } finally {
-      setLoading(false)
+      if (!encolado) setLoading(false)
     }
   }
 
@@ -312,6 +378,36 @@ export default function AdminProcesarRangoPage() {
               </Alert>
             )}
 
+            {job && loading && (
+              <div className="space-y-2">
+                <div className="flex justify-between text-sm">
+                  <span>
+                    {job.estado === 'PENDIENTE'
+                      ? 'En cola...'
+                      : `Procesando ${job.dia_actual ?? ''}`}
+                  </span>
+                  <span className="font-medium">
+                    {job.dias_procesados} / {job.dias_total} días
+                  </span>
+                </div>
+                <div className="h-2 w-full rounded-full bg-muted">
+                  <div
+                    className="h-2 rounded-full bg-primary transition-all"
+                    style={{ width: `${job.progreso}%` }}
+                  />
+                </div>
+                <Button
+                  size="sm"
+                  variant="outline"
+                  onClick={handleCancelar}
+                  disabled={job.cancelar}
+                >
+                  <XCircle className="h-4 w-4 mr-1" />
+                  {job.cancelar ? 'Cancelando...' : 'Cancelar'}
+                </Button>
+              </div>
+            )}
+
             {resultado && (
               <Alert>
                 <CheckCircle2 className="h-4 w-4" />
@@ -365,8 +461,9 @@ export default function AdminProcesarRangoPage() {
             </Button>
 
             <p className="text-xs text-muted-foreground">
-              Este proceso puede tomar varios minutos. Los datos se guardan en la BD
-              y se pueden exportar después.
+              Este proceso puede tomar varios minutos y continúa en el servidor aunque
+              cierre esta página. Los datos se guardan en la BD día por día y se pueden
+              exportar después.
             </p>
           </CardContent>
         </Card>
@@ -7,6 +7,7 @@ import type {
   Estadisticas,
   NotasPorEstado,
   PaginatedResponse,
+  CursorPaginatedResponse,
   ApiError,
   Factura,
   EstadisticasFacturas,
@@ -123,9 +124,10 @@ export const notasApi = {
     fecha_desde?: string
     fecha_hasta?: string
     limite?: number
-    offset?: number
-  }): Promise<PaginatedResponse<NotaCredito>> => {
-    const { data } = await api.get<PaginatedResponse<NotaCredito>>('/api/notas', { params })
+    cursor?: string
+    incluir_total?: boolean
+  }): Promise<CursorPaginatedResponse<NotaCredito>> => {
+    const { data } = await api.get<CursorPaginatedResponse<NotaCredito>>('/api/notas', { params })
     return data
   },
 
@@ -162,9 +164,10 @@ export const facturasApi = {
     fecha_hasta?: string
     es_valida?: boolean
     limite?: number
-    offset?: number
-  }): Promise<PaginatedResponse<Factura>> => {
-    const { data } = await api.get<PaginatedResponse<Factura>>('/api/facturas', { params })
+    cursor?: string
+    incluir_total?: boolean
+  }): Promise<CursorPaginatedResponse<Factura>> => {
+    const { data } = await api.get<CursorPaginatedResponse<Factura>>('/api/facturas', { params })
     return data
   },
 
@@ -74,6 +74,15 @@ export interface PaginatedResponse<T> {
   offset: number
 }
 
+// Listados paginados por cursor (/api/facturas, /api/notas, /api/facturas/rechazadas)
+export interface CursorPaginatedResponse<T> {
+  items: T[]
+  limite: number
+  siguiente_cursor: string | null
+  hay_mas: boolean
+  total?: number
+}
+
 export interface ApiError {
   error: string
   details?: string